@@ -3,9 +3,15 @@
 #
 
 import pandas as pd
+import numpy as np           # For vectorized duplicate analysis
 import chardet               # For detecting file encoding
 
 import os                   # For findDNAFiles
+import io                   # For compressed input
+import zipfile
+import gzip
+import bz2
+import lzma
 from typing import List
 import re                   # For determineDNACompany
 import argparse             # Command line argument parser
@@ -18,11 +24,14 @@ import argparse             # Command line argument parser
 
 saveStructure = False
 saveDuplicates = False
+coverage = False
 
 # Parser arguments
 parser = argparse.ArgumentParser( formatter_class=argparse.RawTextHelpFormatter )
 parser.add_argument('-ss', '--saveStructure', action='store_true', help='Save DNA file structure (without genotype) to a .df file in the ./data/ directory.', required=False)
-parser.add_argument('-sd', '--saveDuplicates', action='store_true', help='Save DNA file duplicate rows to a .df file in the ./data/ directory.', required=False)
+parser.add_argument('-sd', '--saveDuplicates', action='store_true', help='Save DNA file duplicate rows (with number of rows per position and genotype conflicts) to a .df file in the ./data/ directory.', required=False)
+parser.add_argument('-cv', '--coverage', action='store_true', help='Analyse the SNP density, coverage gaps and runs of homozygosity of every kit and of the superkit, and how much of the gaps of every kit the superkit closes.', required=False)
+parser.add_argument('-gs', '--gapSize', type=int, help='Least distance in base pairs between two SNPs that is a coverage gap for --coverage. Defaults to 500000.', required=False)
 
 # Get arguments from command line
 args = parser.parse_args()
@@ -30,6 +39,7 @@ args = parser.parse_args()
 # Save the arguments to variables
 saveStructure = args.saveStructure
 saveDuplicates = args.saveDuplicates
+coverage = args.coverage
 
 
 ####################################################################################
@@ -51,6 +61,23 @@ fileEndings = (
     'csv'
 )
 
+# Compressed input filetypes. The compression itself is sniffed from the file
+# header, each txt/csv member of a zip archive is loaded as a kit of its own
+compressedFileEndings = (
+    'zip',
+    'gz',
+    'bz2',
+    'xz'
+)
+
+# File header signatures of the compressed input formats
+compressionSignatures = {
+    'zip': b'PK\x03\x04',
+    'gzip': b'\x1f\x8b',
+    'bz2': b'BZh',
+    'xz': b'\xfd7zXZ\x00',
+}
+
 # Genotype list
 genotypeList = [
                 'AA', 'CC', 'GG', 'TT',
@@ -75,6 +102,39 @@ genotypeList = [
                 '00'
                 ]
 
+# Lookup tables from genotype code (index in genotypeList) to called and heterozygous genotype
+genotypeCalled = np.array( [ g not in [ '--', '00' ] for g in genotypeList ] )
+genotypeHeterozygous = np.array( [ len( g ) == 2 and g[ 0 ] != g[ 1 ] and g[ 0 ] in 'ACGTDI' and g[ 1 ] in 'ACGTDI' for g in genotypeList ] )
+
+# Number of rows parsed at a time when loading a DNA file
+ingestChunkSize = 200000
+
+# Proportion of heterozygous calls on chromosome X, below is male and above is female.
+# In between, the call rate on chromosome Y decides
+genderHeterozygousMale = 0.05
+genderHeterozygousFemale = 0.15
+genderCallRateYMale = 0.5
+
+# Superkit compared with the kits by --coverage, the kits merged by position when it does not exist
+superkitFile = './output/DNASuperKit-SuperKit.txt'
+
+# Chromosomes of the coverage analysis, AncestryDNA v2 numbers X as 23
+coverageChromosomes = [ str( chromosome ) for chromosome in range( 1, 23 ) ] + [ 'X' ]
+coverageChromosomeTable = { '23': 'X', '24': 'Y', '25': 'XY', '26': 'MT' }
+
+# Window size of the SNP density histograms, and the least distance between two SNPs that is a gap
+coverageWindowSize = 1000000
+coverageGapSize = 500000
+if args.gapSize is not None:
+    coverageGapSize = args.gapSize
+
+# Least number of SNPs and base pairs of a run of homozygosity, as PLINK
+rohMinimumSnps = 100
+rohMinimumLength = 1000000
+
+# Number of largest gaps and runs of homozygosity printed per kit
+coverageMaxRows = 10
+
 ####################################################################################
 ####################################################################################
 
@@ -92,23 +152,156 @@ def findDNAFiles( fileEndings: List ) -> List:
     # Get script directory
     scriptDir = os.path.dirname( os.path.realpath( __file__ ) )
     # Add inputFileDir to directory to get subdir
-    scriptDir = scriptDir + inputFileDir
+    scriptDir = os.path.join( scriptDir, inputFileDir )
 
     # List all files in subdir and add files with fileEndings
-    # and append to result list
+    # and append to result list. Compressed files are added as well,
+    # and every DNA file inside a zip archive is added as archive/member
     fileList = [ f for f in os.listdir( path=scriptDir ) ]
     result = []
     for f in fileList:
-        if f.lower().endswith( fileEndings ):
-            result.append( inputFileDir + f )
+        if f.lower().endswith( fileEndings + compressedFileEndings ):
+            file = inputFileDir + f
+            if getCompression( file ) == 'zip':
+                result.extend( file + '/' + member for member in listArchiveMembers( file, fileEndings ) )
+            else:
+                result.append( file )
 
-#    print( f"{result}" )
 
     return result
 
 ##########################################
 
 
+##########################################
+# Sniff the compression of a file from its header.
+# Returns 'zip', 'gzip', 'bz2', 'xz' or None
+#
+
+def getCompression( file: str ) -> str:
+
+    with open( file, 'rb' ) as f:
+        header = f.read( 8 )
+
+    for compression, signature in compressionSignatures.items():
+        if header.startswith( signature ):
+            return compression
+
+
+    return None
+
+##########################################
+
+
+##########################################
+# List the DNA files in a zip archive.
+# Folders and macOS resource forks are skipped
+#
+
+def listArchiveMembers( archive: str, fileEndings: List ) -> List:
+
+    with zipfile.ZipFile( archive ) as z:
+        members = [ m.filename for m in z.infolist() if not m.is_dir() ]
+
+    result = []
+    for member in members:
+        name = member.rsplit( '/', 1 )[ -1 ]
+        if member.startswith( '__MACOSX/' ) or name.startswith( '._' ):
+            continue
+        if name.lower().endswith( fileEndings ):
+            result.append( member )
+
+
+    return result
+
+##########################################
+
+
+##########################################
+# Split a DNA file path into the file on disk
+# and the member inside a zip archive (or None)
+#
+
+def splitArchivePath( file: str ) -> tuple:
+
+    archive = file
+    while not os.path.isfile( archive ):
+        parent = os.path.dirname( archive )
+        if parent == archive or not parent:
+            return file, None
+        archive = parent
+
+
+    return archive, file[ len( archive ) + 1: ] or None
+
+##########################################
+
+
+##########################################
+# Open a DNA file, zip archive member or compressed
+# file as a decompressed stream. Nothing is extracted
+# to disk. mode is 'r' (text) or 'rb' (bytes)
+#
+
+def openDNAFile( file: str, mode: str = 'r' ):
+
+    archive, member = splitArchivePath( file )
+    compression = getCompression( archive )
+
+    if compression is None:
+        return open( archive, mode )
+
+    if compression == 'zip':
+        with zipfile.ZipFile( archive ) as z:
+            if member is None:
+                member = listArchiveMembers( archive, fileEndings )[ 0 ]
+            stream = z.open( member )
+    elif compression == 'gzip':
+        stream = gzip.open( archive, 'rb' )
+    elif compression == 'bz2':
+        stream = bz2.open( archive, 'rb' )
+    else:
+        stream = lzma.open( archive, 'rb' )
+
+    if 'b' in mode:
+        return stream
+
+
+    return io.TextIOWrapper( stream )
+
+##########################################
+
+
+##########################################
+# Check if a DNA file has to be read through openDNAFile
+#
+
+def isCompressedDNAFile( file: str ) -> bool:
+
+    archive, member = splitArchivePath( file )
+
+
+    return member is not None or getCompression( archive ) is not None
+
+##########################################
+
+
+##########################################
+# Yield the chunks of a pandas reader and close
+# the underlying stream when they run out
+#
+
+def readDNAFileChunks( reader, stream ):
+
+    try:
+        for df in reader:
+            yield df
+    finally:
+        stream.close()
+
+##########################################
+
+
 ##########################################
 # Pre-screen file to determine DNA company
 #
@@ -129,12 +322,12 @@ def prescreenDNAFile( inputDNAFile: str ) -> str:
     mystring = ' '
 
     # count lines in the file
-    with open( inputDNAFile, 'r') as fp:
+    with openDNAFile( inputDNAFile ) as fp:
         for n, line in enumerate(fp):
             pass
 
     # look at the first n lines
-    with open( inputDNAFile ) as myfile:
+    with openDNAFile( inputDNAFile ) as myfile:
         head = [ next( myfile ) for x in range( n ) ]
 
     # put all lines in a string
@@ -186,7 +379,7 @@ def determineDNACompany( text: str, filename: str ) -> str:
 # Load DNA file into pandas dataframe
 #
 
-def loadDNAFile( file: str, company: str ) -> pd.DataFrame:
+def loadDNAFile( file: str, company: str, chunksize: int = None ) -> pd.DataFrame:
 
     # Create a dictionary with the file reading options for each company
     company_options = {
@@ -203,8 +396,19 @@ def loadDNAFile( file: str, company: str ) -> pd.DataFrame:
     if company not in company_options:
         raise ValueError(f"Invalid company name: {company}")
     
-    # Load input file into pandas using the company-specific options
-    df = pd.read_csv(file, **company_options[company])
+    # Load input file into pandas using the company-specific options.
+    # With chunksize, an iterator over dataframes of chunksize rows is returned
+    options = company_options[ company ]
+    if not isCompressedDNAFile( file ):
+        df = pd.read_csv(file, chunksize=chunksize, **options)
+
+    # Compressed files and zip archive members are parsed from the decompressed stream
+    elif chunksize:
+        stream = openDNAFile( file )
+        df = readDNAFileChunks( pd.read_csv(stream, chunksize=chunksize, **options), stream )
+    else:
+        with openDNAFile( file ) as stream:
+            df = pd.read_csv(stream, **options)
 
 
     return df
@@ -241,25 +445,83 @@ def normalizeDNAFile( df: pd.DataFrame, company: str ) -> pd.DataFrame:
 
 
 ##########################################
-# Guesses the gender based on the genotype data in chromosome X/23.
+# Accumulate heterozygous calls on chromosome X/23
+# and the call rate on chromosome Y/24 from a chunk
+# of a normalized DNA file
 #
 
-def guessGenderFromDataframe( df: pd.DataFrame, company: str ) -> str:
+def accumulateSexStatistics( df: pd.DataFrame, company: str, sexStatistics: dict ) -> dict:
 
-    # Filter the DataFrame to include only chromosome X/23
+    # AncestryDNA v2 numbers X and Y as 23 and 24
     if company == 'AncestryDNA v2':
-        df_chr23 = df[df['chromosome'] == '23']
+        labelX, labelY = '23', '24'
     else:
-        df_chr23 = df[df['chromosome'] == 'X']
-    
-    # Count the number of heterozygous SNPs on chromosome 23
-    hetero_count = df_chr23['genotype'].str.contains('/').sum()
-    
-    # Guess the gender based on the proportion of homozygous SNPs on chromosome 23
-    if hetero_count / len(df_chr23) < 0.05:
-        gender = 'Male'
-    else:
-        gender = 'Female'
+        labelX, labelY = 'X', 'Y'
+
+    # Code the genotypes once and look up calls and heterozygous calls
+    genotypeCodes = pd.Categorical( df['genotype'], categories=genotypeList ).codes
+    known = genotypeCodes >= 0
+    called = known & genotypeCalled[ genotypeCodes ]
+    heterozygous = called & genotypeHeterozygous[ genotypeCodes ]
+
+    chromosome = df['chromosome'].to_numpy()
+    chromosomeX = chromosome == labelX
+    chromosomeY = chromosome == labelY
+
+    sexStatistics['callsX'] += int( np.count_nonzero( called & chromosomeX ) )
+    sexStatistics['heterozygousX'] += int( np.count_nonzero( heterozygous & chromosomeX ) )
+    sexStatistics['rowsY'] += int( np.count_nonzero( chromosomeY ) )
+    sexStatistics['callsY'] += int( np.count_nonzero( called & chromosomeY ) )
+
+
+    return sexStatistics
+
+
+##########################################
+# Load, normalize and gather sex chromosome
+# statistics from a DNA file in one pass
+#
+
+def ingestDNAFile( file: str, company: str ) -> tuple:
+
+    sexStatistics = { 'callsX': 0, 'heterozygousX': 0, 'rowsY': 0, 'callsY': 0 }
+    chunks = []
+
+    # Normalize each chunk as it is parsed and accumulate statistics on it
+    for df in loadDNAFile( file, company, chunksize=ingestChunkSize ):
+        df = normalizeDNAFile( df, company )
+        accumulateSexStatistics( df, company, sexStatistics )
+        chunks.append( df )
+
+    df = pd.concat( chunks, ignore_index=True )
+
+
+    return df, sexStatistics
+
+
+##########################################
+# Guesses the gender based on the heterozygous
+# calls on chromosome X/23 and the call rate on Y/24.
+#
+
+def guessGenderFromStatistics( sexStatistics: dict ) -> str:
+
+    gender = 'Unknown'
+
+    # Males only have one X, so heterozygous calls on X are (almost) only read errors
+    if sexStatistics['callsX'] > 0:
+        heterozygousX = sexStatistics['heterozygousX'] / sexStatistics['callsX']
+        if heterozygousX < genderHeterozygousMale:
+            gender = 'Male'
+        elif heterozygousX > genderHeterozygousFemale:
+            gender = 'Female'
+
+    # Undecided from X, females have (almost) only nocalls on Y
+    if gender == 'Unknown' and sexStatistics['rowsY'] > 0:
+        if sexStatistics['callsY'] / sexStatistics['rowsY'] >= genderCallRateYMale:
+            gender = 'Male'
+        else:
+            gender = 'Female'
 
 
     return gender
@@ -288,25 +550,77 @@ def saveDNAStructureToFile( df: pd.DataFrame, company: str ):
 
 
 ##########################################
-# Function to save the duplicate rows in the DNA file to a .df template file
+# Function to analyse duplicate positions in the DNA file
+# in a single pass over the rows sorted by chromosome and position
 #
 
-def saveDNAFileDuplicates( df: pd.DataFrame, company: str ):
+def analyseDNAFileDuplicates( df: pd.DataFrame ) -> dict:
+
+    # Sort row indexes on chromosome (in file order) and position, stable to keep file order within a position
+    chromosomeCodes = pd.factorize( df[ 'chromosome' ] )[ 0 ]
+    positions = df[ 'position' ].to_numpy()
+    order = np.lexsort( ( positions, chromosomeCodes ) )
+    chromosomeCodes = chromosomeCodes[ order ]
+    positions = positions[ order ]
+    genotypeCodes = pd.Categorical( df[ 'genotype' ] ).codes[ order ]
+
+    # Mark the first row of every position, and give each row the index of its position
+    groupStart = np.ones( len( order ), dtype=bool )
+    groupStart[ 1: ] = ( chromosomeCodes[ 1: ] != chromosomeCodes[ :-1 ] ) | ( positions[ 1: ] != positions[ :-1 ] )
+    groupStarts = np.flatnonzero( groupStart )
+    groupIndex = np.cumsum( groupStart ) - 1
+
+    # Number of rows on each position
+    multiplicity = np.diff( np.append( groupStarts, len( order ) ) )
+
+    # A position is conflicting if any of its rows has another genotype than the first row
+    differs = genotypeCodes != genotypeCodes[ groupStarts ][ groupIndex ]
+    conflict = np.logical_or.reduceat( differs, groupStarts ) if len( groupStarts ) > 0 else np.zeros( 0, dtype=bool )
+
+    # Keep the duplicate rows, sorted by chromosome and position
+    rowMultiplicity = multiplicity[ groupIndex ]
+    duplicateRows = rowMultiplicity > 1
+    duplicates = df.iloc[ order[ duplicateRows ] ].copy()
+    duplicates[ 'multiplicity' ] = rowMultiplicity[ duplicateRows ]
+    duplicates[ 'conflict' ] = conflict[ groupIndex ][ duplicateRows ]
+
+    # Per position statistics, leaving out the "junk" chromosome 0
+    positionChromosome = df[ 'chromosome' ].to_numpy()[ order[ groupStarts ] ]
+    statistics = pd.DataFrame( { 'chromosome': positionChromosome, 'multiplicity': multiplicity, 'conflict': conflict } )
+    statistics = statistics[ ( statistics[ 'chromosome' ] != '0' ) & ( statistics[ 'multiplicity' ] > 1 ) ]
+
+    # Breakdown of duplicate positions per chromosome
+    statistics = statistics.assign( agree=~statistics[ 'conflict' ], extraRows=statistics[ 'multiplicity' ] - 1 )
+    chromosomeBreakdown = statistics.groupby( 'chromosome', sort=False ).agg(
+        positions=( 'multiplicity', 'size' ),
+        agree=( 'agree', 'sum' ),
+        conflict=( 'conflict', 'sum' ),
+        extraRows=( 'extraRows', 'sum' )
+    )
+
+
+    return {
+        'duplicates': duplicates,
+        'positions': len( statistics ),
+        'extraRows': int( statistics[ 'extraRows' ].sum() ),
+        'agree': int( statistics[ 'agree' ].sum() ),
+        'conflict': int( statistics[ 'conflict' ].sum() ),
+        'multiplicityCounts': statistics[ 'multiplicity' ].value_counts().sort_index(),
+        'chromosomeBreakdown': chromosomeBreakdown
+    }
 
-    # Make a copy of dataframe
-    df_duplicates = df.copy()
+####################################################################################
+####################################################################################
 
-    # group the rows based on 'chromosome' and 'position'
-    groups = df_duplicates.groupby(['chromosome', 'position'])
 
-    # filter the groups that have more than one row (i.e., duplicates)
-    duplicates = groups.filter(lambda x: len(x) > 1)
+##########################################
+# Function to save the duplicate rows in the DNA file to a .df template file
+#
 
-    # concatenate the filtered groups into a new dataframe
-    duplicates_df = pd.concat([duplicates])
+def saveDNAFileDuplicates( duplicates: pd.DataFrame, company: str ):
 
-    # Save to file
-    duplicates_df.to_csv('./data/' + company + '-duplicates' + '.df', index=None, sep='\t', encoding='ascii', lineterminator='\r\n')
+    # Save the duplicate rows from analyseDNAFileDuplicates to file
+    duplicates.to_csv('./data/' + company + '-duplicates' + '.df', index=None, sep='\t', encoding='ascii', lineterminator='\r\n')
 
 
     return
@@ -322,7 +636,7 @@ def saveDNAFileDuplicates( df: pd.DataFrame, company: str ):
 def getLineTerminator( filePath: str ) -> str:
 
     # Open file
-    with open(filePath, 'rb') as file:
+    with openDNAFile( filePath, 'rb' ) as file:
         data = file.read()
     
     # Windows line terminator
@@ -351,7 +665,7 @@ def getLineTerminator( filePath: str ) -> str:
 #
 
 def getFileEncoding( filePath: str ) -> str:
-    with open( filePath, 'rb' ) as file:
+    with openDNAFile( filePath, 'rb' ) as file:
         rawData = file.read()
 
         # use chardet to detect encoding
@@ -407,6 +721,183 @@ def compareDataframes(df1, df2):
 ####################################################################################
 
 
+##########################################
+# Function to get the called SNPs of a DNA file for the coverage analysis,
+# as sorted chromosome (index in coverageChromosomes) and position keys
+# and whether the SNP is homozygous. One row per position
+#
+
+def getCoverageKeys( df: pd.DataFrame ) -> tuple:
+
+    chromosome = pd.Categorical( df[ 'chromosome' ].replace( coverageChromosomeTable ), categories=coverageChromosomes ).codes.astype( np.int64 )
+    genotypeCodes = pd.Categorical( df[ 'genotype' ], categories=genotypeList ).codes
+    called = ( chromosome >= 0 ) & ( genotypeCodes >= 0 ) & genotypeCalled[ genotypeCodes ]
+
+    keys = chromosome[ called ] * 2**40 + df[ 'position' ].to_numpy( dtype=np.int64 )[ called ]
+    homozygous = ~genotypeHeterozygous[ genotypeCodes[ called ] ]
+
+    # The first row of duplicate positions
+    keys, rows = np.unique( keys, return_index=True )
+
+
+    return keys, homozygous[ rows ]
+
+####################################################################################
+####################################################################################
+
+
+##########################################
+# Function to count the SNPs in fixed windows of every chromosome
+# and sum up the histograms per chromosome
+#
+
+def analyseSNPDensity( keys: np.ndarray ) -> pd.DataFrame:
+
+    chromosome = keys >> 40
+    window = ( keys & ( 2**40 - 1 ) ) // coverageWindowSize
+
+    # Windows up to the last SNP of every chromosome
+    lastWindow = np.zeros( len( coverageChromosomes ), dtype=np.int64 )
+    np.maximum.at( lastWindow, chromosome, window )
+    windowOffset = np.concatenate( [ [ 0 ], np.cumsum( lastWindow + 1 ) ] )
+    histogram = np.bincount( windowOffset[ chromosome ] + window, minlength=windowOffset[ -1 ] )
+
+    rows = []
+    for index, name in enumerate( coverageChromosomes ):
+        counts = histogram[ windowOffset[ index ]:windowOffset[ index + 1 ] ]
+        if not np.any( chromosome == index ):
+            continue
+        rows.append( {
+            'chromosome': name,
+            'snps': int( counts.sum() ),
+            'windows': len( counts ),
+            'emptyWindows': int( np.count_nonzero( counts == 0 ) ),
+            'minimum': int( counts.min() ),
+            'median': int( np.median( counts ) ),
+            'maximum': int( counts.max() )
+        } )
+
+
+    return pd.DataFrame( rows, columns=[ 'chromosome', 'snps', 'windows', 'emptyWindows', 'minimum', 'median', 'maximum' ] )
+
+####################################################################################
+####################################################################################
+
+
+##########################################
+# Function to find the gaps of at least coverageGapSize base pairs
+# between two SNPs on the same chromosome
+#
+
+def findCoverageGaps( keys: np.ndarray ) -> pd.DataFrame:
+
+    sameChromosome = ( keys[ 1: ] >> 40 ) == ( keys[ :-1 ] >> 40 )
+    gaps = np.flatnonzero( sameChromosome & ( np.diff( keys ) >= coverageGapSize ) )
+
+
+    return pd.DataFrame( {
+        'chromosome': np.array( coverageChromosomes, dtype=object )[ keys[ gaps ] >> 40 ],
+        'start': keys[ gaps ],
+        'end': keys[ gaps + 1 ],
+        'length': keys[ gaps + 1 ] - keys[ gaps ]
+    } )
+
+####################################################################################
+####################################################################################
+
+
+##########################################
+# Function to find the runs of homozygosity on chromosomes 1-22, the runs
+# of homozygous SNPs with at least rohMinimumSnps SNPs and rohMinimumLength
+# base pairs. Any heterozygous SNP ends a run
+#
+
+def findRunsOfHomozygosity( keys: np.ndarray, homozygous: np.ndarray ) -> pd.DataFrame:
+
+    chromosome = keys >> 40
+    run = homozygous & ( chromosome < coverageChromosomes.index( 'X' ) )
+    newChromosome = np.r_[ True, chromosome[ 1: ] != chromosome[ :-1 ] ]
+    lastOfChromosome = np.r_[ newChromosome[ 1: ], True ]
+
+    first = np.flatnonzero( run & ( np.r_[ True, ~run[ :-1 ] ] | newChromosome ) )
+    last = np.flatnonzero( run & ( np.r_[ ~run[ 1: ], True ] | lastOfChromosome ) )
+    keep = ( last - first + 1 >= rohMinimumSnps ) & ( keys[ last ] - keys[ first ] >= rohMinimumLength )
+    first = first[ keep ]
+    last = last[ keep ]
+
+
+    return pd.DataFrame( {
+        'chromosome': np.array( coverageChromosomes, dtype=object )[ chromosome[ first ] ],
+        'start': keys[ first ] & ( 2**40 - 1 ),
+        'end': keys[ last ] & ( 2**40 - 1 ),
+        'length': keys[ last ] - keys[ first ],
+        'snps': last - first + 1
+    } )
+
+####################################################################################
+####################################################################################
+
+
+##########################################
+# Function to measure how much of the gaps of a kit are left in the superkit.
+# Both gap lists are sorted and do not overlap, so the superkit gaps that
+# overlap a kit gap are found with a binary search and their lengths are
+# summed with a cumulative sum, clipped to the kit gap at both ends
+#
+
+def compareCoverageGaps( gaps: pd.DataFrame, superkitGaps: pd.DataFrame ) -> pd.DataFrame:
+
+    start = gaps[ 'start' ].to_numpy()
+    end = gaps[ 'end' ].to_numpy()
+    superkitStart = superkitGaps[ 'start' ].to_numpy()
+    superkitEnd = superkitGaps[ 'end' ].to_numpy()
+
+    first = np.searchsorted( superkitEnd, start, side='right' )
+    last = np.searchsorted( superkitStart, end, side='left' )
+    overlapping = last > first
+
+    lengths = np.concatenate( [ [ 0 ], np.cumsum( superkitEnd - superkitStart ) ] )
+    remaining = lengths[ last ] - lengths[ first ]
+    if overlapping.any():
+        remaining[ overlapping ] -= np.maximum( 0, start[ overlapping ] - superkitStart[ first[ overlapping ] ] )
+        remaining[ overlapping ] -= np.maximum( 0, superkitEnd[ last[ overlapping ] - 1 ] - end[ overlapping ] )
+
+
+    return gaps.assign( remaining=remaining, closed=~overlapping )
+
+####################################################################################
+####################################################################################
+
+
+##########################################
+# Function to print the coverage analysis of a kit or superkit
+#
+
+def printCoverageAnalysis( keys: np.ndarray, homozygous: np.ndarray ):
+
+    density = analyseSNPDensity( keys )
+    gaps = findCoverageGaps( keys )
+    runs = findRunsOfHomozygosity( keys, homozygous )
+
+    print( f'SNP density in windows of {coverageWindowSize} base pairs:' )
+    print( density.to_string( index=False ) )
+    print()
+    print( f'Coverage gaps of at least {coverageGapSize} base pairs: {len( gaps )}, {gaps[ "length" ].sum()} base pairs' )
+    if len( gaps ):
+        print( gaps.nlargest( coverageMaxRows, 'length' ).assign( start=lambda g: g[ 'start' ] & ( 2**40 - 1 ), end=lambda g: g[ 'end' ] & ( 2**40 - 1 ) ).to_string( index=False ) )
+    print()
+    print( f'Runs of homozygosity of at least {rohMinimumSnps} SNPs and {rohMinimumLength} base pairs: {len( runs )}, {runs[ "length" ].sum()} base pairs' )
+    if len( runs ):
+        print( runs.nlargest( coverageMaxRows, 'length' ).to_string( index=False ) )
+    print()
+
+
+    return
+
+####################################################################################
+####################################################################################
+
+
 ####################################################################################
 # MAIN LOOP
 ####################################################################################
@@ -428,6 +919,7 @@ if not rawDNAFiles:
 # empty array to put results in
 dataframeList = []
 companyList = []
+coverageList = []
 chromosomeZero = pd.DataFrame()
 
 for file in rawDNAFiles:
@@ -442,12 +934,10 @@ for file in rawDNAFiles:
     company = determineDNACompany( fileScreening , file)
 
     if company != 'unknown':
-        # Load the DNA file into pandas and get columns
-        df = loadDNAFile( file, company )
-        # Normalize the DNA file
-        df = normalizeDNAFile( df, company )
+        # Load and normalize the DNA file, gathering X and Y statistics while parsing
+        df, sexStatistics = ingestDNAFile( file, company )
         # Guess gender in kit
-        guessGender = guessGenderFromDataframe( df, company )
+        guessGender = guessGenderFromStatistics( sexStatistics )
 
         # Add dataframes to list
         dataframeList.append( df )
@@ -463,9 +953,12 @@ for file in rawDNAFiles:
         if saveStructure == True:
             saveDNAStructureToFile( df, company )
 
+        # Analyse duplicate positions in the kit
+        duplicateAnalysis = analyseDNAFileDuplicates( df )
+
         # Save DNA file duplicate rows to a .df file in ./data/ folder
         if saveDuplicates == True:
-            saveDNAFileDuplicates( df, company )
+            saveDNAFileDuplicates( duplicateAnalysis[ 'duplicates' ], company )
 
 
     ########################
@@ -490,16 +983,12 @@ for file in rawDNAFiles:
         # Calculate percentage of nocalls
         Nocalls_Percentage = round( Nocall_count / len(df) * 100, 2 )
 
-        # Get nr of duplicate positions
-        # group the rows based on 'chromosome' and 'position'
-        duplicate_count_group = df[df['chromosome'] != '0'].groupby(['chromosome', 'position'])
-        # filter the groups that have more than one row (i.e., duplicates)
-        duplicates_count_filter = duplicate_count_group.filter(lambda x: len(x) > 1)
-        # concatenate the filtered groups into a new dataframe, count rows and divide by two (to get the nr of real duplicates)
-        duplicates_count = int( len( pd.concat([duplicates_count_filter]) ) / 2 )
+        # Get nr of duplicate positions and the extra rows on them
+        duplicates_count = duplicateAnalysis[ 'positions' ]
+        duplicates_extra_rows = duplicateAnalysis[ 'extraRows' ]
         # Calculate percentage of duplicates
         duplicates_percentage = round( duplicates_count / len( df[df['chromosome'] != '0'] ) * 100, 2 )
-  
+
 
         # This will return a series with the count of each unique value in the genotype column
         genotype_counts_all = df["genotype"].value_counts()
@@ -524,13 +1013,26 @@ for file in rawDNAFiles:
         print( f'# Line terminator:            {lineTerminator}' )
         print( f'#' )
         print( f'# Assumed gender in kit:      {guessGender}' )
+        print( f'#   Heterozygous calls on X:  {sexStatistics["heterozygousX"]} of {sexStatistics["callsX"]}' )
+        print( f'#   Calls on Y:               {sexStatistics["callsY"]} of {sexStatistics["rowsY"]}' )
         print( '#')
         print( f'# SNPs tested in kit:         {len(df)}' )
         print( f'# Number of nocalls in kit:   {Nocall_count} / {Nocalls_Percentage}%' )
         print( f'# Duplicate positions in kit: {duplicates_count} / {duplicates_percentage}%' )
+        print( f'#   Extra duplicate rows:     {duplicates_extra_rows}' )
+        print( f'#   Agreeing genotypes:       {duplicateAnalysis["agree"]}' )
+        print( f'#   Conflicting genotypes:    {duplicateAnalysis["conflict"]}' )
         print( f'#')
         print( '#' * fenceNr)
         print()
+        if duplicates_count > 0:
+            print( 'Duplicate positions by number of rows:' )
+            for multiplicity, count in duplicateAnalysis[ 'multiplicityCounts' ].items():
+                print( f'{multiplicity} rows: {count}' )
+            print()
+            print( 'Duplicate positions per chromosome:' )
+            print( duplicateAnalysis[ 'chromosomeBreakdown' ] )
+            print()
         print( f'Chromosomes: {df.chromosome.unique().tolist()}' )
         print( f'Genotypes: {df.genotype.unique().tolist()}' )
         print( 'Occurances of genotypes in the file:')
@@ -691,6 +1193,16 @@ for file in rawDNAFiles:
             print()
 
 
+        # SNP density, coverage gaps and runs of homozygosity
+        if coverage:
+            coverageKeys, coverageHomozygous = getCoverageKeys( df )
+            coverageList.append( ( file.replace( inputFileDir, '' ), company, coverageKeys, findCoverageGaps( coverageKeys ) ) )
+            print()
+            print( 'Coverage' )
+            print()
+            printCoverageAnalysis( coverageKeys, coverageHomozygous )
+
+
         print()
         # Let user know processing is completed successfully
         print( 'Done analyzing file: ' + file.replace( inputFileDir, '' ) )
@@ -745,6 +1257,55 @@ if countCompanies > 1:
     print()
 
 
+########################
+# Compare the coverage gaps of every kit with the superkit
+
+if coverage and coverageList:
+
+    # The superkit in ./output/, or else the positions of all kits
+    if os.path.exists( superkitFile ):
+        superkitName = superkitFile.replace( outputFileDir, '' )
+        superkit = pd.read_csv( superkitFile, sep='\t', dtype=str )
+        superkit[ 'position' ] = superkit[ 'position' ].astype( int )
+        superkitKeys, superkitHomozygous = getCoverageKeys( superkit )
+    else:
+        superkitName = 'All kits merged by position'
+        superkit = pd.concat( dataframeList, ignore_index=True )
+        superkitKeys, superkitHomozygous = getCoverageKeys( superkit )
+    superkitGaps = findCoverageGaps( superkitKeys )
+
+    fenceNr = 70
+    print( '#' * fenceNr )
+    print( '#' )
+    print( f'# Coverage of the superkit: {superkitName}' )
+    print( '#' )
+    print( '#' * fenceNr )
+    print()
+    printCoverageAnalysis( superkitKeys, superkitHomozygous )
+
+    # Gaps of every kit before and after merging
+    rows = []
+    for name, company, keys, gaps in coverageList:
+        compared = compareCoverageGaps( gaps, superkitGaps )
+        rows.append( {
+            'kit': name,
+            'company': company,
+            'snps': len( keys ),
+            'superkitSnps': len( superkitKeys ),
+            'gaps': len( gaps ),
+            'gapsClosed': int( compared[ 'closed' ].sum() ),
+            'gapBasePairs': int( compared[ 'length' ].sum() ),
+            'remainingBasePairs': int( compared[ 'remaining' ].sum() ),
+        } )
+    report = pd.DataFrame( rows )
+    with np.errstate( divide='ignore', invalid='ignore' ):
+        report[ 'closedPercentage' ] = ( 100 - report[ 'remainingBasePairs' ] / report[ 'gapBasePairs' ] * 100 ).round( 2 ).fillna( 100.0 )
+
+    print( f'Coverage gaps of every kit before and after merging, gaps of at least {coverageGapSize} base pairs:' )
+    print( report.to_string( index=False ) )
+    print()
+
+
 
 ####################################################################################
 # EOF #
@@ -3,9 +3,12 @@
 #
 
 import os                   # For findDNAFiles
+import io                   # For compressed input
+import zipfile
+import gzip
 from typing import List
 import pandas as pd
-import re                   # For determineDNACompany
+import numpy as np          # For coded genotype arrays
 
 import argparse             # Command line argument parser
 import sys                  # sys.exit(1)
@@ -13,6 +16,43 @@ import time
 import datetime             # Get time
 
 import random
+import tempfile             # For out-of-core runs (--memoryLimit)
+import contextlib           # For compressed output
+import json
+import asyncio              # For the I/O and CPU pipeline (--pipeline)
+
+# pyarrow is only needed for the superkit store
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# The subsystems are in the superkit_*.py modules next to this script. The settings
+# they need are passed to them, the tables and the DNA file functions they share with
+# this script are in superkit_tables.py and superkit_files.py
+from superkit_tables import ( chromosomePriorityList, genotypeTable, genotypeTableMajorityVote, genotypeTableXYMales,
+                              genotypeCodeList, genotypeCodeHeterozygous, noCallDelIns, chromosomeTableAncestryIn,
+                              chromosomeTableVCF )
+from superkit_files import ( fileEndings, prefetchedDNAFiles, findDNAFiles, openDNAFile, isCompressedDNAFile,
+                             readDNAFileChunks, screenDNAFile )
+from superkit_harmonize import getReferenceAlleles, harmonizeDNAFile, printHarmonizeStatistics
+from superkit_liftover import liftoverDNAFile, printLiftoverStatistics
+from superkit_vcf import getVCFAlleles, writeVCFFileChunks
+from superkit_plink import writePLINKFileChunks
+from superkit_store import ( getSuperKitCandidates, loadStoreChromosomeZero, loadSuperKitStore, openSuperKitStore,
+                             spillSuperKitStore, updateSuperKit, writeSuperKitStore )
+from superkit_outofcore import ( decodeRecords, encodeRecords, getOutOfCorePlan, getRecordKeys, writeSegment, readSegments,
+                                 mergeRuns, concatenateRecords, readSegmentsAsText, selectOriginalPositions,
+                                 spillSuperKitRecords )
+from superkit_watch import watchInputDir
+from superkit_service import serveSuperKits
+from superkit_pipeline import prepareDNAFilesPipelined, writeDNAFileChunksPipelined
+from superkit_parallel import prepareDNAFilesParallel
+from superkit_concordance import closeConcordanceReport, countConcordance, openConcordanceReport
+from superkit_consensus import closeConsensusSidecar, openConsensusSidecar, writeConsensusRecords
+from superkit_query import queryDNAFiles
+from superkit_matching import addMatchKits, findMatchingKits, matchDNAFiles
+from superkit_kinship import estimateKinship
 
 
 ####################################################################################
@@ -23,6 +63,47 @@ import random
 convertFormat = False
 # Set majority vote off as default
 majorityVote = False
+# Run in memory as default, a memory limit runs out-of-core
+memoryLimit = None
+# Write uncompressed to ./output/ as default
+outputCompression = 'none'
+compressionLevel = 6
+outputStdout = False
+# Write a new PLINK fileset as default
+plinkAppend = False
+sampleId = None
+# No superkit store as default
+saveStore = False
+loadStore = False
+update = False
+# Build once as default
+watch = False
+# No conversion service as default
+serve = None
+serveWorkers = 2
+serveConcurrency = 4
+# Load the DNA files one at a time, in this process, as default
+pipeline = False
+ingestJobs = 1
+# No concordance report of the companies as default
+concordance = False
+conflicts = False
+# No consensus sidecar as default
+consensus = False
+# Keep the strand of the kits as default
+harmonize = False
+# Keep the palindromic SNPs and the SNPs that do not match the reference alleles as default
+harmonizeDrop = False
+# Take the positions of the kits as they are (GRCh37) as default
+liftover = False
+# Build a superkit as default, not answer a query or compare kits
+query = None
+match = None
+matchAdd = False
+matchFind = None
+matchMinimumSnps = 500
+matchMinimumCentimorgans = 7.0
+kinship = False
 
 # Parser arguments
 parser = argparse.ArgumentParser( formatter_class=argparse.RawTextHelpFormatter )
@@ -37,9 +118,68 @@ parser.add_argument('-o', '--outputFormat', type=str, required=False,
                     MyHeritage v1
                     MyHeritage v2
                     tellmeGen v4
+                    VCF v4 (block-gzip with a tabix index)
+                    PLINK (binary .bed/.bim/.fam fileset)
                     ''')
-parser.add_argument('-cf', '--convertFormat', action='store_true', help='Converts DNA file to a more accurate output format. Keeps only rsid and positions that are true to the original format and adds comments. Not valid with SuperKit format.', required=False)
+parser.add_argument('-cf', '--convertFormat', action='store_true', help='Converts DNA file to a more accurate output format. Keeps only rsid and positions that are true to the original format and adds comments. Not valid with SuperKit, VCF v4 or PLINK format.', required=False)
 parser.add_argument('-mv', '--majorityVote', action='store_true', help='Drops duplicate genotype based on a majority vote. Considerably slower than regular keep first row drop. Only resonable if you want to merge 3 kits or more.', required=False)
+parser.add_argument('-ml', '--memoryLimit', '--memory-limit', type=str, required=False,
+                    help='''
+                    Keeps memory use below the limit, e.g. 512M or 4G (plain numbers are megabytes).
+                    DNA files are read in chunks and spilled as sorted runs to temporary files,
+                    which are merged, formatted and written chromosome by chromosome.
+                    The output is identical to running in memory.
+                    ''')
+parser.add_argument('-oc', '--outputCompression', '--output-compression', type=str, required=False, choices=[ 'none', 'gzip', 'zip' ],
+                    help='''
+                    Writes the resulting DNA file straight into a compressed container:
+                    none (Default)
+                    gzip (adds .gz to the filename)
+                    zip (adds .zip to the filename, the DNA file is the only member)
+                    ''')
+parser.add_argument('-cl', '--compressionLevel', '--compression-level', type=int, required=False, help='Compression level for --outputCompression, 1 (fastest) to 9 (smallest). Defaults to 6.')
+parser.add_argument('-pa', '--plinkAppend', '--plink-append', action='store_true', help='Adds the DNA file as a new individual to the PLINK fileset in ./output/ instead of replacing it. Only valid with PLINK format.', required=False)
+parser.add_argument('-si', '--sampleId', '--sample-id', type=str, required=False, help='Individual ID of the DNA file in VCF v4 and PLINK formats. Defaults to DNASuperKit.')
+parser.add_argument('-ss', '--saveStore', '--save-store', action='store_true', help='Saves the merged superkit, with the company of every SNP, to a Parquet dataset partitioned by chromosome and an Arrow IPC file in ./output/DNASuperKit-store/. Needs pyarrow.', required=False)
+parser.add_argument('-ls', '--loadStore', '--load-store', action='store_true', help='Loads the merged superkit from ./output/DNASuperKit-store/ instead of the DNA files in ./input/, e.g. to convert it to another format. Needs pyarrow.', required=False)
+parser.add_argument('-u', '--update', action='store_true', help='Adds the new DNA files in ./input/ to the superkit in ./output/DNASuperKit-store/ and saves the updated store. Kits already in the store are skipped and only positions in the new kits are merged again. Needs pyarrow.', required=False)
+parser.add_argument('-w', '--watch', action='store_true', help='Keeps running and builds the superkit again every time the DNA files in ./input/ change. Parsed kits are cached between builds.', required=False)
+parser.add_argument('-sv', '--serve', type=str, required=False,
+                    help='''
+                    Runs a local conversion service instead of building once, on [HOST:]PORT
+                    (HOST defaults to 127.0.0.1) or on a Unix socket with unix:PATH.
+                    POST a DNA file to /convert?filename=NAME&outputFormat=FORMAT&convertFormat=1&majorityVote=1
+                    to get the resulting DNA file back. GET /metrics shows request counts and timings.
+                    ''')
+parser.add_argument('-sw', '--serveWorkers', '--serve-workers', type=int, required=False, help='Number of worker processes of the conversion service. Defaults to 2.')
+parser.add_argument('-sc', '--serveConcurrency', '--serve-concurrency', type=int, required=False, help='Number of requests the conversion service takes at a time, more are refused with 503. Defaults to 4.')
+parser.add_argument('-pl', '--pipeline', action='store_true', help='Reads and decompresses the next DNA file while the one before is parsed, and compresses and writes the output file while the next rows are formatted, to keep both disk and CPU busy.', required=False)
+parser.add_argument('-j', '--jobs', type=int, required=False, help='Number of worker processes that load, normalize and clean the DNA files in parallel. The kits are handed back through memory-mapped files. Also the number of worker processes of --matchAdd and --matchFind. Defaults to 1.')
+parser.add_argument('-hz', '--harmonize', action='store_true', required=False, help='Puts the genotypes of every kit on the forward strand of the reference alleles in ./data/reference-alleles.txt while loading, flipping calls on the reverse strand. Palindromic A/T and C/G SNPs are left as they are.')
+parser.add_argument('-hd', '--harmonizeDrop', action='store_true', required=False, help='Drops the palindromic A/T and C/G SNPs and the SNPs that do not match the reference alleles, with --harmonize, instead of leaving them as they are.')
+parser.add_argument('-lo', '--liftover', action='store_true', required=False, help='Detects the genome build of every kit from the positions of known rsids in the DNA file templates, and lifts GRCh38 kits over to GRCh37 with the chain file ./data/hg38ToHg19.over.chain.gz while loading. Rows that can not be lifted over are dropped.')
+parser.add_argument('-cr', '--concordance', action='store_true', required=False, help='Counts how often the companies agree on the positions they share while the duplicates are dropped, and saves the genotype confusion matrix of every pair of companies to ./output/DNASuperKit-concordance.csv.')
+parser.add_argument('-cx', '--conflicts', action='store_true', required=False, help='Writes every position where two companies have different genotypes to ./output/DNASuperKit-conflicts.csv, with --concordance.')
+parser.add_argument('-cs', '--consensus', action='store_true', required=False, help='Saves how the genotype of every SNP of the superkit was chosen, the number of kits that agree and disagree, the method and the company, to ./output/DNASuperKit-consensus.bin and .json.')
+parser.add_argument('-q', '--query', type=str, required=False,
+                    help='''
+                    Shows the genotypes of every DNA file in ./input/ and the stored superkit at the given
+                    rsids and regions, instead of building a superkit. For example "rs4988235,rs1426654,2:136608646"
+                    or "X:100000-200000". The DNA files are indexed the first time they are queried.
+                    ''')
+parser.add_argument('-mt', '--match', type=str, nargs=2, metavar='FILE', required=False,
+                    help='''
+                    Compares two DNA files or superkits (in SuperKit format) over their shared autosomal SNPs
+                    and shows the half identical and fully identical segments, instead of building a superkit.
+                    Files that are not found are looked for in ./input/. Centimorgans are taken from the
+                    genetic map in ./data/genetic-map.txt when there is one.
+                    ''')
+parser.add_argument('-ma', '--matchAdd', action='store_true', required=False, help='Adds the DNA files and superkits in ./input/ to the match database in ./output/DNASuperKit-matchdb/, instead of building a superkit. Kits that are already in it are replaced when they have changed.')
+parser.add_argument('-mf', '--matchFind', type=str, metavar='FILE', required=False, help='Searches the match database for the kits that share segments with a DNA file or superkit, and shows them ranked on shared centimorgans.')
+parser.add_argument('-kn', '--kinship', action='store_true', required=False, help='Estimates the kinship coefficient and IBS0 fraction of every pair of DNA files and superkits in ./input/, instead of building a superkit. The table is saved to ./output/DNASuperKit-kinship.csv.')
+parser.add_argument('-ms', '--matchMinimumSnps', type=int, required=False, help='Least number of SNPs of a segment for --match. Defaults to 500.')
+parser.add_argument('-mc', '--matchMinimumCentimorgans', type=float, required=False, help='Least length of a segment in centimorgans for --match. Defaults to 7.')
+parser.add_argument('-so', '--stdout', action='store_true', help='Writes the resulting DNA file to stdout instead of ./output/. Progress and statistics are written to stderr.', required=False)
 
 # Get arguments from command line
 args = parser.parse_args()
@@ -48,19 +188,166 @@ args = parser.parse_args()
 outputFormat = args.outputFormat
 convertFormat = args.convertFormat
 majorityVote = args.majorityVote
+memoryLimit = args.memoryLimit
+outputCompression = args.outputCompression or outputCompression
+outputStdout = args.stdout
+plinkAppend = args.plinkAppend
+sampleId = args.sampleId
+saveStore = args.saveStore
+loadStore = args.loadStore
+update = args.update
+watch = args.watch
+serve = args.serve
+pipeline = args.pipeline
+concordance = args.concordance or args.conflicts
+conflicts = args.conflicts
+consensus = args.consensus
+harmonize = args.harmonize
+harmonizeDrop = args.harmonizeDrop
+liftover = args.liftover
+query = args.query
+match = args.match
+matchAdd = args.matchAdd
+matchFind = args.matchFind
+kinship = args.kinship
+if args.matchMinimumSnps is not None:
+    matchMinimumSnps = args.matchMinimumSnps
+if args.matchMinimumCentimorgans is not None:
+    matchMinimumCentimorgans = args.matchMinimumCentimorgans
+if args.jobs is not None:
+    ingestJobs = args.jobs
+if args.serveWorkers is not None:
+    serveWorkers = args.serveWorkers
+if args.serveConcurrency is not None:
+    serveConcurrency = args.serveConcurrency
+if args.compressionLevel is not None:
+    compressionLevel = args.compressionLevel
 
 # If outputFormat are not set, default to SuperKit
 if not outputFormat:
     outputFormat = 'SuperKit'
 
 # Allowed outputFormats
-allowed_outputFormats = ['SuperKit', '23andMe v5', 'AncestryDNA v2', 'FamilyTreeDNA v3', 'LivingDNA v1.0.2', 'MyHeritage v1', 'MyHeritage v2', 'tellmeGen v4']
+allowed_outputFormats = ['SuperKit', '23andMe v5', 'AncestryDNA v2', 'FamilyTreeDNA v3', 'LivingDNA v1.0.2', 'MyHeritage v1', 'MyHeritage v2', 'tellmeGen v4', 'VCF v4', 'PLINK']
 
 # Check if outputFormat are valid, if not then exit
 if outputFormat and outputFormat not in allowed_outputFormats:
     print(f'Invalid output format: {outputFormat}. Allowed formats are: {", ".join(allowed_outputFormats)}.')
     sys.exit(1)
 
+# Convert memoryLimit to bytes, if not valid then exit
+if memoryLimit:
+    memoryUnits = { 'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40 }
+    memoryLimitText = memoryLimit.strip().upper().rstrip( 'B' )
+    try:
+        if memoryLimitText[ -1: ] in memoryUnits:
+            memoryLimit = int( float( memoryLimitText[ :-1 ] ) * memoryUnits[ memoryLimitText[ -1 ] ] )
+        else:
+            memoryLimit = int( float( memoryLimitText ) * memoryUnits[ 'M' ] )
+    except ValueError:
+        memoryLimit = 0
+    if memoryLimit <= 0:
+        print(f'Invalid memory limit: {args.memoryLimit}. Use for example 512M or 4G.')
+        sys.exit(1)
+
+# VCF v4 is always written block-gzip compressed
+if outputFormat == 'VCF v4' and outputCompression != 'none':
+    print(f'Invalid output compression for VCF v4: {outputCompression}. VCF v4 is always block-gzip compressed.')
+    sys.exit(1)
+
+# PLINK is a binary fileset in ./output/
+if outputFormat == 'PLINK' and ( outputCompression != 'none' or outputStdout ):
+    print('Invalid output for PLINK: the fileset can only be written uncompressed to ./output/.')
+    sys.exit(1)
+
+# Only PLINK filesets can be appended to
+if plinkAppend and outputFormat != 'PLINK':
+    print('Invalid argument: --plinkAppend is only valid with PLINK format.')
+    sys.exit(1)
+
+# The superkit store is read and written with pyarrow
+if ( saveStore or loadStore or update ) and pa is None:
+    print('Invalid argument: --saveStore, --loadStore and --update need pyarrow (pip install pyarrow).')
+    sys.exit(1)
+
+# The superkit is updated in memory and saved back to the store
+if update and ( loadStore or memoryLimit ):
+    print('Invalid argument: --update is not valid with --loadStore or --memoryLimit.')
+    sys.exit(1)
+if update:
+    saveStore = True
+
+# A loaded superkit is already in the store
+if saveStore and loadStore:
+    print('Invalid argument: --saveStore is not valid with --loadStore.')
+    sys.exit(1)
+
+# Every build in watch mode writes a new DNA file to ./output/
+if watch and ( loadStore or outputStdout ):
+    print('Invalid argument: --watch is not valid with --loadStore or --stdout.')
+    sys.exit(1)
+
+# The service takes the DNA files and options of every request
+if serve and ( watch or saveStore or loadStore or update or plinkAppend or outputStdout ):
+    print('Invalid argument: --serve is not valid with --watch, --saveStore, --loadStore, --update, --plinkAppend or --stdout.')
+    sys.exit(1)
+if serve and not serve.startswith( 'unix:' ) and not serve.rpartition( ':' )[ 2 ].isdigit():
+    print(f'Invalid service address: {serve}. Use for example 8080, 127.0.0.1:8080 or unix:/tmp/superkit.sock.')
+    sys.exit(1)
+if serveWorkers < 1 or serveConcurrency < 1:
+    print('Invalid argument: --serveWorkers and --serveConcurrency must be at least 1.')
+    sys.exit(1)
+
+# The concordance report is counted while the kits are merged
+if concordance and ( loadStore or update or serve ):
+    print('Invalid argument: --concordance and --conflicts are not valid with --loadStore, --update or --serve.')
+    sys.exit(1)
+if consensus and ( loadStore or update or serve ):
+    print('Invalid argument: --consensus is not valid with --loadStore, --update or --serve.')
+    sys.exit(1)
+
+# Only harmonized kits know which SNPs are palindromic or do not match
+if harmonizeDrop and not harmonize:
+    print('Invalid argument: --harmonizeDrop is only valid with --harmonize.')
+    sys.exit(1)
+
+# A query only reads the DNA files and the stored superkit
+if query and ( watch or serve or saveStore or loadStore or update or plinkAppend ):
+    print('Invalid argument: --query is not valid with --watch, --serve, --saveStore, --loadStore, --update or --plinkAppend.')
+    sys.exit(1)
+
+# Comparing kits only reads the two files, or the kits in ./input/ and the match database
+if ( match or matchAdd or matchFind or kinship ) and ( query or watch or serve or saveStore or loadStore or update or plinkAppend ):
+    print('Invalid argument: --match, --matchAdd, --matchFind and --kinship are not valid with --query, --watch, --serve, --saveStore, --loadStore, --update or --plinkAppend.')
+    sys.exit(1)
+if match and ( matchAdd or matchFind ):
+    print('Invalid argument: --match is not valid with --matchAdd or --matchFind.')
+    sys.exit(1)
+if kinship and ( match or matchAdd or matchFind ):
+    print('Invalid argument: --kinship is not valid with --match, --matchAdd or --matchFind.')
+    sys.exit(1)
+if matchMinimumSnps < 1 or matchMinimumCentimorgans < 0:
+    print('Invalid argument: --matchMinimumSnps must be at least 1 and --matchMinimumCentimorgans can not be negative.')
+    sys.exit(1)
+
+# Every worker process holds whole DNA files, and the workers of the service cannot have workers of their own
+if ingestJobs < 1:
+    print('Invalid argument: --jobs must be at least 1.')
+    sys.exit(1)
+if ingestJobs > 1 and ( memoryLimit or serve ):
+    print('Invalid argument: --jobs is not valid with --memoryLimit or --serve.')
+    sys.exit(1)
+
+# Check if compressionLevel are valid, if not then exit
+if compressionLevel < 1 or compressionLevel > 9:
+    print(f'Invalid compression level: {compressionLevel}. Allowed levels are 1 to 9.')
+    sys.exit(1)
+
+# Keep stdout for the DNA file and print everything else to stderr
+if outputStdout:
+    outputStream = sys.stdout.buffer
+    sys.stdout = sys.stderr
+
 ####################################################################################
 ####################################################################################
 
@@ -73,39 +360,77 @@ if outputFormat and outputFormat not in allowed_outputFormats:
 inputFileDir = './input/'
 outputFileDir = './output/'
 
-# Input filetypes
-fileEndings = (
-    'txt',
-    'csv'
-)
-
 # Output File name and file ending
 outputFileName = 'DNASuperKit'
 outputFileEnding = '.csv'
 
+# Superkit store (--saveStore/--loadStore)
+superkitStoreDir = f'{outputFileDir}{outputFileName}-store/'
+
+# Number of rows parsed at a time when loading a DNA file
+ingestChunkSize = 200000
+
+# Positions of the DNA file templates in ./data/ that VCF files are restricted to, per
+# company priority as the rsid is taken from the first company. Loaded when the first
+# VCF file is parsed
+templatePositions = {}
+
+# DNA file templates in ./data/ per output format (--convertFormat), loaded when first used
+formatTemplates = {}
+
+# Sorted chromosome and position keys of the DNA file templates per output format, that
+# the kits are filtered on while they are loaded with --convertFormat. Loaded when first used
+formatTemplateKeys = {}
+
+# Concordance report and conflicting positions of --concordance and --conflicts
+concordanceOutputFile = f'{outputFileDir}{outputFileName}-concordance.csv'
+conflictsOutputFile = f'{outputFileDir}{outputFileName}-conflicts.csv'
+
+# Consensus sidecar of --consensus, the records and a description of them
+consensusOutputFile = f'{outputFileDir}{outputFileName}-consensus.bin'
+consensusMetadataFile = f'{outputFileDir}{outputFileName}-consensus.json'
+
+# Indexes of the DNA files and the stored superkit for --query
+queryIndexDir = f'{outputFileDir}{outputFileName}-index/'
+
+# Match database of --matchAdd and --matchFind
+matchDatabaseDir = f'{outputFileDir}{outputFileName}-matchdb/'
+
+# Kinship table of --kinship
+kinshipOutputFile = f'{outputFileDir}{outputFileName}-kinship.csv'
+
+# Reference panel compiled from the DNA file templates in ./data/ (see REFERENCE PANEL FUNCTIONS),
+# and the panel and its metadata when loaded
+referencePanelFile = './data/reference-panel.npy'
+referencePanel = {}
+
 
 ##### CHANGE DEPENDING ON OUTPUTFORMAT? #####
 # Sorting order for company column
 # Define the company priority lists
 company_priority_lists = {
-    '23andMe v5': ['23andMe v5', 'AncestryDNA v2', 'FamilyTreeDNA v3', 'MyHeritage v2', 'LivingDNA v1.0.2', 'tellmeGen v4', 'MyHeritage v1'],
-    'AncestryDNA v2': ['AncestryDNA v2', '23andMe v5', 'FamilyTreeDNA v3', 'MyHeritage v2', 'LivingDNA v1.0.2', 'tellmeGen v4', 'MyHeritage v1'],
-    'FamilyTreeDNA v3': ['FamilyTreeDNA v3', '23andMe v5', 'AncestryDNA v2', 'MyHeritage v2', 'LivingDNA v1.0.2', 'tellmeGen v4', 'MyHeritage v1'],
-    'LivingDNA v1.0.2': ['LivingDNA v1.0.2', '23andMe v5', 'AncestryDNA v2', 'FamilyTreeDNA v3', 'MyHeritage v2', 'tellmeGen v4', 'MyHeritage v1'],
-    'MyHeritage v1': ['MyHeritage v1', '23andMe v5', 'AncestryDNA v2', 'FamilyTreeDNA v3', 'MyHeritage v2', 'LivingDNA v1.0.2', 'tellmeGen v4'],
-    'MyHeritage v2': ['MyHeritage v2', '23andMe v5', 'AncestryDNA v2', 'FamilyTreeDNA v3', 'LivingDNA v1.0.2', 'tellmeGen v4', 'MyHeritage v1'],
-    'tellmeGen v4': ['tellmeGen v4', '23andMe v5', 'AncestryDNA v2', 'FamilyTreeDNA v3', 'MyHeritage v2', 'LivingDNA v1.0.2', 'MyHeritage v1']
+    '23andMe v5': ['23andMe v5', 'AncestryDNA v2', 'FamilyTreeDNA v3', 'MyHeritage v2', 'LivingDNA v1.0.2', 'tellmeGen v4', 'MyHeritage v1', 'VCF v4'],
+    'AncestryDNA v2': ['AncestryDNA v2', '23andMe v5', 'FamilyTreeDNA v3', 'MyHeritage v2', 'LivingDNA v1.0.2', 'tellmeGen v4', 'MyHeritage v1', 'VCF v4'],
+    'FamilyTreeDNA v3': ['FamilyTreeDNA v3', '23andMe v5', 'AncestryDNA v2', 'MyHeritage v2', 'LivingDNA v1.0.2', 'tellmeGen v4', 'MyHeritage v1', 'VCF v4'],
+    'LivingDNA v1.0.2': ['LivingDNA v1.0.2', '23andMe v5', 'AncestryDNA v2', 'FamilyTreeDNA v3', 'MyHeritage v2', 'tellmeGen v4', 'MyHeritage v1', 'VCF v4'],
+    'MyHeritage v1': ['MyHeritage v1', '23andMe v5', 'AncestryDNA v2', 'FamilyTreeDNA v3', 'MyHeritage v2', 'LivingDNA v1.0.2', 'tellmeGen v4', 'VCF v4'],
+    'MyHeritage v2': ['MyHeritage v2', '23andMe v5', 'AncestryDNA v2', 'FamilyTreeDNA v3', 'LivingDNA v1.0.2', 'tellmeGen v4', 'MyHeritage v1', 'VCF v4'],
+    'tellmeGen v4': ['tellmeGen v4', '23andMe v5', 'AncestryDNA v2', 'FamilyTreeDNA v3', 'MyHeritage v2', 'LivingDNA v1.0.2', 'MyHeritage v1', 'VCF v4']
 }
 
+# Company priority list of output formats without a list of their own
+defaultCompanyPriorityList = ['23andMe v5',
+                              'AncestryDNA v2',
+                              'FamilyTreeDNA v3',
+                              'MyHeritage v2',
+                              'LivingDNA v1.0.2',
+                              'tellmeGen v4',
+                              'MyHeritage v1',
+                              'VCF v4'
+                              ]
+
 # Get the company priority list based on the output format
-companyPriorityList = company_priority_lists.get(outputFormat, ['23andMe v5',
-                                                                'AncestryDNA v2',
-                                                                'FamilyTreeDNA v3',
-                                                                'MyHeritage v2',
-                                                                'LivingDNA v1.0.2',
-                                                                'tellmeGen v4',
-                                                                'MyHeritage v1'
-                                                                ])
+companyPriorityList = company_priority_lists.get(outputFormat, defaultCompanyPriorityList)
 
 
 # Kit statistics
@@ -196,6 +521,30 @@ superkitUniqueGenotypes = []
 #    If it indicates chromosome 26, it's mitochondrial data (which is present in at least some Ancestry data produced since May 2016).
 
 
+# VCF v4 chromosome numbering and order (sequencing, first sample of the file):
+# #CHROM	POS	ID	REF	ALT	QUAL	FILTER	INFO	FORMAT	SAMPLE
+# 1, 2, 3, 4, 5, 6, 7, 8, 9, 10,                With or without chr prefix,
+# 11, 12, 13, 14, 15, 16, 17, 18,               M = MT. Other contigs are dropped
+# 19, 20, 21, 22
+# X, Y, MT
+# Alleles = GT field, 0 = REF and 1, 2.. = ALT (0/1, 1|1, haploid 1)
+# Nocalls = ./.
+# Tabulated
+
+
+# VCF v4 output:
+# REF and ALT from ./data/reference-alleles.txt, called alleles that are neither are added to ALT.
+# SNPs without reference alleles get REF N and every called allele as ALT (1/1, 1/2).
+# GT 0/0, 0/1, 1/1 (two alleles), 0 or 1 (one allele) and ./. (nocall, indel).
+# Chromosome 0 is dropped. Written as block-gzip (BGZF) with a tabix (.tbi) index
+
+# PLINK output:
+# .bim   chromosome, rsid, centimorgan (0), position, allele 1, allele 2 (0 if not seen)
+# .fam   family ID, individual ID, father (0), mother (0), sex (1 = male, 2 = female, 0), phenotype (-9)
+# .bed   SNP-major, 2 bits per individual: 00 = homozygous allele 1, 01 = nocall, 10 = heterozygous,
+#        11 = homozygous allele 2. Chromosome 0 is dropped
+
+
 # Normalized chromosome numbering and order:
 # 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10,
 # 11, 12, 13, 14, 15, 16, 17, 18
@@ -221,62 +570,15 @@ superkitUniqueGenotypes = []
 # Normalization tables
 ####################################################################################
 
-# Sorting order for chromosome column
-chromosomePriorityList = [ '0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12', '13', '14', '15', '16', '17', '18', '19', '20', '21', '22', 'X', 'Y', 'XY', 'MT' ]
-
-
-# Table for normalizing genotypes
-genotypeTable = {
-    '00': '--',
-#    'CA': 'AC',
-#    'TG': 'GT',
-#    'GC': 'CG',
-#    'TA': 'AT',
-#    'TC': 'CT',
-#    'GA': 'AG',
-
-#    'ID': 'DI',
-
-    '-G': 'G',
-    '-C': 'C',
-    '-A': 'A',
-    '-T': 'T'
-}
-
-genotypeTableMajorityVote = {
-    'CA': 'AC',
-    'TG': 'GT',
-    'CG': 'GC', # Ancestry format
-    'AT': 'TA', # Ancestry format
-    'TC': 'CT',
-    'GA': 'AG',
-
-    'ID': 'DI',
-}
-
+# The sorting order of the chromosome column and the tables for normalizing genotypes,
+# chromosome names and alleles are in superkit_tables.py, shared with the superkit_*.py modules
 
-# Table for normalizing genotype on X and Y chromosome (Males)
-genotypeTableXYMales = {
-    'GG': 'G',
-    'CC': 'C',
-    'AA': 'A',
-    'TT': 'T',
 
-    'DD': 'D',
-    'II': 'I',
-
-    'AC': '--',
-    'GT': '--',
-    'CG': '--',
-    'AT': '--',
-    'CT': '--',
-    'AG': '--'
-}
-
-
-# List of no calls, deletions and insertions genotypes
-noCallDelIns = [ 'DD', 'II', 'DI', 'D', 'I', '--' ]
-#noCallsHyphen = [ 'DD', 'II', 'DI', 'D', 'I' ]
+# Proportion of heterozygous calls on chromosome X, below is male and above is female.
+# In between, the call rate on chromosome Y decides
+genderHeterozygousMale = 0.05
+genderHeterozygousFemale = 0.15
+genderCallRateYMale = 0.5
 
 
 ####################################################################################
@@ -318,12 +620,7 @@ genotypeTable23andMe = {
 # Sorting order for ancestry chromosome column
 chromosomePriorityListAncestry =  [ '0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12', '13', '14', '15', '16', '17', '18', '19', '20', '21', '22', '23', '24', '25', '26' ]
 
-# Table for normalizing chromosome names
-chromosomeTableAncestryIn = { '23': 'X',
-                              '24': 'Y',
-                              '25': 'XY',
-                              '26': 'MT'
-}
+# The table for normalizing Ancestry chromosome names, chromosomeTableAncestryIn, is in superkit_tables.py
 
 # Table for converting file to ancestry format
 chromosomeTableAncestryOut = { 'X':  '23',
@@ -451,115 +748,47 @@ genotypeTabletellmeGenv4 = {
 ##########################################
 
 
-####################################################################################
-# FUNCTIONS
-####################################################################################
-
-##########################################
-# Find all files in directory with
-# the desired file ending from 'fileEndings'
-
-def findDNAFiles( fileEndings: List ) -> List:
-    # Get script directory
-    scriptDir = os.path.dirname( os.path.realpath( __file__ ) )
-    # Add inputFileDir to directory to get subdir
-    scriptDir = scriptDir + inputFileDir
-
-    # List all files in subdir and add files with fileEndings
-    # and append to result list
-    fileList = [ f for f in os.listdir( path=scriptDir ) ]
-    result = []
-    for f in fileList:
-        if f.lower().endswith( fileEndings ):
-            result.append( inputFileDir + f )
-
-
-    return result
-
-##########################################
-
-
 ##########################################
-# Pre-screen file to determine DNA company
-#
-
-def prescreenDNAFile( inputDNAFile: str ) -> str:
-
-    ##############################
-    #  n = number of comment lines.
-    #       23andMe v5        = 19
-    #       AncestryDNA v2    = 18
-    #       FamilyTreeDNA v3  = 0
-    #       Living DNA v1.0.2 = 11
-    #       MyHeritage v1     = 6
-    #       MyHeritage v2     = 12
-    #       tellmeGen v4      = 0
-
-
-    n = 1
-    mystring = ' '
-
-    # count lines in the file
-    with open( inputDNAFile, 'r') as fp:
-        for n, line in enumerate(fp):
-            pass
-
-    # look at the first n lines
-    with open( inputDNAFile ) as myfile:
-        head = [ next( myfile ) for x in range( n ) ]
-
-    # put all lines in a string
-    for x in head:
-       mystring += ' ' + x
-
+# File options for each output format
 
-    return mystring
-
-##########################################
+# Line terminators: 
+# \n = LF (Linux), \r\n = CRLF (Windows)
+formats = {
+    '23andMe v5': { 'sep': '\t', 'encoding': 'ascii', 'lineterminator': '\r\n' },
+    'AncestryDNA v2': { 'sep': '\t', 'encoding': 'ascii', 'lineterminator': '\r\n' },
+    'FamilyTreeDNA v3': { 'sep': ',', 'encoding': 'ascii', 'lineterminator': '\n' },
+    'LivingDNA v1.0.2': { 'sep': '\t', 'encoding': 'ascii', 'lineterminator': '\n' },
+    'MyHeritage v1': { 'header': False, 'sep': ',', 'encoding': 'ascii', 'lineterminator': '\n', 'quoting': 2 },
+    'MyHeritage v2': { 'header': False, 'sep': ',', 'encoding': 'ascii', 'lineterminator': '\n', 'quoting': 2 },
+    'tellmeGen v4': { 'sep': '\t', 'encoding': 'ascii', 'lineterminator': '\n' },
+    'SuperKit': { 'sep': '\t', 'encoding': 'ascii', 'lineterminator': '\r\n' },
+    'VCF v4': { 'header': False, 'sep': '\t', 'encoding': 'ascii', 'lineterminator': '\n' },
+    'PLINK': { 'header': False, 'sep': '\t', 'encoding': 'ascii', 'lineterminator': '\n' }
+}
 
+# Output formats that gets the original comments on top of the file with --convertFormat
+companiesWithCommentsToAdd = [
+                            '23andMe v5',
+                            'AncestryDNA v2',
+                            'LivingDNA v1.0.2',
+                            'MyHeritage v1',
+                            'MyHeritage v2'
+                            ]
 
 ##########################################
-# Try to determine what DNA testing
-# company the file originates from
-#
-
-#### NEEDS IMPROVMENT? ####
-def determineDNACompany( text: str, filename: str ) -> str:
-
-    # List of company and patterns
-    company_patterns = {
-        '23andMe v5': r'_v5_full_',
-        'AncestryDNA v2': r'ancestrydna array version: v2\.0',
-        'LivingDNA v1.0.2': r'# living dna customer genotype data download file version: 1\.0\.2',
-        'MyHeritage v2': r'##format=mhv1\.0',
-        'MyHeritage v1': r'# myheritage dna raw data\.',
-        'FamilyTreeDNA v3': r'rsid,chromosome,position,result',
-        'tellmeGen v4': r'# rsid	chromosome	position	genotype'
-    }
-
-    # Convert to lowercase to make it easier
-    filename = filename.lower()
-    text = text.lower()
-
-    # Search for pattern in file
-    for company, pattern in company_patterns.items():
-        if re.search(pattern, filename) or re.search(pattern, text):
-            # Return company according to list depending on textpattern
-            return company
-
-
-    # If it cannot find a pattern, return unknown
-    return 'unknown'
 
 
-##########################################
+####################################################################################
+# FUNCTIONS
+####################################################################################
 
+# Finding, opening and screening the DNA files is in superkit_files.py
 
 ##########################################
 # Load DNA file into pandas dataframe
 #
 
-def loadDNAFile( file: str, company: str ) -> pd.DataFrame:
+def loadDNAFile( file: str, company: str, chunksize: int = None, engine: str = None ) -> pd.DataFrame:
 
     # Create a dictionary with the file reading options for each company
     company_options = {
@@ -570,14 +799,34 @@ def loadDNAFile( file: str, company: str ) -> pd.DataFrame:
         'MyHeritage v1': {'dtype': str, 'comment': '#'},
         'MyHeritage v2': {'dtype': str, 'comment': '#'},
         'tellmeGen v4': {'dtype': str, 'sep': '\t', 'comment': '#', 'index_col': False, 'header': None, 'engine': 'python'},
+        'VCF v4': {'dtype': str, 'sep': '\t', 'comment': '#', 'header': None, 'usecols': [ 0, 1, 2, 3, 4, 9 ]},
     }
     
     # Check if the company name is valid
     if company not in company_options:
         raise ValueError(f"Invalid company name: {company}")
     
-    # Load input file into pandas using the company-specific options
-    df = pd.read_csv(file, **company_options[company])
+    # Load input file into pandas using the company-specific options.
+    # With chunksize, an iterator over dataframes of chunksize rows is returned.
+    # With engine, the parser of the company is overridden (out-of-core reads
+    # use the C parser, as the python parser buffers the whole file)
+    options = dict( company_options[ company ] )
+    if engine:
+        options[ 'engine' ] = engine
+
+    # Files read ahead by the pipeline (--pipeline) are parsed from memory
+    if file in prefetchedDNAFiles:
+        df = pd.read_csv(io.BytesIO( prefetchedDNAFiles[ file ] ), chunksize=chunksize, **options)
+    elif not isCompressedDNAFile( file ):
+        df = pd.read_csv(file, chunksize=chunksize, **options)
+
+    # Compressed files and zip archive members are parsed from the decompressed stream
+    elif chunksize:
+        stream = openDNAFile( file )
+        df = readDNAFileChunks( pd.read_csv(stream, chunksize=chunksize, **options), stream )
+    else:
+        with openDNAFile( file ) as stream:
+            df = pd.read_csv(stream, **options)
 
 
     return df
@@ -590,7 +839,12 @@ def loadDNAFile( file: str, company: str ) -> pd.DataFrame:
 # Normalize the  DNA file
 #
 
-def normalizeDNAFile( df: pd.DataFrame, company: str ) -> pd.DataFrame:
+def normalizeDNAFile( df: pd.DataFrame, company: str, liftoverStatistics: dict = None ) -> pd.DataFrame:
+
+    # VCF v4
+    if company == 'VCF v4':
+        # Map contigs, keep template positions and pair the GT alleles
+        df = normalizeVCFFile( df, liftoverStatistics )
 
     # AncestryDNA v2
     if company == 'AncestryDNA v2':
@@ -613,6 +867,10 @@ def normalizeDNAFile( df: pd.DataFrame, company: str ) -> pd.DataFrame:
     # Set datatype on each column
     df = df.astype( {'rsid': str, 'chromosome': str, 'position': int, 'genotype': str, 'company': str} )
 
+    # GRCh38 positions to GRCh37, VCF files are lifted over before the template positions are kept
+    if liftover and company != 'VCF v4':
+        df = liftoverDNAFile( df, liftoverStatistics if liftoverStatistics is not None else {}, getTemplatePositions() )
+
 
     return df
 
@@ -621,226 +879,634 @@ def normalizeDNAFile( df: pd.DataFrame, company: str ) -> pd.DataFrame:
 
 
 ##########################################
-# Guesses the gender based on the genotype data in chromosome X/23.
-#
+# Load the chromosome and position of every SNP in
+# the DNA file templates in ./data/ (analyse_dna_file.py -ss)
+# as sorted keys, with the rsid from the company first
+# in companyPriorityList. Read from the reference panel
 
-def guessGenderFromDataframe( df: pd.DataFrame, company: str ) -> str:
+def loadTemplatePositions() -> tuple:
 
-    # Filter the DataFrame to include only chromosome X/23
-    df_chr23 = df[df['chromosome'] == 'X']
-    
-    # Count the number of heterozygous SNPs on chromosome 23
-    hetero_count = df_chr23['genotype'].str.contains('/').sum()
-    
-    # Guess the gender based on the proportion of homozygous SNPs on chromosome 23
-    if hetero_count / len(df_chr23) < 0.05:
-        gender = 'Male'
-    else:
-        gender = 'Female'
+    panel, metadata = loadReferencePanel()
+    templates = [ t for t in companyPriorityList if t in metadata[ 'formats' ] and t != 'VCF v4' ]
+    if not templates:
+        return np.array( [], dtype=np.int64 ), np.array( [], dtype=object )
 
+    # Rank of the first company in companyPriorityList that has the row
+    rank = np.full( len( panel ), len( templates ) )
+    for i, t in reversed( list( enumerate( templates ) ) ):
+        rank[ ( panel[ 'formats' ] >> metadata[ 'formats' ].index( t ) ) & 1 == 1 ] = i
 
-    return gender
+    # Keys of the normalized chromosomes, as the kits are normalized (Ancestry 23-26 are X, Y, XY and MT)
+    keep = ( rank < len( templates ) ) & ( panel[ 'normalizedChromosome' ] >= 0 )
+    rows = panel[ keep ]
+    keys = rows[ 'normalizedChromosome' ].astype( np.int64 ) * 2**40 + rows[ 'position' ]
 
+    # Keep the row of the first company per key
+    order = np.lexsort( ( rank[ keep ], keys ) )
+    keys = keys[ order ]
+    first = np.r_[ True, keys[ 1: ] != keys[ :-1 ] ]
 
-##########################################
+
+    return keys[ first ], np.char.decode( rows[ 'rsid' ][ order ][ first ], 'utf-8' ).astype( object )
 
 
 ##########################################
-# Clean file and normalize chromosome
-# and genotype
 
-def cleanDNAFile( df: pd.DataFrame, company: str, gender: str ) -> pd.DataFrame:
 
-    # IF position contains genotype larger than two alleles, replace with nocall '--' (clean dirty information from LivingDNA and more?)
-    df.loc[ df[ 'genotype' ].str.len() > 2, 'genotype' ] = '--'
+##########################################
+# The template positions of loadTemplatePositions for
+# companyPriorityList, loaded once per company priority
 
-    # If position are 0 on other chromosome than 0, assume wrong read from chip and move that row to "junk" chromosome 0
-    df.loc[(df['chromosome'] != '0') & (df['position'] == 0), 'chromosome'] = '0'
+def getTemplatePositions() -> tuple:
 
-    # FamilyTreeDNA v3, additional step to keep chromosome 0
-    if company == 'FamilyTreeDNA v3':
-        # Drop chromosome 0 rows, likely nocalls or incomplete information
-        df = df.drop( df[ df[ 'chromosome' ] == '0' ].index )
+    priority = tuple( companyPriorityList )
+    if priority not in templatePositions:
+        templatePositions[ priority ] = loadTemplatePositions()
 
 
-    return df
+    return templatePositions[ priority ]
 
 
 ##########################################
 
 
 ##########################################
-# Sort file based on custom chromosome order,
-# position and custom genotype order
+# Normalize the chunks of a DNA file. Rows held back
+# by the build detection of --liftover are normalized
+# after the last chunk
 
-def sortDNAFile( df: pd.DataFrame ) -> pd.DataFrame:
-    # Custom sorting order on chromosome and company column. Modify at top of file.
-    df[ 'chromosome' ] = pd.Categorical( df[ 'chromosome' ], chromosomePriorityList )
-    df[ 'company' ] = pd.Categorical( df[ 'company' ], companyPriorityList )
+def normalizeDNAFileChunks( chunks, company: str, liftoverStatistics: dict ):
 
-    # Sort dataframe based on custom sorting orders and position
-    df.sort_values( [ 'chromosome', 'position', 'company' ], ascending=( True, True, True ), inplace=True )
+    empty = None
+    for df in chunks:
+        empty = df.iloc[ :0 ].copy()
+        yield normalizeDNAFile( df, company, liftoverStatistics )
 
+    if liftover and empty is not None and liftoverStatistics.get( 'pending' ):
+        liftoverStatistics[ 'final' ] = True
+        yield normalizeDNAFile( empty, company, liftoverStatistics )
 
-    return df
+
+##########################################
 
 
 ##########################################
+# Normalize a chunk of a VCF file to rsid, chromosome,
+# position and paired alleles. Only positions in the
+# DNA file templates are kept (all if there are none)
+
+def normalizeVCFFile( df: pd.DataFrame, liftoverStatistics: dict = None ) -> pd.DataFrame:
+
+    df.columns = [ 'chromosome', 'position', 'rsid', 'ref', 'alt', 'sample' ]
+
+    # Map contig names to chromosomePriorityList and drop other contigs
+    df[ 'chromosome' ] = df[ 'chromosome' ].str.replace( r'^(?i:chr)', '', regex=True ).replace( chromosomeTableVCF )
+    df = df[ df[ 'chromosome' ].isin( chromosomePriorityList ) ]
+
+    # GRCh38 positions to GRCh37 (--liftover)
+    if liftover:
+        df = df.astype( { 'position': np.int64 } )
+        df = liftoverDNAFile( df, liftoverStatistics if liftoverStatistics is not None else {}, getTemplatePositions() )
+
+    # Keep only template positions, and take the rsid from the template if the VCF has none
+    templateKeys, templateRsids = getTemplatePositions()
+    rsid = df[ 'rsid' ].str.split( ';', n=1 ).str[ 0 ].to_numpy( dtype=object )
+    if len( templateKeys ):
+        chromosome = pd.Categorical( df[ 'chromosome' ], categories=chromosomePriorityList ).codes
+        keys = chromosome.astype( np.int64 ) * 2**40 + df[ 'position' ].astype( np.int64 ).to_numpy()
+        index = np.minimum( np.searchsorted( templateKeys, keys ), len( templateKeys ) - 1 )
+        keep = templateKeys[ index ] == keys
+        df = df[ keep ]
+        rsid = np.where( rsid[ keep ] == '.', templateRsids[ index[ keep ] ], rsid[ keep ] )
+
+    if df.empty:
+        return pd.DataFrame( { 'rsid': rsid, 'chromosome': df[ 'chromosome' ], 'position': df[ 'position' ], 'genotype': df[ 'sample' ] } )
+
+    # GT is the first field of the sample, alleles are indexes into REF and ALT
+    alleles = pd.concat( [ df[ 'ref' ], df[ 'alt' ].str.split( ',', expand=True ) ], axis=1 ).to_numpy( dtype=object )
+    calls = df[ 'sample' ].str.split( ':', n=1 ).str[ 0 ].str.split( r'[/|]', n=1, expand=True, regex=True )
+    if calls.shape[ 1 ] == 1:
+        calls[ 1 ] = None
+
+    genotype = np.full( len( df ), '', dtype=object )
+    called = np.ones( len( df ), dtype=bool )
+    for allele in ( 0, 1 ):
+        # A haploid call (X, Y and MT in males) is written as a homozygous pair
+        call = calls[ allele ].fillna( calls[ 0 ] ) if allele == 1 else calls[ 0 ]
+        index = pd.to_numeric( call, errors='coerce' ).to_numpy()
+        valid = ~np.isnan( index ) & ( index < alleles.shape[ 1 ] )
+        index = np.where( valid, index, 0 ).astype( int )
+        base = alleles[ np.arange( len( df ) ), index ]
+        valid &= np.isin( base, [ 'A', 'C', 'G', 'T' ] )
+        called &= valid
+        genotype = genotype + np.where( valid, base, '' ).astype( object )
+
+    # Nocalls, indels and symbolic alleles are nocalls
+    genotype[ ~called ] = '--'
+
+
+    return pd.DataFrame( { 'rsid': rsid, 'chromosome': df[ 'chromosome' ].to_numpy(), 'position': df[ 'position' ].to_numpy(), 'genotype': genotype } )
 
 
 ##########################################
-# Drop duplicates on genotype, keeping
-# only genotype according to priority list
-# in companyPriorityList
 
-def dropDuplicatesDNAFile( df: pd.DataFrame ) -> pd.DataFrame:
 
+##########################################
+# Encode normalized genotypes to codes
+# according to genotypeCodeList
 
-##### STEP 1 - Drop NoCalls only if there are duplicate rows with atleast one genotype that is not a nocall #####
+def encodeGenotypes( genotypes: pd.Series ) -> np.ndarray:
 
-    print()
-    print( 'Drop nocall if there is a non nocall genotype on duplicate position' )
-    print()
+    # Codes are the index in genotypeCodeList, unknown genotypes are -1
+    return pd.Categorical( genotypes, categories=genotypeCodeList ).codes
 
-    # Create a boolean mask for rows where position is not a duplicate within each chromosome
-    mask = df.groupby(['chromosome', 'position']).genotype.transform('nunique') == 1
 
-    # Select rows where the mask is True or genotype != '--'
-    df = df[mask | df.genotype.ne('--')]
+##########################################
 
 
-    print( 'DONE!' )
-    print()
+##########################################
+# Accumulate heterozygous calls on chromosome X
+# and the call rate on chromosome Y from a chunk
+# of a normalized DNA file
 
+def accumulateSexStatistics( df: pd.DataFrame, sexStatistics: dict ) -> dict:
 
+    # Code the genotypes once and look up calls and heterozygous calls
+    genotypeCodes = encodeGenotypes( df[ 'genotype' ] )
+    called = genotypeCodes > 0
+    heterozygous = called & genotypeCodeHeterozygous[ genotypeCodes ]
 
-##### STEP 2 - Do a majority vote on the duplicates and choose the genotype that has the most of the same #####
+    chromosome = df[ 'chromosome' ].to_numpy()
+    chromosomeX = chromosome == 'X'
+    chromosomeY = chromosome == 'Y'
 
-    if majorityVote == True:
-        print()
-        print( 'Drop based on majority vote' )
-        print()
+    sexStatistics[ 'callsX' ] += int( np.count_nonzero( called & chromosomeX ) )
+    sexStatistics[ 'heterozygousX' ] += int( np.count_nonzero( heterozygous & chromosomeX ) )
+    sexStatistics[ 'rowsY' ] += int( np.count_nonzero( chromosomeY ) )
+    sexStatistics[ 'callsY' ] += int( np.count_nonzero( called & chromosomeY ) )
 
-        # Normalize genotype to be able to compare and count majority easier
-        df_copy = df.copy()
-        df_copy.loc[:, 'genotype'] = df['genotype'].replace(to_replace=genotypeTableMajorityVote)
-        df = df_copy
-
-#        df[ 'genotype' ] = df[ 'genotype' ].replace( to_replace=genotypeTableMajorityVote )
-
-#        df[ 'genotype' ].replace( to_replace=genotypeTableFamilyTreeDNA, inplace=True )
-#        df[ 'genotype' ].replace( to_replace=genotypeTableMajorityVote, inplace=True )
-#        df.loc[ :, 'genotype' ] = df[ 'genotype' ].replace( to_replace=genotypeTableMajorityVote )
-
-        # Group the data frame by chromosome and position columns and apply a lambda function to each group
-        df = df.groupby([df['chromosome'], 'position']).apply(
-            lambda x: 
-                # If the majority genotype count is greater than or equal to 50%, filter the group to keep only rows with the majority genotype and return the first row
-                x[x['genotype'] == x['genotype'].mode().iloc[0]].iloc[:1] if (x['genotype'] == x['genotype'].mode().iloc[0]).sum()/x.shape[0] >= 0.5 
-                # Otherwise, return the original group
-                else x
-        # Reset the index of the resulting data frame after grouping and filtering
-        ).reset_index(drop=True)
-        print( 'DONE!' )
-        print()
 
+    return sexStatistics
 
 
-##### STEP 3 - Drop duplicates and save only the first row. Which genotype that is first are determined by companyPriorityList #####
+##########################################
 
-    # If genotype is different on the same position, then only keep the genotype from the company according to the order in companyPriorityList (which got sorted earlier)
-    print()
-    print( 'Keep first duplicate, drop the rest' )
-    print()
-    df = df.drop_duplicates(subset=['chromosome', 'position'], keep='first')
-    print( 'DONE!' )
-    print()
 
+##########################################
+# Load, normalize and gather sex chromosome
+# statistics from a DNA file in one pass
 
-    return df
+def ingestDNAFile( file: str, company: str ) -> tuple:
 
+    sexStatistics = { 'callsX': 0, 'heterozygousX': 0, 'rowsY': 0, 'callsY': 0 }
+    liftoverStatistics = {}
+    chunks = []
 
-##########################################
+    # Normalize each chunk as it is parsed and accumulate statistics on it
+    for df in normalizeDNAFileChunks( loadDNAFile( file, company, chunksize=ingestChunkSize ), company, liftoverStatistics ):
+        accumulateSexStatistics( df, sexStatistics )
+        chunks.append( df )
+
+    df = pd.concat( chunks, ignore_index=True )
+    if liftover:
+        printLiftoverStatistics( file.replace( inputFileDir, '' ), liftoverStatistics )
+
+
+    return df, sexStatistics
 
 
 ##########################################
-# Restore original output rsid, chromosome
-# and position, based on outputFormat
 
-def restoreOriginalPositions( df: pd.DataFrame, outputFormat: str ) -> pd.DataFrame:
 
-    # Load the data file
-    df_original = pd.read_csv('./data/' + outputFormat + '.df', dtype=str, sep='\t')
+##########################################
+# Guesses the gender based on the heterozygous
+# calls on chromosome X and the call rate on Y.
+#
 
-    # Add dummy genotype
-    df_original['genotype'] = '--'
-    
-    # Set all columns as strings
-    df_original = df_original.astype( {'rsid': str, 'chromosome': str, 'position': int, 'genotype': str} )
+def guessGenderFromStatistics( sexStatistics: dict ) -> str:
 
-    # Merge the two dataframes on chromosome and position
-    df_merged = pd.merge(df_original, df[['chromosome', 'position', 'genotype']], on=['chromosome', 'position'], how='left')
+    gender = 'Unknown'
 
-    # Replace NaN values in genotype with the original values
-    df_merged['genotype'] = df_merged['genotype_y'].fillna(df_merged['genotype_x'])
+    # Males only have one X, so heterozygous calls on X are (almost) only read errors
+    if sexStatistics[ 'callsX' ] > 0:
+        heterozygousX = sexStatistics[ 'heterozygousX' ] / sexStatistics[ 'callsX' ]
+        if heterozygousX < genderHeterozygousMale:
+            gender = 'Male'
+        elif heterozygousX > genderHeterozygousFemale:
+            gender = 'Female'
 
-    # Drop unnecessary columns and rename columns to original format
-    df_merged.drop(['genotype_x', 'genotype_y'], axis=1, inplace=True)
-    df_merged = df_merged.reindex(columns=['rsid', 'chromosome', 'position', 'genotype'])
+    # Undecided from X, females have (almost) only nocalls on Y
+    if gender == 'Unknown' and sexStatistics[ 'rowsY' ] > 0:
+        if sexStatistics[ 'callsY' ] / sexStatistics[ 'rowsY' ] >= genderCallRateYMale:
+            gender = 'Male'
+        else:
+            gender = 'Female'
 
 
-    return df_merged
+    return gender
+
 
 ##########################################
 
 
 ##########################################
-# prepare database for company specific
-# output format
+# Clean file and normalize chromosome
+# and genotype. With --harmonize the genotypes
+# are put on the forward strand, counted in
+# harmonizeStatistics
 
-def formatDNAFile( df: pd.DataFrame, company: str ) -> pd.DataFrame:
+def cleanDNAFile( df: pd.DataFrame, company: str, gender: str, harmonizeStatistics: dict = None ) -> pd.DataFrame:
 
-    # 23andMe v5
-    if company == '23andMe v5':
+    # IF position contains genotype larger than two alleles, replace with nocall '--' (clean dirty information from LivingDNA and more?)
+    df.loc[ df[ 'genotype' ].str.len() > 2, 'genotype' ] = '--'
 
-######### DROP UNUSED CHROMOSOMES #########
-        # Drop chromosomes that arent used
+    # If position are 0 on other chromosome than 0, assume wrong read from chip and move that row to "junk" chromosome 0
+    df.loc[(df['chromosome'] != '0') & (df['position'] == 0), 'chromosome'] = '0'
+
+    # FamilyTreeDNA v3, additional step to keep chromosome 0
+    if company == 'FamilyTreeDNA v3':
+        # Drop chromosome 0 rows, likely nocalls or incomplete information
         df = df.drop( df[ df[ 'chromosome' ] == '0' ].index )
-        df = df.drop( df[ df[ 'chromosome' ] == 'XY' ].index )
 
-######### NORMALIZE #########
-       # Replace genotypes
-        df[ 'genotype' ].replace( to_replace=genotypeTable23andMe, inplace=True )
+    # Forward strand and one allele order
+    if harmonize:
+        df = harmonizeDNAFile( df, harmonizeStatistics if harmonizeStatistics is not None else {}, harmonizeDrop )
 
-######### SORTING #########
-        # Custom sorting order on chromosome column.
-        df[ 'chromosome' ] = pd.Categorical( df[ 'chromosome' ], chromosomePriorityList23andMe )
-        # Sort frame based on custom sorting orders and position
-        df.sort_values( [ 'chromosome', 'position' ], ascending=( True, True ), inplace=True )
 
-######### RENAME COLUMNS #########
-        # Rename columns
-        df.rename( columns = { 'rsid':'# rsid' }, inplace = True )
+    return df
 
 
+##########################################
 
-    # AncestryDNA v2
-    elif company == 'AncestryDNA v2':
 
-######### DROP UNUSED CHROMOSOMES #########
-        # Drop chromosomes that arent used
-        df = df.drop( df[ df[ 'chromosome' ] == '0' ].index )
+##########################################
+# Load, normalize and clean a DNA file in memory.
+# Returns the DNA file, the guessed gender and
+# chromosome 0 of FamilyTreeDNA v3
 
-######### NORMALIZE #########
-        # Normalize chromosome order with custom chromosomeTable
-        df[ 'chromosome' ].replace( to_replace=chromosomeTableAncestryOut, inplace=True )
-        # Changed nocalls from -- to 00
-        df[ 'genotype' ].replace( to_replace=genotypeTableAncestry, inplace=True )
+def prepareDNAFile( file: str, company: str ) -> tuple:
 
-######### SORTING #########
-        # Custom sorting order on chromosome column.
-        df[ 'chromosome' ] = pd.Categorical( df[ 'chromosome' ], chromosomePriorityListAncestry )
-        # Sort frame based on custom sorting orders and position
+    # Load and normalize the DNA file, gathering X and Y statistics while parsing
+    df, sexStatistics = ingestDNAFile( file, company )
+    # Guess gender in kit
+    guessGender = guessGenderFromStatistics( sexStatistics )
+
+
+    # Normalize genotypes on X and Y (MT?) chromosomes where heterozygous calls are defined as nocalls '--'
+    # (as males only have one X and one Y), and the rest are changed to a single letter
+    #
+    # Add commandline to bypass this check to handle mutations?
+    ##### HANDLE D/I calls? #####
+    if guessGender == 'Male':
+        sexChromosomes = df[ 'chromosome' ].isin( [ 'X','Y', 'MT' ] )
+        df.loc[ sexChromosomes, 'genotype' ] = df.loc[ sexChromosomes, 'genotype' ].replace( genotypeTableXYMales )
+
+    # Workaround to keep Chromosome 0 (nocalls? bad data?)
+    chromosomeZero = None
+    if company == 'FamilyTreeDNA v3':
+        chromosomeZero = df.loc[ df[ 'chromosome' ] == '0' ]
+        del chromosomeZero[ 'company' ]
+
+    # Clean dataframe
+    harmonizeStatistics = {}
+    df = cleanDNAFile( df, company, guessGender, harmonizeStatistics )
+    if harmonize:
+        printHarmonizeStatistics( file.replace( inputFileDir, '' ), harmonizeStatistics, harmonizeDrop )
+
+
+    return df, guessGender, chromosomeZero
+
+
+##########################################
+
+
+##########################################
+# Load, normalize and clean a DNA file, or take
+# it from the cache (see screenDNAFile)
+
+def loadPreparedDNAFile( file: str, company: str, kitCache: dict = None ) -> tuple:
+
+    if kitCache is not None and 'kit' in kitCache.get( file, {} ):
+        return kitCache[ file ][ 'kit' ]
+
+    kit = prepareDNAFile( file, company )
+    if kitCache is not None and file in kitCache:
+        kitCache[ file ][ 'kit' ] = kit
+
+
+    return kit
+
+
+##########################################
+
+
+##########################################
+# Sort file based on custom chromosome order,
+# position and custom genotype order
+
+def sortDNAFile( df: pd.DataFrame ) -> pd.DataFrame:
+    # Custom sorting order on chromosome and company column. Modify at top of file.
+    df[ 'chromosome' ] = pd.Categorical( df[ 'chromosome' ], chromosomePriorityList )
+    df[ 'company' ] = pd.Categorical( df[ 'company' ], companyPriorityList )
+
+    # Sort dataframe based on custom sorting orders and position
+    df.sort_values( [ 'chromosome', 'position', 'company' ], ascending=( True, True, True ), inplace=True )
+
+
+    return df
+
+
+##########################################
+
+
+##########################################
+# Group the rows of a sorted dataframe of kits on
+# chromosome and position. Returns the group and
+# the chromosome and position key of every row, the
+# first row of every group, and the genotypes coded
+# as they are and normalized as for --majorityVote
+
+def getDuplicateGroups( df: pd.DataFrame ) -> dict:
+
+    # Chromosomes that are not in chromosomePriorityList are sorted last
+    chromosome = pd.Categorical( df[ 'chromosome' ], categories=chromosomePriorityList ).codes.astype( np.int64 )
+    chromosome[ chromosome < 0 ] = len( chromosomePriorityList )
+    keys = chromosome * 2**40 + df[ 'position' ].to_numpy( dtype=np.int64 )
+
+    newGroup = np.r_[ True, keys[ 1: ] != keys[ :-1 ] ]
+    group = np.cumsum( newGroup ) - 1
+
+    # Codes of the genotypes, -1 is missing. Normalized genotypes are coded in sorted order
+    codes, genotypes = pd.factorize( df[ 'genotype' ] )
+    codes = codes.astype( np.int64 )
+    normalizedGenotypes, normalizedCodes = np.unique( np.array( [ genotypeTableMajorityVote.get( g, g ) for g in genotypes ], dtype=object ), return_inverse=True )
+    normalized = np.r_[ normalizedCodes, -1 ][ codes ]
+    nocall = np.r_[ np.isin( normalizedGenotypes, [ '--', '00' ] ), True ]
+
+
+    return {
+        'keys': keys,
+        'chromosome': chromosome,
+        'group': group,
+        'first': np.flatnonzero( newGroup ),
+        'genotypes': np.array( list( genotypes ), dtype=object ),
+        'codes': codes,
+        'normalizedGenotypes': normalizedGenotypes,
+        'normalized': normalized,
+        'called': ~nocall[ normalized ],
+        'company': pd.Categorical( df[ 'company' ], categories=companyPriorityList ).codes.astype( np.int64 )
+    }
+
+
+##########################################
+
+
+##########################################
+# Drop duplicates on genotype, keeping
+# only genotype according to priority list
+# in companyPriorityList. The agreement of the
+# companies is counted in concordanceReport, and
+# how every genotype was chosen is written to
+# consensusSidecar
+
+def dropDuplicatesDNAFile( df: pd.DataFrame, verbose: bool = True, concordanceReport: dict = None, consensusSidecar: dict = None ) -> pd.DataFrame:
+
+    if len( df ) == 0:
+        return df
+
+    # The rows of every position, the steps below and the reports all work on them
+    groups = getDuplicateGroups( df )
+    group = groups[ 'group' ]
+    validChromosome = groups[ 'chromosome' ] < len( chromosomePriorityList )
+
+    # Count the agreement of the companies on the rows before any is dropped
+    if concordanceReport is not None:
+        countConcordance( groups, concordanceReport )
+
+
+##### STEP 1 - Drop NoCalls only if there are duplicate rows with atleast one genotype that is not a nocall #####
+
+    if verbose:
+        print()
+        print( 'Drop nocall if there is a non nocall genotype on duplicate position' )
+        print()
+
+    # Positions with one genotype keep all rows, others drop their nocalls. Missing genotypes are not counted
+    codes = groups[ 'codes' ]
+    valid = codes >= 0
+    genotypePairs = np.unique( group[ valid ] * ( len( groups[ 'genotypes' ] ) + 1 ) + codes[ valid ] )
+    genotypeCounts = np.bincount( genotypePairs // ( len( groups[ 'genotypes' ] ) + 1 ), minlength=len( groups[ 'first' ] ) )
+    nocall = np.r_[ groups[ 'genotypes' ] == '--', False ][ codes ]
+    rows = np.flatnonzero( ( ( genotypeCounts[ group ] == 1 ) & validChromosome ) | ~nocall )
+
+
+    if verbose:
+        print( 'DONE!' )
+        print()
+
+
+
+##### STEP 2 - Do a majority vote on the duplicates and choose the genotype that has the most of the same #####
+
+    if majorityVote == True:
+        if verbose:
+            print()
+            print( 'Drop based on majority vote' )
+            print()
+
+        # Count the rows of every normalized genotype on a position. Missing genotypes are not counted
+        normalized = groups[ 'normalized' ][ rows ]
+        rowGroup = group[ rows ]
+        valid = normalized >= 0
+        genotypeCount = len( groups[ 'normalizedGenotypes' ] )
+        pairs, pairCounts = np.unique( rowGroup[ valid ] * genotypeCount + normalized[ valid ], return_counts=True )
+        pairGroup, pairGenotype = np.divmod( pairs, genotypeCount )
+
+        # The most common genotype of every position, on a tie the first in sorted order as pandas mode
+        best = np.lexsort( ( pairGenotype, -pairCounts, pairGroup ) )
+        best = best[ np.diff( pairGroup[ best ], prepend=-1 ) != 0 ]
+        modeGenotype = np.full( len( groups[ 'first' ] ), -2 )
+        modeGenotype[ pairGroup[ best ] ] = pairGenotype[ best ]
+        modeCount = np.zeros( len( groups[ 'first' ] ), dtype=np.int64 )
+        modeCount[ pairGroup[ best ] ] = pairCounts[ best ]
+
+        # With the majority genotype in at least half of the rows only its rows are left, else all rows,
+        # and the first row left is kept below. Chromosomes that are not in chromosomePriorityList are dropped
+        majority = 2 * modeCount >= np.bincount( rowGroup, minlength=len( groups[ 'first' ] ) )
+        rows = rows[ ( ~majority[ rowGroup ] | ( normalized == modeGenotype[ rowGroup ] ) ) & validChromosome[ rows ] ]
+        if verbose:
+            print( 'DONE!' )
+            print()
+
+
+
+##### STEP 3 - Drop duplicates and save only the first row. Which genotype that is first are determined by companyPriorityList #####
+
+    # If genotype is different on the same position, then only keep the genotype from the company according to the order in companyPriorityList (which got sorted earlier)
+    if verbose:
+        print()
+        print( 'Keep first duplicate, drop the rest' )
+        print()
+    rows = rows[ np.diff( group[ rows ], prepend=-1 ) != 0 ]
+    df = df.iloc[ rows ]
+    if majorityVote == True:
+        # Genotypes chosen by majority vote are normalized
+        df = df.assign( genotype=df[ 'genotype' ].replace( to_replace=genotypeTableMajorityVote ) ).reset_index( drop=True )
+    if verbose:
+        print( 'DONE!' )
+        print()
+
+    if consensusSidecar is not None:
+        writeConsensusRecords( groups, rows, consensusSidecar )
+
+
+    return df
+
+
+##########################################
+
+
+##########################################
+# Load the DNA file template of an output format,
+# kept in memory after the first time
+
+def loadFormatTemplate( outputFormat: str ) -> pd.DataFrame:
+
+    if outputFormat not in formatTemplates:
+        formatTemplates[ outputFormat ] = pd.read_csv('./data/' + outputFormat + '.df', dtype=str, sep='\t')
+
+
+    return formatTemplates[ outputFormat ].copy()
+
+
+##########################################
+
+
+##########################################
+# Sorted keys of the chromosomes and positions in the
+# DNA file template of outputFormat, from the reference
+# panel. Chromosomes are coded as in the panel
+
+def loadTemplateKeys( outputFormat: str ) -> tuple:
+
+    if outputFormat not in formatTemplateKeys:
+        panel, metadata = loadReferencePanel()
+        keys = np.array( [], dtype=np.int64 )
+        if outputFormat in metadata[ 'formats' ]:
+            # The panel is sorted and has one row per position and format
+            keys = getPanelKeys( panel[ ( panel[ 'formats' ] >> metadata[ 'formats' ].index( outputFormat ) ) & 1 == 1 ] )
+        formatTemplateKeys[ outputFormat ] = ( metadata[ 'chromosomes' ], keys )
+
+
+    return formatTemplateKeys[ outputFormat ]
+
+
+##########################################
+
+
+##########################################
+# Keep only the rows on chromosomes and positions in
+# the DNA file template of outputFormat. These are
+# the only rows restoreOriginalPositions keeps, and
+# duplicates are dropped per position, so filtering
+# the kits first gives the same converted superkit
+
+def selectTemplatePositions( df: pd.DataFrame, outputFormat: str ) -> pd.DataFrame:
+
+    chromosomes, keys = loadTemplateKeys( outputFormat )
+    if len( keys ) == 0:
+        return df.iloc[ :0 ]
+
+    chromosome = pd.Categorical( df[ 'chromosome' ], categories=chromosomes ).codes
+    rowKeys = chromosome.astype( np.int64 ) * 2**40 + df[ 'position' ].to_numpy( dtype=np.int64 )
+    index = np.minimum( np.searchsorted( keys, rowKeys ), len( keys ) - 1 )
+    keep = ( chromosome >= 0 ) & ( keys[ index ] == rowKeys )
+
+
+    return df[ keep ]
+
+
+##########################################
+
+
+##########################################
+# Restore original output rsid, chromosome
+# and position, based on outputFormat
+
+def restoreOriginalPositions( df: pd.DataFrame, outputFormat: str ) -> pd.DataFrame:
+
+    # Load the data file
+    df_original = loadFormatTemplate( outputFormat )
+
+    # Add dummy genotype
+    df_original['genotype'] = '--'
+    
+    # Set all columns as strings
+    df_original = df_original.astype( {'rsid': str, 'chromosome': str, 'position': int, 'genotype': str} )
+
+    # Merge the two dataframes on chromosome and position
+    df_merged = pd.merge(df_original, df[['chromosome', 'position', 'genotype']], on=['chromosome', 'position'], how='left')
+
+    # Replace NaN values in genotype with the original values
+    df_merged['genotype'] = df_merged['genotype_y'].fillna(df_merged['genotype_x'])
+
+    # Drop unnecessary columns and rename columns to original format
+    df_merged.drop(['genotype_x', 'genotype_y'], axis=1, inplace=True)
+    df_merged = df_merged.reindex(columns=['rsid', 'chromosome', 'position', 'genotype'])
+
+
+    return df_merged
+
+##########################################
+
+
+##########################################
+# prepare database for company specific
+# output format
+
+def formatDNAFile( df: pd.DataFrame, company: str, chromosomeZero: pd.DataFrame = None ) -> pd.DataFrame:
+
+    # 23andMe v5
+    if company == '23andMe v5':
+
+######### DROP UNUSED CHROMOSOMES #########
+        # Drop chromosomes that arent used
+        df = df.drop( df[ df[ 'chromosome' ] == '0' ].index )
+        df = df.drop( df[ df[ 'chromosome' ] == 'XY' ].index )
+
+######### NORMALIZE #########
+       # Replace genotypes
+        df[ 'genotype' ].replace( to_replace=genotypeTable23andMe, inplace=True )
+
+######### SORTING #########
+        # Custom sorting order on chromosome column.
+        df[ 'chromosome' ] = pd.Categorical( df[ 'chromosome' ], chromosomePriorityList23andMe )
+        # Sort frame based on custom sorting orders and position
+        df.sort_values( [ 'chromosome', 'position' ], ascending=( True, True ), inplace=True )
+
+######### RENAME COLUMNS #########
+        # Rename columns
+        df.rename( columns = { 'rsid':'# rsid' }, inplace = True )
+
+
+
+    # AncestryDNA v2
+    elif company == 'AncestryDNA v2':
+
+######### DROP UNUSED CHROMOSOMES #########
+        # Drop chromosomes that arent used
+        df = df.drop( df[ df[ 'chromosome' ] == '0' ].index )
+
+######### NORMALIZE #########
+        # Normalize chromosome order with custom chromosomeTable
+        df[ 'chromosome' ].replace( to_replace=chromosomeTableAncestryOut, inplace=True )
+        # Changed nocalls from -- to 00
+        df[ 'genotype' ].replace( to_replace=genotypeTableAncestry, inplace=True )
+
+######### SORTING #########
+        # Custom sorting order on chromosome column.
+        df[ 'chromosome' ] = pd.Categorical( df[ 'chromosome' ], chromosomePriorityListAncestry )
+        # Sort frame based on custom sorting orders and position
         df.sort_values( [ 'chromosome', 'position', ], ascending=( True, True ), inplace=True )
 
 ######### ALLELES #########
@@ -855,7 +1521,7 @@ def formatDNAFile( df: pd.DataFrame, company: str ) -> pd.DataFrame:
     elif company == 'FamilyTreeDNA v3':
 
 ######### ADD CHROMOSOME 0 #########
-        # Concat dataframe with previously dropped chromosome 0
+        # Concat dataframe with previously dropped chromosome 0 (FamilyTreeDNA v3)
         df = pd.concat( [df, chromosomeZero] , sort=False, ignore_index=True)
 
 ######### DROP UNUSED CHROMOSOMES #########
@@ -963,11 +1629,59 @@ def formatDNAFile( df: pd.DataFrame, company: str ) -> pd.DataFrame:
 
 
 
+    # VCF v4
+    elif company == 'VCF v4':
+
+######### DROP UNUSED CHROMOSOMES #########
+        # Drop chromosomes that arent used
+        df = df.drop( df[ df[ 'chromosome' ] == '0' ].index )
+
+######### SORTING #########
+        # Custom sorting order on chromosome column.
+        df[ 'chromosome' ] = pd.Categorical( df[ 'chromosome' ], chromosomePriorityList )
+        # Sort frame based on custom sorting orders and position
+        df = df.sort_values( [ 'chromosome', 'position' ], ascending=( True, True ) )
+
+######### REF, ALT AND GT #########
+        # Look up REF, ALT and GT once per unique genotype and reference alleles, and take them by code
+        reference, alternative = getReferenceAlleles( df[ 'chromosome' ].cat.codes.to_numpy(), df[ 'position' ].to_numpy() )
+        codes, uniques = pd.MultiIndex.from_arrays( [ df[ 'genotype' ].fillna( '--' ).to_numpy(), reference, alternative ] ).factorize()
+        alleles = pd.DataFrame( [ getVCFAlleles( *u ) for u in uniques ], columns=[ 'REF', 'ALT', 'GT' ], dtype=object )
+        ref, alt, gt = [ alleles[ column ].to_numpy()[ codes ] for column in [ 'REF', 'ALT', 'GT' ] ]
+
+        df = pd.DataFrame( {
+            '#CHROM': df[ 'chromosome' ].astype( str ).to_numpy(),
+            'POS': df[ 'position' ].to_numpy(),
+            'ID': df[ 'rsid' ].to_numpy(),
+            'REF': ref,
+            'ALT': alt,
+            'QUAL': '.',
+            'FILTER': '.',
+            'INFO': '.',
+            'FORMAT': 'GT',
+            sampleId or outputFileName: gt
+        } )
+
+
+    # PLINK
+    elif company == 'PLINK':
+
+######### DROP UNUSED CHROMOSOMES #########
+        # Drop chromosomes that arent used
+        df = df.drop( df[ df[ 'chromosome' ] == '0' ].index )
+
+######### SORTING #########
+        # Custom sorting order on chromosome column.
+        df[ 'chromosome' ] = pd.Categorical( df[ 'chromosome' ], chromosomePriorityList )
+        # Sort frame based on custom sorting orders and position
+        df = df.sort_values( [ 'chromosome', 'position' ], ascending=( True, True ) )
+
+
     # SuperKit format
     elif company == 'SuperKit':
 
 ######### ADD CHROMOSOME 0 #########
-        # Concat dataframe with previously dropped chromosome 0
+        # Concat dataframe with previously dropped chromosome 0 (FamilyTreeDNA v3)
         df = pd.concat( [df, chromosomeZero] , sort=False, ignore_index=True)
 
 ######### SORTING #########
@@ -983,15 +1697,16 @@ def formatDNAFile( df: pd.DataFrame, company: str ) -> pd.DataFrame:
 
 
 ##########################################
-# Adds comments on top of the DNA file
-# that mimics the original comments of the output format
+# Get the comments that mimics the original
+# comments of the output format, and the line
+# terminator they are written with
 
-def addCommentsToFile( tmpFileName: str, outputFormat: str):
+def getFileComments( outputFormat: str ) -> tuple:
 
-    ### ADD COMMENTS
-    print()
-    print("Add comments to file")
-    # Add comments to file
+    data = ''
+    newline = '\n'
+
+    # Comments for the output format
     if outputFormat == '23andMe v5':
         # Get current time
         now = datetime.datetime.utcnow().strftime('%a %b %d %H:%M:%S %Y')
@@ -1023,13 +1738,8 @@ def addCommentsToFile( tmpFileName: str, outputFormat: str):
             "#\n"
         )
 
-        # Read the existing contents of the file
-        with open(tmpFileName, "r") as f:
-            existing_data = f.read()
-
-        # Write the new data followed by the original contents
-        with open(tmpFileName, "w", newline="\r\n") as f:
-            f.write(data + existing_data)
+        # Line terminator of the format
+        newline = "\r\n"
 
 
     elif outputFormat == 'AncestryDNA v2':
@@ -1058,13 +1768,8 @@ def addCommentsToFile( tmpFileName: str, outputFormat: str):
             "#on the forward (+) strand with respect to the human reference.\n"
         )
 
-        # Read the existing contents of the file
-        with open(tmpFileName, "r") as f:
-            existing_data = f.read()
-
-        # Write the new data followed by the original contents
-        with open(tmpFileName, "w", newline="\r\n") as f:
-            f.write(data + existing_data)
+        # Line terminator of the format
+        newline = "\r\n"
 
 
     elif outputFormat == 'LivingDNA v1.0.2':
@@ -1098,13 +1803,8 @@ def addCommentsToFile( tmpFileName: str, outputFormat: str):
             "#\n"
         )
 
-        # Read the existing contents of the file
-        with open(tmpFileName, "r") as f:
-            existing_data = f.read()
-
-        # Write the new data followed by the original contents
-        with open(tmpFileName, "w", newline="\n") as f:
-            f.write(data + existing_data)
+        # Line terminator of the format
+        newline = "\n"
 
 
     elif outputFormat == 'MyHeritage v1':
@@ -1121,14 +1821,8 @@ def addCommentsToFile( tmpFileName: str, outputFormat: str):
 #            "RSID,CHROMOSOME,POSITION,RESULT\n"
         )
 
-        # Read the existing contents of the file
-        with open(tmpFileName, "r") as f:
-            existing_data = f.read()
-
-        # Write the new data followed by the original contents
-        #with open(tmpFileName, "w", newline="\r\n") as f:
-        with open(tmpFileName, "w", newline="\n") as f:
-            f.write(data + existing_data)
+        # Line terminator of the format
+        newline = "\n"
 
 
     elif outputFormat == 'MyHeritage v2':
@@ -1152,407 +1846,1069 @@ def addCommentsToFile( tmpFileName: str, outputFormat: str):
 #            "RSID,CHROMOSOME,POSITION,RESULT\n"
         )
 
-        # Read the existing contents of the file
-        with open(tmpFileName, "r") as f:
-            existing_data = f.read()
+        # Line terminator of the format
+        newline = "\n"
 
-        # Write the new data followed by the original contents
-        with open(tmpFileName, "w", newline="\n") as f:
-            f.write(data + existing_data)
 
+    return data, newline
 
-    return
 
-
-####################################################################################
-####################################################################################
+##########################################
 
 
+##########################################
+# Get unique chromosomes and genotypes of
+# a formatted DNA file
 
-####################################################################################
-# MAIN LOOP
-####################################################################################
+def getUniqueChromosomesAndGenotypes( df: pd.DataFrame, outputFormat: str ) -> tuple:
 
-# Get the start time
-start_time = time.time()
+    if outputFormat == 'AncestryDNA v2':
+        superkitUniqueChromosomes = df.chromosome.unique().tolist()
+        # Merge allele1 and allele2 to genotype
+        superkitUniqueGenotypes = ( df[ 'allele1' ] + df[ 'allele2' ] ).unique().tolist()
 
-# Find files in dir with the correct file endings
-rawDNAFiles = findDNAFiles( fileEndings )
+    elif outputFormat == 'FamilyTreeDNA v3' or outputFormat == 'MyHeritage v1' or outputFormat == 'MyHeritage v2':
+        superkitUniqueChromosomes = df.CHROMOSOME.unique().tolist()
+        superkitUniqueGenotypes = df.RESULT.unique().tolist()
 
-# Check if there are any files in the directory
-if not rawDNAFiles:
-    print()
-    print ("There is no files in the directory")
-    exit()
+    elif outputFormat == 'VCF v4':
+        superkitUniqueChromosomes = df[ '#CHROM' ].unique().tolist()
+        superkitUniqueGenotypes = df[ sampleId or outputFileName ].unique().tolist()
 
+    else:
+        superkitUniqueChromosomes = df.chromosome.unique().tolist()
+        superkitUniqueGenotypes = df.genotype.unique().tolist()
 
-########################
-# Preparing and cleaning DNA files
 
-# empty array to put results in
-resultFiles = []
-chromosomeZero = pd.DataFrame()
-DNACount = 0
+    return superkitUniqueChromosomes, superkitUniqueGenotypes
 
 
 ##########################################
-# Look for files and process them
 
 
-for file in rawDNAFiles:
+##########################################
+# Open the output DNA file as a text stream. Depending on
+# --outputCompression and --stdout it is a plain file, a gzip
+# file or the only member of a zip archive, on disk or on stdout.
+# Rows are compressed as they are written, with no plain file in between
+
+@contextlib.contextmanager
+def openOutputFile( tmpFileName: str, encoding: str ):
+
+    with contextlib.ExitStack() as stack:
+
+        # Plain file or stdout
+        if outputStdout:
+            target = outputStream
+        else:
+            target = stack.enter_context( open( tmpFileName, 'wb' ) )
+
+        # Compression
+        if outputCompression == 'gzip':
+            target = stack.enter_context( gzip.GzipFile( filename=os.path.basename( tmpFileName[ :-3 ] ), mode='wb', fileobj=target, compresslevel=compressionLevel ) )
+        elif outputCompression == 'zip':
+            archive = stack.enter_context( zipfile.ZipFile( target, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=compressionLevel ) )
+            target = stack.enter_context( archive.open( os.path.basename( tmpFileName[ :-4 ] ), 'w' ) )
+
+        # Text on top, line terminators are written as they are
+        f = io.TextIOWrapper( target, encoding=encoding, newline='' )
+        try:
+            yield f
+        finally:
+            f.flush()
+            f.detach()
 
-#    print( type(file) )
 
-    # Screening file to determine company
-    fileScreening = prescreenDNAFile( file )
+##########################################
 
-    # Get DNA company from file comment
-    company = determineDNACompany( fileScreening , file)
 
-    if company != 'unknown':
+##########################################
+# Pass the formatted chunks on, adding the unique
+# chromosomes and genotypes of every chunk to
+# uniqueChromosomes and uniqueGenotypes
 
-        DNACount = DNACount + 1
+def countUniqueChromosomesAndGenotypes( chunks, outputFormat: str, uniqueChromosomes: list, uniqueGenotypes: list ):
 
-        # Load the DNA file into pandas and get columns
-        df = loadDNAFile( file, company )
-        # Normalize the DNA file
-        df = normalizeDNAFile( df, company )
-        # Guess gender in kit
-        guessGender = guessGenderFromDataframe( df, company )
+    for df in chunks:
+        chunkChromosomes, chunkGenotypes = getUniqueChromosomesAndGenotypes( df, outputFormat )
+        uniqueChromosomes += [ c for c in chunkChromosomes if c not in uniqueChromosomes ]
+        uniqueGenotypes += [ g for g in chunkGenotypes if g not in uniqueGenotypes ]
+        yield df
 
 
-        # Normalize genotypes on X and Y (MT?) chromosomes where heterozygous calls are defined as nocalls '--'
-        # (as males only have one X and one Y), and the rest are changed to a single letter
-        #
-        # Add commandline to bypass this check to handle mutations?
-        ##### HANDLE D/I calls? #####
-        if guessGender == 'Male':
-            rep = df[ 'genotype' ].replace( genotypeTableXYMales )
-            df[ 'genotype' ] = df[ 'genotype' ].mask( df[ 'chromosome' ].isin( [ 'X','Y', 'MT' ] ), rep )
+##########################################
 
-        # Workaround to keep Chromosome 0 (nocalls? bad data?)
-        if company == 'FamilyTreeDNA v3':
-            chromosomeZero = df.loc[ df[ 'chromosome' ] == '0' ]
-            del chromosomeZero[ 'company' ]
 
-        # Clean dataframe
-        df = cleanDNAFile( df, company, guessGender )
+##########################################
+# Write formatted chunks to the output file. Comments
+# and the MyHeritage header are written before the rows,
+# all in one pass. A DNA file in memory is a single chunk
 
-        # Concatenate DNA data
-        resultFiles.append( df )
+def writeDNAFileChunks( tmpFileName: str, chunks, outputFormat: str, addComments: bool ) -> tuple:
 
-        # Presenting results
-        print()
-        print( '######################################################################')
-        print( "#")
-        print( f"# Testcompany:            {company}" )
-        print( "#" )
-        print( f"# File:                   {file.replace( inputFileDir, '' )}")
-        print( f"# SNPs tested in kit:     {len(df)}")
-        print( f"# Assumed gender in kit:  {guessGender}" )
-        print( "#")
-        print( '######################################################################')
-        print()
-        print( f"Chromosomes: {df.chromosome.unique().tolist()}" )
-        print()
+    superkitUniqueChromosomes = []
+    superkitUniqueGenotypes = []
+    chunks = countUniqueChromosomesAndGenotypes( chunks, outputFormat, superkitUniqueChromosomes, superkitUniqueGenotypes )
 
-    # If file is unknown
-    else:
-        print()
-        print( '######################################################################')
-        print( "#")
-        print( f"# Testcompany:            {company}" )
-        print( "#" )
-        print( f"# File:                   {file.replace( inputFileDir, '' )}")
-        print( "#")
-        print( '######################################################################')
-        print()
+    # VCF v4 is written block-gzip compressed, with an index
+    if outputFormat == 'VCF v4':
+        writeVCFFileChunks( tmpFileName, chunks, outputFileName, sampleId or outputFileName, compressionLevel, outputStream if outputStdout else None )
+        return superkitUniqueChromosomes, superkitUniqueGenotypes
 
+    # PLINK is a binary fileset
+    if outputFormat == 'PLINK':
+        writePLINKFileChunks( tmpFileName, chunks, formats[ 'PLINK' ], sampleId or outputFileName, superkitGender, plinkAppend )
+        return superkitUniqueChromosomes, superkitUniqueGenotypes
 
-# Check if there are objects in DNASuperKit
-# if not, then quit script
-if not resultFiles:
-    print ("No compatible files has been found")
+    options = dict( formats[ outputFormat ] )
+    encoding = options.pop( 'encoding' )
+    header = options.pop( 'header', True )
 
-    exit()
+    with openOutputFile( tmpFileName, encoding ) as f:
 
+        # Comments that mimics the original comments of the output format
+        if addComments:
+            data, newline = getFileComments( outputFormat )
+            f.write( data.replace( '\n', newline ) )
 
-##########################################
-##########################################
+        # Special case for MyHeritage
+        if outputFormat == 'MyHeritage v1' or outputFormat == 'MyHeritage v2':
+            f.write( "RSID,CHROMOSOME,POSITION,RESULT\n" )
 
+        # Rows are formatted while the rows before are compressed and written
+        if pipeline:
+            asyncio.run( writeDNAFileChunksPipelined( f, chunks, options, header ) )
 
-########################
-# Concatenate and remove duplicates
+        else:
+            for df in chunks:
+                df.to_csv( f, index=None, header=header, **options )
+                header = False
 
-print()
-print( '######################################################################' )
-print( "#" )
-print( "# Concatenating files, sorting list and dropping duplicates" )
-print( "#" )
-print( '######################################################################' )
 
+    return superkitUniqueChromosomes, superkitUniqueGenotypes
 
-print()
-print( f"# Concatenating {DNACount} DNA files" )
-print()
 
-# Concatenate all DNA files into one list
-DNASuperKit = pd.concat(resultFiles, sort=False, ignore_index=True)
-# Delete unnecessary
-del df
-print( "DONE!" )
-print()
+####################################################################################
+####################################################################################
 
 
-print()
-print( "Sorting resulting dataframe" )
-print()
+####################################################################################
+# OUT-OF-CORE FUNCTIONS (--memoryLimit)
+####################################################################################
 
-# Sort DNA according to order provided in customization
-DNASuperKit = sortDNAFile( DNASuperKit )
-print( "DONE!" )
-print()
+# The DNA files are spilled as sorted runs of records and merged in blocks with the
+# records and runs of superkit_outofcore.py, and the merged superkit is formatted
+# chromosome by chromosome from its spilled records.
 
+##########################################
+# Normalize, clean and sort a DNA file in chunks
+# and spill each chunk as a sorted run
 
-print()
-print( 'Dropping duplicates' )
-print()
+def spillDNAFile( file: str, company: str, fileIndex: int, spill: dict ) -> tuple:
 
-# Drop duplicates
-DNASuperKit = dropDuplicatesDNAFile( DNASuperKit )
-print( "DONE!" )
-print()
+    sexStatistics = { 'callsX': 0, 'heterozygousX': 0, 'rowsY': 0, 'callsY': 0 }
+    harmonizeStatistics = {}
+    liftoverStatistics = {}
+    kitLength = 0
+    kitChromosomes = []
+    chromosomeZero = []
 
+    for df in normalizeDNAFileChunks( loadDNAFile( file, company, chunksize=spill[ 'chunkRows' ], engine='c' ), company, liftoverStatistics ):
+        accumulateSexStatistics( df, sexStatistics )
 
-# Count SNPs per included per company
-companySNPCounts = []
+        # The gender is not known until the whole file is read, so X/Y/MT rows
+        # are marked and converted for males when the runs are merged
+        df[ 'sexChromosome' ] = df[ 'chromosome' ].isin( [ 'X','Y', 'MT' ] )
 
-for f in companyPriorityList:
-    companySNPCount = DNASuperKit['company'].value_counts()[f].astype(str)
-    companySNPCounts.append(f + ': ' + companySNPCount)
+        # Workaround to keep Chromosome 0 (nocalls? bad data?)
+        if company == 'FamilyTreeDNA v3':
+            chromosomeZero.append( df.loc[ df[ 'chromosome' ] == '0', [ 'rsid', 'chromosome', 'position', 'genotype' ] ] )
 
+        # Clean and sort chunk, within a position rows keep their file order
+        df = cleanDNAFile( df, company, None, harmonizeStatistics )
+        kitLength += len( df )
+        kitChromosomes += [ c for c in df[ 'chromosome' ].unique().tolist() if c not in kitChromosomes ]
 
-# Delete 'company' column
-del DNASuperKit[ 'company' ]
+        # Only rows in the template of the output format are merged (--convertFormat)
+        if spill[ 'templateFilter' ]:
+            df = selectTemplatePositions( df, spill[ 'templateFilter' ] )
 
-########################
+        records = encodeRecords( df, companyPriorityList, fileIndex, spill[ 'rows' ], df[ 'sexChromosome' ].to_numpy() )
+        records = records[ np.lexsort( ( records[ 'order' ], records[ 'position' ], records[ 'chromosome' ] ) ) ]
 
+        # Spill run to file
+        path = os.path.join( spill[ 'directory' ].name, f"run{len( spill[ 'runs' ] )}.bin" )
+        spill[ 'runs' ].append( [ writeSegment( path, records ) ] )
+        spill[ 'rows' ] += len( df )
 
-########################
-#Format dataframe to a specific company format
+    if chromosomeZero:
+        chromosomeZero = pd.concat( chromosomeZero )
+    else:
+        chromosomeZero = pd.DataFrame()
 
-print()
-print( '######################################################################' )
-print( "#" )
-print( "# Formatting, trimming and saving data" )
-print( "#" )
-print( '######################################################################' )
+    if liftover:
+        printLiftoverStatistics( file.replace( inputFileDir, '' ), liftoverStatistics )
+    if harmonize:
+        printHarmonizeStatistics( file.replace( inputFileDir, '' ), harmonizeStatistics, harmonizeDrop )
 
 
-#if outputFormat != 'SuperKit':
-    ##### DONT FORGET TO MAKE CONVERSION OPTIONAL! #####
-if outputFormat != 'SuperKit' and convertFormat == True:
+    return sexStatistics, kitLength, kitChromosomes, chromosomeZero
+
+
+##########################################
+
+
+##########################################
+# Merge the spilled runs, drop duplicates and
+# spill the superkit per chromosome
+
+def mergeDNARuns( spill: dict ) -> tuple:
+
+    store = { 'directory': spill[ 'directory' ], 'chromosomes': {}, 'rows': 0, 'chunkRows': spill[ 'chunkRows' ] }
+    companyCounts = {}
+
+    for df in mergeDNABlocks( spill ):
+        df = dropDuplicatesDNAFile( df, verbose=False, concordanceReport=spill[ 'concordanceReport' ], consensusSidecar=spill[ 'consensusSidecar' ] )
+
+        # Count SNPs per company, the company is kept for the superkit store
+        for company, count in df[ 'company' ].value_counts().items():
+            companyCounts[ company ] = companyCounts.get( company, 0 ) + int( count )
+
+        spillSuperKitRecords( store, encodeRecords( df, companyPriorityList ) )
+
+
+    return store, companyCounts
+
+
+##########################################
+
+
+##########################################
+# Merge the spilled runs in sorted blocks that
+# holds every row of the positions in them
+
+def mergeDNABlocks( spill: dict ):
+
+    maleFiles = np.array( spill[ 'maleFiles' ], dtype=bool )
+
+    # Share the rows held in memory between all runs
+    blockRows = max( 1000, spill[ 'mergeRows' ] // max( 1, len( spill[ 'runs' ] ) ) )
+
+    for records in mergeRuns( spill[ 'runs' ], blockRows, getRecordKeys ):
+
+        # Same order as sortDNAFile on all files concatenated
+        records = records[ np.lexsort( ( records[ 'order' ], records[ 'company' ], records[ 'position' ], records[ 'chromosome' ] ) ) ]
+        df = decodeRecords( records, companyPriorityList, maleFiles )
+        yield sortDNAFile( df )
+
+
+##########################################
+
+
+##########################################
+# Chromosome order of an output format, as
+# indexes in chromosomePriorityList
+
+def getOutputChromosomeOrder( outputFormat: str ) -> list:
+
+    formatPriorityLists = {
+        '23andMe v5': chromosomePriorityList23andMe,
+        'AncestryDNA v2': [ chromosomeTableAncestryIn.get( c, c ) for c in chromosomePriorityListAncestry ],
+        'FamilyTreeDNA v3': chromosomePriorityListFamilyTreeDNA,
+        'LivingDNA v1.0.2': chromosomePriorityListLivingDNA,
+        'MyHeritage v1': chromosomePriorityListMyHeritage,
+        'MyHeritage v2': chromosomePriorityListMyHeritage,
+        # tellmeGen v4 sorts chromosome names as text
+        'tellmeGen v4': sorted( chromosomePriorityList ),
+        'SuperKit': chromosomePriorityList,
+        'VCF v4': chromosomePriorityList,
+        'PLINK': chromosomePriorityList
+    }
+
+    # Unknown chromosomes (NaN) are sorted last in every format
+    return [ chromosomePriorityList.index( c ) for c in formatPriorityLists[ outputFormat ] ] + [ len( chromosomePriorityList ) ]
+
+
+##########################################
+
+
+##########################################
+# Format the spilled superkit chromosome by
+# chromosome to the output format
+
+def formatSuperKitChunks( store: dict, outputFormat: str, chromosomeZero: pd.DataFrame ):
+
+    for chromosome in getOutputChromosomeOrder( outputFormat ):
+        segments = store[ 'chromosomes' ].get( chromosome, [] )
+
+        # Chromosome 0 is formatted in one go, together with chromosome 0 of FamilyTreeDNA v3
+        if chromosome == 0:
+            if not segments and outputFormat not in [ 'SuperKit', 'FamilyTreeDNA v3' ]:
+                continue
+            chunks = [ concatenateRecords( list( readSegments( segments, store[ 'chunkRows' ] ) ) ) ]
+        elif outputFormat == 'tellmeGen v4':
+            chunks = readSegmentsAsText( store, chromosome, segments, store[ 'chunkRows' ] )
+        else:
+            chunks = readSegments( segments, store[ 'chunkRows' ] )
+
+        for records in chunks:
+            df = decodeRecords( records, companyPriorityList )[ [ 'rsid', 'chromosome', 'position', 'genotype' ] ]
+            if chromosome == 0:
+                yield formatDNAFile( df, outputFormat, chromosomeZero )
+            else:
+                yield formatDNAFile( df, outputFormat, pd.DataFrame() )
+
+
+##########################################
+
+
+####################################################################################
+####################################################################################
+
+
+####################################################################################
+# REFERENCE PANEL FUNCTIONS
+####################################################################################
+
+# The DNA file templates in ./data/ overlap a lot (23andMe v5 and MyHeritage v2 are both
+# the GSA chip), so they are compiled into one reference panel, ./data/reference-panel.npy,
+# with the union of their SNPs sorted on chromosome and position. Every row has a bitmask
+# of the templates that have it. A row is a chromosome, position and rsid, so where the
+# templates disagree on the rsid of a position there is a row per rsid. Chromosomes are
+# coded as they are named in the templates, so where a format places a SNP differently
+# (AncestryDNA v2 names X 23, FamilyTreeDNA v3 has SNPs on XY that others have on X)
+# the rows stay apart. The normalized chromosome is kept next to it for comparisons across
+# formats. The panel and its metadata (reference-panel.json, the formats of the bits, the
+# chromosome names and the time stamps of the templates) are compiled when the panel is
+# first needed and again when a template has changed. The panel is memory-mapped, and
+# the positions to keep of VCF files and of --convertFormat are read from it. The rows and
+# the row order of a converted DNA file are still those of its template.
+
+
+##########################################
+# Record layout of the reference panel,
+# rsid width varies between panels
+
+def getPanelDtype( rsidWidth: int ) -> np.dtype:
+
+    return np.dtype( [
+        ( 'chromosome', 'i1' ),               # Index in the chromosomes of the panel metadata, as named in the templates
+        ( 'normalizedChromosome', 'i1' ),     # Index in chromosomePriorityList, -1 if not in it
+        ( 'position', 'i8' ),
+        ( 'formats', 'u4' ),                  # Bit i is set if the row is in the template of format i of the panel metadata
+        ( 'rsid', f'S{max( rsidWidth, 1 )}' )
+    ] )
+
+
+##########################################
+
+
+##########################################
+# Sort keys of panel rows, chromosome and
+# position as one integer
+
+def getPanelKeys( panel: np.ndarray ) -> np.ndarray:
+
+    return panel[ 'chromosome' ].astype( np.int64 ) * 2**40 + panel[ 'position' ]
+
+
+##########################################
+
+
+##########################################
+# Compile the reference panel from the DNA file
+# templates. Returns the panel and its metadata
+
+def buildReferencePanel( templates: list ) -> tuple:
+
+    frames = []
+    for i, t in enumerate( templates ):
+        df = loadFormatTemplate( t )[ [ 'rsid', 'chromosome', 'position' ] ]
+        df[ 'formats' ] = np.uint32( 1 << i )
+        # The first row of a position in a template, as when the template is merged on
+        frames.append( df.drop_duplicates( subset=[ 'chromosome', 'position' ] ) )
+
+    df = pd.concat( frames, ignore_index=True ) if frames else pd.DataFrame( columns=[ 'rsid', 'chromosome', 'position', 'formats' ] )
+    df[ 'position' ] = df[ 'position' ].astype( np.int64 )
+    df[ 'rsid' ] = df[ 'rsid' ].fillna( '' )
+
+    # Chromosomes in the order of chromosomePriorityList, other names after it
+    chromosomes = chromosomePriorityList + sorted( set( df[ 'chromosome' ] ) - set( chromosomePriorityList ) )
+    df[ 'chromosome' ] = pd.Categorical( df[ 'chromosome' ], categories=chromosomes ).codes
+
+    # One row per chromosome, position and rsid with the bits of its templates
+    df = df.groupby( [ 'chromosome', 'position', 'rsid' ], sort=True )[ 'formats' ].sum().reset_index()
+
+    rsid = df[ 'rsid' ].str.encode( 'utf-8' ).to_numpy().astype( 'S' )
+    panel = np.zeros( len( df ), dtype=getPanelDtype( rsid.dtype.itemsize ) )
+    panel[ 'chromosome' ] = df[ 'chromosome' ].to_numpy()
+    normalized = [ chromosomeTableAncestryIn.get( c, c ) for c in chromosomes ]
+    panel[ 'normalizedChromosome' ] = np.array( [ chromosomePriorityList.index( c ) if c in chromosomePriorityList else -1 for c in normalized ], dtype=np.int8 )[ panel[ 'chromosome' ] ]
+    panel[ 'position' ] = df[ 'position' ].to_numpy()
+    panel[ 'formats' ] = df[ 'formats' ].to_numpy()
+    panel[ 'rsid' ] = rsid
+
+
+    return panel, { 'formats': templates, 'chromosomes': chromosomes }
+
+
+##########################################
+
+
+##########################################
+# Load the memory-mapped reference panel, and compile
+# it first if a template is new or has changed.
+# Returns the panel and its metadata
+
+def loadReferencePanel() -> tuple:
+
+    if referencePanel:
+        return referencePanel[ 'panel' ], referencePanel[ 'metadata' ]
+
+    # Templates of the output formats, not the duplicates saved by analyse_dna_file.py -sd
+    templates = []
+    if os.path.isdir( './data/' ):
+        templates = sorted( f[ :-3 ] for f in os.listdir( './data/' ) if f.endswith( '.df' ) and f[ :-3 ] in allowed_outputFormats )
+    stamps = { t: os.stat( './data/' + t + '.df' ).st_mtime_ns for t in templates }
+    metadataFile = referencePanelFile[ :-len( '.npy' ) ] + '.json'
+
+    metadata = None
+    if os.path.exists( referencePanelFile ) and os.path.exists( metadataFile ):
+        with open( metadataFile ) as f:
+            metadata = json.load( f )
+
+    if metadata is not None and metadata.get( 'stamps' ) == stamps:
+        panel = np.load( referencePanelFile, mmap_mode='r' )
+
+    else:
+        panel, metadata = buildReferencePanel( templates )
+        metadata[ 'stamps' ] = stamps
+
+        # Saved next to the templates, replaced in one step as other processes may read it.
+        # Without write access to ./data/ the panel is only kept in memory
+        try:
+            np.save( f'{referencePanelFile}.{os.getpid()}.tmp.npy', panel )
+            os.replace( f'{referencePanelFile}.{os.getpid()}.tmp.npy', referencePanelFile )
+            with open( f'{metadataFile}.{os.getpid()}.tmp', 'w' ) as f:
+                json.dump( metadata, f )
+            os.replace( f'{metadataFile}.{os.getpid()}.tmp', metadataFile )
+        except OSError:
+            pass
+
+    referencePanel.update( { 'panel': panel, 'metadata': metadata } )
+
+
+    return panel, metadata
+
+
+##########################################
+
+
+####################################################################################
+####################################################################################
+
+
+####################################################################################
+# SERVICE FUNCTIONS (--serve)
+####################################################################################
+
+# The conversion service is in superkit_service.py. Its workers build a superkit for
+# every job with buildServiceJob, with the settings of the job as the options of this
+# script for that build only.
+
+
+##########################################
+# Use the settings of a job as the options of the
+# script while building, and put the options of the
+# worker back afterwards, also when the build fails
+
+@contextlib.contextmanager
+def serviceJobSettings( settings: dict ):
+
+    previous = { name: globals()[ name ] for name in settings }
+    try:
+        globals().update( settings )
+        yield
+    finally:
+        globals().update( previous )
+
+
+##########################################
+
+
+##########################################
+# Build a superkit with the settings of a job of
+# the service, with the company priority of its
+# output format
+
+def buildServiceJob( settings: dict ):
+
+    companies = company_priority_lists.get( settings[ 'outputFormat' ], defaultCompanyPriorityList )
+    with serviceJobSettings( dict( settings, companyPriorityList=companies ) ):
+        createSuperKit()
+
+
+##########################################
+
+
+##########################################
+# Load the DNA file templates of every output
+# format, and the template positions of VCF files
+# for every company priority
+
+def warmServiceWorker():
+
+    for f in allowed_outputFormats:
+        if os.path.exists( './data/' + f + '.df' ):
+            loadFormatTemplate( f )
+
+    for f in allowed_outputFormats:
+        with serviceJobSettings( { 'companyPriorityList': company_priority_lists.get( f, defaultCompanyPriorityList ) } ):
+            getTemplatePositions()
+
+
+##########################################
+
+
+####################################################################################
+####################################################################################
+
+
+####################################################################################
+# MAIN LOOP
+####################################################################################
+
+##########################################
+# Build the superkit from the DNA files in ./input/.
+# The kit cache keeps parsed kits between builds (--watch)
+
+def createSuperKit( kitCache: dict = None ):
+
+    # Gender of the superkit is used when writing PLINK filesets
+    global superkitGender
+
+    # Get the start time
+    start_time = time.time()
+
+    # Find files in dir with the correct file endings, a superkit from the store needs none
+    rawDNAFiles = [] if loadStore else findDNAFiles( inputFileDir, fileEndings )
+
+    # Kits already in the superkit store are not merged again
+    if update:
+        storeMetadata = openSuperKitStore( superkitStoreDir )[ 1 ]
+        rawDNAFiles = [ f for f in rawDNAFiles if f.replace( inputFileDir, '' ) not in storeMetadata[ 'kits' ] ]
+
+    # Forget cached kits that are no longer in the directory
+    if kitCache is not None:
+        for file in [ f for f in kitCache if f not in rawDNAFiles ]:
+            del kitCache[ file ]
+
+    # Check if there are any files in the directory
+    if not rawDNAFiles and not loadStore:
+        print()
+        print ("There is no files in the directory")
+        return
+
+    # Prepare the kits in worker processes, or read them ahead, into the kit cache where the loop below takes them from
+    if ingestJobs > 1:
+        kitCache = {} if kitCache is None else kitCache
+        prepareDNAFilesParallel( rawDNAFiles, kitCache, prepareDNAFile, ingestJobs, companyPriorityList )
+    elif pipeline and not memoryLimit:
+        kitCache = {} if kitCache is None else kitCache
+        asyncio.run( prepareDNAFilesPipelined( rawDNAFiles, kitCache, loadPreparedDNAFile ) )
+
+
+    ########################
+    # Preparing and cleaning DNA files
+
+    # empty array to put results in
+    resultFiles = []
+    chromosomeZero = loadStoreChromosomeZero( superkitStoreDir ) if update else pd.DataFrame()
+    DNACount = 0
+    kitFiles = []
+    kitGenders = []
+
+    # With --convertFormat, only the rows of the kits that are in the template of the output format
+    # can end up in the superkit. A superkit store keeps every row, for other formats and updates
+    templateFilter = None
+    if outputFormat not in [ 'SuperKit', 'VCF v4', 'PLINK' ] and convertFormat == True and not saveStore:
+        templateFilter = outputFormat
+
+    # Agreement of the companies, counted while dropping duplicates
+    concordanceReport = openConcordanceReport( concordanceOutputFile, conflictsOutputFile if conflicts else None, companyPriorityList ) if concordance else None
+    # How the genotype of every SNP was chosen, written while dropping duplicates
+    consensusSidecar = openConsensusSidecar( consensusOutputFile, consensusMetadataFile, companyPriorityList, majorityVote ) if consensus else None
+
+    # Out-of-core mode, sorted runs are spilled to a temporary directory
+    if memoryLimit:
+        spill = getOutOfCorePlan( memoryLimit )
+        spill.update( { 'directory': tempfile.TemporaryDirectory( prefix='DNASuperKit-' ), 'runs': [], 'rows': 0, 'maleFiles': [], 'templateFilter': templateFilter, 'concordanceReport': concordanceReport, 'consensusSidecar': consensusSidecar } )
+
+
+    ##########################################
+    # Look for files and process them
+
+
+    for file in rawDNAFiles:
+
+    #    print( type(file) )
+
+        # Screening file to determine company from file comment, cached between builds (--watch)
+        company = screenDNAFile( file, kitCache )
+
+        if company != 'unknown':
+
+            DNACount = DNACount + 1
+            kitFiles.append( file.replace( inputFileDir, '' ) )
+
+            if memoryLimit:
+                # Normalize, clean and spill the DNA file in chunks
+                sexStatistics, kitLength, kitChromosomes, kitChromosomeZero = spillDNAFile( file, company, DNACount - 1, spill )
+                # Guess gender in kit, X/Y/MT of males are normalized when the runs are merged
+                guessGender = guessGenderFromStatistics( sexStatistics )
+                spill[ 'maleFiles' ].append( guessGender == 'Male' )
+                kitGenders.append( guessGender )
+
+                # Workaround to keep Chromosome 0 (nocalls? bad data?)
+                if company == 'FamilyTreeDNA v3':
+                    chromosomeZero = kitChromosomeZero
+
+            else:
+                # Load, normalize and clean the DNA file, or take it from the cache of an earlier build (--watch)
+                df, guessGender, kitChromosomeZero = loadPreparedDNAFile( file, company, kitCache )
+                kitGenders.append( guessGender )
+
+                # Workaround to keep Chromosome 0 (nocalls? bad data?)
+                if company == 'FamilyTreeDNA v3':
+                    chromosomeZero = kitChromosomeZero
+
+                kitLength = len( df )
+                kitChromosomes = df.chromosome.unique().tolist()
+
+                # Only rows in the template of the output format are merged (--convertFormat)
+                if templateFilter:
+                    df = selectTemplatePositions( df, templateFilter )
+
+                # Concatenate DNA data
+                resultFiles.append( df )
+
+            # Presenting results
+            print()
+            print( '######################################################################')
+            print( "#")
+            print( f"# Testcompany:            {company}" )
+            print( "#" )
+            print( f"# File:                   {file.replace( inputFileDir, '' )}")
+            print( f"# SNPs tested in kit:     {kitLength}")
+            print( f"# Assumed gender in kit:  {guessGender}" )
+            print( "#")
+            print( '######################################################################')
+            print()
+            print( f"Chromosomes: {kitChromosomes}" )
+            print()
+
+        # If file is unknown
+        else:
+            print()
+            print( '######################################################################')
+            print( "#")
+            print( f"# Testcompany:            {company}" )
+            print( "#" )
+            print( f"# File:                   {file.replace( inputFileDir, '' )}")
+            print( "#")
+            print( '######################################################################')
+            print()
+
+
+    # A superkit from the store keeps the kits it was made from in its metadata
+    if loadStore:
+        storeMetadata = openSuperKitStore( superkitStoreDir )[ 1 ]
+        kitFiles = storeMetadata[ 'kits' ]
+        kitGenders = storeMetadata[ 'genders' ]
+        DNACount = len( kitFiles )
+
+    # Check if there are objects in DNASuperKit
+    # if not, then quit script
+    if DNACount == 0:
+        print ("No compatible files has been found")
+
+        return
+
+    # An updated superkit is made from the stored and the new kits
+    if update:
+        kitFiles = storeMetadata[ 'kits' ] + kitFiles
+        kitGenders = storeMetadata[ 'genders' ] + kitGenders
+
+    # Gender of the superkit, unknown if the kits disagree
+    knownGenders = set( kitGenders ) - { 'Unknown' }
+    superkitGender = knownGenders.pop() if len( knownGenders ) == 1 else 'Unknown'
+
+
+    ##########################################
+    ##########################################
+
+
+    ########################
+    # Concatenate and remove duplicates
 
     print()
-    print( f'Converting rsid and positions to {outputFormat} format' )
-    print()
+    print( '######################################################################' )
+    print( "#" )
+    print( "# Concatenating files, sorting list and dropping duplicates" )
+    print( "#" )
+    print( '######################################################################' )
+
+
+    # Metadata of the superkit store
+    storeMetadata = { 'kits': kitFiles, 'genders': kitGenders, 'majorityVote': majorityVote, 'companyPriorityList': companyPriorityList }
 
+    if memoryLimit and loadStore:
 
-##### HANDLE CHROMOSOME 0 in FamilyTreeDNA v3, if no chromosome 0 exist, add fake? #####
-##### does it update rsid?
-    # Restore original RSID and positions according to outputFormat
-    DNASuperKit = restoreOriginalPositions( DNASuperKit, outputFormat )
+        print()
+        print( f"# Loading the superkit of {DNACount} DNA files from {superkitStoreDir}" )
+        print()
+
+        # Spill the stored superkit per chromosome
+        superkitStore, companyCounts, chromosomeZero = spillSuperKitStore( superkitStoreDir, spill, companyPriorityList )
+        print( "DONE!" )
+        print()
+
+        # Count SNPs per included per company
+        companySNPCounts = [ f + ': ' + str( companyCounts.get( f, 0 ) ) for f in companyPriorityList ]
+
+    elif memoryLimit:
+
+        print()
+        print( f"# Merging {len( spill[ 'runs' ] )} sorted runs from {DNACount} DNA files and dropping duplicates" )
+        print()
+
+        # Merge runs, drop duplicates and spill the superkit per chromosome
+        superkitStore, companyCounts = mergeDNARuns( spill )
+        print( "DONE!" )
+        print()
+
+        # Count SNPs per included per company
+        companySNPCounts = [ f + ': ' + str( companyCounts.get( f, 0 ) ) for f in companyPriorityList ]
+
+        if saveStore:
+            print()
+            print( f'Saving superkit store to {superkitStoreDir}' )
+            print()
+
+            # Superkit in sort order, chromosome by chromosome, and the candidates from the runs merged again
+            storeChunks = ( decodeRecords( records, companyPriorityList ) for chromosome in sorted( superkitStore[ 'chromosomes' ] ) for records in readSegments( superkitStore[ 'chromosomes' ][ chromosome ], superkitStore[ 'chunkRows' ] ) )
+            candidateChunks = ( getSuperKitCandidates( df ) for df in mergeDNABlocks( spill ) )
+            writeSuperKitStore( superkitStoreDir, storeChunks, candidateChunks, chromosomeZero, storeMetadata, companyPriorityList )
+            print( "DONE!" )
+            print()
+
+    elif loadStore:
+
+        print()
+        print( f"# Loading the superkit of {DNACount} DNA files from {superkitStoreDir}" )
+        print()
+
+        # Load the memory-mapped superkit, already sorted and without duplicates
+        DNASuperKit, chromosomeZero = loadSuperKitStore( superkitStoreDir )
+        print( "DONE!" )
+        print()
+
+    else:
+
+        print()
+        print( f"# Concatenating {DNACount} DNA files" )
+        print()
+
+        # Concatenate all DNA files into one list
+        DNASuperKit = pd.concat(resultFiles, sort=False, ignore_index=True)
+        # Delete unnecessary
+        del df
+        print( "DONE!" )
+        print()
+
+
+        print()
+        print( "Sorting resulting dataframe" )
+        print()
+
+        # Sort DNA according to order provided in customization
+        DNASuperKit = sortDNAFile( DNASuperKit )
+        print( "DONE!" )
+        print()
+
+
+        print()
+        print( 'Merging the new DNA files with the superkit store' if update else 'Dropping duplicates' )
+        print()
+
+        if update:
+            # Only positions in the new kits are merged with the stored superkit
+            DNASuperKit, DNACandidates = updateSuperKit( superkitStoreDir, DNASuperKit, majorityVote, companyPriorityList, sortDNAFile, dropDuplicatesDNAFile )
+        else:
+            # Candidate rows for later updates
+            if saveStore:
+                DNACandidates = getSuperKitCandidates( DNASuperKit )
+
+            # Drop duplicates
+            DNASuperKit = dropDuplicatesDNAFile( DNASuperKit, concordanceReport=concordanceReport, consensusSidecar=consensusSidecar )
+        print( "DONE!" )
+        print()
+
+        if saveStore:
+            print()
+            print( f'Saving superkit store to {superkitStoreDir}' )
+            print()
+
+            # Save the superkit with the company of every SNP
+            writeSuperKitStore( superkitStoreDir, [ DNASuperKit ], [ DNACandidates ], chromosomeZero, storeMetadata, companyPriorityList )
+            print( "DONE!" )
+            print()
+
+
+    if not memoryLimit:
+
+        # Count SNPs per included per company
+        companySNPCounts = []
+
+        for f in companyPriorityList:
+            companySNPCount = DNASuperKit['company'].value_counts()[f].astype(str)
+            companySNPCounts.append(f + ': ' + companySNPCount)
+
+
+        # Delete 'company' column
+        del DNASuperKit[ 'company' ]
+
+    # Save and show the agreement of the companies
+    if concordanceReport is not None:
+        closeConcordanceReport( concordanceReport )
+    if consensusSidecar is not None:
+        closeConsensusSidecar( consensusSidecar )
+
+    ########################
+
+
+    ########################
+    #Format dataframe to a specific company format
 
-    print( "DONE!" )
     print()
+    print( '######################################################################' )
+    print( "#" )
+    print( "# Formatting, trimming and saving data" )
+    print( "#" )
+    print( '######################################################################' )
 
 
-# Nr of SNPs in kit
-superkitLength = len(DNASuperKit)
+    #if outputFormat != 'SuperKit':
+        ##### DONT FORGET TO MAKE CONVERSION OPTIONAL! #####
+    if outputFormat not in [ 'SuperKit', 'VCF v4', 'PLINK' ] and convertFormat == True:
 
-print()
-print( f'Formatting DNA file to {outputFormat} format' )
-print()
+        print()
+        print( f'Converting rsid and positions to {outputFormat} format' )
+        print()
 
-# Format DNA file to match desired output structure
-DNASuperKit = formatDNAFile( DNASuperKit, outputFormat )
-print( "DONE!" )
-print()
+        # Out-of-core, only the superkit rows in the format are needed in memory
+        if memoryLimit:
+            DNASuperKit = selectOriginalPositions( superkitStore, loadFormatTemplate( outputFormat ), companyPriorityList )
 
+    ##### HANDLE CHROMOSOME 0 in FamilyTreeDNA v3, if no chromosome 0 exist, add fake? #####
+    ##### does it update rsid?
+        # Restore original RSID and positions according to outputFormat
+        DNASuperKit = restoreOriginalPositions( DNASuperKit, outputFormat )
 
-# Line terminators: 
-# \n = LF (Linux), \r\n = CRLF (Windows)
-formats = {
-    '23andMe v5': { 'sep': '\t', 'encoding': 'ascii', 'lineterminator': '\r\n' },
-    'AncestryDNA v2': { 'sep': '\t', 'encoding': 'ascii', 'lineterminator': '\r\n' },
-    'FamilyTreeDNA v3': { 'sep': ',', 'encoding': 'ascii', 'lineterminator': '\n' },
-    'LivingDNA v1.0.2': { 'sep': '\t', 'encoding': 'ascii', 'lineterminator': '\n' },
-    'MyHeritage v1': { 'header': False, 'sep': ',', 'encoding': 'ascii', 'lineterminator': '\n', 'quoting': 2 },
-    'MyHeritage v2': { 'header': False, 'sep': ',', 'encoding': 'ascii', 'lineterminator': '\n', 'quoting': 2 },
-    'tellmeGen v4': { 'sep': '\t', 'encoding': 'ascii', 'lineterminator': '\n' },
-    'SuperKit': { 'sep': '\t', 'encoding': 'ascii', 'lineterminator': '\r\n' }
-}
+        print( "DONE!" )
+        print()
 
-# Handle unsupported format (shouldn't be possible though)
-if outputFormat not in formats:
-    raise ValueError(f"Unsupported format: {outputFormat}")
+        # The converted superkit is formatted in memory
+        streamSuperKit = False
 
-# Set correct file ending
-if outputFormat in ['AncestryDNA v2', 'LivingDNA v1.0.2', '23andMe v5', 'SuperKit']:
-    ext = 'txt'
-else:
-    ext = 'csv'
+    else:
+        # Out-of-core, the superkit is formatted and written chromosome by chromosome
+        streamSuperKit = bool( memoryLimit )
 
-# File directory + filename to one string variable
-tmpFileName = f"{outputFileDir}{outputFileName}-{outputFormat}.{ext}"
 
+    # Nr of SNPs in kit
+    if streamSuperKit:
+        superkitLength = superkitStore[ 'rows' ]
+    else:
+        superkitLength = len(DNASuperKit)
 
 
-##### CHANGE SO IF ARG --convertFormat, THEN USE ORIGINAL FILENAME #####
+    # Handle unsupported format (shouldn't be possible though)
+    if outputFormat not in formats:
+        raise ValueError(f"Unsupported format: {outputFormat}")
 
-if convertFormat == True:
+    # Set correct file ending
+    if outputFormat in ['AncestryDNA v2', 'LivingDNA v1.0.2', '23andMe v5', 'SuperKit']:
+        ext = 'txt'
+    elif outputFormat == 'VCF v4':
+        ext = 'vcf.gz'
+    elif outputFormat == 'PLINK':
+        ext = 'bed'
+    else:
+        ext = 'csv'
 
-    # Get current time
-    current_time = datetime.datetime.utcnow()
+    # File directory + filename to one string variable
+    tmpFileName = f"{outputFileDir}{outputFileName}-{outputFormat}.{ext}"
 
-    if outputFormat == '23andMe v5':
-        # Set correct datetime format
-        time_format = '%Y%m%d%H%M%S'
-        time_string = current_time.strftime(time_format)
-        # Set filename
-        tmpFileName = f"{outputFileDir}DNASuperKit-genome_Super_Kit_v5_Full_{time_string}"
 
-    elif outputFormat == 'AncestryDNA v2':
-        # Set filename
-        tmpFileName = f"{outputFileDir}DNASuperKit-AncestryDNA"
 
-    elif outputFormat == 'FamilyTreeDNA v3':
-        # Set correct datetime format
-        time_format = '%Y%m%d'
-        time_string = current_time.strftime(time_format)
-        # Set filename
-        tmpFileName = f"{outputFileDir}DNASuperKit-37_S_Kit_Chrom_Autoso_{time_string}"
+    ##### CHANGE SO IF ARG --convertFormat, THEN USE ORIGINAL FILENAME #####
 
-    elif outputFormat == 'LivingDNA v1.0.2':
-        # Set filename
-        tmpFileName = f"{outputFileDir}DNASuperKit-autosomal"
+    if outputFormat not in [ 'SuperKit', 'VCF v4', 'PLINK' ] and convertFormat == True:
 
-    elif outputFormat == 'MyHeritage v1':
-        # Set filename
-        tmpFileName = f"{outputFileDir}DNASuperKit-MyHeritage_raw_dna_data"
+        # Get current time
+        current_time = datetime.datetime.utcnow()
 
-    elif outputFormat == 'MyHeritage v2':
-        # Set filename
-        tmpFileName = f"{outputFileDir}DNASuperKit-MyHeritage_raw_dna_data"
+        if outputFormat == '23andMe v5':
+            # Set correct datetime format
+            time_format = '%Y%m%d%H%M%S'
+            time_string = current_time.strftime(time_format)
+            # Set filename
+            tmpFileName = f"{outputFileDir}DNASuperKit-genome_Super_Kit_v5_Full_{time_string}"
+
+        elif outputFormat == 'AncestryDNA v2':
+            # Set filename
+            tmpFileName = f"{outputFileDir}DNASuperKit-AncestryDNA"
 
-    elif outputFormat == 'tellmeGen v4':
-        #test = 7
-        ##### NEED TO FIND tellmeGen FILE PATTERN #####
-        # Set filename
-        tmpFileName = f"{outputFileDir}DNASuperKit-{outputFormat}"
+        elif outputFormat == 'FamilyTreeDNA v3':
+            # Set correct datetime format
+            time_format = '%Y%m%d'
+            time_string = current_time.strftime(time_format)
+            # Set filename
+            tmpFileName = f"{outputFileDir}DNASuperKit-37_S_Kit_Chrom_Autoso_{time_string}"
 
-    tmpFileName = f"{tmpFileName}.{ext}"
+        elif outputFormat == 'LivingDNA v1.0.2':
+            # Set filename
+            tmpFileName = f"{outputFileDir}DNASuperKit-autosomal"
 
+        elif outputFormat == 'MyHeritage v1':
+            # Set filename
+            tmpFileName = f"{outputFileDir}DNASuperKit-MyHeritage_raw_dna_data"
 
-# Save to file
-print( f'Saving DNA Superkit to {outputFormat} format.' )
-DNASuperKit.to_csv(tmpFileName, index=None, **formats[outputFormat])
-print( "DONE!" )
-print()
+        elif outputFormat == 'MyHeritage v2':
+            # Set filename
+            tmpFileName = f"{outputFileDir}DNASuperKit-MyHeritage_raw_dna_data"
 
+        elif outputFormat == 'tellmeGen v4':
+            #test = 7
+            ##### NEED TO FIND tellmeGen FILE PATTERN #####
+            # Set filename
+            tmpFileName = f"{outputFileDir}DNASuperKit-{outputFormat}"
 
-# Special case for MyHeritage
-if outputFormat == 'MyHeritage v1' or outputFormat == 'MyHeritage v2':
-    test = 0
+        tmpFileName = f"{tmpFileName}.{ext}"
 
-    data = ( "RSID,CHROMOSOME,POSITION,RESULT\n")
+    # Compressed output gets the container file ending
+    if outputCompression == 'gzip':
+        tmpFileName = f"{tmpFileName}.gz"
+    elif outputCompression == 'zip':
+        tmpFileName = f"{tmpFileName}.zip"
 
-    # Read the existing contents of the file
-    with open(tmpFileName, "r") as f:
-        existing_data = f.read()
 
-    # Write the new data followed by the original contents
-    with open(tmpFileName, "w", newline="\n") as f:
-        f.write(data + existing_data)
+    if streamSuperKit:
 
+        print()
+        print( f'Formatting DNA file to {outputFormat} format and saving it chromosome by chromosome' )
+        print()
 
-# Only add comments if converting to true format ()
-if convertFormat == True:
-    # Add comments to file
-    companiesWithCommentsToAdd = [
-                                '23andMe v5',
-                                'AncestryDNA v2',
-                                'LivingDNA v1.0.2',
-                                'MyHeritage v1',
-                                'MyHeritage v2'
-                                ]
+        # Format and write each chromosome, with comments first if converting to true format
+        superkitChunks = formatSuperKitChunks( superkitStore, outputFormat, chromosomeZero )
+        addComments = convertFormat == True and outputFormat in companiesWithCommentsToAdd
+        superkitUniqueChromosomes, superkitUniqueGenotypes = writeDNAFileChunks( tmpFileName, superkitChunks, outputFormat, addComments )
+        print( "DONE!" )
+        print()
 
-    # Add comment if outputformat is in above list
-    if outputFormat in companiesWithCommentsToAdd:
+    else:
 
         print()
-        print( f'Adding comments to top of file according to {outputFormat} format' )
+        print( f'Formatting DNA file to {outputFormat} format' )
+        print()
+
+        # Format DNA file to match desired output structure
+        DNASuperKit = formatDNAFile( DNASuperKit, outputFormat, chromosomeZero )
+        print( "DONE!" )
         print()
 
-        # Adding comment
-        addCommentsToFile( tmpFileName, outputFormat )
+
+        # Only add comments if converting to true format ()
+        addComments = convertFormat == True and outputFormat in companiesWithCommentsToAdd
+        if addComments:
+            print( f'Adding comments to top of file according to {outputFormat} format' )
+
+        # Save to file, comments and header are written first
+        print( f'Saving DNA Superkit to {outputFormat} format.' )
+        superkitUniqueChromosomes, superkitUniqueGenotypes = writeDNAFileChunks( tmpFileName, [ DNASuperKit ], outputFormat, addComments )
         print( "DONE!" )
         print()
 
 
-# Presenting results
-print()
-print()
-print( '######################################################################')
-print( '#')
-print( '# DNA SuperKit Statistics')
-print( '#')
-print( f'# Outputformat:           {outputFormat}' )
-print( '#' )
-print( f'# File:                   {tmpFileName}')
-print( f'# Total nr of SNPs:       {superkitLength}')
-print( '#')
-print( '######################################################################')
-print()
-print( f'Total SNP used per company: {companySNPCounts}')
+    # Remove spilled runs
+    if memoryLimit:
+        spill[ 'directory' ].cleanup()
 
 
-if outputFormat == 'AncestryDNA v2':
-    superkitUniqueChromosomes = DNASuperKit.chromosome.unique().tolist()
-    # Merge allele1 and allele2 to genotype column
-    DNASuperKit[ 'genotype' ] = DNASuperKit[ 'allele1' ] + DNASuperKit[ 'allele2' ]
-    DNASuperKit = DNASuperKit.drop( [ 'allele1', 'allele2' ], axis=1 )
-    superkitUniqueGenotypes = DNASuperKit.genotype.unique().tolist()
+    # Presenting results
+    print()
+    print()
+    print( '######################################################################')
+    print( '#')
+    print( '# DNA SuperKit Statistics')
+    print( '#')
+    print( f'# Outputformat:           {outputFormat}' )
+    print( '#' )
+    print( f'# File:                   {"stdout" if outputStdout else tmpFileName}')
+    print( f'# Total nr of SNPs:       {superkitLength}')
+    print( '#')
+    print( '######################################################################')
+    print()
+    print( f'Total SNP used per company: {companySNPCounts}')
 
-elif outputFormat == 'FamilyTreeDNA v3' or outputFormat == 'MyHeritage v1' or outputFormat == 'MyHeritage v2':
-    superkitUniqueChromosomes = DNASuperKit.CHROMOSOME.unique().tolist()
-    superkitUniqueGenotypes = DNASuperKit.RESULT.unique().tolist()
 
-else:
-    superkitUniqueChromosomes = DNASuperKit.chromosome.unique().tolist()
-    superkitUniqueGenotypes = DNASuperKit.genotype.unique().tolist()
+    # Information about the results
+    print()
+    print( f'Chromosome List: {superkitUniqueChromosomes}')
+    print()
+    print( f'Genotype List: {superkitUniqueGenotypes}')
+    print()
+
 
+    # Time elapsed
+    # Get the end time
+    end_time = time.time()
+    # Calculate the elapsed time
+    elapsed_time = end_time - start_time
+
+    print()
+    print( 'DNA SuperKit successfully created!' )
+    print( f'time elapsed since start of script: {elapsed_time} seconds')
+    print()
 
-# Information about the results
-print()
-print( f'Chromosome List: {superkitUniqueChromosomes}')
-print()
-print( f'Genotype List: {superkitUniqueGenotypes}')
-print()
 
+##########################################
 
-# Time elapsed
-# Get the end time
-end_time = time.time()
-# Calculate the elapsed time
-elapsed_time = end_time - start_time
 
-print()
-print( 'DNA SuperKit successfully created!' )
-print( f'time elapsed since start of script: {elapsed_time} seconds')
-print()
+# Build the superkit once, every time the DNA files in ./input/ change, or for
+# every request to the conversion service. Worker processes of the service that
+# are not forked import this file without building
+if __name__ == '__main__':
+    if query:
+        queryDNAFiles( query, inputFileDir, superkitStoreDir, outputFileName, queryIndexDir, companyPriorityList, prepareDNAFile )
+    elif match:
+        matchDNAFiles( match, inputFileDir, matchMinimumSnps, matchMinimumCentimorgans, prepareDNAFile )
+    elif kinship:
+        estimateKinship( inputFileDir, kinshipOutputFile, ingestJobs, prepareDNAFile )
+    elif matchAdd or matchFind:
+        if matchAdd:
+            addMatchKits( matchDatabaseDir, inputFileDir, ingestJobs, prepareDNAFile )
+        if matchFind:
+            findMatchingKits( matchFind, matchDatabaseDir, inputFileDir, matchMinimumSnps, matchMinimumCentimorgans, ingestJobs, prepareDNAFile )
+    elif serve:
+        serveSuperKits( serve, serveWorkers, serveConcurrency, allowed_outputFormats, buildServiceJob, warmServiceWorker )
+    elif watch:
+        watchInputDir( inputFileDir, createSuperKit )
+    else:
+        createSuperKit()
 
 
 ####################################################################################
 # EOF #
-####################################################################################
\ No newline at end of file
+####################################################################################
@@ -0,0 +1,161 @@
+##############################################################################################
+# Concordance report of the companies (--concordance/--conflicts)
+# of create_superkit.py
+#
+
+import os
+import pandas as pd
+import numpy as np
+
+from superkit_tables import chromosomePriorityList
+
+
+####################################################################################
+# CONCORDANCE FUNCTIONS (--concordance, --conflicts)
+####################################################################################
+
+# While dropDuplicatesDNAFile merges the kits, the genotypes the companies have on the
+# same positions are compared, on the groups of rows per position of getDuplicateGroups.
+# The rows are sorted on chromosome, position and company, so the first called row of
+# every company on a position is found by comparing every row with the row before, and
+# the pairs of companies on a position by comparing every row with the rows 1, 2, ...
+# rows further on, as many times as there are companies. Genotypes are normalized as for
+# --majorityVote, so CA and AC are the same, and nocalls and the "junk" chromosome 0 are
+# left out. The counts of every pair of companies and genotypes are summed over all
+# blocks of the merge, and the positions where two companies disagree are written to the
+# conflicts file a block at a time.
+
+##########################################
+# Start a concordance report of the companies, in
+# priority order, saved to concordanceFile. The
+# conflicts file is open unless it is None
+
+def openConcordanceReport( concordanceFile: str, conflictsFile: str, companies: list ) -> dict:
+
+    report = { 'genotypes': [], 'counts': {}, 'conflicts': None, 'conflictRows': 0,
+               'companies': companies, 'concordanceFile': concordanceFile, 'conflictsFile': conflictsFile }
+    if conflictsFile is not None:
+        os.makedirs( os.path.dirname( conflictsFile ), exist_ok=True )
+        report[ 'conflicts' ] = open( conflictsFile, 'w', newline='' )
+        report[ 'conflicts' ].write( 'chromosome,position,company1,genotype1,company2,genotype2\n' )
+
+
+    return report
+
+
+##########################################
+
+
+##########################################
+# Count the pairs of companies and genotypes on the
+# positions of the groups of getDuplicateGroups
+
+def countConcordance( groups: dict, report: dict ):
+
+    # Normalized genotypes, coded as indexes in the genotypes of the report
+    for g in groups[ 'normalizedGenotypes' ]:
+        if g not in report[ 'genotypes' ]:
+            report[ 'genotypes' ].append( g )
+    reportCodes = np.array( [ report[ 'genotypes' ].index( g ) for g in groups[ 'normalizedGenotypes' ] ] + [ -1 ], dtype=np.int64 )
+    called = groups[ 'called' ] & ( groups[ 'chromosome' ] > 0 ) & ( groups[ 'chromosome' ] < len( chromosomePriorityList ) ) & ( groups[ 'company' ] >= 0 )
+
+    # The first called row of every company on a position
+    rows = np.flatnonzero( called )
+    group, company, genotype = groups[ 'group' ][ rows ], groups[ 'company' ][ rows ], reportCodes[ groups[ 'normalized' ][ rows ] ]
+    if len( rows ) == 0:
+        return
+    first = ~np.r_[ False, ( group[ 1: ] == group[ :-1 ] ) & ( company[ 1: ] == company[ :-1 ] ) ]
+    rows, group, company, genotype = rows[ first ], group[ first ], company[ first ], genotype[ first ]
+
+    # Pairs of rows on the same position, offset rows apart
+    companies = report[ 'companies' ]
+    pairs = []
+    for offset in range( 1, len( companies ) ):
+        same = group[ offset: ] == group[ :-offset ]
+        if not same.any():
+            break
+        pairRows = np.flatnonzero( same )
+        pairs.append( ( pairRows, pairRows + offset ) )
+    if not pairs:
+        return
+    left = np.concatenate( [ a for a, b in pairs ] )
+    right = np.concatenate( [ b for a, b in pairs ] )
+
+    # Counts of every pair of companies and genotypes
+    genotypeCount = len( report[ 'genotypes' ] )
+    companyCount = len( companies )
+    keys = ( ( company[ left ] * companyCount + company[ right ] ) * genotypeCount + genotype[ left ] ) * genotypeCount + genotype[ right ]
+    keys, counts = np.unique( keys, return_counts=True )
+    for key, count in zip( keys, counts ):
+        key, genotypeRight = divmod( int( key ), genotypeCount )
+        key, genotypeLeft = divmod( key, genotypeCount )
+        companyLeft, companyRight = divmod( key, companyCount )
+        index = ( companies[ companyLeft ], companies[ companyRight ], report[ 'genotypes' ][ genotypeLeft ], report[ 'genotypes' ][ genotypeRight ] )
+        report[ 'counts' ][ index ] = report[ 'counts' ].get( index, 0 ) + int( count )
+
+    # Positions where two companies disagree
+    if report[ 'conflicts' ] is not None:
+        conflict = genotype[ left ] != genotype[ right ]
+        left, right = left[ conflict ], right[ conflict ]
+        order = np.lexsort( ( right, left ) )
+        left, right = left[ order ], right[ order ]
+        genotypeNames = np.array( report[ 'genotypes' ], dtype=object )
+        companyNames = np.array( companies, dtype=object )
+        keys = groups[ 'keys' ][ rows[ left ] ]
+        pd.DataFrame( {
+            'chromosome': np.array( chromosomePriorityList, dtype=object )[ keys >> 40 ],
+            'position': keys & ( 2**40 - 1 ),
+            'company1': companyNames[ company[ left ] ],
+            'genotype1': genotypeNames[ genotype[ left ] ],
+            'company2': companyNames[ company[ right ] ],
+            'genotype2': genotypeNames[ genotype[ right ] ]
+        } ).to_csv( report[ 'conflicts' ], header=False, index=False )
+        report[ 'conflictRows' ] += len( left )
+
+
+    return
+
+
+##########################################
+
+
+##########################################
+# Save the confusion matrices of the concordance
+# report, close the conflicts file and show the
+# agreement of every pair of companies
+
+def closeConcordanceReport( report: dict ):
+
+    if report[ 'conflicts' ] is not None:
+        report[ 'conflicts' ].close()
+
+    counts = pd.DataFrame( [ ( *index, count ) for index, count in report[ 'counts' ].items() ], columns=[ 'company1', 'company2', 'genotype1', 'genotype2', 'count' ] )
+    counts = counts.sort_values( [ 'company1', 'company2', 'genotype1', 'genotype2' ] )
+    os.makedirs( os.path.dirname( report[ 'concordanceFile' ] ), exist_ok=True )
+    counts.to_csv( report[ 'concordanceFile' ], index=False )
+
+    # Shared, agreeing and disagreeing positions of every pair of companies
+    summary = counts.assign( agree=np.where( counts[ 'genotype1' ] == counts[ 'genotype2' ], counts[ 'count' ], 0 ) )
+    summary = summary.groupby( [ 'company1', 'company2' ], sort=False ).agg( shared=( 'count', 'sum' ), agree=( 'agree', 'sum' ) ).reset_index()
+    summary[ 'disagree' ] = summary[ 'shared' ] - summary[ 'agree' ]
+    summary[ 'concordance' ] = ( summary[ 'agree' ] / summary[ 'shared' ] * 100 ).round( 3 )
+
+    print()
+    print( 'Concordance of the companies on shared positions:' )
+    print()
+    print( summary.to_string( index=False ) if len( summary ) else 'No positions are shared by two companies' )
+    print()
+    print( f'Genotype confusion matrices saved to {report[ "concordanceFile" ]}' )
+    if report[ 'conflicts' ] is not None:
+        print( f'{report[ "conflictRows" ]} conflicting genotypes saved to {report[ "conflictsFile" ]}' )
+    print()
+
+
+    return
+
+
+##########################################
+
+
+####################################################################################
+####################################################################################
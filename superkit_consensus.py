@@ -0,0 +1,133 @@
+##############################################################################################
+# Consensus sidecar of the superkit (--consensus)
+# of create_py
+#
+
+import os
+import numpy as np
+import json
+
+from superkit_tables import chromosomePriorityList
+
+
+####################################################################################
+# CONSENSUS FUNCTIONS (--consensus)
+####################################################################################
+
+# For every SNP of the superkit dropDuplicatesDNAFile keeps, a record of how it was
+# chosen is written to ./output/DNASuperKit-consensus.bin, in the order of the merged
+# superkit (chromosomePriorityList and position):
+#   chromosome   index in chromosomePriorityList
+#   position     position
+#   supporting   rows of the kits with a call that is the chosen genotype (at most 255)
+#   dissenting   rows of the kits with another call (at most 255)
+#   method       index in consensusMethods: a single call, all calls the same, chosen by
+#                company priority, or chosen by --majorityVote
+#   company      index of the company of the chosen genotype in companyPriorityList
+# Genotypes are compared normalized as for --majorityVote. The records are 9 bytes
+# without padding, and ./output/DNASuperKit-consensus.json describes them, so they can
+# be read with numpy.fromfile to filter the superkit without merging the kits again.
+# The records are counted on the groups of rows per position that dropDuplicatesDNAFile
+# chooses the genotypes on (see getDuplicateGroups), so they take no pass of their own.
+
+# Record layout of the consensus sidecar, and the ways a genotype is chosen
+consensusDtype = np.dtype( [ ( 'chromosome', 'u1' ), ( 'position', '<u4' ), ( 'supporting', 'u1' ), ( 'dissenting', 'u1' ), ( 'method', 'u1' ), ( 'company', 'u1' ) ] )
+consensusMethods = [ 'single source', 'unanimous', 'priority', 'majority vote' ]
+
+
+##########################################
+# Open the consensus sidecar outputFile, described
+# in metadataFile, of the companies in priority order
+
+def openConsensusSidecar( outputFile: str, metadataFile: str, companies: list, majorityVote: bool ) -> dict:
+
+    os.makedirs( os.path.dirname( outputFile ), exist_ok=True )
+
+
+    return { 'file': open( outputFile, 'wb' ), 'rows': 0, 'methods': np.zeros( len( consensusMethods ), dtype=np.int64 ),
+             'outputFile': outputFile, 'metadataFile': metadataFile, 'companies': companies, 'majorityVote': majorityVote }
+
+
+##########################################
+
+
+##########################################
+# Write the consensus records of the SNPs kept by
+# dropDuplicatesDNAFile, from the groups of rows of
+# getDuplicateGroups and the kept row of every group
+
+def writeConsensusRecords( groups: dict, chosenRows: np.ndarray, sidecar: dict ):
+
+    if len( chosenRows ) == 0:
+        return
+    records = np.zeros( len( chosenRows ), dtype=consensusDtype )
+
+    # Calls of every position, and the calls that are the chosen genotype
+    chosenGroup = groups[ 'group' ][ chosenRows ]
+    chosen = np.full( len( groups[ 'first' ] ), -2 )
+    chosen[ chosenGroup ] = groups[ 'normalized' ][ chosenRows ]
+    agrees = groups[ 'called' ] & ( groups[ 'normalized' ] == chosen[ groups[ 'group' ] ] )
+
+    calls = np.bincount( groups[ 'group' ], weights=groups[ 'called' ], minlength=len( groups[ 'first' ] ) )[ chosenGroup ].astype( np.int64 )
+    supporting = np.bincount( groups[ 'group' ], weights=agrees, minlength=len( groups[ 'first' ] ) )[ chosenGroup ].astype( np.int64 )
+    dissenting = calls - supporting
+
+    # Only a majority of at least half the calls is chosen by majority vote, else by company priority
+    method = np.where( dissenting == 0, 1, np.where( sidecar[ 'majorityVote' ] & ( 2 * supporting >= calls ), 3, 2 ) )
+    method[ calls <= 1 ] = 0
+
+    keys = groups[ 'keys' ][ chosenRows ]
+    records[ 'chromosome' ] = keys >> 40
+    records[ 'position' ] = keys & ( 2**40 - 1 )
+    records[ 'supporting' ] = np.minimum( supporting, 255 )
+    records[ 'dissenting' ] = np.minimum( dissenting, 255 )
+    records[ 'method' ] = method
+    records[ 'company' ] = groups[ 'company' ][ chosenRows ]
+
+    sidecar[ 'file' ].write( records.tobytes() )
+    sidecar[ 'rows' ] += len( records )
+    sidecar[ 'methods' ] += np.bincount( method, minlength=len( consensusMethods ) )
+
+
+    return
+
+
+##########################################
+
+
+##########################################
+# Close the consensus sidecar, describe the records
+# and show how the genotypes were chosen
+
+def closeConsensusSidecar( sidecar: dict ):
+
+    sidecar[ 'file' ].close()
+
+    metadata = {
+        'rows': sidecar[ 'rows' ],
+        'dtype': [ [ name, consensusDtype[ name ].str ] for name in consensusDtype.names ],
+        'chromosomes': chromosomePriorityList,
+        'companies': sidecar[ 'companies' ],
+        'methods': consensusMethods,
+        'majorityVote': sidecar[ 'majorityVote' ]
+    }
+    with open( sidecar[ 'metadataFile' ], 'w' ) as f:
+        json.dump( metadata, f, indent=1 )
+
+    print()
+    print( 'Genotypes of the superkit chosen by:' )
+    for method, count in zip( consensusMethods, sidecar[ 'methods' ] ):
+        print( f'{method}: {count}' )
+    print()
+    print( f'Consensus records of {sidecar[ "rows" ]} SNPs saved to {sidecar[ "outputFile" ]}' )
+    print()
+
+
+    return
+
+
+##########################################
+
+
+####################################################################################
+####################################################################################
@@ -0,0 +1,343 @@
+##############################################################################################
+# Finding, opening and screening the DNA files of create_superkit.py
+#
+
+import os
+import io
+import zipfile
+import gzip
+import bz2
+import lzma
+from typing import List
+import re
+
+
+####################################################################################
+# VARIABLES
+####################################################################################
+
+# Input filetypes
+fileEndings = (
+    'txt',
+    'csv',
+    'vcf'
+)
+
+# Compressed input filetypes. The compression itself is sniffed from the file
+# header, each txt/csv member of a zip archive is loaded as a kit of its own
+compressedFileEndings = (
+    'zip',
+    'gz',
+    'bz2',
+    'xz'
+)
+
+# File header signatures of the compressed input formats
+compressionSignatures = {
+    'zip': b'PK\x03\x04',
+    'gzip': b'\x1f\x8b',
+    'bz2': b'BZh',
+    'xz': b'\xfd7zXZ\x00',
+}
+
+# Decompressed contents of the DNA files read ahead by the pipeline, by file
+prefetchedDNAFiles = {}
+
+# Number of lines at the top of a DNA file that are screened for the company.
+# The patterns in determineDNACompany are all in the comments or header
+prescreenLineCount = 100
+
+
+####################################################################################
+####################################################################################
+
+
+####################################################################################
+# FILE FUNCTIONS
+####################################################################################
+
+##########################################
+# Find all files in directory inputDir with
+# the desired file ending from 'fileEndings'
+
+def findDNAFiles( inputDir: str, fileEndings: List ) -> List:
+    # Get script directory
+    scriptDir = os.path.dirname( os.path.realpath( __file__ ) )
+    # Add inputDir to directory to get subdir
+    scriptDir = os.path.join( scriptDir, inputDir )
+
+    # List all files in subdir and add files with fileEndings
+    # and append to result list. Compressed files are added as well,
+    # and every DNA file inside a zip archive is added as archive/member
+    fileList = [ f for f in os.listdir( path=scriptDir ) ]
+    result = []
+    for f in fileList:
+        if f.lower().endswith( fileEndings + compressedFileEndings ):
+            file = inputDir + f
+            if getCompression( file ) == 'zip':
+                result.extend( file + '/' + member for member in listArchiveMembers( file, fileEndings ) )
+            else:
+                result.append( file )
+
+
+    return result
+
+##########################################
+
+
+##########################################
+# Sniff the compression of a file from its header.
+# Returns 'zip', 'gzip', 'bz2', 'xz' or None
+#
+
+def getCompression( file: str ) -> str:
+
+    with open( file, 'rb' ) as f:
+        header = f.read( 8 )
+
+    for compression, signature in compressionSignatures.items():
+        if header.startswith( signature ):
+            return compression
+
+
+    return None
+
+##########################################
+
+
+##########################################
+# List the DNA files in a zip archive.
+# Folders and macOS resource forks are skipped
+#
+
+def listArchiveMembers( archive: str, fileEndings: List ) -> List:
+
+    with zipfile.ZipFile( archive ) as z:
+        members = [ m.filename for m in z.infolist() if not m.is_dir() ]
+
+    result = []
+    for member in members:
+        name = member.rsplit( '/', 1 )[ -1 ]
+        if member.startswith( '__MACOSX/' ) or name.startswith( '._' ):
+            continue
+        if name.lower().endswith( fileEndings ):
+            result.append( member )
+
+
+    return result
+
+##########################################
+
+
+##########################################
+# Split a DNA file path into the file on disk
+# and the member inside a zip archive (or None)
+#
+
+def splitArchivePath( file: str ) -> tuple:
+
+    archive = file
+    while not os.path.isfile( archive ):
+        parent = os.path.dirname( archive )
+        if parent == archive or not parent:
+            return file, None
+        archive = parent
+
+
+    return archive, file[ len( archive ) + 1: ] or None
+
+##########################################
+
+
+##########################################
+# Open a DNA file, zip archive member or compressed
+# file as a decompressed stream. Nothing is extracted
+# to disk. mode is 'r' (text) or 'rb' (bytes)
+#
+
+def openDNAFile( file: str, mode: str = 'r' ):
+
+    # Read ahead by the pipeline (--pipeline)
+    if file in prefetchedDNAFiles:
+        stream = io.BytesIO( prefetchedDNAFiles[ file ] )
+        return stream if 'b' in mode else io.TextIOWrapper( stream )
+
+    archive, member = splitArchivePath( file )
+    compression = getCompression( archive )
+
+    if compression is None:
+        return open( archive, mode )
+
+    if compression == 'zip':
+        with zipfile.ZipFile( archive ) as z:
+            if member is None:
+                member = listArchiveMembers( archive, fileEndings )[ 0 ]
+            stream = z.open( member )
+    elif compression == 'gzip':
+        stream = gzip.open( archive, 'rb' )
+    elif compression == 'bz2':
+        stream = bz2.open( archive, 'rb' )
+    else:
+        stream = lzma.open( archive, 'rb' )
+
+    if 'b' in mode:
+        return stream
+
+
+    return io.TextIOWrapper( stream )
+
+##########################################
+
+
+##########################################
+# Check if a DNA file has to be read through openDNAFile
+#
+
+def isCompressedDNAFile( file: str ) -> bool:
+
+    archive, member = splitArchivePath( file )
+
+
+    return member is not None or getCompression( archive ) is not None
+
+##########################################
+
+
+##########################################
+# Yield the chunks of a pandas reader and close
+# the underlying stream when they run out
+#
+
+def readDNAFileChunks( reader, stream ):
+
+    try:
+        for df in reader:
+            yield df
+    finally:
+        stream.close()
+
+##########################################
+
+
+##########################################
+# Pre-screen file to determine DNA company
+#
+
+def prescreenDNAFile( inputDNAFile: str ) -> str:
+
+    ##############################
+    #  n = number of comment lines.
+    #       23andMe v5        = 19
+    #       AncestryDNA v2    = 18
+    #       FamilyTreeDNA v3  = 0
+    #       Living DNA v1.0.2 = 11
+    #       MyHeritage v1     = 6
+    #       MyHeritage v2     = 12
+    #       tellmeGen v4      = 0
+
+
+    n = 1
+    mystring = ' '
+
+    # count lines in the file, but no more than prescreenLineCount
+    with openDNAFile( inputDNAFile ) as fp:
+        for n, line in enumerate(fp):
+            if n >= prescreenLineCount:
+                break
+
+    # look at the first n lines
+    with openDNAFile( inputDNAFile ) as myfile:
+        head = [ next( myfile ) for x in range( n ) ]
+
+    # put all lines in a string
+    for x in head:
+       mystring += ' ' + x
+
+
+    return mystring
+
+##########################################
+
+
+##########################################
+# Try to determine what DNA testing
+# company the file originates from
+#
+
+#### NEEDS IMPROVMENT? ####
+def determineDNACompany( text: str, filename: str ) -> str:
+
+    # List of company and patterns
+    company_patterns = {
+        '23andMe v5': r'_v5_full_',
+        'AncestryDNA v2': r'ancestrydna array version: v2\.0',
+        'LivingDNA v1.0.2': r'# living dna customer genotype data download file version: 1\.0\.2',
+        'MyHeritage v2': r'##format=mhv1\.0',
+        'MyHeritage v1': r'# myheritage dna raw data\.',
+        'FamilyTreeDNA v3': r'rsid,chromosome,position,result',
+        'tellmeGen v4': r'# rsid	chromosome	position	genotype',
+        'VCF v4': r'##fileformat=vcfv4'
+    }
+
+    # Convert to lowercase to make it easier
+    filename = filename.lower()
+    text = text.lower()
+
+    # Search for pattern in file
+    for company, pattern in company_patterns.items():
+        if re.search(pattern, filename) or re.search(pattern, text):
+            # Return company according to list depending on textpattern
+            return company
+
+
+    # If it cannot find a pattern, return unknown
+    return 'unknown'
+
+
+##########################################
+
+
+##########################################
+# Size and modification time of a DNA file,
+# of the archive for files in a zip archive
+
+def getFileStamp( file: str ) -> tuple:
+
+    archive, member = splitArchivePath( file )
+    stat = os.stat( archive )
+
+
+    return ( stat.st_size, stat.st_mtime_ns )
+
+
+##########################################
+
+
+##########################################
+# Determine the company of a DNA file, cached
+# by file size and modification time
+
+def screenDNAFile( file: str, kitCache: dict = None ) -> str:
+
+    stamp = getFileStamp( file )
+    if kitCache is not None and kitCache.get( file, {} ).get( 'stamp' ) == stamp:
+        return kitCache[ file ][ 'company' ]
+
+    # Screening file to determine company
+    fileScreening = prescreenDNAFile( file )
+
+    # Get DNA company from file comment
+    company = determineDNACompany( fileScreening , file)
+
+    if kitCache is not None:
+        kitCache[ file ] = { 'stamp': stamp, 'company': company }
+
+
+    return company
+
+
+##########################################
+
+
+####################################################################################
+####################################################################################
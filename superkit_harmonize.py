@@ -0,0 +1,241 @@
+##############################################################################################
+# Harmonization of the kits to the forward strand (--harmonize)
+# of create_py
+#
+
+import os
+import pandas as pd
+import numpy as np
+import re
+import json
+
+from superkit_tables import chromosomePriorityList, chromosomeTableAncestryIn, chromosomeTableVCF, genotypeTableMajorityVote, alleleBits, alleleComplements
+
+
+####################################################################################
+# HARMONIZATION FUNCTIONS (--harmonize)
+####################################################################################
+
+# The companies call SNPs on the strand of their own chip, so the same genotype can be
+# AG in one kit and TC in another. With --harmonize every kit is compared with the
+# reference and alternative alleles of the SNPs on the forward strand, from
+# ./data/reference-alleles.txt. It has a line per SNP with the chromosome, position,
+# reference and alternative allele (tab, space or comma separated, with or without
+# header, like the first columns of a VCF file without ID). It is compiled once to
+# ./data/reference-alleles.npy, sorted on chromosome and position, and memory-mapped.
+# The same alleles are the REF and ALT of VCF v4 output (see superkit_vcf.py).
+#
+# The genotypes of a kit are looked up with one binary search and compared as allele
+# bits (see superkit_matching.py):
+#   - alleles that are all reference or alternative alleles are on the forward strand
+#   - alleles that are when complemented are on the reverse strand and are flipped
+#   - A/T and C/G SNPs are the same on both strands (palindromic) and are left as they are
+#   - anything else does not match the reference and is left as it is
+# With --harmonizeDrop the palindromic SNPs and the SNPs that do not match are dropped
+# instead, so only calls known to be on the forward strand are merged.
+# After that every genotype gets the one allele order of genotypeTableMajorityVote, so
+# each output format only needs its own genotype table to re-encode the genotypes.
+
+# Reference and alternative alleles of the SNPs on the forward strand, compiled to a
+# memory-mapped file, and the compiled alleles when loaded
+referenceAllelesSource = './data/reference-alleles.txt'
+referenceAllelesFile = './data/reference-alleles.npy'
+referenceAlleles = {}
+# Record layout of the compiled reference alleles, one record per SNP
+referenceAllelesDtype = np.dtype( [
+    ( 'key', '<i8' ),                   # Index in chromosomePriorityList * 2**40 + position
+    ( 'alleles', 'u1' ),                # Allele bits of the reference and alternative allele
+    ( 'reference', 'S1' ),
+    ( 'alternative', 'S1' )
+] )
+
+
+##########################################
+# Compile the reference alleles of ./data/reference-alleles.txt.
+# Only SNPs with one reference and one alternative base are kept
+
+def buildReferenceAlleles() -> np.ndarray:
+
+    with open( referenceAllelesSource ) as f:
+        firstLine = f.readline()
+    sep = ',' if ',' in firstLine else r'\s+'
+    hasHeader = firstLine.startswith( '#' ) or not re.fullmatch( r'\d+', re.split( sep, firstLine.strip() )[ 1 ] )
+    df = pd.read_csv( referenceAllelesSource, sep=sep, header=None, skiprows=1 if hasHeader else 0, comment='#', usecols=[ 0, 1, 2, 3 ], names=[ 'chromosome', 'position', 'reference', 'alternative' ], dtype=str )
+
+    chromosome = df[ 'chromosome' ].str.replace( r'^chr', '', regex=True, case=False ).str.upper()
+    chromosome = pd.Categorical( chromosome.replace( chromosomeTableAncestryIn ).replace( chromosomeTableVCF ), categories=chromosomePriorityList ).codes.astype( np.int64 )
+    reference = alleleBits[ df[ 'reference' ].str.upper().str.encode( 'ascii' ).to_numpy().astype( 'S1' ).view( np.uint8 ) ]
+    alternative = alleleBits[ df[ 'alternative' ].str.upper().str.encode( 'ascii' ).to_numpy().astype( 'S1' ).view( np.uint8 ) ]
+    single = ( df[ 'reference' ].str.len() == 1 ).to_numpy() & ( df[ 'alternative' ].str.len() == 1 ).to_numpy()
+    keep = single & ( chromosome >= 0 ) & ( reference > 0 ) & ( alternative > 0 ) & ( reference != alternative )
+
+    alleles = np.zeros( np.count_nonzero( keep ), dtype=referenceAllelesDtype )
+    alleles[ 'key' ] = chromosome[ keep ] * 2**40 + pd.to_numeric( df[ 'position' ] ).to_numpy( dtype=np.int64 )[ keep ]
+    alleles[ 'alleles' ] = reference[ keep ] | alternative[ keep ]
+    alleles[ 'reference' ] = df[ 'reference' ].str.upper().to_numpy( dtype=object )[ keep ]
+    alleles[ 'alternative' ] = df[ 'alternative' ].str.upper().to_numpy( dtype=object )[ keep ]
+    alleles = alleles[ np.argsort( alleles[ 'key' ], kind='stable' ) ]
+
+    # One SNP per position, the first in the file
+    first = np.r_[ True, alleles[ 'key' ][ 1: ] != alleles[ 'key' ][ :-1 ] ]
+
+
+    return alleles[ first ]
+
+
+##########################################
+
+
+##########################################
+# Load the compiled reference alleles, compiled again
+# when ./data/reference-alleles.txt has changed.
+# Returns None without reference alleles, and warns
+# once of every consequence of that
+
+def loadReferenceAlleles( consequence: str ) -> np.ndarray:
+
+    if 'alleles' in referenceAlleles:
+        alleles = referenceAlleles[ 'alleles' ]
+        if alleles is None and consequence not in referenceAlleles[ 'warned' ]:
+            print( f'WARNING: No reference alleles in {referenceAllelesSource}, {consequence}' )
+            referenceAlleles[ 'warned' ].add( consequence )
+        return alleles
+
+    alleles = None
+    if os.path.exists( referenceAllelesSource ):
+        stamp = os.stat( referenceAllelesSource ).st_mtime_ns
+        stampFile = referenceAllelesFile[ :-len( '.npy' ) ] + '.json'
+        compiledStamp = None
+        if os.path.exists( referenceAllelesFile ) and os.path.exists( stampFile ):
+            with open( stampFile ) as f:
+                compiledStamp = json.load( f ).get( 'stamp' )
+
+        if compiledStamp == stamp:
+            alleles = np.load( referenceAllelesFile, mmap_mode='r' )
+            # Compiled with another record layout
+            if alleles.dtype != referenceAllelesDtype:
+                alleles = None
+
+        if alleles is None:
+            alleles = buildReferenceAlleles()
+
+            # Replaced in one step as other processes may read it, as the reference panel
+            try:
+                np.save( f'{referenceAllelesFile}.{os.getpid()}.tmp.npy', alleles )
+                os.replace( f'{referenceAllelesFile}.{os.getpid()}.tmp.npy', referenceAllelesFile )
+                with open( f'{stampFile}.{os.getpid()}.tmp', 'w' ) as f:
+                    json.dump( { 'stamp': stamp }, f )
+                os.replace( f'{stampFile}.{os.getpid()}.tmp', stampFile )
+            except OSError:
+                pass
+    else:
+        print( f'WARNING: No reference alleles in {referenceAllelesSource}, {consequence}' )
+
+    referenceAlleles[ 'alleles' ] = alleles
+    referenceAlleles[ 'warned' ] = { consequence }
+
+
+    return alleles
+
+
+##########################################
+
+
+##########################################
+# Reference and alternative allele of every position
+# of chromosomes (index in chromosomePriorityList) and
+# positions, '' where the SNP has no reference alleles
+
+def getReferenceAlleles( chromosome: np.ndarray, position: np.ndarray ) -> tuple:
+
+    reference = loadReferenceAlleles( 'VCF v4 is written without reference bases (REF N, every called allele an ALT)' )
+    if reference is None or len( reference ) == 0:
+        return np.full( len( position ), '', dtype='U1' ), np.full( len( position ), '', dtype='U1' )
+
+    keys = chromosome.astype( np.int64 ) * 2**40 + position.astype( np.int64 )
+    index = np.minimum( np.searchsorted( reference[ 'key' ], keys ), len( reference ) - 1 )
+    found = ( chromosome >= 0 ) & ( reference[ 'key' ][ index ] == keys )
+
+
+    return np.where( found, reference[ 'reference' ][ index ].astype( 'U1' ), '' ), np.where( found, reference[ 'alternative' ][ index ].astype( 'U1' ), '' )
+
+
+##########################################
+
+
+##########################################
+# Put the genotypes of a normalized DNA file on the
+# forward strand and in one allele order, and count
+# what was done in statistics. With drop (--harmonizeDrop)
+# the palindromic and mismatched rows are dropped
+
+def harmonizeDNAFile( df: pd.DataFrame, statistics: dict, drop: bool = False ) -> pd.DataFrame:
+
+    reference = loadReferenceAlleles( 'the kits are not harmonized' )
+    if reference is None or len( reference ) == 0 or len( df ) == 0:
+        return df
+
+    # Genotypes are coded once, the genotypes of a kit are few
+    codes, genotypes = pd.factorize( df[ 'genotype' ], use_na_sentinel=False )
+    letters = np.array( [ g if isinstance( g, str ) else '--' for g in genotypes ], dtype=object ).astype( 'S2' )
+    letters = letters.view( np.uint8 ).reshape( -1, 2 )
+    genotypeBits = alleleBits[ letters[ :, 0 ] ] | alleleBits[ letters[ :, 1 ] ]
+    # A genotype is compared if all its letters are bases, one letter genotypes (males on X, Y and MT) too
+    bases = ( alleleBits[ letters[ :, 0 ] ] > 0 ) & ( ( alleleBits[ letters[ :, 1 ] ] > 0 ) | ( letters[ :, 1 ] == 0 ) )
+    complementBits = alleleBits[ alleleComplements[ letters[ :, 0 ] ] ] | alleleBits[ alleleComplements[ letters[ :, 1 ] ] ]
+
+    # Reference alleles of every row
+    chromosome = pd.Categorical( df[ 'chromosome' ], categories=chromosomePriorityList ).codes.astype( np.int64 )
+    keys = chromosome * 2**40 + df[ 'position' ].to_numpy( dtype=np.int64 )
+    index = np.minimum( np.searchsorted( reference[ 'key' ], keys ), len( reference ) - 1 )
+    found = ( chromosome >= 0 ) & ( reference[ 'key' ][ index ] == keys )
+    alleles = np.where( found, reference[ 'alleles' ][ index ], 0 )
+
+    compared = found & bases[ codes ]
+    palindromic = compared & np.isin( alleles, [ 1 | 8, 2 | 4 ] )
+    forward = compared & ~palindromic & ( ( genotypeBits[ codes ] & ~alleles ) == 0 )
+    reverse = compared & ~palindromic & ~forward & ( ( complementBits[ codes ] & ~alleles ) == 0 )
+    mismatched = compared & ~palindromic & ~forward & ~reverse
+
+    # Flipped genotypes of every genotype, then one allele order for all
+    flipped = np.array( [ bytes( alleleComplements[ np.frombuffer( g, dtype=np.uint8 ) ] ).decode( 'ascii' ) if bases[ i ] else genotypes[ i ] for i, g in enumerate( letters.view( 'S2' ).ravel() ) ], dtype=object )
+    genotypes = np.array( [ genotypeTableMajorityVote.get( g, g ) for g in genotypes ], dtype=object )
+    flipped = np.array( [ genotypeTableMajorityVote.get( g, g ) for g in flipped ], dtype=object )
+    df[ 'genotype' ] = np.where( reverse, flipped[ codes ], genotypes[ codes ] )
+
+    for name, rows in [ ( 'compared', compared ), ( 'forward', forward ), ( 'flipped', reverse ), ( 'palindromic', palindromic ), ( 'mismatched', mismatched ) ]:
+        statistics[ name ] = statistics.get( name, 0 ) + int( np.count_nonzero( rows ) )
+
+    if drop:
+        df = df[ ~( palindromic | mismatched ) ]
+
+
+    return df
+
+
+##########################################
+
+
+##########################################
+# Show how the genotypes of a kit were harmonized,
+# and whether rows were dropped (--harmonizeDrop)
+
+def printHarmonizeStatistics( name: str, statistics: dict, drop: bool = False ):
+
+    if not statistics:
+        return
+
+    print( f'Harmonized {name}: {statistics[ "compared" ]} SNPs with reference alleles, '
+           f'{statistics[ "forward" ]} forward, {statistics[ "flipped" ]} flipped from the reverse strand, '
+           f'{statistics[ "palindromic" ]} palindromic A/T or C/G and {statistics[ "mismatched" ]} not matching the reference'
+           + ( ', the palindromic and not matching SNPs dropped' if drop else '' ) )
+
+
+    return
+
+
+##########################################
+
+
+####################################################################################
+####################################################################################
@@ -0,0 +1,206 @@
+##############################################################################################
+# Kinship of the kits in ./input/ (--kinship)
+# of create_superkit.py
+#
+
+import os
+import pandas as pd
+import numpy as np
+import time
+import tempfile
+import functools
+import multiprocessing
+
+from superkit_files import fileEndings, findDNAFiles
+from superkit_matching import loadMatchKit, projectMatchKit, matchMaxResults
+
+
+####################################################################################
+# VARIABLES
+####################################################################################
+
+# Number of genotypes of the kits multiplied at a time
+kinshipChunkGenotypes = 2**24
+
+# Least kinship coefficient of every degree of relationship, as in KING
+kinshipDegrees = [ ( 0.354, 'Duplicate or twin' ), ( 0.177, 'First degree' ), ( 0.0884, 'Second degree' ), ( 0.0442, 'Third degree' ) ]
+# First degree relatives with a lower IBS0 fraction are parent and child, they always share an allele
+kinshipParentChildIBS0 = 0.005
+
+# Allele bits of the homozygous genotypes, and of the heterozygous genotypes of every two alleles
+homozygousAlleleBits = [ 1, 2, 4, 8 ]
+heterozygousAlleleBits = [ a | b for a in homozygousAlleleBits for b in homozygousAlleleBits if a < b ]
+
+
+####################################################################################
+# KINSHIP FUNCTIONS (--kinship)
+####################################################################################
+
+# The kinship of every pair of kits in ./input/ is estimated with the robust estimator
+# of KING, that does not depend on the allele frequencies of a population:
+#   kinship = ( Aa/Aa - 2 * AA/aa ) / ( Aa of the first kit + Aa of the second kit )
+# counted over the SNPs both kits have called, where Aa/Aa are the SNPs that are
+# heterozygous in both and AA/aa the opposite homozygotes. The IBS0 fraction is the
+# opposite homozygotes over the shared SNPs. A SNP is shared by a pair when the two kits
+# have at most two alleles between them, so the SNPs of a pair do not depend on the
+# other kits. The kits are put on the positions of all kits as allele bits (see
+# superkit_matching.py) in a memory-mapped matrix, and the counts of all pairs are matrix
+# products of a chunk of columns at a time, summed over the six heterozygous genotypes and
+# the SNPs of either kit within their two alleles, so the memory needed stays the same for
+# any number of SNPs. Two kits homozygous for the same allele are within three of the six,
+# and are taken out twice.
+
+
+##########################################
+# Count the shared SNPs, heterozygous SNPs and opposite
+# homozygotes of every pair of kits from their allele
+# bits, and estimate the kinship. Returns matrices of
+# the kinship, IBS0 fraction and shared SNPs
+
+def computeKinship( genotypes: np.ndarray ) -> tuple:
+
+    kits, positions = genotypes.shape
+    chunk = max( 1024, kinshipChunkGenotypes // kits )
+
+    bothHeterozygous = np.zeros( ( kits, kits ) )
+    oppositeHomozygous = np.zeros( ( kits, kits ) )
+    heterozygousCalled = np.zeros( ( kits, kits ) )
+    shared = np.zeros( ( kits, kits ) )
+
+    for first in range( 0, positions, chunk ):
+        bits = np.array( genotypes[ :, first:first + chunk ] )
+
+        # Homozygous SNPs of the same allele in both kits, and of any allele
+        sameHomozygous = np.zeros( ( kits, kits ) )
+        for allele in homozygousAlleleBits:
+            homozygous = ( bits == allele ).astype( np.float32 )
+            sameHomozygous += homozygous @ homozygous.T
+        homozygous = ( ( ( bits & ( bits - 1 ) ) == 0 ) & ( bits > 0 ) ).astype( np.float32 )
+        oppositeHomozygous += homozygous @ homozygous.T - sameHomozygous
+
+        # Heterozygous SNPs of a genotype, and the called SNPs within its two alleles
+        for alleles in heterozygousAlleleBits:
+            heterozygous = ( bits == alleles ).astype( np.float32 )
+            within = ( ( ( bits & ~np.uint8( alleles ) ) == 0 ) & ( bits > 0 ) ).astype( np.float32 )
+            bothHeterozygous += heterozygous @ heterozygous.T
+            heterozygousCalled += heterozygous @ within.T
+            shared += within @ within.T
+        shared -= 2 * sameHomozygous
+
+    with np.errstate( divide='ignore', invalid='ignore' ):
+        kinshipCoefficients = ( bothHeterozygous - 2 * oppositeHomozygous ) / ( heterozygousCalled + heterozygousCalled.T )
+        ibs0 = oppositeHomozygous / shared
+
+
+    return kinshipCoefficients, ibs0, shared
+
+
+##########################################
+
+
+##########################################
+# Degree of relationship of a kinship coefficient
+# and IBS0 fraction
+
+def getRelationship( kinshipCoefficient: float, ibs0: float ) -> str:
+
+    for threshold, relationship in kinshipDegrees:
+        if kinshipCoefficient >= threshold:
+            if relationship == 'First degree':
+                return 'Parent and child' if ibs0 < kinshipParentChildIBS0 else 'Full siblings'
+            return relationship
+
+
+    return 'Unrelated'
+
+
+##########################################
+
+
+##########################################
+# Estimate the kinship of every pair of kits in
+# inputDir, loaded by jobs processes with
+# prepare( file, company ), save the table to
+# outputFile and show the relatives
+
+def estimateKinship( inputDir: str, outputFile: str, jobs: int, prepare ):
+
+    files = findDNAFiles( inputDir, fileEndings )
+
+    with tempfile.TemporaryDirectory( prefix='DNASuperKit-' ) as directory:
+
+        # Kits are loaded by --jobs processes, and kept on disk until the positions of all kits are known
+        load = functools.partial( loadMatchKit, inputDir=inputDir, prepare=prepare )
+        pool = multiprocessing.Pool( min( jobs, len( files ) ) ) if jobs > 1 and files else None
+        loaded = pool.imap( load, files ) if pool else map( load, files )
+
+        kits = []
+        panel = np.array( [], dtype=np.int64 )
+        for file, ( company, keys, bits ) in zip( files, loaded ):
+            if company == 'unknown':
+                print( f'Skipping {file}, not a compatible DNA file or superkit' )
+                continue
+            print( f'Loaded {file} ({company})' )
+            np.save( os.path.join( directory, f'{len( kits )}.keys.npy' ), keys )
+            np.save( os.path.join( directory, f'{len( kits )}.bits.npy' ), bits )
+            panel = np.union1d( panel, keys )
+            kits.append( ( file.replace( inputDir, '' ), company ) )
+
+        if pool:
+            pool.close()
+            pool.join()
+
+        if len( kits ) < 2:
+            print( 'At least two compatible files are needed for --kinship' )
+            return
+
+        genotypes = np.lib.format.open_memmap( os.path.join( directory, 'genotypes.npy' ), mode='w+', dtype=np.uint8, shape=( len( kits ), len( panel ) ) )
+        for row in range( len( kits ) ):
+            genotypes[ row ] = projectMatchKit( panel, np.load( os.path.join( directory, f'{row}.keys.npy' ) ), np.load( os.path.join( directory, f'{row}.bits.npy' ) ) )
+
+        start_time = time.time()
+        kinshipCoefficients, ibs0, shared = computeKinship( genotypes )
+        elapsed_time = time.time() - start_time
+        del genotypes
+
+    # A row per pair of kits
+    first, second = np.triu_indices( len( kits ), k=1 )
+    names = np.array( [ name for name, company in kits ], dtype=object )
+    pairs = pd.DataFrame( {
+        'kit1': names[ first ],
+        'kit2': names[ second ],
+        'sharedSnps': shared[ first, second ].astype( np.int64 ),
+        'kinship': kinshipCoefficients[ first, second ],
+        'ibs0': ibs0[ first, second ]
+    } )
+    pairs[ 'relationship' ] = [ getRelationship( k, i ) for k, i in zip( pairs[ 'kinship' ], pairs[ 'ibs0' ] ) ]
+    pairs = pairs.sort_values( 'kinship', ascending=False )
+    pairs.to_csv( outputFile, index=False, float_format='%.5f' )
+
+    related = pairs[ pairs[ 'relationship' ] != 'Unrelated' ]
+
+    print()
+    print( '######################################################################' )
+    print( '#' )
+    print( f'# Kits:                   {len( kits )}' )
+    print( f'# Positions:              {len( panel )}' )
+    print( f'# Pairs:                  {len( pairs )}' )
+    print( f'# Related pairs:          {len( related )}' )
+    print( f'# Kinship table:          {outputFile}' )
+    print( '#' )
+    print( '######################################################################' )
+    print()
+
+    if len( related ):
+        print( related.head( matchMaxResults ).to_string( index=False, float_format=lambda x: f'{x:.4f}' ) )
+        print()
+
+    print( f'Kinship of all pairs estimated in {elapsed_time * 1000:.1f} ms' )
+    print()
+
+
+##########################################
+
+
+####################################################################################
+####################################################################################
@@ -0,0 +1,349 @@
+##############################################################################################
+# Liftover of GRCh38 kits to GRCh37 (--liftover)
+# of create_py
+#
+
+import os
+import pandas as pd
+import numpy as np
+import json
+
+from superkit_tables import chromosomePriorityList, chromosomeTableVCF, alleleComplements
+
+
+####################################################################################
+# LIFTOVER FUNCTIONS (--liftover)
+####################################################################################
+
+# All DNA file formats here are on GRCh37 (hg19), but newer exports and VCF files can be
+# on GRCh38, and their positions would not match those of the other kits. With --liftover
+# the genome build of every kit is detected from a sample of its rows: the rsids that are
+# in the DNA file templates are anchors, and the build is the one where the positions of
+# the kit (GRCh37) or the positions lifted over (GRCh38) match the template positions of
+# the anchors. VCF files without rsids are compared on the template positions only.
+# The chunks of a kit are held back until buildDetectionRows rows (or the whole kit) are
+# read, the sample is spread over those, and the build is kept for the rest of the kit,
+# so the build does not depend on the chunk size of the out-of-core builds.
+#
+# GRCh38 kits are lifted over with the UCSC chain file ./data/hg38ToHg19.over.chain.gz.
+# It is compiled once to ./data/hg38ToHg19.npy, the aligned blocks sorted on chromosome
+# and start, and memory-mapped, so a kit is lifted over with one binary search. Rows in
+# no block are dropped, and calls in blocks on the reverse strand are complemented. Two
+# GRCh38 positions can land on one GRCh37 position (collisions), the row of the first
+# position of the kit keeps it and the rows of the other positions are dropped. The
+# GRCh37 positions taken are remembered over the chunks of the kit.
+
+# Chain file from GRCh38 to GRCh37, compiled to a memory-mapped file, and the compiled
+# blocks when loaded
+liftoverChainFile = './data/hg38ToHg19.over.chain.gz'
+liftoverFile = './data/hg38ToHg19.npy'
+liftoverBlocks = {}
+# Record layout of the compiled chain file, one record per aligned block
+liftoverDtype = np.dtype( [
+    ( 'start', '<i8' ),                 # Index in chromosomePriorityList * 2**40 + start on GRCh38, 0-based
+    ( 'size', '<u4' ),
+    ( 'chromosome', 'i1' ),             # Index in chromosomePriorityList on GRCh37
+    ( 'target', '<i8' ),                # Start on GRCh37, 0-based, the end of the block on the reverse strand
+    ( 'reverse', '?' )
+] )
+# Rows of a kit whose positions are compared with the templates to detect the genome build,
+# and the least number of them that must agree with a build
+buildSampleRows = 5000
+buildMinimumAnchors = 20
+# Rows at the start of a kit the sample is spread over, held back until the build is known,
+# so the build is the same for any chunk size
+buildDetectionRows = 200000
+# The first template position of every rsid of the template positions last used
+buildAnchors = {}
+
+
+##########################################
+# Chromosome names of a chain file as index in
+# chromosomePriorityList, -1 for other contigs
+
+def getChainChromosomes( names: pd.Series ) -> np.ndarray:
+
+    names = names.str.replace( r'^(?i:chr)', '', regex=True ).replace( chromosomeTableVCF )
+
+
+    return pd.Categorical( names, categories=chromosomePriorityList ).codes.astype( np.int64 )
+
+
+##########################################
+
+
+##########################################
+# Compile the aligned blocks of the chain file
+
+def buildLiftoverBlocks() -> np.ndarray:
+
+    # A chain is a header line followed by lines with the size of a block and the gaps after it
+    # on both builds, the last block without gaps
+    chain = pd.read_csv( liftoverChainFile, sep=r'\s+', header=None, names=range( 13 ), dtype=str, comment='#' )
+    header = ( chain[ 0 ] == 'chain' ).to_numpy()
+    chainIndex = np.cumsum( header )[ ~header ] - 1
+    headers = chain[ header ]
+    rows = chain[ ~header ]
+
+    size = rows[ 0 ].astype( np.int64 ).to_numpy()
+    gapSource = pd.to_numeric( rows[ 1 ] ).fillna( 0 ).to_numpy( dtype=np.int64 )
+    gapTarget = pd.to_numeric( rows[ 2 ] ).fillna( 0 ).to_numpy( dtype=np.int64 )
+
+    # Start of every block from the start of its chain, the blocks and gaps before it
+    offsetSource = pd.Series( size + gapSource ).groupby( chainIndex ).cumsum().to_numpy() - ( size + gapSource )
+    offsetTarget = pd.Series( size + gapTarget ).groupby( chainIndex ).cumsum().to_numpy() - ( size + gapTarget )
+
+    sourceChromosome = getChainChromosomes( headers[ 2 ] )[ chainIndex ]
+    targetChromosome = getChainChromosomes( headers[ 7 ] )[ chainIndex ]
+    sourceStart = headers[ 5 ].astype( np.int64 ).to_numpy()[ chainIndex ] + offsetSource
+    targetStart = headers[ 10 ].astype( np.int64 ).to_numpy()[ chainIndex ] + offsetTarget
+    targetSize = headers[ 8 ].astype( np.int64 ).to_numpy()[ chainIndex ]
+    reverse = ( headers[ 9 ] == '-' ).to_numpy()[ chainIndex ]
+
+    # Blocks to or from other contigs (alternative haplotypes, unplaced) are left out
+    keep = ( sourceChromosome >= 0 ) & ( targetChromosome >= 0 )
+    blocks = np.zeros( np.count_nonzero( keep ), dtype=liftoverDtype )
+    blocks[ 'start' ] = sourceChromosome[ keep ] * 2**40 + sourceStart[ keep ]
+    blocks[ 'size' ] = size[ keep ]
+    blocks[ 'chromosome' ] = targetChromosome[ keep ]
+    # Positions on the reverse strand count from the end of the chromosome
+    blocks[ 'target' ] = np.where( reverse, targetSize - 1 - targetStart, targetStart )[ keep ]
+    blocks[ 'reverse' ] = reverse[ keep ]
+
+
+    return blocks[ np.argsort( blocks[ 'start' ], kind='stable' ) ]
+
+
+##########################################
+
+
+##########################################
+# Load the compiled chain file, compiled again
+# when the chain file has changed.
+# Returns None without chain file
+
+def loadLiftoverBlocks() -> np.ndarray:
+
+    if 'blocks' in liftoverBlocks:
+        return liftoverBlocks[ 'blocks' ]
+
+    blocks = None
+    if os.path.exists( liftoverChainFile ):
+        stamp = os.stat( liftoverChainFile ).st_mtime_ns
+        stampFile = liftoverFile[ :-len( '.npy' ) ] + '.json'
+        compiledStamp = None
+        if os.path.exists( liftoverFile ) and os.path.exists( stampFile ):
+            with open( stampFile ) as f:
+                compiledStamp = json.load( f ).get( 'stamp' )
+
+        if compiledStamp == stamp:
+            blocks = np.load( liftoverFile, mmap_mode='r' )
+        else:
+            blocks = buildLiftoverBlocks()
+
+            # Replaced in one step as other processes may read it, as the reference panel
+            try:
+                np.save( f'{liftoverFile}.{os.getpid()}.tmp.npy', blocks )
+                os.replace( f'{liftoverFile}.{os.getpid()}.tmp.npy', liftoverFile )
+                with open( f'{stampFile}.{os.getpid()}.tmp', 'w' ) as f:
+                    json.dump( { 'stamp': stamp }, f )
+                os.replace( f'{stampFile}.{os.getpid()}.tmp', stampFile )
+            except OSError:
+                pass
+    else:
+        print( f'No chain file in {liftoverChainFile}, GRCh38 kits are not lifted over' )
+
+    liftoverBlocks[ 'blocks' ] = blocks
+
+
+    return blocks
+
+
+##########################################
+
+
+##########################################
+# Lift GRCh38 positions over to GRCh37. Returns the
+# chromosomes (index in chromosomePriorityList) and
+# positions on GRCh37, and which positions are in a
+# block and which on the reverse strand
+
+def liftPositions( blocks: np.ndarray, chromosome: np.ndarray, position: np.ndarray ) -> tuple:
+
+    # The pseudoautosomal region XY is on X in the chain files
+    xy = chromosome == chromosomePriorityList.index( 'XY' )
+    source = np.where( xy, chromosomePriorityList.index( 'X' ), chromosome )
+
+    # Block that starts last at or before every position
+    keys = source * 2**40 + position - 1
+    index = np.searchsorted( blocks[ 'start' ], keys, side='right' ) - 1
+    mapped = ( index >= 0 ) & ( chromosome > 0 ) & ( position > 0 )
+    index = np.maximum( index, 0 )
+    offset = keys - blocks[ 'start' ][ index ]
+    mapped &= offset < blocks[ 'size' ][ index ]
+
+    reverse = mapped & blocks[ 'reverse' ][ index ]
+    lifted = blocks[ 'target' ][ index ] + np.where( reverse, -offset, offset ) + 1
+    liftedChromosome = blocks[ 'chromosome' ][ index ].astype( np.int64 )
+    liftedChromosome[ xy & ( liftedChromosome == chromosomePriorityList.index( 'X' ) ) ] = chromosomePriorityList.index( 'XY' )
+
+
+    return liftedChromosome, lifted, mapped, reverse
+
+
+##########################################
+
+
+##########################################
+# Detect the genome build of a normalized DNA file from
+# a sample of its rows and the keys and rsids of the
+# template positions. Returns the build (GRCh37, GRCh38
+# or unknown), the number of anchors and the number of
+# anchors on the build
+
+def detectGenomeBuild( df: pd.DataFrame, blocks: np.ndarray, templates: tuple ) -> tuple:
+
+    templateKeys, templateRsids = templates
+    if len( templateKeys ) == 0 or len( df ) == 0:
+        return 'unknown', 0, 0
+
+    # The first template position of every rsid, looked up by hash
+    if buildAnchors.get( 'rsids' ) is not templateRsids:
+        rsids = pd.Index( templateRsids )
+        first = ~rsids.duplicated()
+        buildAnchors.update( { 'rsids': templateRsids, 'anchors': ( rsids[ first ], templateKeys[ first ] ) } )
+    anchorRsids, anchorKeys = buildAnchors[ 'anchors' ]
+
+    # A sample spread over the kit
+    sample = df.iloc[ ::max( 1, len( df ) // buildSampleRows ) ]
+    chromosome = pd.Categorical( sample[ 'chromosome' ], categories=chromosomePriorityList ).codes.astype( np.int64 )
+    position = sample[ 'position' ].to_numpy( dtype=np.int64 )
+    keys = np.where( chromosome > 0, chromosome * 2**40 + position, -1 )
+    liftedKeys = np.full( len( sample ), -1, dtype=np.int64 )
+    if blocks is not None and len( blocks ):
+        liftedChromosome, lifted, mapped, _ = liftPositions( blocks, chromosome, position )
+        liftedKeys[ mapped ] = liftedChromosome[ mapped ] * 2**40 + lifted[ mapped ]
+
+    index = anchorRsids.get_indexer( sample[ 'rsid' ] )
+    anchored = index >= 0
+    if np.count_nonzero( anchored ) >= buildMinimumAnchors:
+        anchors = np.count_nonzero( anchored )
+        matchesGRCh37 = np.count_nonzero( keys[ anchored ] == anchorKeys[ index[ anchored ] ] )
+        matchesGRCh38 = np.count_nonzero( liftedKeys[ anchored ] == anchorKeys[ index[ anchored ] ] )
+
+    # No rsids (VCF files), the positions are looked up in the template positions
+    else:
+        anchors = len( sample )
+        matchesGRCh37 = np.count_nonzero( np.isin( keys, templateKeys ) )
+        matchesGRCh38 = np.count_nonzero( np.isin( liftedKeys, templateKeys ) )
+
+    build, matches = 'unknown', max( matchesGRCh37, matchesGRCh38 )
+    if matchesGRCh37 >= buildMinimumAnchors and matchesGRCh37 >= 2 * matchesGRCh38:
+        build = 'GRCh37'
+    elif matchesGRCh38 >= buildMinimumAnchors and matchesGRCh38 >= 2 * matchesGRCh37:
+        build = 'GRCh38'
+
+
+    return build, anchors, matches
+
+
+##########################################
+
+
+##########################################
+# Lift a GRCh38 DNA file over to GRCh37 and count
+# what was done in statistics. Chunks are held back
+# and returned empty until the build is detected on
+# the template positions of templates (keys, rsids),
+# statistics[ 'final' ] is set for the last chunk
+
+def liftoverDNAFile( df: pd.DataFrame, statistics: dict, templates: tuple ) -> pd.DataFrame:
+
+    blocks = loadLiftoverBlocks()
+    if 'build' not in statistics:
+        statistics.setdefault( 'pending', [] ).append( df )
+        if sum( len( pending ) for pending in statistics[ 'pending' ] ) < buildDetectionRows and not statistics.get( 'final' ):
+            return df.iloc[ :0 ]
+
+        df = pd.concat( statistics.pop( 'pending' ) )
+        build, anchors, matches = detectGenomeBuild( df.iloc[ :buildDetectionRows ], blocks, templates )
+        statistics.update( { 'build': build, 'anchors': anchors, 'matches': matches, 'lifted': 0, 'reverse': 0, 'unmapped': 0, 'collisions': 0,
+                             'targets': np.array( [], dtype=np.int64 ), 'sources': np.array( [], dtype=np.int64 ) } )
+
+    if statistics[ 'build' ] != 'GRCh38' or blocks is None or len( df ) == 0:
+        return df
+
+    # Chromosome 0 and position 0 are junk and are kept as they are
+    chromosome = pd.Categorical( df[ 'chromosome' ], categories=chromosomePriorityList ).codes.astype( np.int64 )
+    position = df[ 'position' ].to_numpy( dtype=np.int64 )
+    lift = ( chromosome > 0 ) & ( position > 0 )
+    liftedChromosome, lifted, mapped, reverse = liftPositions( blocks, chromosome, position )
+
+    # GRCh37 positions taken by another GRCh38 position, in this chunk or an earlier one
+    rows = np.flatnonzero( mapped )
+    sourceKeys = chromosome[ rows ] * 2**40 + position[ rows ]
+    targets, first, inverse = np.unique( liftedChromosome[ rows ] * 2**40 + lifted[ rows ], return_index=True, return_inverse=True )
+    sources = sourceKeys[ first ]
+    index = np.minimum( np.searchsorted( statistics[ 'targets' ], targets ), max( len( statistics[ 'targets' ] ) - 1, 0 ) )
+    held = np.zeros( len( targets ), dtype=bool ) if len( statistics[ 'targets' ] ) == 0 else statistics[ 'targets' ][ index ] == targets
+    sources[ held ] = statistics[ 'sources' ][ index[ held ] ]
+    collided = np.zeros( len( df ), dtype=bool )
+    collided[ rows ] = sourceKeys != sources[ inverse ]
+    mapped &= ~collided
+    reverse &= ~collided
+
+    targets = np.concatenate( [ statistics[ 'targets' ], targets[ ~held ] ] )
+    order = np.argsort( targets, kind='stable' )
+    statistics[ 'targets' ] = targets[ order ]
+    statistics[ 'sources' ] = np.concatenate( [ statistics[ 'sources' ], sources[ ~held ] ] )[ order ]
+
+    df = df.assign(
+        chromosome=np.where( mapped, np.array( chromosomePriorityList, dtype=object )[ liftedChromosome ], df[ 'chromosome' ].to_numpy( dtype=object ) ),
+        position=np.where( mapped, lifted, position )
+    )
+
+    # Calls on the reverse strand of GRCh37 are complemented
+    if reverse.any():
+        complements = { allele: int( alleleComplements[ allele ] ) for allele in b'ACGT' }
+        for column in [ 'genotype', 'ref', 'alt' ]:
+            if column in df:
+                df.loc[ reverse, column ] = df.loc[ reverse, column ].str.translate( complements )
+
+    statistics[ 'lifted' ] += int( np.count_nonzero( mapped ) )
+    statistics[ 'reverse' ] += int( np.count_nonzero( reverse ) )
+    statistics[ 'unmapped' ] += int( np.count_nonzero( lift & ~mapped & ~collided ) )
+    statistics[ 'collisions' ] += int( np.count_nonzero( collided ) )
+
+
+    return df[ ~( lift & ~mapped ) ]
+
+
+##########################################
+
+
+##########################################
+# Show the genome build of a kit and how it was lifted over
+
+def printLiftoverStatistics( name: str, statistics: dict ):
+
+    if not statistics:
+        return
+
+    build = f'Genome build of {name}: {statistics[ "build" ]} ({statistics[ "matches" ]} of {statistics[ "anchors" ]} anchors)'
+    if statistics[ 'build' ] == 'GRCh38' and liftoverBlocks.get( 'blocks' ) is not None:
+        print( f'{build}, {statistics[ "lifted" ]} SNPs lifted over to GRCh37, {statistics[ "reverse" ]} of them on the reverse strand, '
+               f'{statistics[ "unmapped" ]} SNPs not in the chain file and {statistics[ "collisions" ]} SNPs lifted onto the GRCh37 position of another SNP dropped' )
+    elif statistics[ 'build' ] == 'GRCh37':
+        print( build )
+    else:
+        print( f'{build}, the positions are taken as they are' )
+
+
+    return
+
+
+##########################################
+
+
+####################################################################################
+####################################################################################
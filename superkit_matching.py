@@ -0,0 +1,555 @@
+##############################################################################################
+# Matching kits and the match database (--match/--matchAdd/--matchFind)
+# of create_superkit.py
+#
+
+import os
+import pandas as pd
+import numpy as np
+import re
+import sys
+import time
+import json
+import functools
+import multiprocessing
+
+from superkit_tables import chromosomePriorityList, chromosomeTableAncestryIn, alleleBits
+from superkit_files import fileEndings, findDNAFiles, splitArchivePath, openDNAFile, getFileStamp, screenDNAFile
+
+
+####################################################################################
+# VARIABLES
+####################################################################################
+
+# Genetic map with the chromosome, position and centimorgan of every line, and the map when loaded
+geneticMapFile = './data/genetic-map.txt'
+geneticMap = {}
+
+# Number of kits of the match database a worker searches at a time, and the number of matches shown at most
+matchSearchChunkKits = 64
+matchMaxResults = 50
+
+
+####################################################################################
+# MATCHING FUNCTIONS (--match)
+####################################################################################
+
+# Two kits are compared as the matching sites do, over the autosomal SNPs both kits
+# have called. Every genotype is coded as the bits of its alleles (A 1, C 2, G 4, T 8),
+# so AG and GA are the same code and a homozygous genotype has one bit. Two genotypes
+# share no allele when their codes have no bit in common, an opposite homozygote like
+# AA and GG. A half identical segment (IBS1) is a run of shared SNPs without opposite
+# homozygotes, and a fully identical segment (IBS2) a run of shared SNPs with the same
+# genotype. Runs are found for all chromosomes at once with array operations, and
+# kept when they have at least --matchMinimumSnps SNPs and --matchMinimumCentimorgans.
+#
+# Centimorgans are interpolated from the genetic map in ./data/genetic-map.txt. It has a
+# line per position with the chromosome, position and centimorgan (tab, space or comma
+# separated, with or without header), like the HapMap and 1000 Genomes maps (with the
+# rate column) or a PLINK .map file. Without a map 1 centimorgan per million base pairs
+# is used, which is only a rough guess.
+
+
+##########################################
+# Path of a kit of --match and --matchFind, files
+# that are not found are looked for in inputDir
+
+def getMatchKitFile( file: str, inputDir: str ) -> str:
+
+    if not os.path.exists( splitArchivePath( file )[ 0 ] ) and os.path.exists( splitArchivePath( inputDir + file )[ 0 ] ):
+        file = inputDir + file
+
+
+    return file
+
+
+##########################################
+
+
+##########################################
+# Load a DNA file, normalized and cleaned with
+# prepare( file, company ), or a superkit in SuperKit
+# format as sorted chromosome and position keys and
+# allele bits of the called autosomal SNPs. The
+# company is unknown for other files
+
+def loadMatchKit( file: str, inputDir: str, prepare ) -> tuple:
+
+    file = getMatchKitFile( file, inputDir )
+    company = screenDNAFile( file )
+    if company != 'unknown':
+        df = prepare( file, company )[ 0 ]
+    else:
+        # Superkits in SuperKit format have no comments to screen
+        with openDNAFile( file ) as f:
+            header = f.readline().strip().split( '\t' )
+            if header != [ 'rsid', 'chromosome', 'position', 'genotype' ]:
+                return 'unknown', np.array( [], dtype=np.int64 ), np.array( [], dtype=np.uint8 )
+            df = pd.read_csv( f, sep='\t', header=None, names=header, dtype={ 'rsid': str, 'chromosome': str, 'position': np.int64, 'genotype': str } )
+        company = 'SuperKit'
+
+    # Autosomal chromosomes only
+    chromosome = pd.Categorical( df[ 'chromosome' ], categories=chromosomePriorityList ).codes.astype( np.int64 )
+    df = df[ ( chromosome >= 1 ) & ( chromosome <= 22 ) ]
+    chromosome = chromosome[ ( chromosome >= 1 ) & ( chromosome <= 22 ) ]
+    keys = chromosome * 2**40 + df[ 'position' ].to_numpy( dtype=np.int64 )
+
+    # Allele bits of both alleles, SNPs with a nocall in one of the alleles are dropped
+    genotypes = df[ 'genotype' ].str.encode( 'utf-8' ).to_numpy().astype( 'S2' ).view( np.uint8 ).reshape( -1, 2 )
+    first = alleleBits[ genotypes[ :, 0 ] ]
+    second = alleleBits[ genotypes[ :, 1 ] ]
+    called = ( first > 0 ) & ( second > 0 )
+    keys = keys[ called ]
+    bits = ( first | second )[ called ]
+
+    # One genotype per position, the first in the file as when merging
+    keys, rows = np.unique( keys, return_index=True )
+
+
+    return company, keys, bits[ rows ]
+
+
+##########################################
+
+
+##########################################
+# Load the genetic map, as positions and centimorgans
+# per chromosome number
+
+def loadGeneticMap() -> dict:
+
+    if geneticMap or not os.path.exists( geneticMapFile ):
+        return geneticMap
+
+    with open( geneticMapFile ) as f:
+        firstLine = f.readline()
+    sep = ',' if ',' in firstLine else r'\s+'
+    fields = re.split( sep, firstLine.strip() )
+    hasHeader = not re.fullmatch( r'\d+(\.\d*)?', fields[ -1 ] )
+    df = pd.read_csv( geneticMapFile, sep=sep, header=None, skiprows=1 if hasHeader else 0, comment='#', dtype=str )
+
+    # Columns by name, or by the number of columns
+    names = [ name.lower() for name in fields ] if hasHeader else []
+    if hasHeader and any( 'pos' in name for name in names ) and any( name.startswith( ( 'map', 'cm', 'genetic' ) ) for name in names ):
+        positionColumn = [ i for i, name in enumerate( names ) if 'pos' in name ][ 0 ]
+        centimorganColumn = [ i for i, name in enumerate( names ) if name.startswith( ( 'map', 'cm', 'genetic' ) ) ][ 0 ]
+    elif df.shape[ 1 ] == 4 and not re.fullmatch( r'\d+', str( df.iloc[ 0, 1 ] ) ):
+        # PLINK .map, chromosome, rsid, centimorgan and position
+        positionColumn, centimorganColumn = 3, 2
+    else:
+        # chromosome, position and centimorgan, with a rate before the centimorgan in the HapMap maps
+        positionColumn, centimorganColumn = 1, df.shape[ 1 ] - 1
+
+    chromosome = df[ 0 ].str.replace( r'^chr', '', regex=True, case=False ).str.upper()
+    chromosome = pd.Categorical( chromosome.replace( chromosomeTableAncestryIn ), categories=chromosomePriorityList ).codes
+    df = pd.DataFrame( { 'chromosome': chromosome, 'position': pd.to_numeric( df[ positionColumn ] ), 'centimorgan': pd.to_numeric( df[ centimorganColumn ] ) } )
+    df = df[ ( df[ 'chromosome' ] >= 1 ) & ( df[ 'chromosome' ] <= 22 ) ].sort_values( [ 'chromosome', 'position' ] )
+
+    for chromosome, group in df.groupby( 'chromosome' ):
+        geneticMap[ chromosome ] = ( group[ 'position' ].to_numpy(), group[ 'centimorgan' ].to_numpy() )
+
+
+    return geneticMap
+
+
+##########################################
+
+
+##########################################
+# Centimorgans of chromosome and position keys
+
+def getCentimorgans( keys: np.ndarray ) -> np.ndarray:
+
+    chromosome = keys >> 40
+    position = keys & ( 2**40 - 1 )
+    centimorgans = position / 1e6
+
+    for number, ( positions, mapCentimorgans ) in loadGeneticMap().items():
+        rows = chromosome == number
+        centimorgans[ rows ] = np.interp( position[ rows ], positions, mapCentimorgans )
+
+
+    return centimorgans
+
+
+##########################################
+
+
+##########################################
+# Runs of SNPs where match is true on the same
+# chromosome, with at least minimumSnps SNPs and
+# minimumCentimorgans. Returns the first and last
+# SNP of every run
+
+def findMatchRuns( keys: np.ndarray, match: np.ndarray, centimorgans: np.ndarray, minimumSnps: int, minimumCentimorgans: float ) -> tuple:
+
+    chromosome = keys >> 40
+    newChromosome = np.r_[ True, chromosome[ 1: ] != chromosome[ :-1 ] ]
+    lastOfChromosome = np.r_[ newChromosome[ 1: ], True ]
+
+    first = np.flatnonzero( match & ( np.r_[ True, ~match[ :-1 ] ] | newChromosome ) )
+    last = np.flatnonzero( match & ( np.r_[ ~match[ 1: ], True ] | lastOfChromosome ) )
+
+    keep = ( last - first + 1 >= minimumSnps ) & ( centimorgans[ last ] - centimorgans[ first ] >= minimumCentimorgans )
+
+
+    return first[ keep ], last[ keep ]
+
+
+##########################################
+
+
+##########################################
+# Half identical and fully identical segments of two
+# kits, from their keys and allele bits, of at least
+# minimumSnps SNPs and minimumCentimorgans. Returns a
+# dataframe with a row per segment and the number
+# of shared SNPs
+
+def matchGenotypes( keysA: np.ndarray, bitsA: np.ndarray, keysB: np.ndarray, bitsB: np.ndarray, minimumSnps: int, minimumCentimorgans: float ) -> tuple:
+
+    keys, rowsA, rowsB = np.intersect1d( keysA, keysB, assume_unique=True, return_indices=True )
+    bitsA = bitsA[ rowsA ]
+    bitsB = bitsB[ rowsB ]
+    centimorgans = getCentimorgans( keys )
+
+    segments = []
+    for kind, match in [ ( 'half', ( bitsA & bitsB ) > 0 ), ( 'full', bitsA == bitsB ) ]:
+        first, last = findMatchRuns( keys, match, centimorgans, minimumSnps, minimumCentimorgans )
+        segments.append( pd.DataFrame( {
+            'type': kind,
+            'chromosome': keys[ first ] >> 40,
+            'start': keys[ first ] & ( 2**40 - 1 ),
+            'end': keys[ last ] & ( 2**40 - 1 ),
+            'centimorgans': centimorgans[ last ] - centimorgans[ first ],
+            'snps': last - first + 1
+        } ) )
+
+
+    return pd.concat( segments, ignore_index=True ), len( keys )
+
+
+##########################################
+
+
+##########################################
+# Compare the two kits of --match and show the
+# segments they share, see loadMatchKit and
+# matchGenotypes
+
+def matchDNAFiles( files: list, inputDir: str, minimumSnps: int, minimumCentimorgans: float, prepare ):
+
+    kits = []
+    for file in files:
+        company, keys, bits = loadMatchKit( file, inputDir, prepare )
+        if company == 'unknown':
+            print( f'{file} is not a compatible DNA file or superkit' )
+            sys.exit( 1 )
+        kits.append( ( file, company, keys, bits ) )
+
+    if not loadGeneticMap():
+        print( f'No genetic map in {geneticMapFile}, using 1 cM per million base pairs' )
+
+    start_time = time.time()
+    segments, sharedSnps = matchGenotypes( kits[ 0 ][ 2 ], kits[ 0 ][ 3 ], kits[ 1 ][ 2 ], kits[ 1 ][ 3 ], minimumSnps, minimumCentimorgans )
+    elapsed_time = time.time() - start_time
+
+    half = segments[ segments[ 'type' ] == 'half' ]
+    full = segments[ segments[ 'type' ] == 'full' ]
+
+    print()
+    print( '######################################################################' )
+    print( '#' )
+    for file, company, keys, bits in kits:
+        print( f'# Kit:                    {file} ({company}), {len( keys )} autosomal SNPs' )
+    print( f'# Shared SNPs:            {sharedSnps}' )
+    print( f'# Minimum segment:        {minimumSnps} SNPs and {minimumCentimorgans} cM' )
+    print( '#' )
+    print( f'# Half identical:         {len( half )} segments, {half[ "centimorgans" ].sum():.1f} cM, largest {half[ "centimorgans" ].max() if len( half ) else 0:.1f} cM' )
+    print( f'# Fully identical:        {len( full )} segments, {full[ "centimorgans" ].sum():.1f} cM' )
+    print( '#' )
+    print( '######################################################################' )
+    print()
+
+    for kind, rows in [ ( 'Half identical segments', half ), ( 'Fully identical segments', full ) ]:
+        if len( rows ):
+            print( kind )
+            rows = rows.drop( columns='type' ).assign( chromosome=[ chromosomePriorityList[ c ] for c in rows[ 'chromosome' ] ] )
+            print( rows.to_string( index=False, float_format=lambda x: f'{x:.1f}' ) )
+            print()
+
+    print( f'Kits compared in {elapsed_time * 1000:.1f} ms' )
+    print()
+
+
+##########################################
+
+
+####################################################################################
+####################################################################################
+
+
+
+####################################################################################
+# MATCH DATABASE FUNCTIONS (--matchAdd, --matchFind)
+####################################################################################
+
+# The match database in ./output/DNASuperKit-matchdb/ holds many kits over one panel
+# of autosomal positions, the positions of the kits that were added first. Kits added
+# later only keep the positions in the panel. It is made of:
+#   panel.npy        chromosome and position keys of the panel
+#   genotypes.npy    allele bits (see MATCHING FUNCTIONS) of every kit on the panel, 0 where not called
+#   homozygous.npy   per kit and allele a bitset of the panel positions that are homozygous for the allele,
+#                    packed in 64 bit words
+#   kits.json        name, company and file size and time of every kit
+#
+# A search first scans the homozygous bitsets of all kits a word at a time. Two kits have
+# an opposite homozygote where both are homozygous and not for the same allele, and a
+# segment of --matchMinimumSnps SNPs in a row holds at least that many SNPs plus one,
+# divided by 64, less one, whole words without one. Only the kits with such a run of words,
+# usually family, are compared SNP by SNP as --match does. Segments of less than 127 SNPs
+# may not hold a whole word, then every kit is compared. Kits are searched in chunks by
+# --jobs processes that memory-map the database.
+
+
+##########################################
+# Pack the positions that are homozygous for each
+# allele in 64 bit words, from the allele bits of
+# one or more kits
+
+def packHomozygous( bits: np.ndarray ) -> np.ndarray:
+
+    homozygous = np.stack( [ bits == bit for bit in [ 1, 2, 4, 8 ] ], axis=-2 )
+    packed = np.packbits( homozygous, axis=-1, bitorder='little' )
+
+    # Pad to whole words
+    padding = -packed.shape[ -1 ] % 8
+    if padding:
+        packed = np.concatenate( [ packed, np.zeros( packed.shape[ :-1 ] + ( padding, ), dtype=np.uint8 ) ], axis=-1 )
+
+
+    return np.ascontiguousarray( packed ).view( np.uint64 )
+
+
+##########################################
+
+
+##########################################
+# Allele bits of a kit on the panel
+
+def projectMatchKit( panel: np.ndarray, keys: np.ndarray, bits: np.ndarray ) -> np.ndarray:
+
+    projected = np.zeros( len( panel ), dtype=np.uint8 )
+    rows = np.minimum( np.searchsorted( panel, keys ), len( panel ) - 1 )
+    found = panel[ rows ] == keys
+    projected[ rows[ found ] ] = bits[ found ]
+
+
+    return projected
+
+
+##########################################
+
+
+##########################################
+# Add the DNA files and superkits in inputDir to the
+# match database in databaseDir, new kits and changed
+# kits only, loaded by jobs processes
+
+def addMatchKits( databaseDir: str, inputDir: str, jobs: int, prepare ):
+
+    catalog = []
+    panel = None
+    if os.path.exists( databaseDir + 'kits.json' ):
+        with open( databaseDir + 'kits.json' ) as f:
+            catalog = json.load( f )
+        panel = np.load( databaseDir + 'panel.npy' )
+
+    stamps = { kit[ 'name' ]: kit[ 'stamp' ] for kit in catalog }
+    files = [ file for file in findDNAFiles( inputDir, fileEndings ) if stamps.get( file.replace( inputDir, '' ) ) != list( getFileStamp( file ) ) ]
+    if not files:
+        print( 'No new or changed kits in ./input/' )
+        return
+
+    # Kits are loaded by --jobs processes
+    load = functools.partial( loadMatchKit, inputDir=inputDir, prepare=prepare )
+    if jobs > 1:
+        with multiprocessing.Pool( min( jobs, len( files ) ) ) as pool:
+            loaded = pool.map( load, files )
+    else:
+        loaded = [ load( file ) for file in files ]
+
+    newKits = []
+    for file, ( company, keys, bits ) in zip( files, loaded ):
+        if company == 'unknown':
+            print( f'Skipping {file}, not a compatible DNA file or superkit' )
+            continue
+        print( f'Adding {file} ({company})' )
+        newKits.append( ( { 'name': file.replace( inputDir, '' ), 'company': company, 'stamp': list( getFileStamp( file ) ) }, keys, bits ) )
+    if not newKits:
+        return
+
+    # The panel is made from the first kits
+    if panel is None:
+        panel = np.unique( np.concatenate( [ keys for kit, keys, bits in newKits ] ) )
+
+    newNames = { kit[ 'name' ] for kit, keys, bits in newKits }
+    keptRows = [ row for row, kit in enumerate( catalog ) if kit[ 'name' ] not in newNames ]
+    catalog = [ catalog[ row ] for row in keptRows ] + [ kit for kit, keys, bits in newKits ]
+
+    # Written next to the database and swapped in, the old kits are copied a chunk at a time
+    os.makedirs( databaseDir, exist_ok=True )
+    words = ( len( panel ) + 63 ) // 64
+    genotypes = np.lib.format.open_memmap( databaseDir + 'genotypes.tmp.npy', mode='w+', dtype=np.uint8, shape=( len( catalog ), len( panel ) ) )
+    homozygous = np.lib.format.open_memmap( databaseDir + 'homozygous.tmp.npy', mode='w+', dtype=np.uint64, shape=( len( catalog ), 4, words ) )
+
+    if keptRows:
+        oldGenotypes = np.load( databaseDir + 'genotypes.npy', mmap_mode='r' )
+        oldHomozygous = np.load( databaseDir + 'homozygous.npy', mmap_mode='r' )
+        for first in range( 0, len( keptRows ), matchSearchChunkKits ):
+            rows = keptRows[ first:first + matchSearchChunkKits ]
+            genotypes[ first:first + len( rows ) ] = oldGenotypes[ rows ]
+            homozygous[ first:first + len( rows ) ] = oldHomozygous[ rows ]
+        del oldGenotypes, oldHomozygous
+
+    for row, ( kit, keys, bits ) in enumerate( newKits, start=len( keptRows ) ):
+        genotypes[ row ] = projectMatchKit( panel, keys, bits )
+        homozygous[ row ] = packHomozygous( genotypes[ row ] )
+
+    genotypes.flush()
+    homozygous.flush()
+    del genotypes, homozygous
+
+    np.save( databaseDir + 'panel.npy', panel )
+    os.replace( databaseDir + 'genotypes.tmp.npy', databaseDir + 'genotypes.npy' )
+    os.replace( databaseDir + 'homozygous.tmp.npy', databaseDir + 'homozygous.npy' )
+    with open( databaseDir + 'kits.json', 'w' ) as f:
+        json.dump( catalog, f )
+
+    print( f'Match database has {len( catalog )} kits on {len( panel )} positions' )
+
+
+    return
+
+
+##########################################
+
+
+##########################################
+# Search a chunk of the match database for kits that
+# share segments of the minimum SNPs and centimorgans
+# with the searched kit. Returns the row, segments
+# and shared SNPs of every match
+
+def searchMatchChunk( job: tuple ) -> list:
+
+    first, last, searched, databaseDir, minimumSnps, minimumCentimorgans = job
+
+    panel = np.load( databaseDir + 'panel.npy', mmap_mode='r' )
+    genotypes = np.load( databaseDir + 'genotypes.npy', mmap_mode='r' )
+
+    # Kits with enough words in a row without opposite homozygotes. A segment of minimumSnps
+    # positions holds this many whole words, when it holds none every kit is a candidate
+    runWords = ( minimumSnps + 1 ) // 64 - 1
+    if runWords < 1:
+        candidates = np.arange( last - first )
+    else:
+        homozygous = np.array( np.load( databaseDir + 'homozygous.npy', mmap_mode='r' )[ first:last ] )
+        searchedHomozygous = packHomozygous( searched )
+
+        # Words with an opposite homozygote, homozygous in both kits but not for the same allele
+        same = np.zeros( ( last - first, homozygous.shape[ 2 ] ), dtype=np.uint64 )
+        for allele in range( 4 ):
+            same |= homozygous[ :, allele ] & searchedHomozygous[ allele ]
+        opposite = np.bitwise_or.reduce( homozygous, axis=1 ) & np.bitwise_or.reduce( searchedHomozygous, axis=0 ) & ~same
+
+        clean = np.cumsum( np.pad( opposite == 0, ( ( 0, 0 ), ( 1, 0 ) ) ), axis=1 )
+        candidates = np.flatnonzero( ( clean[ :, runWords: ] - clean[ :, :-runWords ] == runWords ).any( axis=1 ) )
+
+    matches = []
+    searchedCalled = searched > 0
+    for row in candidates + first:
+        called = genotypes[ row ] > 0
+        segments, sharedSnps = matchGenotypes( panel[ called ], genotypes[ row ][ called ], panel[ searchedCalled ], searched[ searchedCalled ], minimumSnps, minimumCentimorgans )
+        if len( segments ):
+            matches.append( ( row, segments, sharedSnps ) )
+
+
+    return matches
+
+
+##########################################
+
+
+##########################################
+# Search the match database in databaseDir for the
+# kit in searchedFile with jobs processes, and show
+# the matches ranked on shared centimorgans
+
+def findMatchingKits( searchedFile: str, databaseDir: str, inputDir: str, minimumSnps: int, minimumCentimorgans: float, jobs: int, prepare ):
+
+    if not os.path.exists( databaseDir + 'kits.json' ):
+        print( f'No match database in {databaseDir}, add kits with --matchAdd' )
+        return
+
+    company, keys, bits = loadMatchKit( searchedFile, inputDir, prepare )
+    if company == 'unknown':
+        print( f'{searchedFile} is not a compatible DNA file or superkit' )
+        sys.exit( 1 )
+
+    with open( databaseDir + 'kits.json' ) as f:
+        catalog = json.load( f )
+    panel = np.load( databaseDir + 'panel.npy' )
+    searched = projectMatchKit( panel, keys, bits )
+
+    # The searched kit is not its own match when it is in the database, by the name and stamp of --matchAdd
+    file = getMatchKitFile( searchedFile, inputDir )
+    stamp = list( getFileStamp( file ) )
+    ownRows = { row for row, kit in enumerate( catalog ) if kit[ 'name' ] == file.replace( inputDir, '' ) and kit[ 'stamp' ] == stamp }
+
+    if not loadGeneticMap():
+        print( f'No genetic map in {geneticMapFile}, using 1 cM per million base pairs' )
+
+    start_time = time.time()
+
+    chunks = [ ( first, min( first + matchSearchChunkKits, len( catalog ) ), searched, databaseDir, minimumSnps, minimumCentimorgans ) for first in range( 0, len( catalog ), matchSearchChunkKits ) ]
+    if jobs > 1:
+        with multiprocessing.Pool( min( jobs, len( chunks ) ) ) as pool:
+            found = pool.map( searchMatchChunk, chunks )
+    else:
+        found = [ searchMatchChunk( chunk ) for chunk in chunks ]
+
+    rows = []
+    for row, segments, sharedSnps in [ match for matches in found for match in matches if match[ 0 ] not in ownRows ]:
+        half = segments[ segments[ 'type' ] == 'half' ][ 'centimorgans' ]
+        full = segments[ segments[ 'type' ] == 'full' ][ 'centimorgans' ]
+        rows.append( { 'kit': catalog[ row ][ 'name' ], 'company': catalog[ row ][ 'company' ], 'totalCentimorgans': half.sum(), 'largestSegment': half.max() if len( half ) else 0.0, 'segments': len( half ), 'fullyIdenticalCentimorgans': full.sum(), 'sharedSnps': sharedSnps } )
+    matches = pd.DataFrame( rows, columns=[ 'kit', 'company', 'totalCentimorgans', 'largestSegment', 'segments', 'fullyIdenticalCentimorgans', 'sharedSnps' ] )
+    matches = matches[ matches[ 'segments' ] > 0 ].sort_values( 'totalCentimorgans', ascending=False )
+
+    elapsed_time = time.time() - start_time
+
+    print()
+    print( '######################################################################' )
+    print( '#' )
+    print( f'# Kit:                    {searchedFile} ({company}), {np.count_nonzero( searched )} of {len( panel )} panel positions' )
+    print( f'# Kits searched:          {len( catalog ) - len( ownRows )}' + ( ', the kit itself left out' if ownRows else '' ) )
+    print( f'# Matches:                {len( matches )}' )
+    print( f'# Minimum segment:        {minimumSnps} SNPs and {minimumCentimorgans} cM' )
+    print( '#' )
+    print( '######################################################################' )
+    print()
+
+    if len( matches ):
+        print( matches.head( matchMaxResults ).to_string( index=False, float_format=lambda x: f'{x:.1f}' ) )
+        print()
+
+    print( f'Match database searched in {elapsed_time * 1000:.1f} ms' )
+    print()
+
+
+##########################################
+
+
+####################################################################################
+####################################################################################
@@ -0,0 +1,302 @@
+##############################################################################################
+# Out-of-core builds (--memoryLimit)
+# of create_py
+#
+
+import os
+import pandas as pd
+import numpy as np
+
+from superkit_tables import chromosomePriorityList, genotypeTableXYMales
+
+
+####################################################################################
+# OUT-OF-CORE FUNCTIONS (--memoryLimit)
+####################################################################################
+
+# DNA files are read in chunks that are normalized, cleaned, sorted on chromosome and
+# position and written ("spilled") as binary runs of records to a temporary directory.
+# The runs are merged in blocks that always holds every row of a position, so the same
+# sortDNAFile and dropDuplicatesDNAFile as in memory are used on each block.
+# The merged superkit is spilled per chromosome and then formatted and written
+# chromosome by chromosome, in the chromosome order of the output format.
+# The records, runs and merges are here, the build of create_py spills and
+# merges the DNA files with them.
+
+# Estimated memory used by the interpreter and pandas, memory always left for DNA data
+# and memory used per row of a DNA file in pandas
+memoryBaselineBytes = 150 * 2**20
+memoryMinimumWorkingBytes = 64 * 2**20
+memoryBytesPerRow = 1000
+
+
+##########################################
+# Plan the number of rows in memory at a time
+# from the memory limit
+
+def getOutOfCorePlan( memoryLimit: int ) -> dict:
+
+    # Memory left for DNA data when the interpreter and pandas are loaded
+    workingBytes = max( memoryLimit - memoryBaselineBytes, memoryMinimumWorkingBytes )
+
+    # A chunk is held in a few copies while it is parsed, normalized and encoded
+    chunkRows = max( 10000, workingBytes // ( memoryBytesPerRow * 4 ) )
+
+
+    return { 'chunkRows': int( chunkRows ), 'mergeRows': int( chunkRows ) }
+
+
+##########################################
+
+
+##########################################
+# Record layout of spilled rows, rsid width
+# varies between runs
+
+def getRecordDtype( rsidWidth: int ) -> np.dtype:
+
+    return np.dtype( [
+        ( 'chromosome', 'i1' ),       # Index in chromosomePriorityList, unknown chromosomes last
+        ( 'position', 'i8' ),
+        ( 'company', 'i1' ),          # Index in companyPriorityList
+        ( 'file', 'i2' ),             # Index of the DNA file
+        ( 'order', 'i8' ),            # Row order of all DNA files concatenated
+        ( 'sexChromosome', '?' ),     # Row was on X/Y/MT before cleaning
+        ( 'genotype', 'S2' ),
+        ( 'rsid', f'S{max( rsidWidth, 1 )}' )
+    ] )
+
+
+##########################################
+
+
+##########################################
+# Encode a normalized dataframe to records, the
+# company as index in companies
+
+def encodeRecords( df: pd.DataFrame, companies: list, fileIndex: int = 0, firstOrder: int = 0, sexChromosome: np.ndarray = False ) -> np.ndarray:
+
+    rsid = df[ 'rsid' ].str.encode( 'utf-8' ).to_numpy().astype( 'S' )
+    records = np.zeros( len( df ), dtype=getRecordDtype( rsid.dtype.itemsize ) )
+
+    # Chromosomes not in chromosomePriorityList are sorted last, as NaN in sortDNAFile
+    chromosome = pd.Categorical( df[ 'chromosome' ], categories=chromosomePriorityList ).codes
+    records[ 'chromosome' ] = np.where( chromosome < 0, len( chromosomePriorityList ), chromosome )
+    records[ 'position' ] = df[ 'position' ].to_numpy()
+    if 'company' in df:
+        records[ 'company' ] = pd.Categorical( df[ 'company' ], categories=companies ).codes
+    records[ 'file' ] = fileIndex
+    records[ 'order' ] = firstOrder + np.arange( len( df ) )
+    records[ 'sexChromosome' ] = sexChromosome
+    records[ 'genotype' ] = df[ 'genotype' ].str.encode( 'utf-8' ).to_numpy().astype( 'S2' )
+    records[ 'rsid' ] = rsid
+
+
+    return records
+
+
+##########################################
+
+
+##########################################
+# Decode records to a normalized dataframe of the
+# companies, converting X/Y/MT genotypes of male kits
+
+def decodeRecords( records: np.ndarray, companies: list, maleFiles: np.ndarray = None ) -> pd.DataFrame:
+
+    chromosomeNames = np.array( chromosomePriorityList + [ np.nan ], dtype=object )
+    companyNames = np.array( companies, dtype=object )
+
+    df = pd.DataFrame( {
+        'rsid': np.char.decode( records[ 'rsid' ], 'utf-8' ).astype( object ),
+        'chromosome': chromosomeNames[ records[ 'chromosome' ] ],
+        'position': records[ 'position' ],
+        'genotype': np.char.decode( records[ 'genotype' ], 'utf-8' ).astype( object ),
+        'company': companyNames[ records[ 'company' ] ]
+    } )
+
+    # Normalize genotypes on X, Y and MT of male kits (see MAIN LOOP of create_py)
+    if maleFiles is not None and len( records ) > 0:
+        sexChromosomes = maleFiles[ records[ 'file' ] ] & records[ 'sexChromosome' ]
+        if sexChromosomes.any():
+            df.loc[ sexChromosomes, 'genotype' ] = df.loc[ sexChromosomes, 'genotype' ].replace( genotypeTableXYMales )
+
+
+    return df
+
+
+##########################################
+
+
+##########################################
+# Sort key of records, chromosome and position
+# as one integer
+
+def getRecordKeys( records: np.ndarray ) -> np.ndarray:
+
+    return records[ 'chromosome' ].astype( np.int64 ) * 2**40 + records[ 'position' ]
+
+
+##########################################
+
+
+##########################################
+# Write records to the end of a binary file,
+# and read them back
+
+def writeSegment( path: str, records: np.ndarray ) -> dict:
+
+    with open( path, 'ab' ) as f:
+        offset = f.tell()
+        records.tofile( f )
+
+
+    return { 'path': path, 'offset': offset, 'count': len( records ), 'dtype': records.dtype }
+
+
+def readSegment( segment: dict, start: int, count: int ) -> np.ndarray:
+
+    offset = segment[ 'offset' ] + start * segment[ 'dtype' ].itemsize
+
+
+    return np.fromfile( segment[ 'path' ], dtype=segment[ 'dtype' ], count=count, offset=offset )
+
+
+##########################################
+
+
+##########################################
+# Concatenate records with different rsid widths
+
+def concatenateRecords( recordList: list ) -> np.ndarray:
+
+    recordList = [ r for r in recordList if r is not None ]
+    if not recordList:
+        return np.zeros( 0, dtype=getRecordDtype( 1 ) )
+
+    rsidWidth = max( r.dtype[ 'rsid' ].itemsize for r in recordList )
+    dtype = getRecordDtype( rsidWidth )
+
+
+    return np.concatenate( [ r.astype( dtype ) for r in recordList ] )
+
+
+##########################################
+
+
+##########################################
+# Read a run (list of segments) in blocks
+
+def readSegments( segments: list, blockRows: int ):
+
+    for segment in segments:
+        for start in range( 0, segment[ 'count' ], blockRows ):
+            yield readSegment( segment, start, min( blockRows, segment[ 'count' ] - start ) )
+
+
+##########################################
+
+
+##########################################
+# Merge sorted runs in blocks. Every block holds
+# all rows of the keys in it, but is not sorted
+
+def mergeRuns( runs: list, blockRows: int, keyFunction ):
+
+    readers = [ readSegments( run, blockRows ) for run in runs ]
+    buffers = [ next( reader, None ) for reader in readers ]
+
+    while True:
+        active = [ i for i, buffer in enumerate( buffers ) if buffer is not None ]
+        if not active:
+            break
+
+        # Everything up to the smallest last key of the buffered blocks is complete
+        bound = min( keyFunction( buffers[ i ] )[ -1 ] for i in active )
+
+        block = []
+        for i in active:
+            # Take rows up to the bound, reading on while a run has more rows of the bound key
+            while buffers[ i ] is not None:
+                n = np.searchsorted( keyFunction( buffers[ i ] ), bound, side='right' )
+                block.append( buffers[ i ][ :n ] )
+                if n < len( buffers[ i ] ):
+                    buffers[ i ] = buffers[ i ][ n: ]
+                    break
+                buffers[ i ] = next( readers[ i ], None )
+
+        yield concatenateRecords( block )
+
+
+##########################################
+
+
+##########################################
+# Spill superkit records sorted on chromosome,
+# each chromosome to its own file
+
+def spillSuperKitRecords( store: dict, records: np.ndarray ):
+
+    chromosomes, starts = np.unique( records[ 'chromosome' ], return_index=True )
+    for chromosome, start, end in zip( chromosomes, starts, np.append( starts[ 1: ], len( records ) ) ):
+        path = os.path.join( store[ 'directory' ].name, f'chromosome{chromosome}.bin' )
+        store[ 'chromosomes' ].setdefault( int( chromosome ), [] ).append( writeSegment( path, records[ start:end ] ) )
+    store[ 'rows' ] += len( records )
+
+
+##########################################
+
+
+##########################################
+# Read a chromosome of the spilled superkit
+# sorted on position as text (tellmeGen v4)
+
+def readSegmentsAsText( store: dict, chromosome: int, segments: list, blockRows: int ):
+
+    # Positions with the same number of digits are in the same order as text,
+    # so split the chromosome in one run per number of digits and merge them
+    runs = {}
+    for records in readSegments( segments, blockRows ):
+        digits = np.char.str_len( records[ 'position' ].astype( 'S20' ) )
+        for digit in np.unique( digits ):
+            path = os.path.join( store[ 'directory' ].name, f'chromosome{chromosome}-{digit}.bin' )
+            runs.setdefault( digit, [] ).append( writeSegment( path, records[ digits == digit ] ) )
+
+    def positionText( records: np.ndarray ) -> np.ndarray:
+        return records[ 'position' ].astype( 'S20' )
+
+    for records in mergeRuns( [ runs[ digit ] for digit in sorted( runs ) ], blockRows, positionText ):
+        yield records[ np.argsort( positionText( records ), kind='stable' ) ]
+
+
+##########################################
+
+
+##########################################
+# Get the rows of the spilled superkit of the companies
+# that are in the DNA file template of the original
+# output format (--convertFormat)
+
+def selectOriginalPositions( store: dict, template: pd.DataFrame, companies: list ) -> pd.DataFrame:
+
+    # Keys of the positions in the format
+    df_original = template[ [ 'chromosome', 'position' ] ]
+    chromosome = pd.Categorical( df_original[ 'chromosome' ], categories=chromosomePriorityList ).codes
+    known = chromosome >= 0
+    originalKeys = np.unique( chromosome[ known ].astype( np.int64 ) * 2**40 + df_original[ 'position' ].astype( int ).to_numpy()[ known ] )
+
+    # Keep only superkit rows on those keys
+    selected = []
+    for segments in store[ 'chromosomes' ].values():
+        for records in readSegments( segments, store[ 'chunkRows' ] ):
+            selected.append( records[ np.isin( getRecordKeys( records ), originalKeys ) ] )
+
+
+    return decodeRecords( concatenateRecords( selected ), companies )[ [ 'rsid', 'chromosome', 'position', 'genotype' ] ]
+
+
+##########################################
+
+
+####################################################################################
+####################################################################################
@@ -0,0 +1,182 @@
+##############################################################################################
+# Loading the DNA files in worker processes (--jobs)
+# of create_superkit.py
+#
+
+import os
+import pandas as pd
+import numpy as np
+import tempfile
+import multiprocessing
+
+from superkit_tables import chromosomePriorityList, genotypeCodeList
+from superkit_files import screenDNAFile
+
+
+####################################################################################
+# PARALLEL INGEST FUNCTIONS (--jobs)
+####################################################################################
+
+# With --jobs the DNA files are loaded, normalized and cleaned in a pool of worker
+# processes. A pandas dataframe of strings is slow to pickle back to the main process,
+# so the workers write the columns of a kit as coded arrays to a memory-mapped file
+# instead: strings with few values (chromosome, genotype and company) as codes of a
+# small list of categories, rsid as fixed-width bytes and position as integers. Only
+# the layout of the file is pickled. The files are in /dev/shm when it exists, so the
+# kits never touch the disk. The kits are put in the kit cache (see screenDNAFile),
+# and the main loop takes them from there.
+#
+# The main process maps the file and builds the dataframe on the mapping. Chromosome,
+# genotype and company are categoricals on the codes, which are coded on the shared lists
+# of the superkit (chromosomePriorityList, genotypeCodeList and companyPriorityList), so the
+# kits are concatenated as codes without decoding them. Position is a view of the mapping,
+# which is mapped copy-on-write, and rsid is decoded from the mapping in one vectorized cast.
+
+# Directory of the memory-mapped files that worker processes hand the kits back through.
+# /dev/shm is in memory, elsewhere the default temporary directory is used
+sharedKitDir = '/dev/shm' if os.path.isdir( '/dev/shm' ) else None
+
+
+##########################################
+# Shared categories of the columns with few values, of
+# the companies in priority order. Other values of a
+# kit are added after them
+
+def getSharedCategories( companies: list ) -> dict:
+
+    return { 'chromosome': chromosomePriorityList, 'genotype': genotypeCodeList, 'company': companies }
+
+
+##########################################
+
+
+##########################################
+# Write the columns of a prepared DNA file to a
+# memory-mapped file, coded on the shared categories
+# of the companies. Returns the layout of the file
+
+def publishDNAFile( df: pd.DataFrame, path: str, companies: list ) -> dict:
+
+    columns = []
+    offset = 0
+    sharedCategories = getSharedCategories( companies )
+
+    with open( path, 'wb' ) as f:
+        for column in df.columns:
+            values = df[ column ]
+            categories = None
+
+            if values.dtype != object and not isinstance( values.dtype, pd.CategoricalDtype ):
+                array = values.to_numpy()
+            elif column == 'rsid' and not values.hasnans:
+                try:
+                    array = values.to_numpy().astype( 'S' )
+                except UnicodeEncodeError:
+                    array = values.str.encode( 'utf-8' ).to_numpy().astype( 'S' )
+            else:
+                # Codes of the shared categories, missing values get code -1
+                categories = list( sharedCategories.get( column, [] ) )
+                known = set( categories )
+                categories += [ value for value in pd.unique( values.dropna() ) if value not in known ]
+                codes = pd.Categorical( values, categories=categories ).codes
+                array = codes.astype( np.int8 if len( categories ) < 2**7 else np.int32 )
+
+            # Columns start on 8 byte boundaries
+            padding = -offset % 8
+            f.write( bytes( padding ) )
+            offset += padding
+
+            array.tofile( f )
+            columns.append( { 'name': column, 'dtype': array.dtype.str, 'offset': offset, 'categories': categories } )
+            offset += array.nbytes
+
+
+    return { 'path': path, 'rows': len( df ), 'columns': columns }
+
+
+##########################################
+
+
+##########################################
+# Map a DNA file written by publishDNAFile as a
+# dataframe on the mapping
+
+def attachDNAFile( kit: dict ) -> pd.DataFrame:
+
+    rows = kit[ 'rows' ]
+    # Copy-on-write, so the dataframe can be changed as any other
+    mapped = np.memmap( kit[ 'path' ], dtype=np.uint8, mode='c' ) if os.path.getsize( kit[ 'path' ] ) else np.zeros( 0, dtype=np.uint8 )
+
+    columns = {}
+    for column in kit[ 'columns' ]:
+        dtype = np.dtype( column[ 'dtype' ] )
+        values = mapped[ column[ 'offset' ]:column[ 'offset' ] + rows * dtype.itemsize ].view( dtype )
+
+        if column[ 'categories' ] is not None:
+            # Code -1 is missing
+            columns[ column[ 'name' ] ] = pd.Categorical.from_codes( values, categories=column[ 'categories' ] )
+        elif dtype.kind == 'S':
+            try:
+                columns[ column[ 'name' ] ] = values.astype( 'U' )
+            except UnicodeDecodeError:
+                columns[ column[ 'name' ] ] = np.char.decode( values, 'utf-8' )
+        else:
+            columns[ column[ 'name' ] ] = values
+
+
+    return pd.DataFrame( columns, copy=False )
+
+
+##########################################
+
+
+##########################################
+# Load, normalize and clean a DNA file with prepare
+# (file, company) in a worker process and publish it
+# to a memory-mapped file
+
+def prepareSharedDNAFile( job: tuple ) -> tuple:
+
+    file, company, path, prepare, companies = job
+    df, guessGender, chromosomeZero = prepare( file, company )
+
+
+    return publishDNAFile( df, path, companies ), guessGender, chromosomeZero
+
+
+##########################################
+
+
+##########################################
+# Prepare the DNA files that are not in the kit cache
+# with prepare (file, company) in jobs worker processes
+# and put them in it. The kits are coded on the shared
+# categories of the companies in priority order
+
+def prepareDNAFilesParallel( files: list, kitCache: dict, prepare, jobs: int, companies: list ):
+
+    # Files are screened here, it only reads the top of them
+    screened = []
+    for file in files:
+        company = screenDNAFile( file, kitCache )
+        if company != 'unknown' and 'kit' not in kitCache[ file ]:
+            screened.append( ( file, company ) )
+
+    if not screened:
+        return
+
+    with tempfile.TemporaryDirectory( prefix='DNASuperKit-', dir=sharedKitDir ) as directory:
+        with multiprocessing.Pool( min( jobs, len( screened ) ) ) as pool:
+
+            # Kits come back in order and are decoded and removed one at a time
+            workerJobs = [ ( file, company, os.path.join( directory, f'{i}.kit' ), prepare, companies ) for i, ( file, company ) in enumerate( screened ) ]
+            for ( file, company ), ( kit, guessGender, chromosomeZero ) in zip( screened, pool.imap( prepareSharedDNAFile, workerJobs ) ):
+                kitCache[ file ][ 'kit' ] = ( attachDNAFile( kit ), guessGender, chromosomeZero )
+                os.remove( kit[ 'path' ] )
+
+
+##########################################
+
+
+####################################################################################
+####################################################################################
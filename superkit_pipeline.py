@@ -0,0 +1,180 @@
+##############################################################################################
+# I/O and CPU pipeline of the build (--pipeline)
+# of create_py
+#
+
+import asyncio
+import concurrent.futures
+
+from superkit_files import getFileStamp, openDNAFile, prefetchedDNAFiles, screenDNAFile
+
+
+####################################################################################
+# PIPELINE FUNCTIONS (--pipeline)
+####################################################################################
+
+# With --pipeline the stages that wait on the disk and those that wait on the CPU
+# overlap. An asyncio orchestrator reads and decompresses the next DNA files into
+# memory in one executor thread while the file before is screened, parsed,
+# normalized and cleaned in another, and the output file is compressed and written
+# in one executor thread while the next rows are formatted in another. Reading,
+# decompressing and writing release the GIL, so this helps most with slow or
+# network-mounted input directories and compressed files. The prepared kits are
+# put in the kit cache (see screenDNAFile), and the main loop takes them from
+# there. With --memoryLimit the kits are not read ahead, as a whole kit in memory
+# would break the limit.
+
+# Number of DNA files read ahead, and rows formatted at a time for the output file
+pipelineReadAhead = 2
+pipelineChunkRows = 100000
+
+
+##########################################
+# Read a DNA file, decompressed, into memory
+
+def readDNAFileBytes( file: str ) -> bytes:
+
+    with openDNAFile( file, 'rb' ) as f:
+        data = f.read()
+
+
+    return data
+
+
+##########################################
+
+
+##########################################
+# Read the DNA files ahead into prefetchedDNAFiles and
+# queue them for preparing. Files already in the kit
+# cache are queued without being read
+
+async def readDNAFilesAhead( files: list, kitCache: dict, queue: asyncio.Queue, executor ):
+
+    loop = asyncio.get_running_loop()
+
+    for file in files:
+        if kitCache.get( file, {} ).get( 'stamp' ) != getFileStamp( file ):
+            prefetchedDNAFiles[ file ] = await loop.run_in_executor( executor, readDNAFileBytes, file )
+        await queue.put( file )
+
+    # No more files
+    await queue.put( None )
+
+
+##########################################
+
+
+##########################################
+# Screen and prepare the queued DNA files from
+# memory with loadPrepared (file, company, kit
+# cache) and put them in the kit cache
+
+async def prepareQueuedDNAFiles( kitCache: dict, queue: asyncio.Queue, executor, loadPrepared ):
+
+    loop = asyncio.get_running_loop()
+
+    while True:
+        file = await queue.get()
+        if file is None:
+            break
+
+        try:
+            company = await loop.run_in_executor( executor, screenDNAFile, file, kitCache )
+            if company != 'unknown':
+                await loop.run_in_executor( executor, loadPrepared, file, company, kitCache )
+        finally:
+            prefetchedDNAFiles.pop( file, None )
+
+
+##########################################
+
+
+##########################################
+# Prepare the DNA files into the kit cache with
+# loadPrepared, reading the next files while the
+# one before is prepared
+
+async def prepareDNAFilesPipelined( files: list, kitCache: dict, loadPrepared ):
+
+    queue = asyncio.Queue( maxsize=pipelineReadAhead )
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor( 1 ) as readExecutor, concurrent.futures.ThreadPoolExecutor( 1 ) as prepareExecutor:
+            await asyncio.gather(
+                readDNAFilesAhead( files, kitCache, queue, readExecutor ),
+                prepareQueuedDNAFiles( kitCache, queue, prepareExecutor, loadPrepared )
+            )
+    finally:
+        prefetchedDNAFiles.clear()
+
+
+##########################################
+
+
+##########################################
+# Split formatted DNA files into chunks of at most
+# rows rows, so a DNA file in memory is pipelined too
+
+def splitDNAFileChunks( chunks, rows: int ):
+
+    for df in chunks:
+        for start in range( 0, len( df ), rows ):
+            yield df.iloc[ start:start + rows ]
+
+
+##########################################
+
+
+##########################################
+# Format the next chunk as text. Returns the text,
+# or None at the end
+
+def formatDNAFileChunk( chunks, options: dict, header: bool ) -> str:
+
+    df = next( chunks, None )
+    if df is None:
+        return None
+
+
+    return df.to_csv( None, index=None, header=header, **options )
+
+
+##########################################
+
+
+##########################################
+# Write formatted chunks to the open output file,
+# formatting the next chunk while the one before
+# is compressed and written (see writeDNAFileChunks)
+
+async def writeDNAFileChunksPipelined( f, chunks, options: dict, header: bool ):
+
+    loop = asyncio.get_running_loop()
+    chunks = splitDNAFileChunks( chunks, pipelineChunkRows )
+
+    with concurrent.futures.ThreadPoolExecutor( 1 ) as formatExecutor, concurrent.futures.ThreadPoolExecutor( 1 ) as writeExecutor:
+
+        writing = None
+        text = await loop.run_in_executor( formatExecutor, formatDNAFileChunk, chunks, options, header )
+
+        while text is not None:
+            # Chunks are written in order, one at a time
+            if writing is not None:
+                await writing
+            writing = loop.run_in_executor( writeExecutor, f.write, text )
+
+            text = await loop.run_in_executor( formatExecutor, formatDNAFileChunk, chunks, options, False )
+
+        if writing is not None:
+            await writing
+
+
+    return
+
+
+##########################################
+
+
+####################################################################################
+####################################################################################
@@ -0,0 +1,224 @@
+##############################################################################################
+# PLINK binary fileset output (--plinkAppend)
+# of create_py
+#
+
+import os
+import pandas as pd
+import numpy as np
+
+from superkit_tables import chromosomePriorityList, genotypeCodeList
+
+
+####################################################################################
+# PLINK OUTPUT FUNCTIONS
+####################################################################################
+
+# PLINK is written as a binary fileset, .bim (one row per SNP), .fam (one row per
+# individual) and .bed with 2 bits per individual and SNP, packed four to a byte.
+# The 2-bit codes come straight from the genotype codes through the allele lookup table.
+# With --plinkAppend the new individual is merged into the existing fileset on the union
+# of the SNPs, individuals that lack a SNP get a nocall.
+
+# First bytes of a SNP-major .bed file
+plinkMagic = bytes( [ 0x6c, 0x1b, 0x01 ] )
+
+# 2-bit codes of the .bed file
+plinkHomozygousA1 = 0
+plinkMissing = 1
+plinkHeterozygous = 2
+plinkHomozygousA2 = 3
+
+# Lookup table from genotype code to its two alleles for PLINK, b'0' for nocalls. One allele is homozygous
+plinkAlleleTable = np.array( [ ( g[ 0 ], g[ -1 ] ) if g and all( a in 'ACGTDI' for a in g ) else ( '0', '0' ) for g in genotypeCodeList ], dtype='S1' )
+
+
+##########################################
+# Pack 2-bit codes of SNPs x individuals into
+# bytes, and unpack them again
+
+def packPLINKGenotypes( codes: np.ndarray ) -> np.ndarray:
+
+    snps, individuals = codes.shape
+    padded = np.zeros( ( snps, -( -individuals // 4 ) * 4 ), dtype=np.uint8 )
+    padded[ :, :individuals ] = codes
+    padded = padded.reshape( snps, -1, 4 )
+
+
+    return padded[ :, :, 0 ] | ( padded[ :, :, 1 ] << 2 ) | ( padded[ :, :, 2 ] << 4 ) | ( padded[ :, :, 3 ] << 6 )
+
+
+def unpackPLINKGenotypes( packed: np.ndarray, individuals: int ) -> np.ndarray:
+
+    codes = ( packed[ :, :, None ] >> np.array( [ 0, 2, 4, 6 ], dtype=np.uint8 ) ) & 3
+
+
+    return codes.reshape( len( packed ), -1 )[ :, :individuals ]
+
+
+##########################################
+
+
+##########################################
+# 2-bit codes of one individual from genotype codes.
+# Alleles that are not yet in the .bim (b'0') are
+# filled in, a third allele is a nocall
+
+def codePLINKGenotypes( allele1: np.ndarray, allele2: np.ndarray, genotypeCodes: np.ndarray ) -> np.ndarray:
+
+    alleles = plinkAlleleTable[ np.where( genotypeCodes < 0, 0, genotypeCodes ) ]
+    called = alleles[ :, 0 ] != b'0'
+
+    # Fill in unknown alleles, first allele 1 then allele 2
+    for allele in ( alleles[ :, 0 ], alleles[ :, 1 ] ):
+        new = called & ( allele != allele1 ) & ( allele != allele2 )
+        fill1 = new & ( allele1 == b'0' )
+        allele1[ fill1 ] = allele[ fill1 ]
+        fill2 = new & ~fill1 & ( allele2 == b'0' )
+        allele2[ fill2 ] = allele[ fill2 ]
+
+    known = ( ( alleles[ :, 0 ] == allele1 ) | ( alleles[ :, 0 ] == allele2 ) ) & ( ( alleles[ :, 1 ] == allele1 ) | ( alleles[ :, 1 ] == allele2 ) )
+    countAllele2 = ( alleles[ :, 0 ] == allele2 ).astype( np.uint8 ) + ( alleles[ :, 1 ] == allele2 )
+
+    # 0, 1 or 2 copies of allele 2 to homozygous allele 1, heterozygous, homozygous allele 2
+    codes = np.array( [ plinkHomozygousA1, plinkHeterozygous, plinkHomozygousA2 ], dtype=np.uint8 )[ countAllele2 ]
+
+
+    return np.where( called & known, codes, plinkMissing ).astype( np.uint8 )
+
+
+##########################################
+
+
+##########################################
+# Read a PLINK fileset
+
+def readPLINKFileset( prefix: str ) -> tuple:
+
+    bim = pd.read_csv( prefix + '.bim', sep='\t', header=None, dtype=str, names=[ 'chromosome', 'rsid', 'centimorgan', 'position', 'allele1', 'allele2' ] )
+    fam = pd.read_csv( prefix + '.fam', sep=r'\s+', header=None, dtype=str, names=[ 'family', 'individual', 'father', 'mother', 'sex', 'phenotype' ] )
+
+    packed = np.fromfile( prefix + '.bed', dtype=np.uint8, offset=len( plinkMagic ) )
+    codes = unpackPLINKGenotypes( packed.reshape( len( bim ), -1 ), len( fam ) )
+
+
+    return bim, fam, codes
+
+
+##########################################
+
+
+##########################################
+# Chromosome and position as one integer key,
+# as the keys of the spilled records
+
+def getPositionKeys( chromosome: pd.Series, position: pd.Series ) -> np.ndarray:
+
+    chromosome = pd.Categorical( chromosome, categories=chromosomePriorityList ).codes
+
+
+    return chromosome.astype( np.int64 ) * 2**40 + position.astype( np.int64 ).to_numpy()
+
+
+##########################################
+
+
+##########################################
+# Write a PLINK fileset with the file options of
+# the PLINK output format
+
+def writePLINKFileset( prefix: str, bim: pd.DataFrame, fam: pd.DataFrame, codes: np.ndarray, options: dict ):
+
+    options = dict( options )
+    encoding = options.pop( 'encoding' )
+
+    bim.to_csv( prefix + '.bim', index=None, encoding=encoding, **options )
+    fam.to_csv( prefix + '.fam', index=None, encoding=encoding, **options )
+
+    with open( prefix + '.bed', 'wb' ) as f:
+        f.write( plinkMagic )
+        f.write( packPLINKGenotypes( codes ).tobytes() )
+
+
+    return
+
+
+##########################################
+
+
+##########################################
+# Write formatted chunks as a PLINK fileset of one
+# individual of gender (Male, Female or Unknown) with
+# the file options of the PLINK output format, or add
+# the individual to the existing fileset with append
+# (--plinkAppend)
+
+def writePLINKFileChunks( tmpFileName: str, chunks, options: dict, individual: str, gender: str, append: bool ):
+
+    prefix = tmpFileName[ :-len( '.bed' ) ]
+
+    # SNPs and genotype codes of the individual, chunk by chunk
+    snps = []
+    genotypeCodes = []
+    for df in chunks:
+        if df.empty:
+            continue
+        snps.append( pd.DataFrame( { 'chromosome': df[ 'chromosome' ].astype( str ).to_numpy(), 'rsid': df[ 'rsid' ].to_numpy(), 'position': df[ 'position' ].to_numpy() } ) )
+        genotypeCodes.append( pd.Categorical( df[ 'genotype' ], categories=genotypeCodeList ).codes )
+
+    snps = pd.concat( snps, ignore_index=True ) if snps else pd.DataFrame( columns=[ 'chromosome', 'rsid', 'position' ] )
+    genotypeCodes = np.concatenate( genotypeCodes ) if genotypeCodes else np.zeros( 0, dtype=np.int8 )
+
+    sex = { 'Male': '1', 'Female': '2' }.get( gender, '0' )
+    fam = pd.DataFrame( [ [ individual, individual, '0', '0', sex, '-9' ] ], columns=[ 'family', 'individual', 'father', 'mother', 'sex', 'phenotype' ] )
+    codes = np.zeros( ( len( snps ), 0 ), dtype=np.uint8 )
+    allele1 = np.full( len( snps ), b'0', dtype='S1' )
+    allele2 = np.full( len( snps ), b'0', dtype='S1' )
+
+    # Merge with the existing fileset on the union of the SNPs
+    if append and all( os.path.isfile( prefix + e ) for e in [ '.bed', '.bim', '.fam' ] ):
+        oldBim, oldFam, oldCodes = readPLINKFileset( prefix )
+
+        # An individual with the same ID is replaced
+        keep = ( oldFam[ 'individual' ] != individual ).to_numpy()
+        fam = pd.concat( [ oldFam[ keep ], fam ], ignore_index=True )
+
+        # Rows of the old and new SNPs in the sorted union
+        oldKeys = getPositionKeys( oldBim[ 'chromosome' ], oldBim[ 'position' ] )
+        newKeys = getPositionKeys( snps[ 'chromosome' ], snps[ 'position' ] )
+        unionKeys = np.union1d( oldKeys, newKeys )
+        oldRows = np.searchsorted( unionKeys, oldKeys )
+        newRows = np.searchsorted( unionKeys, newKeys )
+
+        # SNPs and alleles of the existing fileset, new SNPs from the individual
+        union = {}
+        for column in [ 'chromosome', 'rsid', 'position' ]:
+            union[ column ] = np.empty( len( unionKeys ), dtype=object )
+            union[ column ][ newRows ] = snps[ column ].to_numpy()
+            union[ column ][ oldRows ] = oldBim[ column ].to_numpy()
+        snps = pd.DataFrame( union )
+
+        allele1 = np.full( len( unionKeys ), b'0', dtype='S1' )
+        allele2 = np.full( len( unionKeys ), b'0', dtype='S1' )
+        allele1[ oldRows ] = oldBim[ 'allele1' ].to_numpy().astype( 'S1' )
+        allele2[ oldRows ] = oldBim[ 'allele2' ].to_numpy().astype( 'S1' )
+
+        # Individuals of the fileset get nocalls on the new SNPs, the individual on SNPs it lacks
+        codes = np.full( ( len( unionKeys ), np.count_nonzero( keep ) ), plinkMissing, dtype=np.uint8 )
+        codes[ oldRows ] = oldCodes[ :, keep ]
+        unionGenotypeCodes = np.zeros( len( unionKeys ), dtype=genotypeCodes.dtype )
+        unionGenotypeCodes[ newRows ] = genotypeCodes
+        genotypeCodes = unionGenotypeCodes
+
+    # Code the individual against the alleles of each SNP, filling in new alleles
+    codes = np.concatenate( [ codes, codePLINKGenotypes( allele1, allele2, genotypeCodes )[ :, None ] ], axis=1 )
+
+    bim = snps[ [ 'chromosome', 'rsid' ] ].assign( centimorgan=0, position=snps[ 'position' ], allele1=allele1.astype( str ), allele2=allele2.astype( str ) )
+    writePLINKFileset( prefix, bim, fam, codes, options )
+
+
+    return
+
+
+####################################################################################
+####################################################################################
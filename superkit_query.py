@@ -0,0 +1,263 @@
+##############################################################################################
+# Queries of the stored superkit (--query)
+# of create_superkit.py
+#
+
+import os
+import pandas as pd
+import numpy as np
+import re
+import time
+import json
+
+# pyarrow is only needed for the superkit store
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from superkit_tables import chromosomePriorityList, chromosomeTableAncestryIn
+from superkit_files import fileEndings, findDNAFiles, getFileStamp, screenDNAFile
+from superkit_outofcore import encodeRecords, decodeRecords, getRecordKeys
+from superkit_store import loadSuperKitStore
+
+
+####################################################################################
+# VARIABLES
+####################################################################################
+
+# Rows of genotypes shown for a query
+queryMaxRows = 1000
+
+
+####################################################################################
+# QUERY FUNCTIONS (--query)
+####################################################################################
+
+# A query shows the genotypes of all DNA files in ./input/, and of the stored superkit,
+# at a list of rsids and regions. Every kit is loaded, normalized and cleaned as for a
+# superkit once, and saved as an index in ./output/DNASuperKit-index/: the records of the
+# kit (see superkit_outofcore.py) sorted on chromosome and position, their chromosome and
+# position keys, and the rsids sorted with the row of each. The indexes are memory-mapped,
+# so a query is a binary search per rsid or region and kit. An index is made again when
+# the size or time of its DNA file changes. An rsid is looked up in every kit, and the
+# positions it is found on are then looked up in every kit too, so kits that name the SNP
+# differently (23andMe i-numbers) are shown as well.
+
+
+##########################################
+# Parse a query into rsids and regions. Regions are
+# CHROMOSOME:POSITION or CHROMOSOME:START-END,
+# anything else is an rsid
+
+def parseQuery( text: str ) -> tuple:
+
+    rsids = []
+    regions = []
+
+    for item in re.split( r'[\s,;]+', text.strip() ):
+        match = re.fullmatch( r'(?i:chr)?(\w+):(\d+)(?:-(\d+))?', item )
+        if match:
+            chromosome = chromosomeTableAncestryIn.get( match.group( 1 ).upper(), match.group( 1 ).upper() )
+            if chromosome not in chromosomePriorityList:
+                print( f'Unknown chromosome in query: {item}' )
+                continue
+            start = int( match.group( 2 ) )
+            end = int( match.group( 3 ) or start )
+            regions.append( ( chromosomePriorityList.index( chromosome ), start, end ) )
+        elif item:
+            rsids.append( item )
+
+
+    return rsids, regions
+
+
+##########################################
+
+
+##########################################
+# Save the index of a normalized and cleaned
+# DNA file of the companies to a directory
+
+def saveDNAFileIndex( df: pd.DataFrame, directory: str, companies: list ):
+
+    records = encodeRecords( df, companies )
+    records = records[ np.lexsort( ( records[ 'order' ], records[ 'position' ], records[ 'chromosome' ] ) ) ]
+    rsidRows = np.argsort( records[ 'rsid' ], kind='stable' )
+
+    os.makedirs( directory, exist_ok=True )
+    np.save( os.path.join( directory, 'records.npy' ), records )
+    np.save( os.path.join( directory, 'keys.npy' ), getRecordKeys( records ) )
+    np.save( os.path.join( directory, 'rsids.npy' ), records[ 'rsid' ][ rsidRows ] )
+    np.save( os.path.join( directory, 'rsidRows.npy' ), rsidRows )
+
+
+    return
+
+
+##########################################
+
+
+##########################################
+# Memory-map the index of a DNA file
+
+def openDNAFileIndex( directory: str ) -> dict:
+
+    return { name: np.load( os.path.join( directory, name + '.npy' ), mmap_mode='r' ) for name in [ 'records', 'keys', 'rsids', 'rsidRows' ] }
+
+
+##########################################
+
+
+##########################################
+# Open the indexes in indexDir of the DNA files in
+# inputDir and of the superkit stored in storeDir,
+# and index the ones that are new or changed with
+# prepare( file, company ). Returns a list of the
+# kit name, company and index of every kit
+
+def loadQueryIndexes( inputDir: str, storeDir: str, storeName: str, indexDir: str, companies: list, prepare ) -> list:
+
+    catalogFile = indexDir + 'catalog.json'
+    catalog = {}
+    if os.path.exists( catalogFile ):
+        with open( catalogFile ) as f:
+            catalog = json.load( f )
+
+    # DNA files, and the stored superkit if there is one
+    kits = [ ( file, file.replace( inputDir, '' ) ) for file in findDNAFiles( inputDir, fileEndings ) ]
+    storeFile = storeDir + 'superkit.arrow'
+    if pa is not None and os.path.exists( storeFile ):
+        kits.append( ( storeFile, f'{storeName} (store)' ) )
+
+    indexes = []
+    for file, name in kits:
+        stamp = list( getFileStamp( file ) )
+        directory = indexDir + re.sub( r'[^\w.-]', '_', name )
+        entry = catalog.get( name, {} )
+
+        if entry.get( 'stamp' ) != stamp or not os.path.isdir( directory ):
+            if file == storeFile:
+                company = 'SuperKit'
+                df = loadSuperKitStore( storeDir )[ 0 ]
+            else:
+                company = screenDNAFile( file )
+                if company == 'unknown':
+                    continue
+                df = prepare( file, company )[ 0 ]
+
+            print( f'Indexing {name}' )
+            saveDNAFileIndex( df, directory, companies )
+            entry = { 'stamp': stamp, 'company': company }
+            catalog[ name ] = entry
+
+        indexes.append( ( name, entry[ 'company' ], openDNAFileIndex( directory ) ) )
+
+    # Forget kits that are gone
+    catalog = { name: catalog[ name ] for name, company, index in indexes }
+    os.makedirs( indexDir, exist_ok=True )
+    with open( catalogFile, 'w' ) as f:
+        json.dump( catalog, f )
+
+
+    return indexes
+
+
+##########################################
+
+
+##########################################
+# Rows of an index with the given rsids, or
+# in the given key ranges
+
+def queryDNAFileIndex( index: dict, rsids: np.ndarray, keyRanges: np.ndarray ) -> np.ndarray:
+
+    rows = []
+
+    if len( rsids ):
+        first = np.searchsorted( index[ 'rsids' ], rsids, side='left' )
+        last = np.searchsorted( index[ 'rsids' ], rsids, side='right' )
+        rows += [ index[ 'rsidRows' ][ a:b ] for a, b in zip( first, last ) ]
+
+    if len( keyRanges ):
+        first = np.searchsorted( index[ 'keys' ], keyRanges[ :, 0 ], side='left' )
+        last = np.searchsorted( index[ 'keys' ], keyRanges[ :, 1 ], side='right' )
+        rows += [ np.arange( a, b ) for a, b in zip( first, last ) ]
+
+    rows = np.unique( np.concatenate( rows ) ) if rows else np.array( [], dtype=np.int64 )
+
+
+    return index[ 'records' ][ rows ]
+
+
+##########################################
+
+
+##########################################
+# Show the genotypes of every kit at the rsids and
+# regions of the query, see loadQueryIndexes
+
+def queryDNAFiles( query: str, inputDir: str, storeDir: str, storeName: str, indexDir: str, companies: list, prepare ):
+
+    rsids, regions = parseQuery( query )
+    if not rsids and not regions:
+        print( f'Nothing to look up in the query: {query}' )
+        return
+
+    indexes = loadQueryIndexes( inputDir, storeDir, storeName, indexDir, companies, prepare )
+    if not indexes:
+        print( 'No compatible files has been found' )
+        return
+
+    start_time = time.time()
+
+    # rsids are looked up in every kit, then their positions are looked up in every kit as well
+    rsidKeys = np.array( [ r.encode( 'utf-8' ) for r in rsids ], dtype='S' ) if rsids else np.array( [], dtype='S1' )
+    keyRanges = np.array( [ ( c * 2**40 + a, c * 2**40 + b ) for c, a, b in regions ], dtype=np.int64 ).reshape( -1, 2 )
+    found = [ getRecordKeys( queryDNAFileIndex( index, rsidKeys, np.zeros( ( 0, 2 ), dtype=np.int64 ) ) ) for name, company, index in indexes ]
+    positionKeys = np.unique( np.concatenate( found ) )
+    keyRanges = np.concatenate( [ keyRanges, np.stack( [ positionKeys, positionKeys ], axis=1 ) ] )
+
+    frames = []
+    for name, company, index in indexes:
+        df = decodeRecords( queryDNAFileIndex( index, rsidKeys, keyRanges ), companies )
+        df[ 'kit' ] = f'{name} ({company})' if company != 'SuperKit' else name
+        frames.append( df )
+    df = pd.concat( frames, ignore_index=True )
+
+    elapsed_time = time.time() - start_time
+
+    print()
+    print( '######################################################################' )
+    print( '#' )
+    print( f'# Query:                  {query}' )
+    print( f'# Kits:                   {len( indexes )}' )
+    print( f'# SNPs found:             {df[ [ "chromosome", "position" ] ].drop_duplicates().shape[ 0 ]}' )
+    print( '#' )
+    print( '######################################################################' )
+    print()
+
+    if not df.empty:
+        # A row per position with the genotype of every kit, duplicate rows of a kit are joined
+        df[ 'chromosome' ] = pd.Categorical( df[ 'chromosome' ], categories=chromosomePriorityList, ordered=True )
+        rsidNames = df.groupby( [ 'chromosome', 'position' ], observed=True )[ 'rsid' ].agg( lambda r: ','.join( pd.unique( r ) ) )
+        genotypes = df.pivot_table( index=[ 'chromosome', 'position' ], columns='kit', values='genotype', aggfunc='/'.join, observed=True, sort=True )
+        genotypes = genotypes.reindex( columns=[ k for k in pd.unique( df[ 'kit' ] ) ] ).fillna( '' )
+        genotypes.insert( 0, 'rsid', rsidNames )
+        genotypes.columns.name = None
+
+        with pd.option_context( 'display.max_rows', queryMaxRows, 'display.max_columns', None, 'display.width', None ):
+            print( genotypes.head( queryMaxRows ) )
+        if len( genotypes ) > queryMaxRows:
+            print( f'... {len( genotypes ) - queryMaxRows} more rows' )
+        print()
+
+    print( f'Query answered in {elapsed_time * 1000:.1f} ms' )
+    print()
+
+
+##########################################
+
+
+####################################################################################
+####################################################################################
@@ -0,0 +1,324 @@
+##############################################################################################
+# Conversion service over HTTP (--serve)
+# of create_superkit.py
+#
+
+import os
+import io
+import zipfile
+import sys
+import time
+import tempfile
+import contextlib
+import json
+import shutil
+import http.server
+import socketserver
+import urllib.parse
+import threading
+import multiprocessing
+
+from superkit_files import fileEndings, compressedFileEndings
+
+
+####################################################################################
+# VARIABLES
+####################################################################################
+
+# Largest DNA file the service takes
+serveMaxUploadBytes = 2**30
+
+# Metrics of the service, shared by the request threads
+serviceMetrics = { 'completed': 0, 'failed': 0, 'rejected': 0, 'inFlight': 0, 'seconds': {} }
+serviceLock = threading.Lock()
+
+
+####################################################################################
+# SERVICE FUNCTIONS (--serve)
+####################################################################################
+
+# The service converts DNA files sent over local HTTP, on a TCP port or a Unix socket:
+#
+#   POST /convert?filename=<name>&outputFormat=<format>&convertFormat=1&majorityVote=1
+#        The body is the DNA file (or a zip archive with several kits) and the
+#        response is the resulting DNA file, or a zip archive for the formats that
+#        are written as several files (VCF v4, PLINK)
+#   GET  /metrics   Request counts and timings as JSON
+#   GET  /health
+#
+# Jobs run in a pool of worker processes that is started when the service starts,
+# after pandas and the DNA file templates in ./data/ are loaded, so a request only
+# pays for the build itself. A worker runs one job at a time, and the build function of
+# the script uses the settings the job carries as its options for that build only. At most
+# serveConcurrency requests are taken at a time, the rest are refused with 503 so the
+# caller can try again.
+
+
+##########################################
+# The settings of a job, the input and output
+# directories and the options of the request
+
+def getServiceJobSettings( inputDir: str, outputDir: str, outputFormat: str, convertFormat: bool, majorityVote: bool ) -> dict:
+
+    return {
+        'inputFileDir': inputDir,
+        'outputFileDir': outputDir,
+        'outputFormat': outputFormat,
+        'convertFormat': convertFormat,
+        'majorityVote': majorityVote
+    }
+
+
+##########################################
+
+
+##########################################
+# Build a superkit in a worker process with
+# build( settings ), the settings of a job
+
+def runServiceJob( build, settings: dict ) -> dict:
+
+    startTime = time.time()
+
+    # The progress of the build is sent back as the log of the job
+    log = io.StringIO()
+    error = None
+    try:
+        with contextlib.redirect_stdout( log ):
+            build( settings )
+    except Exception as e:
+        error = f'{type( e ).__name__}: {e}'
+
+
+    return { 'start': startTime, 'seconds': time.time() - startTime, 'error': error, 'files': sorted( os.listdir( settings[ 'outputFileDir' ] ) ), 'log': log.getvalue() }
+
+
+##########################################
+
+
+##########################################
+# Count a request and the seconds of its stages
+# in the service metrics
+
+def recordServiceMetrics( result: str, timings: dict ):
+
+    with serviceLock:
+        serviceMetrics[ result ] += 1
+        for stage, seconds in timings.items():
+            timing = serviceMetrics[ 'seconds' ].setdefault( stage, { 'count': 0, 'total': 0.0, 'max': 0.0 } )
+            timing[ 'count' ] += 1
+            timing[ 'total' ] += seconds
+            timing[ 'max' ] = max( timing[ 'max' ], seconds )
+
+
+##########################################
+
+
+##########################################
+# HTTP requests of the service
+
+class SuperKitRequestHandler( http.server.BaseHTTPRequestHandler ):
+
+    # HTTP/1.1 answers 'Expect: 100-continue' before large uploads. Every
+    # response closes the connection, so a body that is not read is not a problem
+    protocol_version = 'HTTP/1.1'
+
+    # Unix sockets have no client address
+    def address_string( self ) -> str:
+        return self.client_address[ 0 ] if isinstance( self.client_address, tuple ) else 'unix'
+
+    def sendText( self, status: int, text: str, contentType: str = 'text/plain; charset=utf-8', headers: dict = None ):
+        body = text.encode( 'utf-8' )
+        self.send_response( status )
+        self.send_header( 'Content-Type', contentType )
+        self.send_header( 'Content-Length', str( len( body ) ) )
+        self.send_header( 'Connection', 'close' )
+        for name, value in ( headers or {} ).items():
+            self.send_header( name, value )
+        self.end_headers()
+        self.wfile.write( body )
+
+    # Read a request body that is not used, so the client is not cut off while sending it
+    def discardBody( self, length: int ):
+        while length > 0:
+            data = self.rfile.read( min( length, 2**20 ) )
+            if not data:
+                break
+            length -= len( data )
+
+    def do_GET( self ):
+        path = urllib.parse.urlparse( self.path ).path
+        if path == '/health':
+            self.sendText( 200, 'ok\n' )
+        elif path == '/metrics':
+            with serviceLock:
+                metrics = json.dumps( serviceMetrics, indent=2 )
+            self.sendText( 200, metrics + '\n', 'application/json' )
+        else:
+            self.sendText( 404, 'Not found\n' )
+
+    def do_POST( self ):
+        url = urllib.parse.urlparse( self.path )
+        if url.path != '/convert':
+            self.sendText( 404, 'Not found\n' )
+            return
+
+        # Options of the job
+        query = urllib.parse.parse_qs( url.query )
+        filename = os.path.basename( query.get( 'filename', [ 'DNAFile.txt' ] )[ 0 ] )
+        outputFormat = query.get( 'outputFormat', [ 'SuperKit' ] )[ 0 ]
+        convertFormat = query.get( 'convertFormat', [ '' ] )[ 0 ].lower() in [ '1', 'true', 'yes' ]
+        majorityVote = query.get( 'majorityVote', [ '' ] )[ 0 ].lower() in [ '1', 'true', 'yes' ]
+        length = int( self.headers.get( 'Content-Length', 0 ) )
+        if length <= 0 or length > serveMaxUploadBytes:
+            self.sendText( 413 if length > 0 else 411, f'The DNA file must be sent as a body of 1 to {serveMaxUploadBytes} bytes.\n' )
+            return
+        if outputFormat not in self.server.outputFormats:
+            self.discardBody( length )
+            self.sendText( 400, f'Invalid output format: {outputFormat}. Allowed formats are: {", ".join( self.server.outputFormats )}.\n' )
+            return
+        if not filename.lower().endswith( fileEndings + compressedFileEndings ):
+            self.discardBody( length )
+            self.sendText( 400, f'Invalid filename: {filename}. The file ending must be one of: {", ".join( fileEndings + compressedFileEndings )}.\n' )
+            return
+
+        # Refuse requests over the concurrency limit
+        if not serviceSlots.acquire( blocking=False ):
+            recordServiceMetrics( 'rejected', {} )
+            self.discardBody( length )
+            self.sendText( 503, 'The service is busy, try again later.\n', headers={ 'Retry-After': '1' } )
+            return
+
+        jobDir = tempfile.mkdtemp( prefix='DNASuperKit-job-' )
+        with serviceLock:
+            serviceMetrics[ 'inFlight' ] += 1
+        try:
+            requestStart = time.time()
+            inputDir = os.path.join( jobDir, 'input', '' )
+            outputDir = os.path.join( jobDir, 'output', '' )
+            os.makedirs( inputDir )
+            os.makedirs( outputDir )
+            settings = getServiceJobSettings( inputDir, outputDir, outputFormat, convertFormat, majorityVote )
+
+            # Receive the DNA file
+            with open( inputDir + filename, 'wb' ) as f:
+                remaining = length
+                while remaining > 0:
+                    data = self.rfile.read( min( remaining, 2**20 ) )
+                    if not data:
+                        break
+                    f.write( data )
+                    remaining -= len( data )
+            if remaining > 0:
+                recordServiceMetrics( 'failed', {} )
+                self.sendText( 400, 'The DNA file was not received completely.\n' )
+                return
+
+            # Build the superkit in a worker
+            submitTime = time.time()
+            result = servicePool.apply( runServiceJob, ( self.server.build, settings ) )
+            timings = { 'upload': submitTime - requestStart, 'queue': max( 0.0, result[ 'start' ] - submitTime ), 'build': result[ 'seconds' ] }
+            serverTiming = ', '.join( f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in timings.items() )
+
+            if result[ 'error' ] or not result[ 'files' ]:
+                recordServiceMetrics( 'failed', timings )
+                reason = result[ 'error' ] or 'No DNA file was made, the company of the file is not known.'
+                self.sendText( 500 if result[ 'error' ] else 422, reason + '\n\n' + result[ 'log' ][ -4000: ], headers={ 'Server-Timing': serverTiming } )
+                return
+
+            # Stream the resulting DNA file back, several files in a zip archive
+            streamStart = time.time()
+            files = [ outputDir + f for f in result[ 'files' ] ]
+            name = result[ 'files' ][ 0 ] if len( files ) == 1 else os.path.splitext( result[ 'files' ][ 0 ] )[ 0 ].replace( '.vcf', '' ) + '.zip'
+            self.send_response( 200 )
+            self.send_header( 'Content-Type', 'application/octet-stream' if len( files ) == 1 else 'application/zip' )
+            self.send_header( 'Content-Disposition', f'attachment; filename="{name}"' )
+            self.send_header( 'Server-Timing', serverTiming )
+            self.send_header( 'Connection', 'close' )
+            if len( files ) == 1:
+                self.send_header( 'Content-Length', str( os.path.getsize( files[ 0 ] ) ) )
+            self.end_headers()
+            if len( files ) == 1:
+                with open( files[ 0 ], 'rb' ) as f:
+                    shutil.copyfileobj( f, self.wfile, 2**20 )
+            else:
+                with zipfile.ZipFile( self.wfile, 'w', zipfile.ZIP_STORED ) as archive:
+                    for file in files:
+                        archive.write( file, os.path.basename( file ) )
+            self.wfile.flush()
+
+            timings[ 'stream' ] = time.time() - streamStart
+            timings[ 'request' ] = time.time() - requestStart
+            recordServiceMetrics( 'completed', timings )
+            self.log_message( '"%s" %s upload=%.3fs queue=%.3fs build=%.3fs stream=%.3fs total=%.3fs', self.requestline, filename, *timings.values() )
+
+        except ( BrokenPipeError, ConnectionResetError ):
+            recordServiceMetrics( 'failed', {} )
+
+        finally:
+            shutil.rmtree( jobDir, ignore_errors=True )
+            with serviceLock:
+                serviceMetrics[ 'inFlight' ] -= 1
+            serviceSlots.release()
+
+
+class ThreadingUnixHTTPServer( socketserver.ThreadingMixIn, socketserver.UnixStreamServer ):
+
+    daemon_threads = True
+
+
+##########################################
+
+
+##########################################
+# Start a pool of workers, warmed up with warm(),
+# and serve requests on serve until stopped. Jobs
+# are built with build( settings ) in the output
+# formats of outputFormats, at most concurrency
+# at a time
+
+def serveSuperKits( serve: str, workers: int, concurrency: int, outputFormats: list, build, warm ):
+
+    global servicePool, serviceSlots
+
+    # Workers are forked after the templates are loaded, and load them themselves if not
+    warm()
+    servicePool = multiprocessing.Pool( workers, initializer=warm )
+    serviceSlots = threading.BoundedSemaphore( concurrency )
+
+    if serve.startswith( 'unix:' ):
+        socketPath = serve[ len( 'unix:' ): ]
+        if os.path.exists( socketPath ):
+            os.remove( socketPath )
+        server = ThreadingUnixHTTPServer( socketPath, SuperKitRequestHandler )
+        address = serve
+    else:
+        host, _, port = serve.rpartition( ':' )
+        server = http.server.ThreadingHTTPServer( ( host or '127.0.0.1', int( port ) ), SuperKitRequestHandler )
+        address = f'http://{host or "127.0.0.1"}:{server.server_address[ 1 ]}'
+
+    # The request handlers take the output formats and the build function from the server
+    server.outputFormats = outputFormats
+    server.build = build
+
+    print()
+    print( f'Serving DNA file conversions on {address} with {workers} workers, press Ctrl+C to stop' )
+    sys.stdout.flush()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print()
+        print( 'Stopped serving' )
+    finally:
+        server.server_close()
+        servicePool.terminate()
+        if serve.startswith( 'unix:' ) and os.path.exists( socketPath ):
+            os.remove( socketPath )
+
+
+##########################################
+
+
+####################################################################################
+####################################################################################
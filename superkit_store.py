@@ -0,0 +1,313 @@
+##############################################################################################
+# Superkit store (--saveStore/--loadStore/--update)
+# of create_superkit.py
+#
+
+import os
+import pandas as pd
+import numpy as np
+import sys
+import json
+import shutil
+
+# pyarrow is only needed for the superkit store
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from superkit_tables import chromosomePriorityList
+from superkit_plink import getPositionKeys
+from superkit_outofcore import encodeRecords, spillSuperKitRecords
+
+
+####################################################################################
+# SUPERKIT STORE FUNCTIONS (--saveStore/--loadStore)
+####################################################################################
+
+# The merged superkit is stored in ./output/DNASuperKit-store/ with the company of
+# every SNP, before it is formatted to an output format:
+#
+#   superkit.arrow                      Arrow IPC file of the whole superkit, in sort order
+#   candidates.arrow                    Arrow IPC file of the candidate rows (see below)
+#   parquet/chromosome=<c>/part-0.parquet   Parquet dataset partitioned by chromosome
+#   chromosome-zero.parquet             Chromosome 0 of FamilyTreeDNA v3 (if any)
+#
+# Chromosome and company are dictionary columns with chromosomePriorityList and
+# companyPriorityList as dictionaries, so they load as the same categoricals as
+# sortDNAFile gives. The Arrow files are memory-mapped when loaded.
+#
+# dropDuplicatesDNAFile only depends on the first row and the number of rows of each
+# genotype on a position, so the candidates keep the first row of every chromosome,
+# position, company and genotype of all kits, with the number of rows as votes.
+# New kits (--update) are added to the candidates of their positions, and the
+# candidates repeated by their votes give the same superkit as all kits merged again.
+
+# Number of rows per Arrow record batch
+storeBatchRows = 65536
+
+
+##########################################
+# Arrow schema of the store, the kits the
+# superkit was made from are kept as metadata
+
+def getStoreSchema( metadata: dict, votes: bool = False ) -> 'pa.Schema':
+
+    fields = [
+        ( 'rsid', pa.string() ),
+        ( 'chromosome', pa.dictionary( pa.int8(), pa.string() ) ),
+        ( 'position', pa.int64() ),
+        ( 'genotype', pa.string() ),
+        ( 'company', pa.dictionary( pa.int8(), pa.string() ) )
+    ]
+    if votes:
+        fields.append( ( 'votes', pa.int32() ) )
+
+
+    return pa.schema( fields, metadata={ 'superkit': json.dumps( metadata ) } )
+
+
+##########################################
+
+
+##########################################
+# Convert superkit rows of the companies to an
+# Arrow table with the store schema
+
+def getStoreTable( df: pd.DataFrame, schema: 'pa.Schema', companies: list ) -> 'pa.Table':
+
+    # Unknown chromosomes are stored as nulls
+    chromosome = pd.Categorical( df[ 'chromosome' ], categories=chromosomePriorityList ).codes
+    company = pd.Categorical( df[ 'company' ], categories=companies ).codes
+
+
+    arrays = [
+        pa.array( df[ 'rsid' ].to_numpy( dtype=object ), pa.string() ),
+        pa.DictionaryArray.from_arrays( pa.array( chromosome, pa.int8(), mask=chromosome < 0 ), pa.array( chromosomePriorityList, pa.string() ) ),
+        pa.array( df[ 'position' ].to_numpy( dtype=np.int64 ), pa.int64() ),
+        pa.array( df[ 'genotype' ].to_numpy( dtype=object ), pa.string() ),
+        pa.DictionaryArray.from_arrays( pa.array( company, pa.int8() ), pa.array( companies, pa.string() ) )
+    ]
+    if 'votes' in schema.names:
+        arrays.append( pa.array( df[ 'votes' ].to_numpy( dtype=np.int32 ), pa.int32() ) )
+
+
+    return pa.Table.from_arrays( arrays, schema=schema )
+
+
+##########################################
+
+
+##########################################
+# Write the superkit store to storeDir from chunks of
+# superkit and candidate rows of the companies in
+# sort order
+
+def writeSuperKitStore( storeDir: str, chunks, candidateChunks, chromosomeZero: pd.DataFrame, metadata: dict, companies: list ) -> int:
+
+    shutil.rmtree( storeDir, ignore_errors=True )
+    os.makedirs( os.path.join( storeDir, 'parquet' ) )
+
+    schema = getStoreSchema( metadata )
+    parquetWriters = {}
+    rows = 0
+
+    with pa.OSFile( os.path.join( storeDir, 'superkit.arrow' ), 'wb' ) as sink, pa.ipc.new_file( sink, schema ) as writer:
+        for df in chunks:
+            table = getStoreTable( df, schema, companies )
+            writer.write_table( table, max_chunksize=storeBatchRows )
+            rows += table.num_rows
+
+            # Partition on chromosome, unknown chromosomes go to the default partition of hive
+            chromosome = pd.Categorical( df[ 'chromosome' ], categories=chromosomePriorityList ).codes
+            for code in np.unique( chromosome ):
+                name = chromosomePriorityList[ code ] if code >= 0 else '__HIVE_DEFAULT_PARTITION__'
+                part = table.filter( pa.array( chromosome == code ) ).drop( [ 'chromosome' ] )
+                if name not in parquetWriters:
+                    path = os.path.join( storeDir, 'parquet', f'chromosome={name}' )
+                    os.makedirs( path )
+                    parquetWriters[ name ] = pq.ParquetWriter( os.path.join( path, 'part-0.parquet' ), part.schema )
+                parquetWriters[ name ].write_table( part )
+
+    for parquetWriter in parquetWriters.values():
+        parquetWriter.close()
+
+    # Candidate rows for updates
+    schema = getStoreSchema( metadata, votes=True )
+    with pa.OSFile( os.path.join( storeDir, 'candidates.arrow' ), 'wb' ) as sink, pa.ipc.new_file( sink, schema ) as writer:
+        for df in candidateChunks:
+            writer.write_table( getStoreTable( df, schema, companies ), max_chunksize=storeBatchRows )
+
+    # Chromosome 0 of FamilyTreeDNA v3 is added again when formatting
+    if not chromosomeZero.empty:
+        chromosomeZero = chromosomeZero[ [ 'rsid', 'chromosome', 'position', 'genotype' ] ]
+        pq.write_table( pa.Table.from_pandas( chromosomeZero, preserve_index=False ), os.path.join( storeDir, 'chromosome-zero.parquet' ) )
+
+
+    return rows
+
+
+##########################################
+
+
+##########################################
+# Open the Arrow file of the store in storeDir
+# memory-mapped and read the metadata
+
+def openSuperKitStore( storeDir: str, fileName: str = 'superkit.arrow' ) -> tuple:
+
+    path = os.path.join( storeDir, fileName )
+    if not os.path.exists( path ):
+        print( f'There is no superkit store in {storeDir}' )
+        sys.exit(1)
+
+    reader = pa.ipc.open_file( pa.memory_map( path, 'r' ) )
+
+
+    return reader, json.loads( reader.schema.metadata[ b'superkit' ] )
+
+
+##########################################
+
+
+##########################################
+# Load chromosome 0 of FamilyTreeDNA v3
+# from the store in storeDir
+
+def loadStoreChromosomeZero( storeDir: str ) -> pd.DataFrame:
+
+    path = os.path.join( storeDir, 'chromosome-zero.parquet' )
+    if not os.path.exists( path ):
+        return pd.DataFrame()
+
+
+    return pq.read_table( path ).to_pandas()
+
+
+##########################################
+
+
+##########################################
+# Load the stored superkit of storeDir in memory,
+# as sortDNAFile and dropDuplicatesDNAFile leave it
+
+def loadSuperKitStore( storeDir: str ) -> tuple:
+
+    reader, metadata = openSuperKitStore( storeDir )
+    df = reader.read_all().to_pandas()
+
+
+    return df, loadStoreChromosomeZero( storeDir )
+
+
+##########################################
+
+
+##########################################
+# Load the stored superkit of storeDir batch by batch
+# into per chromosome files (--memoryLimit), with the
+# companies in priority order of the build
+
+def spillSuperKitStore( storeDir: str, spill: dict, companies: list ) -> tuple:
+
+    store = { 'directory': spill[ 'directory' ], 'chromosomes': {}, 'rows': 0, 'chunkRows': spill[ 'chunkRows' ] }
+    companyCounts = {}
+    reader, metadata = openSuperKitStore( storeDir )
+
+    for i in range( reader.num_record_batches ):
+        df = reader.get_batch( i ).to_pandas()
+
+        # Count SNPs per company
+        for company, count in df[ 'company' ].value_counts().items():
+            companyCounts[ company ] = companyCounts.get( company, 0 ) + int( count )
+
+        spillSuperKitRecords( store, encodeRecords( df, companies ) )
+
+
+    return store, companyCounts, loadStoreChromosomeZero( storeDir )
+
+
+##########################################
+
+
+##########################################
+# Reduce sorted rows to candidate rows, the first
+# row of every chromosome, position, company and
+# genotype with the number of rows as votes
+
+def getSuperKitCandidates( df: pd.DataFrame ) -> pd.DataFrame:
+
+    columns = [ 'chromosome', 'position', 'company', 'genotype' ]
+    if 'votes' not in df:
+        df = df.assign( votes=1 )
+
+    votes = df.groupby( columns, observed=True, sort=False, dropna=False )[ 'votes' ].transform( 'sum' )
+    df = df.assign( votes=votes.astype( np.int32 ) )
+
+
+    return df.drop_duplicates( subset=columns, keep='first' )
+
+
+##########################################
+
+
+##########################################
+# Repeat candidate rows by their votes, to rows
+# that dropDuplicatesDNAFile chooses from as
+# from all kits
+
+def expandSuperKitCandidates( df: pd.DataFrame ) -> pd.DataFrame:
+
+    rows = np.repeat( np.arange( len( df ) ), df[ 'votes' ].to_numpy() )
+
+
+    return df.iloc[ rows ].drop( columns='votes' ).reset_index( drop=True )
+
+
+##########################################
+
+
+##########################################
+# Add sorted rows of new kits to the stored superkit
+# of storeDir, choosing genotypes again only on the
+# positions of the new kits. The rows are sorted with
+# sort and the genotypes chosen with dropDuplicates,
+# as sortDNAFile and dropDuplicatesDNAFile do with
+# majorityVote and the companies in priority order
+
+def updateSuperKit( storeDir: str, df: pd.DataFrame, majorityVote: bool, companies: list, sort, dropDuplicates ) -> tuple:
+
+    reader, metadata = openSuperKitStore( storeDir )
+    stored = reader.read_all().to_pandas()
+    candidates = openSuperKitStore( storeDir, 'candidates.arrow' )[ 0 ].read_all().to_pandas()
+
+    # Every position is chosen again if the store was made with other rules
+    if metadata[ 'majorityVote' ] == majorityVote and metadata.get( 'companyPriorityList' ) == companies:
+        newKeys = np.unique( getPositionKeys( df[ 'chromosome' ], df[ 'position' ] ) )
+        affected = np.isin( getPositionKeys( candidates[ 'chromosome' ], candidates[ 'position' ] ), newKeys )
+        stored = stored[ ~np.isin( getPositionKeys( stored[ 'chromosome' ], stored[ 'position' ] ), newKeys ) ]
+    else:
+        affected = np.ones( len( candidates ), dtype=bool )
+        stored = stored.iloc[ :0 ]
+
+    # New rows come after the rows of the stored kits, as the files are merged in order
+    rows = sort( pd.concat( [ candidates[ affected ], df.assign( votes=1 ) ], ignore_index=True ) )
+    rows = getSuperKitCandidates( rows )
+
+    # Choose genotypes with the same rules as when all kits are merged
+    chosen = dropDuplicates( expandSuperKitCandidates( rows ), verbose=False )
+
+    stored = sort( pd.concat( [ stored, chosen ], ignore_index=True ) )
+    candidates = sort( pd.concat( [ candidates[ ~affected ], rows ], ignore_index=True ) )
+
+
+    return stored, candidates
+
+
+##########################################
+
+
+####################################################################################
+####################################################################################
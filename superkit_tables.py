@@ -0,0 +1,122 @@
+##############################################################################################
+# Normalization tables of create_superkit.py, shared with the superkit_*.py modules
+#
+
+import numpy as np
+
+
+####################################################################################
+# Normalization tables
+####################################################################################
+
+# Sorting order for chromosome column
+chromosomePriorityList = [ '0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12', '13', '14', '15', '16', '17', '18', '19', '20', '21', '22', 'X', 'Y', 'XY', 'MT' ]
+
+
+# Table for normalizing genotypes
+genotypeTable = {
+    '00': '--',
+#    'CA': 'AC',
+#    'TG': 'GT',
+#    'GC': 'CG',
+#    'TA': 'AT',
+#    'TC': 'CT',
+#    'GA': 'AG',
+
+#    'ID': 'DI',
+
+    '-G': 'G',
+    '-C': 'C',
+    '-A': 'A',
+    '-T': 'T'
+}
+
+genotypeTableMajorityVote = {
+    'CA': 'AC',
+    'TG': 'GT',
+    'CG': 'GC', # Ancestry format
+    'AT': 'TA', # Ancestry format
+    'TC': 'CT',
+    'GA': 'AG',
+
+    'ID': 'DI',
+}
+
+
+# Table for normalizing genotype on X and Y chromosome (Males)
+genotypeTableXYMales = {
+    'GG': 'G',
+    'CC': 'C',
+    'AA': 'A',
+    'TT': 'T',
+
+    'DD': 'D',
+    'II': 'I',
+
+    'AC': '--',
+    'GT': '--',
+    'CG': '--',
+    'AT': '--',
+    'CT': '--',
+    'AG': '--',
+
+    # Reversed allele order (AncestryDNA, LivingDNA, FamilyTreeDNA)
+    'CA': '--',
+    'TG': '--',
+    'GC': '--',
+    'TA': '--',
+    'TC': '--',
+    'GA': '--'
+}
+
+
+# Genotype codes for normalized genotypes, the code is the index in the list.
+# Genotypes not in the list gets code -1
+genotypeCodeList = [ '--',
+                     'AA', 'CC', 'GG', 'TT',
+                     'AC', 'AG', 'AT', 'CG', 'CT', 'GT',
+                     'CA', 'GA', 'TA', 'GC', 'TC', 'TG',
+                     'A', 'C', 'G', 'T',
+                     'DD', 'II', 'DI', 'ID',
+                     'D', 'I' ]
+
+# Lookup table from genotype code to heterozygous call
+genotypeCodeHeterozygous = np.array( [ len( g ) == 2 and g[ 0 ] != g[ 1 ] and '-' not in g for g in genotypeCodeList ] )
+
+# List of no calls, deletions and insertions genotypes
+noCallDelIns = [ 'DD', 'II', 'DI', 'D', 'I', '--' ]
+#noCallsHyphen = [ 'DD', 'II', 'DI', 'D', 'I' ]
+
+
+####################################################################################
+####################################################################################
+
+
+####################################################################################
+# Chromosome and allele tables
+####################################################################################
+
+# Table for normalizing chromosome names
+chromosomeTableAncestryIn = { '23': 'X',
+                              '24': 'Y',
+                              '25': 'XY',
+                              '26': 'MT'
+}
+
+# Table for normalizing VCF contig names (after the chr prefix is removed)
+chromosomeTableVCF = { 'M': 'MT' }
+
+# Alleles of genotypes as bits, so kits are compared with bit operations (see superkit_matching.py).
+# Anything else, like nocalls, deletions and insertions, is 0
+alleleBits = np.zeros( 256, dtype=np.uint8 )
+for allele, bit in zip( b'ACGT', [ 1, 2, 4, 8 ] ):
+    alleleBits[ allele ] = bit
+
+# Complement of every allele, A and T, C and G, as letters for --harmonize and --liftover
+alleleComplements = np.arange( 256, dtype=np.uint8 )
+for allele, complement in zip( b'ACGT', b'TGCA' ):
+    alleleComplements[ allele ] = complement
+
+
+####################################################################################
+####################################################################################
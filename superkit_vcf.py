@@ -0,0 +1,334 @@
+##############################################################################################
+# VCF v4 output, block-gzip compressed and tabix indexed
+# of create_superkit.py
+#
+
+import pandas as pd
+import numpy as np
+import datetime
+import zlib
+import struct
+
+from superkit_tables import chromosomePriorityList
+import superkit_harmonize as harmonize   # Reference alleles
+
+
+####################################################################################
+# VCF OUTPUT FUNCTIONS
+####################################################################################
+
+# VCF v4 is written as block-gzip (BGZF), gzip members of at most 64 KB of text that
+# can be decompressed one at a time. The tabix index (.tbi) holds, for every 16 kb window
+# of each chromosome, the virtual offset (compressed block offset << 16 | offset in the
+# block) of its first and the end of its last row, so a region is read without a full scan.
+# Every row is one position (a 1 bp region), so all rows are in the 16 kb bins of tabix.
+# REF and ALT are the reference and alternative allele of ./data/reference-alleles.txt, a
+# kit has no reference bases of its own. SNPs that are not in it are written with REF N.
+
+# Rows are rendered with numpy instead of pandas to_csv. The columns after ID only have
+# a few combinations, the REF, ALT and GT of a genotype on a SNP, so each combination is
+# rendered once and taken by code, and the fields of a block of rows are copied into one
+# buffer with their tabs and line terminators.
+
+# Uncompressed size of a BGZF block, and the empty block that ends a BGZF file
+bgzfBlockSize = 0xff00
+bgzfEOF = bytes.fromhex( '1f8b08040000000000ff0600424302001b0003000000000000000000' )
+
+# tabix bins and linear index windows of 16 kb
+tabixMinShift = 14
+tabixBinOffset = 4681
+
+# Number of rows rendered at a time
+vcfRenderRows = 65536
+
+
+##########################################
+# REF, ALT and GT of a normalized genotype at a SNP
+# with the reference and alternative allele from
+# ./data/reference-alleles.txt ('' if not in it).
+# Without reference REF is N and every called allele
+# is an ALT, so no call is taken for the reference
+
+def getVCFAlleles( genotype: str, reference: str, alternative: str ) -> tuple:
+
+    bases = [ 'A', 'C', 'G', 'T' ]
+
+    ref = reference or 'N'
+    alts = [ alternative ] if reference and alternative else []
+
+    # Nocalls, insertions and deletions
+    if not isinstance( genotype, str ) or len( genotype ) not in ( 1, 2 ) or any( a not in bases for a in genotype ):
+        return ref, ','.join( alts ) or '.', './.'
+
+    # Alleles that are neither the reference nor the alternative allele are added to ALT.
+    # One allele, e.g. FamilyTreeDNA v3 -G, is a haploid call
+    for allele in genotype:
+        if allele != reference and allele not in alts:
+            alts.append( allele )
+    # Unphased, so the allele indexes are sorted
+    gt = sorted( 0 if allele == reference else alts.index( allele ) + 1 for allele in genotype )
+
+
+    return ref, ','.join( alts ) or '.', '/'.join( str( i ) for i in gt )
+
+
+##########################################
+# VCF meta-information and header line, of the
+# superkit source and the sample of its column
+
+def getVCFHeader( source: str, sample: str ) -> str:
+
+    current_time = datetime.datetime.utcnow().strftime( '%Y%m%d' )
+
+    contigs = ''.join( f'##contig=<ID={c}>\n' for c in chromosomePriorityList if c != '0' )
+
+    data = (
+        '##fileformat=VCFv4.2\n'
+        f'##fileDate={current_time}\n'
+        f'##source={source}\n'
+        f'{contigs}'
+        '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n'
+        f'#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t{sample}\n'
+    )
+
+
+    return data
+
+
+##########################################
+
+
+##########################################
+# Join fixed-width byte fields to lines, the fields
+# of a row separated by tabs. The fields are set side
+# by side with their padding, and the padding, the
+# zero bytes, is left out. Returns the lines and the
+# length of every line
+
+def joinByteFields( fields: list ) -> tuple:
+
+    rows = len( fields[ 0 ] )
+    columns = []
+    for column, field in enumerate( fields ):
+        columns.append( field.view( np.uint8 ).reshape( rows, field.dtype.itemsize ) )
+        columns.append( np.full( ( rows, 1 ), ord( '\t' ) if column < len( fields ) - 1 else ord( '\n' ), dtype=np.uint8 ) )
+    table = np.concatenate( columns, axis=1 )
+    used = table != 0
+
+
+    return table[ used ].tobytes(), used.sum( axis=1 )
+
+
+##########################################
+
+
+##########################################
+# Render a formatted VCF chunk as text a block of
+# rows at a time. Yields the text and the length of
+# every row of each block
+
+def renderVCFRows( df: pd.DataFrame, encoding: str ):
+
+    # Chromosomes and the columns after ID are rendered once per value and taken by code
+    chromosomeCodes, chromosomes = pd.factorize( df[ '#CHROM' ] )
+    chromosomes = np.array( [ str( c ).encode( encoding ) for c in chromosomes ], dtype='S' )
+    tailCodes = np.zeros( len( df ), dtype=np.int64 )
+    tailValues = []
+    for column in df.columns[ 3: ]:
+        codes, values = pd.factorize( df[ column ] )
+        tailCodes = tailCodes * len( values ) + codes
+        tailValues.append( values )
+    tailCodes, tails = pd.factorize( tailCodes )
+    tails = np.array( [ '\t'.join( values[ code ] for values, code in zip( tailValues, np.unravel_index( tail, [ len( values ) for values in tailValues ] ) ) ).encode( encoding )
+                        for tail in tails ], dtype='S' )
+
+    positions = df[ 'POS' ].to_numpy()
+    ids = df[ 'ID' ].fillna( '' ).to_numpy()
+
+    for first in range( 0, len( df ), vcfRenderRows ):
+        rows = slice( first, first + vcfRenderRows )
+        yield joinByteFields( [ chromosomes[ chromosomeCodes[ rows ] ], positions[ rows ].astype( 'S' ), ids[ rows ].astype( 'S' ), tails[ tailCodes[ rows ] ] ] )
+
+
+##########################################
+
+
+##########################################
+# Compress one BGZF block, a gzip member with
+# the compressed block size in the BC extra field
+
+def compressBGZFBlock( data: bytes, compressionLevel: int ) -> bytes:
+
+    compressor = zlib.compressobj( compressionLevel, zlib.DEFLATED, -15 )
+    compressed = compressor.compress( data ) + compressor.flush()
+
+    header = struct.pack( '<4BI2BH2BHH', 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, ord( 'B' ), ord( 'C' ), 2, len( compressed ) + 25 )
+
+
+    return header + compressed + struct.pack( '<2I', zlib.crc32( data ), len( data ) )
+
+
+##########################################
+
+
+##########################################
+# Write a BGZF file from a list of byte strings,
+# ending with the EOF block. Returns the compressed
+# offset of every block, and the end of the last block
+
+def writeBGZFFile( f, parts, compressionLevel: int = 6 ) -> list:
+
+    blockOffsets = []
+    offset = 0
+    buffer = bytearray()
+
+    def writeBlock( data: bytes ):
+        nonlocal offset
+        block = compressBGZFBlock( data, compressionLevel )
+        f.write( block )
+        blockOffsets.append( offset )
+        offset += len( block )
+
+    for part in parts:
+        buffer += part
+        while len( buffer ) >= bgzfBlockSize:
+            writeBlock( bytes( buffer[ :bgzfBlockSize ] ) )
+            del buffer[ :bgzfBlockSize ]
+
+    if buffer:
+        writeBlock( bytes( buffer ) )
+    blockOffsets.append( offset )
+    f.write( bgzfEOF )
+
+
+    return blockOffsets
+
+
+##########################################
+
+
+##########################################
+# Build the tabix index from the first and last row
+# of every 16 kb window, as uncompressed offsets
+
+def buildTabixIndex( windows: dict, blockOffsets: list ) -> bytes:
+
+    blockOffsets = np.array( blockOffsets, dtype=np.uint64 )
+
+    # Uncompressed offsets to virtual offsets, blocks are all bgzfBlockSize long
+    def virtualOffsets( offsets: np.ndarray ) -> np.ndarray:
+        block = offsets // bgzfBlockSize
+        return ( blockOffsets[ block ] << np.uint64( 16 ) ) | ( offsets - block * bgzfBlockSize ).astype( np.uint64 )
+
+    names = b''.join( name.encode( 'ascii' ) + b'\0' for name in windows )
+
+    # VCF preset: format 2, sequence name column 1, position column 2, no end column, # comments
+    index = [ b'TBI\1', struct.pack( '<8i', len( windows ), 2, 1, 2, 0, ord( '#' ), 0, len( names ) ), names ]
+
+    for window, start, end in windows.values():
+        window = np.concatenate( window )
+        start = np.concatenate( start )
+        end = np.concatenate( end )
+
+        # A window can be split over chunks, keep its first start and last end
+        first = np.r_[ True, window[ 1: ] != window[ :-1 ] ]
+        last = np.r_[ window[ 1: ] != window[ :-1 ], True ]
+        window = window[ first ]
+        start = virtualOffsets( start[ first ] )
+        end = virtualOffsets( end[ last ] )
+
+        # One bin per window with one chunk
+        index.append( struct.pack( '<i', len( window ) ) )
+        bins = np.zeros( len( window ), dtype=[ ( 'bin', '<u4' ), ( 'n_chunk', '<i4' ), ( 'beg', '<u8' ), ( 'end', '<u8' ) ] )
+        bins[ 'bin' ] = window + tabixBinOffset
+        bins[ 'n_chunk' ] = 1
+        bins[ 'beg' ] = start
+        bins[ 'end' ] = end
+        index.append( bins.tobytes() )
+
+        # Linear index, empty windows get the offset of the window before
+        linear = np.zeros( window[ -1 ] + 1, dtype=np.uint64 )
+        linear[ window ] = start
+        linear = np.maximum.accumulate( linear )
+        index.append( struct.pack( '<i', len( linear ) ) )
+        index.append( linear.astype( '<u8' ).tobytes() )
+
+
+    return b''.join( index )
+
+
+##########################################
+
+
+##########################################
+# Write formatted VCF chunks of the superkit source,
+# with the genotypes in the sample column, as BGZF with
+# a tabix index next to it, or to stream without index
+# (--stdout)
+
+def writeVCFFileChunks( tmpFileName: str, chunks, source: str, sample: str, compressionLevel: int = 6, stream=None ):
+
+    encoding = 'ascii'
+
+    # Windows, first row start and last row end per chromosome
+    windows = {}
+    written = 0
+    # Called SNPs without reference alleles
+    unknown = 0
+
+    def vcfParts():
+        nonlocal written, unknown
+
+        header = getVCFHeader( source, sample ).encode( encoding )
+        written += len( header )
+        yield header
+
+        for df in chunks:
+            if df.empty:
+                continue
+            texts = []
+            lengths = []
+            for text, rowLengths in renderVCFRows( df, encoding ):
+                texts.append( text )
+                lengths.append( rowLengths )
+
+            # Offsets of the rows from their lengths
+            ends = np.cumsum( np.concatenate( lengths ) ).astype( np.uint64 ) + np.uint64( written )
+            starts = np.r_[ np.uint64( written ), ends[ :-1 ] ]
+            written += int( sum( len( text ) for text in texts ) )
+
+            window = ( df[ 'POS' ].to_numpy( dtype=np.int64 ) - 1 ) >> tabixMinShift
+            chromosome = df[ '#CHROM' ].to_numpy()
+            for c in pd.unique( chromosome ):
+                rows = chromosome == c
+                entry = windows.setdefault( c, ( [], [], [] ) )
+                entry[ 0 ].append( window[ rows ] )
+                entry[ 1 ].append( starts[ rows ] )
+                entry[ 2 ].append( ends[ rows ] )
+
+            unknown += int( np.count_nonzero( ( df[ 'REF' ] == 'N' ).to_numpy() & ( df[ sample ] != './.' ).to_numpy() ) )
+
+            yield from texts
+
+    if stream is not None:
+        writeBGZFFile( stream, vcfParts(), compressionLevel )
+        stream.flush()
+
+    else:
+        with open( tmpFileName, 'wb' ) as f:
+            blockOffsets = writeBGZFFile( f, vcfParts(), compressionLevel )
+
+        # The index is BGZF compressed as well
+        with open( tmpFileName + '.tbi', 'wb' ) as f:
+            writeBGZFFile( f, [ buildTabixIndex( windows, blockOffsets ) ], compressionLevel )
+
+    # Without any reference alleles it was shown when they were loaded
+    if unknown and harmonize.referenceAlleles.get( 'alleles' ) is not None:
+        print( f'{unknown} called SNPs are not in {harmonize.referenceAllelesSource} and are written with REF N' )
+
+
+    return
+
+
+####################################################################################
+####################################################################################
@@ -0,0 +1,166 @@
+##############################################################################################
+# Watching ./input/ for new DNA files (--watch)
+# of create_superkit.py
+#
+
+import os
+import sys
+import time
+import select
+import ctypes
+
+from superkit_files import fileEndings, compressedFileEndings
+
+
+####################################################################################
+# VARIABLES
+####################################################################################
+
+# Seconds without a change to the DNA files before the superkit is built again,
+# and seconds between the polls where inotify is not available
+watchSettleSeconds = 2
+watchPollSeconds = 2
+
+
+####################################################################################
+# WATCH FUNCTIONS (--watch)
+####################################################################################
+
+# In watch mode the script keeps running and builds the superkit again every time
+# the DNA files in ./input/ change. The input directory is watched with inotify on
+# Linux and polled elsewhere. A build starts when no file has changed size or time
+# for watchSettleSeconds, so files that are still being copied are not read.
+# The company and the normalized and cleaned kit of every file are cached by file
+# size and modification time, so only new or changed kits are parsed again before
+# the kits are merged, formatted and written.
+
+
+##########################################
+# Watch a directory with inotify. Returns the
+# inotify file descriptor, or None if inotify
+# is not available
+
+def openInputWatcher( inputDir: str ):
+
+    # inotify events for files that are written, moved in or out, or removed
+    inotifyMask = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200
+
+    try:
+        libc = ctypes.CDLL( None, use_errno=True )
+        watcher = libc.inotify_init1( os.O_NONBLOCK | os.O_CLOEXEC )
+    except ( OSError, AttributeError ):
+        return None
+    if watcher < 0:
+        return None
+
+    if libc.inotify_add_watch( watcher, os.fsencode( inputDir ), inotifyMask ) < 0:
+        os.close( watcher )
+        return None
+
+
+    return watcher
+
+
+##########################################
+
+
+##########################################
+# Wait for a change in the input directory, or
+# for the timeout (seconds, None waits for a change)
+
+def waitForInputChange( watcher, timeout: float ):
+
+    # Polling
+    if watcher is None:
+        time.sleep( watchPollSeconds if timeout is None else min( timeout, watchPollSeconds ) )
+        return
+
+    ready, _, _ = select.select( [ watcher ], [], [], timeout )
+    if ready:
+        # The events themselves are not needed, the directory is read again
+        try:
+            while os.read( watcher, 65536 ):
+                pass
+        except BlockingIOError:
+            pass
+
+
+##########################################
+
+
+##########################################
+# Size and modification time of the files in
+# the input directory that findDNAFiles would use
+
+def getInputSnapshot( inputDir: str ) -> dict:
+
+    snapshot = {}
+    for entry in os.scandir( inputDir ):
+        if entry.is_file() and entry.name.lower().endswith( fileEndings + compressedFileEndings ):
+            stat = entry.stat()
+            snapshot[ entry.name ] = ( stat.st_size, stat.st_mtime_ns )
+
+
+    return snapshot
+
+
+##########################################
+
+
+##########################################
+# Build the superkit with build( kitCache ) every
+# time the DNA files in the input directory have
+# changed and settled
+
+def watchInputDir( inputFileDir: str, build ):
+
+    inputDir = os.path.join( os.path.dirname( os.path.realpath( __file__ ) ), inputFileDir )
+    watcher = openInputWatcher( inputDir )
+    kitCache = {}
+    builtSnapshot = None
+    snapshot = getInputSnapshot( inputDir )
+    changedTime = time.time()
+    rebuildCount = 0
+
+    print()
+    print( f"Watching {inputFileDir} for DNA files ({'inotify' if watcher is not None else 'polling'}), press Ctrl+C to stop" )
+
+    try:
+        while True:
+            currentSnapshot = getInputSnapshot( inputDir )
+            if currentSnapshot != snapshot:
+                snapshot = currentSnapshot
+                changedTime = time.time()
+
+            # Files still being written change size or time, so wait until they have settled
+            settleTime = changedTime + watchSettleSeconds - time.time()
+            if snapshot != builtSnapshot and settleTime <= 0:
+                rebuildCount += 1
+                rebuildStart = time.time()
+                try:
+                    build( kitCache )
+                    result = 'done'
+                except Exception as e:
+                    # A broken or incomplete file is tried again when it changes
+                    result = f'failed ({type( e ).__name__}: {e})'
+                builtSnapshot = snapshot
+
+                print()
+                print( f'# Rebuild {rebuildCount} {result} in {time.time() - rebuildStart:.2f} seconds, {len( snapshot )} files in {inputFileDir}' )
+                print()
+                print( f"Watching {inputFileDir} for DNA files, press Ctrl+C to stop" )
+                sys.stdout.flush()
+                continue
+
+            waitForInputChange( watcher, settleTime if snapshot != builtSnapshot else None )
+
+    except KeyboardInterrupt:
+        print()
+        print( 'Stopped watching' )
+
+
+##########################################
+
+
+####################################################################################
+####################################################################################
@@ -0,0 +1,394 @@
+##############################################################################################
+# Shared fixtures of the tests
+#
+# The scripts read ./input/ and ./data/ and write ./output/ of the working directory,
+# so every build runs as a script in a directory of its own, with synthetic kits of
+# the DNA file formats that are generated once per test session.
+
+import os
+import sys
+import gzip
+import random
+import shutil
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+packageDir = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+if packageDir not in sys.path:
+    sys.path.insert( 0, packageDir )
+
+# Chromosomes of the synthetic panel, X, Y and MT as named by Ancestry
+sampleChromosomes = [ str( c ) for c in range( 1, 23 ) ] + [ 'X', 'Y', 'MT' ]
+sampleChromosomesAncestry = { 'X': '23', 'Y': '24', 'MT': '26' }
+
+
+##########################################
+# Synthetic panel of SNPs, rsid, chromosome,
+# position and two alleles
+
+def makeSamplePanel( seed: int = 1, snpsPerChromosome: int = 1500 ) -> list:
+
+    rng = random.Random( seed )
+    panel = []
+    rsid = 1000
+    for chromosome in sampleChromosomes:
+        count = snpsPerChromosome if chromosome not in ( 'Y', 'MT' ) else snpsPerChromosome // 10
+        for position in sorted( rng.sample( range( 10000, 50000000 ), count ) ):
+            rsid += 1
+            panel.append( ( f'rs{rsid}', chromosome, position, *rng.sample( 'ACGT', 2 ) ) )
+
+
+    return panel
+
+
+##########################################
+
+
+##########################################
+# Write a kit of every supported company for one
+# person of the panel to directory. The kits overlap
+# partly and have a few read errors and nocalls
+
+def writeSampleKits( directory: str, panel: list, seed: int = 1, male: bool = False ):
+
+    rng = random.Random( seed )
+    os.makedirs( directory, exist_ok=True )
+
+    # The genotypes of the person
+    truth = {}
+    for rsid, chromosome, position, reference, alternative in panel:
+        alleles = [ rng.choice( [ reference, alternative ] ) for _ in range( 2 ) ]
+        if chromosome in ( 'X', 'Y', 'MT' ) and male:
+            alleles = [ alleles[ 0 ], alleles[ 0 ] ]
+        truth[ rsid ] = None if chromosome == 'Y' and not male else alleles
+
+    def call( rsid: str ) -> list:
+        alleles = truth[ rsid ]
+        if alleles is None or rng.random() < 0.02:
+            return None
+        if rng.random() < 0.01:
+            return [ rng.choice( 'ACGT' ), rng.choice( 'ACGT' ) ]
+        return list( alleles )
+
+    def sample( fraction: float, sampleSeed: int ) -> list:
+        sampleRng = random.Random( seed * 100 + sampleSeed )
+        return [ row for row in panel if sampleRng.random() < fraction ]
+
+    with open( os.path.join( directory, 'genome_Test_v5_Full_2020.txt' ), 'w', newline='\r\n' ) as f:
+        f.write( '# This data file generated by 23andMe at: Mon Jan 01 00:00:00 2020\n#\n' )
+        f.write( '# rsid\tchromosome\tposition\tgenotype\n' )
+        for rsid, chromosome, position, _, _ in sample( 0.7, 1 ):
+            alleles = call( rsid )
+            f.write( f'{rsid}\t{chromosome}\t{position}\t{"--" if alleles is None else "".join( sorted( alleles ) )}\n' )
+        # Two rows of one position
+        rsid, chromosome, position, _, _ = panel[ 5 ]
+        f.write( f'i900001\t{chromosome}\t{position}\tAA\ni900002\t{chromosome}\t{position}\tAA\n' )
+
+    with open( os.path.join( directory, 'AncestryDNA.txt' ), 'w', newline='\r\n' ) as f:
+        f.write( '#AncestryDNA raw data download\n#Data was collected using AncestryDNA array version: V2.0\n' )
+        f.write( 'rsid\tchromosome\tposition\tallele1\tallele2\n' )
+        for rsid, chromosome, position, _, _ in sample( 0.6, 2 ):
+            alleles = call( rsid ) or [ '0', '0' ]
+            f.write( f'{rsid}\t{sampleChromosomesAncestry.get( chromosome, chromosome )}\t{position}\t{alleles[ 0 ]}\t{alleles[ 1 ]}\n' )
+
+    with open( os.path.join( directory, '37_Test_Chrom_Autoso_2020.csv' ), 'w', newline='\n' ) as f:
+        f.write( 'RSID,CHROMOSOME,POSITION,RESULT\n"rs99","0","0","--"\n' )
+        for rsid, chromosome, position, _, _ in sample( 0.5, 3 ):
+            if chromosome != 'Y':
+                alleles = call( rsid )
+                f.write( f'"{rsid}","{chromosome}","{position}","{"--" if alleles is None else "".join( alleles )}"\n' )
+
+    with open( os.path.join( directory, 'MyHeritage_raw_dna_data.csv' ), 'w', newline='\n' ) as f:
+        f.write( '##fileformat=MyHeritage\n##format=MHv1.0\n# MyHeritage DNA raw data.\n' )
+        f.write( 'RSID,CHROMOSOME,POSITION,RESULT\n' )
+        for rsid, chromosome, position, _, _ in sample( 0.55, 4 ):
+            if chromosome != 'MT':
+                alleles = call( rsid )
+                f.write( f'"{rsid}","{chromosome}","{position}","{"--" if alleles is None else "".join( alleles )}"\n' )
+
+    with open( os.path.join( directory, 'autosomal.txt' ), 'w', newline='\n' ) as f:
+        f.write( '# Living DNA customer genotype data download file version: 1.0.2\n#\n# rsid\tchromosome\tposition\tgenotype\n' )
+        for rsid, chromosome, position, _, _ in sample( 0.5, 5 ):
+            alleles = call( rsid ) if chromosome not in ( 'Y', 'MT' ) else None
+            if alleles is not None:
+                f.write( f'{rsid}\t{chromosome}\t{position}\t{"".join( alleles )}\n' )
+
+
+##########################################
+
+
+##########################################
+# Write a DNA file template of every company,
+# the SNPs of its sample kit, to directory
+
+def writeSampleTemplates( directory: str, panel: list ):
+
+    os.makedirs( directory, exist_ok=True )
+    ancestry = { 'X': '23', 'Y': '24', 'MT': '26' }
+    for company, fraction, sampleSeed, skip in [ ( '23andMe v5', 0.7, 1, () ), ( 'AncestryDNA v2', 0.6, 2, () ), ( 'FamilyTreeDNA v3', 0.5, 3, ( 'Y', ) ),
+                                                 ( 'MyHeritage v2', 0.55, 4, ( 'MT', ) ), ( 'LivingDNA v1.0.2', 0.5, 5, ( 'Y', 'MT' ) ) ]:
+        sampleRng = random.Random( 100 + sampleSeed )
+        with open( os.path.join( directory, f'{company}.df' ), 'w' ) as f:
+            f.write( 'rsid\tchromosome\tposition\tcompany\n' )
+            for rsid, chromosome, position, _, _ in panel:
+                if sampleRng.random() < fraction and chromosome not in skip:
+                    name = ancestry.get( chromosome, chromosome ) if company == 'AncestryDNA v2' else chromosome
+                    f.write( f'{rsid}\t{name}\t{position}\t{company}\n' )
+
+
+##########################################
+
+
+##########################################
+# Reference and alternative alleles of the panel on
+# the forward strand, as ./data/reference-alleles.txt
+
+def writeSampleReferenceAlleles( directory: str, panel: list ):
+
+    os.makedirs( directory, exist_ok=True )
+    with open( os.path.join( directory, 'reference-alleles.txt' ), 'w' ) as f:
+        f.write( '#CHROM\tPOS\tREF\tALT\n' )
+        for _, chromosome, position, reference, alternative in panel:
+            f.write( f'chr{chromosome}\t{position}\t{reference}\t{alternative}\n' )
+
+
+##########################################
+
+
+##########################################
+# Copy the kits of kitsDir to directory with the calls of
+# every other SNP of the 23andMe kit on the reverse strand,
+# as some chips call them. Only calls of the alleles of the
+# panel that are not A/T or C/G can be told apart
+
+def writeFlippedKits( directory: str, kitsDir: str, panel: list ):
+
+    os.makedirs( directory, exist_ok=True )
+    flippable = { rsid: { a, b } for rsid, _, _, a, b in panel if { a, b } not in ( { 'A', 'T' }, { 'C', 'G' } ) }
+    complements = str.maketrans( 'ACGT', 'TGCA' )
+    for file in os.listdir( kitsDir ):
+        shutil.copy( os.path.join( kitsDir, file ), os.path.join( directory, file ) )
+
+    file = os.path.join( directory, 'genome_Test_v5_Full_2020.txt' )
+    with open( file, newline='' ) as f:
+        lines = f.read().split( '\r\n' )
+    for i, line in enumerate( lines ):
+        fields = line.split( '\t' )
+        if i % 2 and len( fields ) == 4 and set( fields[ 3 ] ) <= flippable.get( fields[ 0 ], set() ):
+            lines[ i ] = '\t'.join( fields[ :3 ] + [ fields[ 3 ].translate( complements ) ] )
+    with open( file, 'w', newline='' ) as f:
+        f.write( '\r\n'.join( lines ) )
+
+
+##########################################
+
+
+##########################################
+# A UCSC chain file from GRCh38 to GRCh37 as
+# ./data/hg38ToHg19.over.chain.gz. Every chromosome is
+# shifted, and chromosome 22 is on the reverse strand
+# from sampleReverseStart on
+
+sampleChainSize = 100000000
+sampleReverseStart = 40000000
+
+
+def getSampleShift( chromosome: str ) -> int:
+
+    return 10000 * ( sampleChromosomes.index( chromosome ) + 1 )
+
+
+def writeSampleChain( directory: str ):
+
+    os.makedirs( directory, exist_ok=True )
+    lines = []
+    for i, chromosome in enumerate( sampleChromosomes ):
+        name = 'chrM' if chromosome == 'MT' else f'chr{chromosome}'
+        shift = getSampleShift( chromosome )
+        size = sampleReverseStart if chromosome == '22' else sampleChainSize - shift
+        lines += [ f'chain 1000 {name} {sampleChainSize + shift} + {shift} {shift + size} {name} {sampleChainSize} + 0 {size} {2 * i + 1}', str( size ), '' ]
+        if chromosome == '22':
+            size = sampleChainSize - sampleReverseStart
+            start = shift + sampleReverseStart
+            lines += [ f'chain 900 {name} {sampleChainSize + shift} + {start} {start + size} {name} {sampleChainSize} - 0 {size} {2 * i + 2}', str( size ), '' ]
+    # Alternative haplotypes are left out
+    lines += [ f'chain 10 chr1_KI270706v1_random 175055 + 0 1000 chr1 {sampleChainSize} + 0 1000 {2 * len( sampleChromosomes ) + 1}', '1000', '' ]
+
+    with gzip.open( os.path.join( directory, 'hg38ToHg19.over.chain.gz' ), 'wt' ) as f:
+        f.write( '\n'.join( lines ) + '\n' )
+
+
+##########################################
+
+
+##########################################
+# GRCh38 position and genotype of a GRCh37 SNP
+# of the sample chain
+
+def getSampleGRCh38( chromosome: str, position: int, genotype: str ) -> tuple:
+
+    if chromosome == '22' and position > sampleReverseStart:
+        return getSampleShift( chromosome ) + sampleReverseStart + sampleChainSize - position + 1, genotype.translate( str.maketrans( 'ACGT', 'TGCA' ) )
+
+
+    return position + getSampleShift( chromosome ), genotype
+
+
+##########################################
+
+
+##########################################
+# Copy the kits of kitsDir to directory with the
+# 23andMe kit on GRCh38
+
+def writeGRCh38Kits( directory: str, kitsDir: str ):
+
+    os.makedirs( directory, exist_ok=True )
+    for file in os.listdir( kitsDir ):
+        shutil.copy( os.path.join( kitsDir, file ), os.path.join( directory, file ) )
+
+    file = os.path.join( directory, 'genome_Test_v5_Full_2020.txt' )
+    with open( file, newline='' ) as f:
+        lines = f.read().split( '\r\n' )
+    for i, line in enumerate( lines ):
+        fields = line.split( '\t' )
+        if len( fields ) == 4 and not line.startswith( '#' ):
+            position, genotype = getSampleGRCh38( fields[ 1 ], int( fields[ 2 ] ), fields[ 3 ] )
+            lines[ i ] = '\t'.join( [ fields[ 0 ], fields[ 1 ], str( position ), genotype ] )
+    with open( file, 'w', newline='' ) as f:
+        f.write( '\r\n'.join( lines ) )
+
+
+##########################################
+
+
+##########################################
+# Sorted rows of random kits of a few companies,
+# with duplicate rows of one company, nocalls and
+# both allele orders of a genotype
+
+def makeMergedKits( superkit, seed: int, rows: int = 3000 ) -> pd.DataFrame:
+
+    rng = np.random.default_rng( seed )
+    df = pd.DataFrame( {
+        'rsid': [ f'rs{i}' for i in range( rows ) ],
+        'chromosome': rng.choice( [ '0', '1', '2', 'X', 'MT' ], rows ),
+        'position': rng.integers( 1, 400, rows ),
+        'genotype': rng.choice( [ '--', 'AA', 'AC', 'CA', 'CC', 'GT', 'TG' ], rows, p=[ 0.1, 0.3, 0.2, 0.1, 0.2, 0.05, 0.05 ] ),
+        'company': rng.choice( superkit.companyPriorityList[ :4 ], rows )
+    } )
+
+
+    return superkit.sortDNAFile( df )
+
+
+##########################################
+
+
+##########################################
+# Panel and kits of one person, generated once
+
+@pytest.fixture( scope='session' )
+def samplePanel() -> list:
+
+    return makeSamplePanel()
+
+
+@pytest.fixture( scope='session' )
+def sampleKits( tmp_path_factory, samplePanel ) -> str:
+
+    directory = str( tmp_path_factory.mktemp( 'kits' ) )
+    writeSampleKits( directory, samplePanel )
+
+
+    return directory
+
+
+@pytest.fixture( scope='session' )
+def sampleTemplates( tmp_path_factory, samplePanel ) -> str:
+
+    directory = str( tmp_path_factory.mktemp( 'templates' ) )
+    writeSampleTemplates( directory, samplePanel )
+
+
+    return directory
+
+
+##########################################
+
+
+##########################################
+# Run create_superkit.py in workDir on the kits in
+# kitsDir (and the files in dataDir as ./data/).
+# The scripts find ./input/ next to them, so they
+# are copied to workDir. Returns what it printed
+
+def runSuperKit( workDir: str, kitsDir: str, *arguments: str, dataDir: str = None, script: str = 'create_superkit.py' ) -> str:
+
+    workDir = str( workDir )
+    for directory in [ 'input', 'output', 'data' ]:
+        os.makedirs( os.path.join( workDir, directory ), exist_ok=True )
+    for file in os.listdir( packageDir ):
+        if file.endswith( '.py' ):
+            shutil.copy( os.path.join( packageDir, file ), os.path.join( workDir, file ) )
+    for file in os.listdir( kitsDir ):
+        shutil.copy( os.path.join( kitsDir, file ), os.path.join( workDir, 'input', file ) )
+    if dataDir:
+        for file in os.listdir( dataDir ):
+            shutil.copy( os.path.join( dataDir, file ), os.path.join( workDir, 'data', file ) )
+
+    result = subprocess.run( [ sys.executable, script, *arguments ], cwd=workDir, capture_output=True, text=True, timeout=600 )
+    assert result.returncode == 0, result.stdout + result.stderr
+
+
+    return result.stdout
+
+
+##########################################
+
+
+##########################################
+# Lines of the output files of a build without the
+# comments, which hold the time of the build. The
+# directories of the store and indexes are left out
+
+def readOutput( workDir: str ) -> dict:
+
+    outputDir = os.path.join( str( workDir ), 'output' )
+    files = {}
+    for file in sorted( os.listdir( outputDir ) ):
+        if os.path.isdir( os.path.join( outputDir, file ) ):
+            continue
+        with open( os.path.join( outputDir, file ), 'rb' ) as f:
+            files[ file ] = [ line for line in f.read().splitlines() if not line.startswith( b'#' ) ]
+
+
+    return files
+
+
+##########################################
+
+
+##########################################
+# create_superkit.py imported as a module, with the
+# default arguments, for tests of single functions
+
+@pytest.fixture( scope='session' )
+def superkit():
+
+    argv = sys.argv
+    sys.argv = [ 'create_superkit.py' ]
+    try:
+        import create_superkit
+    finally:
+        sys.argv = argv
+
+
+    return create_superkit
+
+
+##########################################
@@ -0,0 +1,91 @@
+##############################################################################################
+# The analysis of the DNA files by analyse_dna_file.py
+#
+
+import os
+
+import pandas as pd
+
+from conftest import runSuperKit
+
+
+##########################################
+# Write a 23andMe v5 kit of rows of rsid, chromosome,
+# position and genotype to directory
+
+def writeKit( directory: str, rows: list ):
+
+    os.makedirs( directory, exist_ok=True )
+    with open( os.path.join( directory, 'genome_Test_v5_Full_2020.txt' ), 'w', newline='\r\n' ) as f:
+        f.write( '# This data file generated by 23andMe at: Mon Jan 01 00:00:00 2020\n#\n' )
+        f.write( '# rsid\tchromosome\tposition\tgenotype\n' )
+        for rsid, chromosome, position, genotype in rows:
+            f.write( f'{rsid}\t{chromosome}\t{position}\t{genotype}\n' )
+
+
+##########################################
+
+
+##########################################
+# Duplicate positions are counted once with their
+# extra rows, agreeing or conflicting, and saved with
+# the number of rows and the conflict of the position
+
+def testDuplicateAnalysis( tmp_path ):
+
+    rows = [ ( f'rs{i}', '1', 10000 * i, 'AA' ) for i in range( 1, 101 ) ] + [ ( 'rs900', '2', 500, '--' ) ]
+    duplicates = [
+        ( 'i1', '2', 3000, 'CC' ), ( 'i2', '1', 20000, 'AA' ), ( 'i3', '2', 3000, 'CT' ),
+        ( 'i4', '1', 50000, 'AG' ), ( 'i5', '1', 50000, 'AA' )
+    ]
+    writeKit( tmp_path / 'kits', rows[ :50 ] + duplicates + rows[ 50: ] )
+
+    log = runSuperKit( tmp_path / 'analyse', tmp_path / 'kits', '-sd', script='analyse_dna_file.py' )
+    assert '# Duplicate positions in kit: 3 /' in log
+    assert '#   Extra duplicate rows:     4' in log
+    assert '#   Agreeing genotypes:       1' in log
+    assert '#   Conflicting genotypes:    2' in log
+
+    # The rows of every duplicate position, sorted on chromosome and position and in file order
+    saved = pd.read_csv( tmp_path / 'analyse' / 'data' / '23andMe v5-duplicates.df', sep='\t', dtype=str )
+    assert list( saved[ [ 'rsid', 'multiplicity', 'conflict' ] ].itertuples( index=False, name=None ) ) == [
+        ( 'rs2', '2', 'False' ), ( 'i2', '2', 'False' ),
+        ( 'rs5', '3', 'True' ), ( 'i4', '3', 'True' ), ( 'i5', '3', 'True' ),
+        ( 'i1', '2', 'True' ), ( 'i3', '2', 'True' )
+    ]
+
+
+##########################################
+
+
+##########################################
+# A kit with a gap of 1 Mbp and a run of homozygosity
+# of 2 Mbp, and a kit that closes part of the gap.
+# What is left of the gap is a gap of the superkit
+
+def testCoverageGapsAndRuns( tmp_path ):
+
+    writeKit( tmp_path / 'kits', [ ( f'rs{position}', '1', position, 'AA' ) for position in range( 1000000, 3000001, 10000 ) ] +
+                                 [ ( f'rs{position}', '1', position, 'AG' ) for position in range( 4000000, 4500001, 10000 ) ] +
+                                 [ ( 'rs900', '2', 500, '--' ) ] )
+    with open( tmp_path / 'kits' / 'AncestryDNA.txt', 'w', newline='\r\n' ) as f:
+        f.write( '#AncestryDNA raw data download\n#Data was collected using AncestryDNA array version: V2.0\n' )
+        f.write( 'rsid\tchromosome\tposition\tallele1\tallele2\n' )
+        for position in range( 3010000, 3400001, 10000 ):
+            f.write( f'rs{position}\t1\t{position}\tC\tT\n' )
+        f.write( 'rs900\t2\t500\t0\t0\n' )
+
+    log = runSuperKit( tmp_path / 'analyse', tmp_path / 'kits', '-cv', script='analyse_dna_file.py' )
+    kit = log.split( 'Analysing file: genome_Test_v5_Full_2020.txt' )[ 1 ].split( 'Done analyzing file' )[ 0 ]
+    assert 'Coverage gaps of at least 500000 base pairs: 1, 1000000 base pairs' in kit
+    assert '1 3000000 4000000 1000000' in ' '.join( kit.split() )
+    assert 'Runs of homozygosity of at least 100 SNPs and 1000000 base pairs: 1, 2000000 base pairs' in kit
+    assert '1 1000000 3000000 2000000 201' in ' '.join( kit.split() )
+
+    superkit = log.split( '# Coverage of the superkit: All kits merged by position' )[ 1 ]
+    assert 'Coverage gaps of at least 500000 base pairs: 1, 600000 base pairs' in superkit
+
+    # Gaps, gaps closed, base pairs in gaps and left in the superkit, and the percentage closed
+    report = { line.split()[ 0 ]: line.split()[ -5: ] for line in superkit.splitlines() if line.strip().endswith( '.0' ) }
+    assert report[ 'genome_Test_v5_Full_2020.txt' ] == [ '1', '0', '1000000', '600000', '40.0' ]
+    assert report[ 'AncestryDNA.txt' ] == [ '0', '0', '0', '0', '100.0' ]
@@ -0,0 +1,90 @@
+##############################################################################################
+# Kits read straight from zip, gzip, bz2 and xz archives, and the superkit written
+# to gzip and zip containers or stdout
+#
+
+import os
+import bz2
+import lzma
+import gzip
+import zipfile
+
+from conftest import runSuperKit, readOutput
+
+
+##########################################
+# Compress the sample kits to directory, two of them
+# in one zip archive, with a file name the compression
+# can not be told from
+
+def writeCompressedKits( directory: str, kitsDir: str ):
+
+    os.makedirs( directory, exist_ok=True )
+
+    def read( file: str ) -> bytes:
+        with open( os.path.join( kitsDir, file ), 'rb' ) as f:
+            return f.read()
+
+    with gzip.open( os.path.join( directory, 'AncestryDNA.txt.gz' ), 'wb' ) as f:
+        f.write( read( 'AncestryDNA.txt' ) )
+    with bz2.open( os.path.join( directory, 'MyHeritage_raw_dna_data.csv.bz2' ), 'wb' ) as f:
+        f.write( read( 'MyHeritage_raw_dna_data.csv' ) )
+    with lzma.open( os.path.join( directory, 'autosomal.xz' ), 'wb' ) as f:
+        f.write( read( 'autosomal.txt' ) )
+    with zipfile.ZipFile( os.path.join( directory, 'kits.zip' ), 'w', zipfile.ZIP_DEFLATED ) as z:
+        z.writestr( 'kits/genome_Test_v5_Full_2020.txt', read( 'genome_Test_v5_Full_2020.txt' ) )
+        z.writestr( 'kits/37_Test_Chrom_Autoso_2020.csv', read( '37_Test_Chrom_Autoso_2020.csv' ) )
+        z.writestr( '__MACOSX/kits/._autosomal.txt', b'\x00\x05\x16\x07' )
+
+
+##########################################
+
+
+##########################################
+# The superkit of the compressed kits is the superkit
+# of the kits, every archive member a kit of its own
+
+def testCompressedInputMatchesKits( tmp_path, sampleKits ):
+
+    writeCompressedKits( tmp_path / 'compressed', sampleKits )
+
+    runSuperKit( tmp_path / 'kits', sampleKits )
+    log = runSuperKit( tmp_path / 'archives', tmp_path / 'compressed' )
+
+    assert log.count( 'kits.zip/kits/' ) >= 2
+    assert '__MACOSX' not in log
+    expected = readOutput( tmp_path / 'kits' )
+    assert expected and all( expected.values() )
+    assert readOutput( tmp_path / 'archives' ) == expected
+
+
+##########################################
+
+
+##########################################
+# The superkit in a gzip file, in a zip archive and on
+# stdout is the plain superkit
+
+def testCompressedOutputMatchesPlain( tmp_path, sampleKits ):
+
+    runSuperKit( tmp_path / 'plain', sampleKits )
+    with open( tmp_path / 'plain' / 'output' / 'DNASuperKit-SuperKit.txt', 'rb' ) as f:
+        plain = f.read()
+
+    runSuperKit( tmp_path / 'gzip', sampleKits, '-oc', 'gzip', '-cl', '1' )
+    assert os.listdir( tmp_path / 'gzip' / 'output' ) == [ 'DNASuperKit-SuperKit.txt.gz' ]
+    with gzip.open( tmp_path / 'gzip' / 'output' / 'DNASuperKit-SuperKit.txt.gz' ) as f:
+        assert f.read() == plain
+
+    runSuperKit( tmp_path / 'zip', sampleKits, '-oc', 'zip' )
+    with zipfile.ZipFile( tmp_path / 'zip' / 'output' / 'DNASuperKit-SuperKit.txt.zip' ) as z:
+        assert z.namelist() == [ 'DNASuperKit-SuperKit.txt' ]
+        assert z.read( 'DNASuperKit-SuperKit.txt' ) == plain
+
+    stdout = runSuperKit( tmp_path / 'stdout', sampleKits, '-so' )
+    assert os.listdir( tmp_path / 'stdout' / 'output' ) == []
+    # Read as text, the line terminators are not kept
+    assert stdout.splitlines() == plain.decode( 'ascii' ).splitlines()
+
+
+##########################################
@@ -0,0 +1,69 @@
+##############################################################################################
+# Concordance report of the companies (--concordance/--conflicts), counted on the
+# rows dropDuplicatesDNAFile groups per position
+#
+
+import os
+
+import pandas as pd
+
+from conftest import makeMergedKits
+
+
+##########################################
+# Pairs of companies and genotypes counted one
+# position at a time
+
+def countPairs( superkit, df: pd.DataFrame ) -> tuple:
+
+    counts = {}
+    conflicts = []
+    for ( chromosome, position ), rows in df.groupby( [ 'chromosome', 'position' ], observed=True, sort=True ):
+        if chromosome == '0':
+            continue
+        calls = []
+        for company, genotype in zip( rows[ 'company' ], rows[ 'genotype' ] ):
+            genotype = superkit.genotypeTableMajorityVote.get( genotype, genotype )
+            if genotype != '--' and company not in [ c for c, g in calls ]:
+                calls.append( ( company, genotype ) )
+        for i, ( companyLeft, genotypeLeft ) in enumerate( calls ):
+            for companyRight, genotypeRight in calls[ i + 1: ]:
+                index = ( companyLeft, companyRight, genotypeLeft, genotypeRight )
+                counts[ index ] = counts.get( index, 0 ) + 1
+                if genotypeLeft != genotypeRight:
+                    conflicts.append( f'{chromosome},{position},{companyLeft},{genotypeLeft},{companyRight},{genotypeRight}' )
+
+
+    return counts, conflicts
+
+
+##########################################
+
+
+##########################################
+# The report counts every pair of companies on a
+# position once, and the duplicates are dropped as
+# the first row of every position after its nocalls
+
+def testConcordanceCounts( superkit, tmp_path ):
+
+    import superkit_concordance
+
+    conflictsFile = os.path.join( str( tmp_path ), 'conflicts.csv' )
+    df = makeMergedKits( superkit, 11 )
+    report = superkit_concordance.openConcordanceReport( os.path.join( str( tmp_path ), 'concordance.csv' ), conflictsFile, superkit.companyPriorityList )
+    merged = superkit.dropDuplicatesDNAFile( df.copy(), verbose=False, concordanceReport=report )
+    report[ 'conflicts' ].close()
+
+    counts, conflicts = countPairs( superkit, df )
+    assert report[ 'counts' ] == counts
+    with open( conflictsFile ) as f:
+        assert sorted( f.read().splitlines()[ 1: ] ) == sorted( conflicts )
+
+    # Nocalls are dropped where a position has other genotypes, then the first row is kept
+    genotypes = df.groupby( [ 'chromosome', 'position' ], observed=True ).genotype.transform( 'nunique' )
+    expected = df[ ( genotypes == 1 ) | df[ 'genotype' ].ne( '--' ) ].drop_duplicates( subset=[ 'chromosome', 'position' ], keep='first' )
+    pd.testing.assert_frame_equal( merged, expected )
+
+
+##########################################
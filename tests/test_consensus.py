@@ -0,0 +1,94 @@
+##############################################################################################
+# Majority vote of dropDuplicatesDNAFile (--majorityVote) and the consensus sidecar
+# (--consensus) written from the same groups of rows
+#
+
+import os
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import makeMergedKits
+
+
+##########################################
+# The majority vote one position at a time, on the
+# rows left after the nocalls are dropped
+
+def voteOnePositionAtATime( superkit, df: pd.DataFrame ) -> pd.DataFrame:
+
+    genotypes = df.groupby( [ 'chromosome', 'position' ], observed=True ).genotype.transform( 'nunique' )
+    df = df[ ( genotypes == 1 ) | df[ 'genotype' ].ne( '--' ) ]
+    df = df.assign( genotype=df[ 'genotype' ].replace( to_replace=superkit.genotypeTableMajorityVote ) )
+
+    kept = []
+    for key, rows in df.groupby( [ 'chromosome', 'position' ], observed=True, sort=True ):
+        mode = rows[ 'genotype' ].mode().iloc[ 0 ]
+        if ( rows[ 'genotype' ] == mode ).sum() / len( rows ) >= 0.5:
+            rows = rows[ rows[ 'genotype' ] == mode ]
+        kept.append( rows.iloc[ :1 ] )
+
+
+    return pd.concat( kept ).reset_index( drop=True )
+
+
+##########################################
+
+
+##########################################
+# Supporting and dissenting calls, method and company
+# of every kept SNP, counted one position at a time
+
+def getConsensusRecords( superkit, df: pd.DataFrame, merged: pd.DataFrame, majorityVote: bool ) -> list:
+
+    records = []
+    positions = df.groupby( [ 'chromosome', 'position' ], observed=True, sort=True )
+    for ( chromosome, position, genotype, company ), ( key, rows ) in zip( merged[ [ 'chromosome', 'position', 'genotype', 'company' ] ].itertuples( index=False ), positions ):
+        assert key == ( chromosome, position )
+        calls = [ superkit.genotypeTableMajorityVote.get( g, g ) for g in rows[ 'genotype' ] if g != '--' ]
+        genotype = superkit.genotypeTableMajorityVote.get( genotype, genotype )
+        supporting = calls.count( genotype )
+        dissenting = len( calls ) - supporting
+        method = 0 if len( calls ) <= 1 else 1 if dissenting == 0 else 3 if majorityVote and 2 * supporting >= len( calls ) else 2
+        records.append( ( superkit.chromosomePriorityList.index( chromosome ), position, supporting, dissenting, method, superkit.companyPriorityList.index( company ) ) )
+
+
+    return records
+
+
+##########################################
+
+
+##########################################
+# The majority vote keeps the first row of the most
+# common genotype with at least half of the rows, and
+# the sidecar has a record of every kept SNP
+
+@pytest.mark.parametrize( 'majorityVote', [ True, False ] )
+def testMajorityVoteAndConsensus( superkit, tmp_path, monkeypatch, majorityVote ):
+
+    import superkit_consensus
+
+    monkeypatch.setattr( superkit, 'majorityVote', majorityVote )
+    outputFile = os.path.join( str( tmp_path ), 'consensus.bin' )
+    metadataFile = os.path.join( str( tmp_path ), 'consensus.json' )
+
+    df = makeMergedKits( superkit, 12 )
+    sidecar = superkit_consensus.openConsensusSidecar( outputFile, metadataFile, superkit.companyPriorityList, majorityVote )
+    merged = superkit.dropDuplicatesDNAFile( df.copy(), verbose=False, consensusSidecar=sidecar )
+    superkit_consensus.closeConsensusSidecar( sidecar )
+
+    if majorityVote:
+        pd.testing.assert_frame_equal( merged, voteOnePositionAtATime( superkit, df ), check_categorical=False )
+
+    with open( metadataFile ) as f:
+        metadata = json.load( f )
+    records = np.fromfile( outputFile, dtype=np.dtype( [ tuple( field ) for field in metadata[ 'dtype' ] ] ) )
+    assert metadata[ 'rows' ] == len( merged )
+    assert records.tolist() == getConsensusRecords( superkit, df, merged, majorityVote )
+    assert ( 3 in records[ 'method' ] ) == majorityVote
+
+
+##########################################
@@ -0,0 +1,67 @@
+##############################################################################################
+# Gender of the kits from the sex chromosome statistics gathered while parsing,
+# and the genotypes on X, Y and MT of males
+#
+
+import os
+
+import pytest
+
+from conftest import writeSampleKits
+
+
+# Company of every sample kit
+sampleKitCompanies = {
+    'genome_Test_v5_Full_2020.txt': '23andMe v5',
+    'AncestryDNA.txt': 'AncestryDNA v2',
+    '37_Test_Chrom_Autoso_2020.csv': 'FamilyTreeDNA v3',
+    'MyHeritage_raw_dna_data.csv': 'MyHeritage v2',
+    'autosomal.txt': 'LivingDNA v1.0.2'
+}
+
+
+##########################################
+# Every kit of a man is male and of a woman female.
+# Calls on X, Y and MT of men are single alleles, or
+# nocalls where they are heterozygous
+
+@pytest.mark.parametrize( 'male', [ True, False ] )
+def testGenderOfKits( superkit, tmp_path, samplePanel, male ):
+
+    writeSampleKits( tmp_path, samplePanel, seed=7, male=male )
+
+    for file, company in sampleKitCompanies.items():
+        df, sexStatistics = superkit.ingestDNAFile( os.path.join( str( tmp_path ), file ), company )
+        assert sexStatistics[ 'callsX' ] == ( df[ 'chromosome' ].eq( 'X' ) & ~df[ 'genotype' ].isin( [ '--', '00' ] ) ).sum() > 0
+        assert sexStatistics[ 'rowsY' ] == df[ 'chromosome' ].eq( 'Y' ).sum()
+
+        df, gender, chromosomeZero = superkit.prepareDNAFile( os.path.join( str( tmp_path ), file ), company )
+        assert gender == ( 'Male' if male else 'Female' ), file
+
+        sexChromosomes = df[ 'chromosome' ].isin( [ 'X', 'Y', 'MT' ] )
+        lengths = set( df.loc[ sexChromosomes & ( df[ 'genotype' ] != '--' ), 'genotype' ].str.len() )
+        assert lengths == ( { 1 } if male else { 2 } ), file
+        assert set( df.loc[ ~sexChromosomes & ( df[ 'genotype' ] != '--' ), 'genotype' ].str.len() ) == { 2 }
+
+        # Heterozygous calls of men, read errors, are nocalls
+        if male:
+            assert df.loc[ sexChromosomes, 'genotype' ].eq( '--' ).sum() > 0
+
+
+##########################################
+
+
+##########################################
+# Undecided from the heterozygous calls on X, the
+# call rate on Y decides
+
+def testGenderFromStatistics( superkit ):
+
+    assert superkit.guessGenderFromStatistics( { 'callsX': 1000, 'heterozygousX': 10, 'rowsY': 0, 'callsY': 0 } ) == 'Male'
+    assert superkit.guessGenderFromStatistics( { 'callsX': 1000, 'heterozygousX': 300, 'rowsY': 100, 'callsY': 100 } ) == 'Female'
+    assert superkit.guessGenderFromStatistics( { 'callsX': 1000, 'heterozygousX': 100, 'rowsY': 100, 'callsY': 90 } ) == 'Male'
+    assert superkit.guessGenderFromStatistics( { 'callsX': 1000, 'heterozygousX': 100, 'rowsY': 100, 'callsY': 2 } ) == 'Female'
+    assert superkit.guessGenderFromStatistics( { 'callsX': 0, 'heterozygousX': 0, 'rowsY': 0, 'callsY': 0 } ) == 'Unknown'
+
+
+##########################################
@@ -0,0 +1,91 @@
+##############################################################################################
+# Harmonization of the kits to the forward strand (--harmonize)
+#
+
+import numpy as np
+import pandas as pd
+
+from conftest import runSuperKit, readOutput, writeSampleReferenceAlleles, writeFlippedKits
+
+
+##########################################
+# Calls on the reverse strand are flipped back, so a kit
+# with flipped calls gives the same superkit
+
+def testHarmonizeFlippedKits( tmp_path, sampleKits, samplePanel ):
+
+    dataDir = tmp_path / 'data'
+    writeSampleReferenceAlleles( dataDir, samplePanel )
+    flippedKits = tmp_path / 'flippedKits'
+    writeFlippedKits( flippedKits, sampleKits, samplePanel )
+
+    runSuperKit( tmp_path / 'forward', sampleKits, '-hz', dataDir=dataDir )
+    log = runSuperKit( tmp_path / 'flipped', flippedKits, '-hz', dataDir=dataDir )
+    runSuperKit( tmp_path / 'notHarmonized', flippedKits )
+
+    forward = readOutput( tmp_path / 'forward' )
+    assert forward and all( forward.values() )
+    assert readOutput( tmp_path / 'flipped' ) == forward
+    assert readOutput( tmp_path / 'notHarmonized' ) != forward
+    assert 'flipped from the reverse strand' in log
+
+
+##########################################
+
+
+##########################################
+# Out-of-core builds harmonize the same
+
+def testHarmonizeMemoryLimit( tmp_path, sampleKits, samplePanel ):
+
+    dataDir = tmp_path / 'data'
+    writeSampleReferenceAlleles( dataDir, samplePanel )
+    flippedKits = tmp_path / 'flippedKits'
+    writeFlippedKits( flippedKits, sampleKits, samplePanel )
+
+    runSuperKit( tmp_path / 'memory', flippedKits, '-hz', dataDir=dataDir )
+    runSuperKit( tmp_path / 'outOfCore', flippedKits, '-hz', '-ml', '1M', dataDir=dataDir )
+
+    assert readOutput( tmp_path / 'outOfCore' ) == readOutput( tmp_path / 'memory' )
+
+
+##########################################
+
+
+##########################################
+# Every row is forward, flipped, palindromic or not
+# matching, or has no reference alleles. Only forward
+# and flipped rows are kept with --harmonizeDrop
+
+def testHarmonizeClasses( superkit, monkeypatch ):
+
+    import superkit_tables
+    import superkit_harmonize
+
+    # Position, reference, alternative, genotype and the harmonized genotype
+    rows = [
+        ( 100, 'A', 'G', 'GA', 'AG' ),   # forward
+        ( 200, 'A', 'G', 'TC', 'AG' ),   # flipped
+        ( 300, 'A', 'T', 'TA', 'AT' ),   # palindromic
+        ( 400, 'A', 'G', 'CA', 'AC' ),   # mismatched
+        ( 500, None, None, 'GG', 'GG' )  # no reference alleles
+    ]
+    reference = np.zeros( 4, dtype=superkit_harmonize.referenceAllelesDtype )
+    reference[ 'key' ] = [ superkit.chromosomePriorityList.index( '1' ) * 2**40 + position for position, *_ in rows[ :4 ] ]
+    reference[ 'alleles' ] = [ superkit_tables.alleleBits[ ord( a ) ] | superkit_tables.alleleBits[ ord( b ) ] for _, a, b, _, _ in rows[ :4 ] ]
+    reference[ 'reference' ] = [ a for _, a, _, _, _ in rows[ :4 ] ]
+    reference[ 'alternative' ] = [ b for _, _, b, _, _ in rows[ :4 ] ]
+    monkeypatch.setitem( superkit_harmonize.referenceAlleles, 'alleles', reference )
+    def getKit() -> pd.DataFrame:
+        return pd.DataFrame( { 'rsid': [ f'rs{position}' for position, *_ in rows ], 'chromosome': '1', 'position': [ position for position, *_ in rows ], 'genotype': [ genotype for *_, genotype, _ in rows ] } )
+
+    statistics = {}
+    df = superkit_harmonize.harmonizeDNAFile( getKit(), statistics )
+    assert list( df[ 'genotype' ] ) == [ superkit.genotypeTableMajorityVote.get( harmonized, harmonized ) for *_, harmonized in rows ]
+    assert statistics == { 'compared': 4, 'forward': 1, 'flipped': 1, 'palindromic': 1, 'mismatched': 1 }
+
+    df = superkit_harmonize.harmonizeDNAFile( getKit(), {}, drop=True )
+    assert list( df[ 'position' ] ) == [ 100, 200, 500 ]
+
+
+##########################################
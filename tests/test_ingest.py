@@ -0,0 +1,25 @@
+##############################################################################################
+# Loading the kits in worker processes (--jobs) and through the pipeline (--pipeline)
+# writes the same superkit as loading them one at a time
+#
+
+import pytest
+
+from conftest import runSuperKit, readOutput
+
+
+##########################################
+
+@pytest.mark.parametrize( 'ingest', [ [ '-j', '2' ], [ '-pl' ] ] )
+@pytest.mark.parametrize( 'arguments', [ [], [ '-o', 'AncestryDNA v2' ] ] )
+def testIngestMatchesInMemory( tmp_path, sampleKits, ingest, arguments ):
+
+    runSuperKit( tmp_path / 'memory', sampleKits, *arguments )
+    runSuperKit( tmp_path / 'ingest', sampleKits, *arguments, *ingest )
+
+    inMemory = readOutput( tmp_path / 'memory' )
+    assert inMemory and all( inMemory.values() )
+    assert readOutput( tmp_path / 'ingest' ) == inMemory
+
+
+##########################################
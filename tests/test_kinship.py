@@ -0,0 +1,73 @@
+##############################################################################################
+# Kinship of the kits in ./input/ (--kinship)
+#
+
+import numpy as np
+
+
+##########################################
+# Random allele bits of kits on the given alleles,
+# two alleles per genotype, with nocalls
+
+def makeKinshipKits( rng, alleles: np.ndarray, kits: int ) -> np.ndarray:
+
+    first = alleles[ np.arange( len( alleles ) ), rng.integers( 0, alleles.shape[ 1 ], ( kits, len( alleles ) ) ) ]
+    second = alleles[ np.arange( len( alleles ) ), rng.integers( 0, alleles.shape[ 1 ], ( kits, len( alleles ) ) ) ]
+    bits = ( first | second ).astype( np.uint8 )
+    bits[ rng.random( bits.shape ) < 0.05 ] = 0
+
+
+    return bits
+
+
+##########################################
+
+
+##########################################
+# KING robust counted directly over the SNPs the two
+# kits have called with at most two alleles between them
+
+def getPairKinship( a: np.ndarray, b: np.ndarray ) -> tuple:
+
+    union = a | b
+    shared = ( a > 0 ) & ( b > 0 ) & ( np.array( [ bin( bits ).count( '1' ) for bits in union ] ) <= 2 )
+    a, b = a[ shared ], b[ shared ]
+    heterozygousA = ( a & ( a - 1 ) ) > 0
+    heterozygousB = ( b & ( b - 1 ) ) > 0
+    opposite = ~heterozygousA & ~heterozygousB & ( a != b )
+
+
+    return ( np.sum( heterozygousA & heterozygousB & ( a == b ) ) - 2 * np.sum( opposite ) ) / ( np.sum( heterozygousA ) + np.sum( heterozygousB ) ), np.sum( opposite ) / len( a ), len( a )
+
+
+##########################################
+
+
+##########################################
+# The kinship of a pair is counted over its own SNPs,
+# kits added with third alleles do not change it
+
+def testKinshipOfPairIgnoresOtherKits( superkit ):
+
+    import superkit_kinship
+
+    rng = np.random.default_rng( 3 )
+    positions = 5000
+    alleles = np.array( [ rng.choice( [ 1, 2, 4, 8 ], 2, replace=False ) for _ in range( positions ) ], dtype=np.uint8 )
+    pair = makeKinshipKits( rng, alleles, 2 )
+    pair[ 1, :positions // 2 ] = pair[ 0, :positions // 2 ]
+    # Other kits have any of the four alleles, and the pair a third allele at a few SNPs
+    others = makeKinshipKits( rng, np.tile( np.array( [ 1, 2, 4, 8 ], dtype=np.uint8 ), ( positions, 1 ) ), 3 )
+    thirdAlleles = np.array( [ min( { 1, 2, 4, 8 } - set( pairAlleles ) ) for pairAlleles in alleles[ :50 ] ], dtype=np.uint8 )
+    pair[ 1, :50 ] = thirdAlleles | alleles[ :50, 0 ]
+
+    kinship, ibs0, shared = superkit_kinship.computeKinship( pair )
+    expected = getPairKinship( pair[ 0 ], pair[ 1 ] )
+    assert np.allclose( ( kinship[ 0, 1 ], ibs0[ 0, 1 ], shared[ 0, 1 ] ), expected )
+    assert kinship[ 0, 1 ] == kinship[ 1, 0 ] and shared[ 0, 1 ] == shared[ 1, 0 ]
+
+    withOthers = superkit_kinship.computeKinship( np.vstack( [ others[ :1 ], pair, others[ 1: ] ] ) )
+    assert [ matrix[ 1, 2 ] for matrix in withOthers ] == [ kinship[ 0, 1 ], ibs0[ 0, 1 ], shared[ 0, 1 ] ]
+
+
+##########################################
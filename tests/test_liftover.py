@@ -0,0 +1,141 @@
+##############################################################################################
+# Liftover of GRCh38 kits to GRCh37 (--liftover)
+#
+
+import os
+import gzip
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from conftest import runSuperKit, readOutput, writeSampleChain, writeGRCh38Kits, getSampleShift, getSampleGRCh38, sampleReverseStart
+
+
+##########################################
+# The templates in ./data/ are the anchors of the
+# build detection, next to the chain file
+
+def writeLiftoverData( directory, templatesDir: str ) -> str:
+
+    os.makedirs( directory )
+    for file in os.listdir( templatesDir ):
+        shutil.copy( os.path.join( templatesDir, file ), directory / file )
+    writeSampleChain( directory )
+
+
+    return str( directory )
+
+
+##########################################
+
+
+##########################################
+# A kit on GRCh38 is lifted over to the positions of
+# the same kit on GRCh37, the SNPs on the reverse
+# strand complemented
+
+def testLiftoverMatchesGRCh37( tmp_path, sampleKits, sampleTemplates ):
+
+    dataDir = writeLiftoverData( tmp_path / 'data', sampleTemplates )
+    kitsGRCh38 = tmp_path / 'kitsGRCh38'
+    writeGRCh38Kits( kitsGRCh38, sampleKits )
+
+    runSuperKit( tmp_path / 'GRCh37', sampleKits, dataDir=dataDir )
+    log = runSuperKit( tmp_path / 'GRCh38', kitsGRCh38, '-lo', dataDir=dataDir )
+
+    GRCh37 = readOutput( tmp_path / 'GRCh37' )
+    assert GRCh37 and all( GRCh37.values() )
+    assert readOutput( tmp_path / 'GRCh38' ) == GRCh37
+    assert 'genome_Test_v5_Full_2020.txt: GRCh38' in log
+    assert 'AncestryDNA.txt: GRCh37' in log
+
+
+##########################################
+
+
+##########################################
+# Out-of-core builds lift over the same
+
+def testLiftoverMemoryLimit( tmp_path, sampleKits, sampleTemplates ):
+
+    dataDir = writeLiftoverData( tmp_path / 'data', sampleTemplates )
+    kitsGRCh38 = tmp_path / 'kitsGRCh38'
+    writeGRCh38Kits( kitsGRCh38, sampleKits )
+
+    runSuperKit( tmp_path / 'memory', kitsGRCh38, '-lo', dataDir=dataDir )
+    runSuperKit( tmp_path / 'outOfCore', kitsGRCh38, '-lo', '-ml', '1M', dataDir=dataDir )
+
+    assert readOutput( tmp_path / 'outOfCore' ) == readOutput( tmp_path / 'memory' )
+
+
+##########################################
+
+
+##########################################
+# Positions in forward blocks are shifted, positions in
+# reverse blocks count back from the end of the block
+
+def testLiftPositions( superkit, tmp_path, monkeypatch ):
+
+    import superkit_liftover
+
+    writeSampleChain( tmp_path )
+    monkeypatch.setattr( superkit_liftover, 'liftoverChainFile', str( tmp_path / 'hg38ToHg19.over.chain.gz' ) )
+    blocks = superkit_liftover.buildLiftoverBlocks()
+
+    # GRCh37 chromosome and position, and whether it is lifted from the reverse strand
+    expected = [ ( '1', 1, False ), ( '1', 123456, False ), ( 'X', 5000, False ), ( 'XY', 2000000, False ),
+                 ( '22', sampleReverseStart, False ), ( '22', sampleReverseStart + 1, True ), ( '22', sampleReverseStart + 654321, True ) ]
+    chromosome = np.array( [ superkit.chromosomePriorityList.index( c ) for c, _, _ in expected ], dtype=np.int64 )
+    position = np.array( [ getSampleGRCh38( 'X' if c == 'XY' else c, p, 'A' )[ 0 ] for c, p, _ in expected ], dtype=np.int64 )
+    liftedChromosome, lifted, mapped, reverse = superkit_liftover.liftPositions( blocks, chromosome, position )
+    assert mapped.all()
+    assert [ superkit.chromosomePriorityList[ c ] for c in liftedChromosome ] == [ c for c, _, _ in expected ]
+    assert list( lifted ) == [ p for _, p, _ in expected ]
+    assert list( reverse ) == [ r for _, _, r in expected ]
+
+    # Before the first block, and an alternative haplotype that is left out
+    chromosome = np.array( [ superkit.chromosomePriorityList.index( '1' ), 0 ], dtype=np.int64 )
+    position = np.array( [ getSampleShift( '1' ), 500 ], dtype=np.int64 )
+    assert not superkit_liftover.liftPositions( blocks, chromosome, position )[ 2 ].any()
+
+
+##########################################
+
+
+##########################################
+# A row lifted onto the GRCh37 position of another
+# GRCh38 position of the kit is dropped, also when the
+# position was taken in an earlier chunk. Rows are
+# held back until the build is detected
+
+def testLiftoverCollisions( superkit, tmp_path, monkeypatch ):
+
+    import superkit_liftover
+
+    # chr1 and chr2 from 1000 to 2000 are both on chr1 from 1000 to 2000
+    chainFile = tmp_path / 'hg38ToHg19.over.chain.gz'
+    with gzip.open( chainFile, 'wt' ) as f:
+        f.write( 'chain 10 chr1 248956422 + 1000 2000 chr1 249250621 + 1000 2000 1\n1000\n\n'
+                 'chain 10 chr2 242193529 + 1000 2000 chr1 249250621 + 1000 2000 2\n1000\n' )
+    monkeypatch.setattr( superkit_liftover, 'liftoverChainFile', str( chainFile ) )
+    monkeypatch.setitem( superkit_liftover.liftoverBlocks, 'blocks', superkit_liftover.buildLiftoverBlocks() )
+    monkeypatch.setattr( superkit_liftover, 'buildDetectionRows', 3 )
+    monkeypatch.setattr( superkit_liftover, 'detectGenomeBuild', lambda df, blocks, templates: ( 'GRCh38', len( df ), len( df ) ) )
+
+    def getChunk( rows: list ) -> pd.DataFrame:
+        return pd.DataFrame( rows, columns=[ 'rsid', 'chromosome', 'position', 'genotype' ] )
+
+    statistics = {}
+    assert superkit_liftover.liftoverDNAFile( getChunk( [ ( 'rs1', '1', 1500, 'AG' ) ] ), statistics, None ).empty
+    df = superkit_liftover.liftoverDNAFile( getChunk( [ ( 'rs2', '2', 1500, 'CT' ), ( 'rs3', '1', 1500, 'AG' ), ( 'rs4', '2', 1600, 'CC' ) ] ), statistics, None )
+    assert statistics[ 'anchors' ] == 3
+    assert df.values.tolist() == [ [ 'rs1', '1', 1500, 'AG' ], [ 'rs3', '1', 1500, 'AG' ], [ 'rs4', '1', 1600, 'CC' ] ]
+
+    df = superkit_liftover.liftoverDNAFile( getChunk( [ ( 'rs5', '1', 1600, 'GG' ), ( 'rs6', '3', 1500, 'TT' ), ( 'rs7', '1', 1700, 'AA' ) ] ), statistics, None )
+    assert df.values.tolist() == [ [ 'rs7', '1', 1700, 'AA' ] ]
+    assert [ statistics[ name ] for name in [ 'lifted', 'unmapped', 'collisions' ] ] == [ 4, 1, 2 ]
+
+
+##########################################
@@ -0,0 +1,155 @@
+##############################################################################################
+# The match database (--matchAdd/--matchFind)
+#
+
+import os
+
+import numpy as np
+
+from conftest import runSuperKit
+
+
+##########################################
+# The kits of the matches shown by --matchFind
+
+def getMatches( log: str ) -> list:
+
+    lines = log.split( '######################################################################' )[ -1 ].strip().splitlines()
+    table = lines[ 1:lines.index( '' ) ] if lines and lines[ 0 ].strip().startswith( 'kit ' ) else []
+
+
+    return [ line.split()[ 0 ] for line in table ]
+
+
+##########################################
+
+
+##########################################
+# A kit of the database is not its own top match,
+# the other kits of the person are still found. A
+# changed kit is no longer the kit in the database
+
+def testMatchFindLeavesOutItself( tmp_path, sampleKits ):
+
+    emptyDir = tmp_path / 'empty'
+    os.makedirs( emptyDir )
+    workDir = tmp_path / 'matchdb'
+    runSuperKit( workDir, sampleKits, '-ma' )
+
+    log = runSuperKit( workDir, emptyDir, '-mf', 'AncestryDNA.txt' )
+    matches = getMatches( log )
+    assert 'AncestryDNA.txt' not in matches
+    assert 'genome_Test_v5_Full_2020.txt' in matches
+    assert '# Kits searched:          4, the kit itself left out' in log
+
+    with open( workDir / 'input' / 'AncestryDNA.txt', 'a' ) as f:
+        f.write( 'rs1\t1\t1\tA\tA\r\n' )
+    log = runSuperKit( workDir, emptyDir, '-mf', 'AncestryDNA.txt' )
+    assert getMatches( log )[ 0 ] == 'AncestryDNA.txt'
+
+
+##########################################
+
+
+##########################################
+# A segment shorter than 127 SNPs may not hold a whole
+# word of the bitsets without opposite homozygotes,
+# the kit is still compared and the segment found
+
+def testMatchFindShortSegment( superkit, tmp_path, monkeypatch ):
+
+    import superkit_matching
+
+    rng = np.random.default_rng( 5 )
+    panel = 1 * 2**40 + np.arange( 1, 1001, dtype=np.int64 ) * 20000
+    searched = rng.choice( np.array( [ 1, 2, 4, 8 ], dtype=np.uint8 ), len( panel ) )
+    # Opposite homozygotes everywhere but in a segment of 100 SNPs across two words
+    kit = np.where( searched == 8, 1, searched << 1 ).astype( np.uint8 )
+    kit[ 70:170 ] = searched[ 70:170 ]
+
+    databaseDir = os.path.join( str( tmp_path ), 'matchdb', '' )
+    os.makedirs( databaseDir )
+    np.save( databaseDir + 'panel.npy', panel )
+    np.save( databaseDir + 'genotypes.npy', kit[ np.newaxis ] )
+    np.save( databaseDir + 'homozygous.npy', superkit_matching.packHomozygous( kit[ np.newaxis ] ) )
+    monkeypatch.setattr( superkit_matching, 'geneticMapFile', databaseDir + 'genetic-map.txt' )
+
+    matches = superkit_matching.searchMatchChunk( ( 0, 1, searched, databaseDir, 100, 1.0 ) )
+    assert len( matches ) == 1
+    row, segments, sharedSnps = matches[ 0 ]
+    half = segments[ segments[ 'type' ] == 'half' ]
+    assert ( row, sharedSnps ) == ( 0, len( panel ) )
+    assert list( half[ [ 'start', 'end', 'snps' ] ].itertuples( index=False, name=None ) ) == [ ( panel[ 70 ] & ( 2**40 - 1 ), panel[ 169 ] & ( 2**40 - 1 ), 100 ) ]
+
+
+##########################################
+
+
+##########################################
+# Runs of the shared SNPs of two kits found one SNP
+# at a time, of at least minimumSnps SNPs and
+# minimumCentimorgans, as type, chromosome, start,
+# end and SNPs
+
+def findRunsOneAtATime( keys: np.ndarray, match: np.ndarray, centimorgans: np.ndarray, kind: str, minimumSnps: int, minimumCentimorgans: float ) -> list:
+
+    runs = []
+    first = None
+    for row in range( len( keys ) + 1 ):
+        if first is not None and ( row == len( keys ) or not match[ row ] or keys[ row ] >> 40 != keys[ first ] >> 40 ):
+            last = row - 1
+            if last - first + 1 >= minimumSnps and centimorgans[ last ] - centimorgans[ first ] >= minimumCentimorgans:
+                runs.append( ( kind, keys[ first ] >> 40, keys[ first ] & ( 2**40 - 1 ), keys[ last ] & ( 2**40 - 1 ), last - first + 1 ) )
+            first = None
+        if row < len( keys ) and match[ row ] and first is None:
+            first = row
+
+
+    return runs
+
+
+##########################################
+
+
+##########################################
+# Two kits that share half and fully identical
+# segments, over partly the same SNPs, with a genetic
+# map for one of the chromosomes
+
+def testMatchGenotypesSegments( superkit, tmp_path, monkeypatch ):
+
+    import superkit_matching
+
+    mapFile = str( tmp_path / 'genetic-map.txt' )
+    with open( mapFile, 'w' ) as f:
+        f.write( 'chromosome\tposition\tcM\nchr1\t0\t0.0\nchr1\t10000000\t20.0\n' )
+    monkeypatch.setattr( superkit_matching, 'geneticMapFile', mapFile )
+    monkeypatch.setattr( superkit_matching, 'geneticMap', {} )
+
+    rng = np.random.default_rng( 8 )
+    alleles = np.array( [ 1, 2, 4, 8 ], dtype=np.uint8 )
+    snps = 4000
+    keys = np.concatenate( [ superkit.chromosomePriorityList.index( chromosome ) * 2**40 + np.arange( 1, 2001, dtype=np.int64 ) * 5000 for chromosome in [ '1', '2' ] ] )
+    bitsA = rng.choice( alleles, snps ) | rng.choice( alleles, snps )
+    bitsB = rng.choice( alleles, snps ) | rng.choice( alleles, snps )
+    # Half identical segments share an allele, fully identical segments both
+    for first, last in [ ( 100, 700 ), ( 1900, 2300 ), ( 3000, 3040 ) ]:
+        bitsB[ first:last ] = bitsA[ first:last ] & -bitsA[ first:last ] | rng.choice( alleles, last - first )
+    bitsB[ 300:500 ] = bitsA[ 300:500 ]
+    rowsA = np.sort( rng.choice( snps, 3600, replace=False ) )
+    rowsB = np.sort( rng.choice( snps, 3600, replace=False ) )
+
+    segments, sharedSnps = superkit_matching.matchGenotypes( keys[ rowsA ], bitsA[ rowsA ], keys[ rowsB ], bitsB[ rowsB ], 50, 1.0 )
+
+    shared = np.intersect1d( rowsA, rowsB )
+    assert sharedSnps == len( shared )
+    centimorgans = np.where( keys[ shared ] >> 40 == 1, ( keys[ shared ] & ( 2**40 - 1 ) ) * 20 / 1e7, ( keys[ shared ] & ( 2**40 - 1 ) ) / 1e6 )
+    assert np.allclose( superkit_matching.getCentimorgans( keys[ shared ] ), centimorgans )
+    expected = findRunsOneAtATime( keys[ shared ], ( bitsA[ shared ] & bitsB[ shared ] ) > 0, centimorgans, 'half', 50, 1.0 ) + \
+               findRunsOneAtATime( keys[ shared ], bitsA[ shared ] == bitsB[ shared ], centimorgans, 'full', 50, 1.0 )
+    assert list( segments[ [ 'type', 'chromosome', 'start', 'end', 'snps' ] ].itertuples( index=False, name=None ) ) == expected
+    # The segment across two chromosomes is two segments, the segment of 40 SNPs is too short
+    assert [ ( kind, chromosome ) for kind, chromosome, *_ in expected ] == [ ( 'half', 1 ), ( 'half', 1 ), ( 'half', 2 ), ( 'full', 1 ) ]
+
+
+##########################################
@@ -0,0 +1,44 @@
+##############################################################################################
+# Out-of-core builds (--memoryLimit) write the same superkit as in memory
+#
+
+import pytest
+
+from conftest import runSuperKit, readOutput
+
+
+##########################################
+# The sample kits are larger than a chunk at the lowest
+# memory limit, so they are spilled in several runs
+
+@pytest.mark.parametrize( 'arguments', [
+    [],
+    [ '-o', '23andMe v5' ],
+    [ '-o', 'FamilyTreeDNA v3' ],
+] )
+def testMemoryLimitMatchesInMemory( tmp_path, sampleKits, arguments ):
+
+    runSuperKit( tmp_path / 'memory', sampleKits, *arguments )
+    log = runSuperKit( tmp_path / 'outOfCore', sampleKits, *arguments, '-ml', '1M' )
+
+    inMemory = readOutput( tmp_path / 'memory' )
+    assert inMemory and all( inMemory.values() )
+    assert readOutput( tmp_path / 'outOfCore' ) == inMemory
+    assert 'DNA SuperKit successfully created!' in log
+
+
+##########################################
+
+
+##########################################
+# Templates are only needed to convert to a format
+
+def testMemoryLimitMatchesInMemoryConverted( tmp_path, sampleKits, sampleTemplates ):
+
+    runSuperKit( tmp_path / 'memory', sampleKits, '-o', 'AncestryDNA v2', '-cf', dataDir=sampleTemplates )
+    runSuperKit( tmp_path / 'outOfCore', sampleKits, '-o', 'AncestryDNA v2', '-cf', '-ml', '1M', dataDir=sampleTemplates )
+
+    assert readOutput( tmp_path / 'outOfCore' ) == readOutput( tmp_path / 'memory' )
+
+
+##########################################
@@ -0,0 +1,111 @@
+##############################################################################################
+# PLINK binary fileset output, and individuals added to it (--plinkAppend)
+#
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from conftest import runSuperKit
+
+
+##########################################
+# Unpacking the packed 2-bit codes gives the codes,
+# for any number of individuals
+
+def testPackUnpack( superkit ):
+
+    import superkit_plink
+
+    rng = np.random.default_rng( 4 )
+    for individuals in range( 1, 10 ):
+        codes = rng.integers( 0, 4, ( 50, individuals ), dtype=np.uint8 )
+        packed = superkit_plink.packPLINKGenotypes( codes )
+        assert packed.shape == ( 50, -( -individuals // 4 ) )
+        assert ( superkit_plink.unpackPLINKGenotypes( packed, individuals ) == codes ).all()
+
+
+##########################################
+
+
+##########################################
+# Genotypes of every individual of a fileset by rsid,
+# sorted alleles or -- for a nocall, and the two
+# alleles of every SNP
+
+def getPLINKGenotypes( superkit, prefix: str ) -> tuple:
+
+    import superkit_plink
+
+    bim, fam, codes = superkit_plink.readPLINKFileset( prefix )
+    genotypes = {}
+    alleles = np.stack( [
+        bim[ 'allele1' ] + bim[ 'allele1' ],
+        ( bim[ 'allele1' ] + bim[ 'allele2' ] ).map( lambda genotype: ''.join( sorted( genotype ) ) ),
+        bim[ 'allele2' ] + bim[ 'allele2' ]
+    ], axis=1 )
+    for column, individual in enumerate( fam[ 'individual' ] ):
+        calls = np.full( len( bim ), '--', dtype=object )
+        for code, allele in [ ( superkit_plink.plinkHomozygousA1, 0 ), ( superkit_plink.plinkHeterozygous, 1 ), ( superkit_plink.plinkHomozygousA2, 2 ) ]:
+            rows = codes[ :, column ] == code
+            calls[ rows ] = alleles[ rows, allele ]
+        genotypes[ individual ] = dict( zip( bim[ 'rsid' ], calls ) )
+
+
+    return genotypes, dict( zip( bim[ 'rsid' ], bim[ 'allele1' ] + bim[ 'allele2' ] ) )
+
+
+##########################################
+
+
+##########################################
+# Genotypes of the superkit text output by rsid
+
+def getSuperKitGenotypes( workDir ) -> dict:
+
+    df = pd.read_csv( os.path.join( str( workDir ), 'output', 'DNASuperKit-SuperKit.txt' ), sep='\t', dtype=str )
+
+
+    return { rsid: ''.join( sorted( genotype ) ) if genotype != '--' else '--' for rsid, genotype in zip( df[ 'rsid' ], df[ 'genotype' ] ) }
+
+
+##########################################
+
+
+##########################################
+# Two kits written to one fileset with --plinkAppend.
+# Every individual has the genotypes of its superkit,
+# and nocalls on the SNPs of the other individual
+
+def testPLINKAppendMatchesSuperKit( superkit, tmp_path, sampleKits ):
+
+    kits = {}
+    for individual, file in [ ( 'first', 'AncestryDNA.txt' ), ( 'second', 'genome_Test_v5_Full_2020.txt' ) ]:
+        kits[ individual ] = tmp_path / individual
+        os.makedirs( kits[ individual ] )
+        shutil.copy( os.path.join( sampleKits, file ), kits[ individual ] )
+    expected = {}
+    for individual in kits:
+        runSuperKit( tmp_path / ( individual + 'SuperKit' ), kits[ individual ] )
+        expected[ individual ] = getSuperKitGenotypes( tmp_path / ( individual + 'SuperKit' ) )
+
+    workDir = tmp_path / 'plink'
+    runSuperKit( workDir, kits[ 'first' ], '-o', 'PLINK', '-si', 'first' )
+    shutil.rmtree( workDir / 'input' )
+    runSuperKit( workDir, kits[ 'second' ], '-o', 'PLINK', '-pa', '-si', 'second' )
+
+    genotypes, alleles = getPLINKGenotypes( superkit, str( workDir / 'output' / 'DNASuperKit-PLINK' ) )
+    assert list( genotypes ) == [ 'first', 'second' ]
+
+    # A call with a third allele of a SNP, a read error, is a nocall
+    for individual in expected:
+        expected[ individual ] = { rsid: genotype if set( genotype ) <= set( alleles[ rsid ] ) else '--' for rsid, genotype in expected[ individual ].items() }
+    assert set( genotypes[ 'first' ] ) == set( expected[ 'first' ] ) | set( expected[ 'second' ] )
+    for individual, other in [ ( 'first', 'second' ), ( 'second', 'first' ) ]:
+        assert { rsid: genotypes[ individual ][ rsid ] for rsid in expected[ individual ] } == expected[ individual ]
+        assert set( genotypes[ individual ][ rsid ] for rsid in set( expected[ other ] ) - set( expected[ individual ] ) ) == { '--' }
+
+
+##########################################
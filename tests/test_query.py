@@ -0,0 +1,72 @@
+##############################################################################################
+# Queries of the DNA files and the stored superkit (--query)
+#
+
+import os
+import re
+
+from conftest import runSuperKit
+
+
+##########################################
+# Positions on chromosome 1 from start to end that a
+# kit file has a call on, by position
+
+def getKitCalls( file: str, start: int, end: int ) -> dict:
+
+    calls = {}
+    with open( file ) as f:
+        for line in f:
+            fields = [ field.strip( '"' ) for field in re.split( r'[\t,]', line.strip() ) ]
+            if len( fields ) < 4 or not fields[ 2 ].isdigit() or fields[ 1 ] != '1':
+                continue
+            genotype = ''.join( fields[ 3: ] )
+            if start <= int( fields[ 2 ] ) <= end and genotype not in ( '--', '00' ):
+                calls[ int( fields[ 2 ] ) ] = genotype
+
+
+    return calls
+
+
+##########################################
+
+
+##########################################
+# A query shows the rsid and the SNPs of the region in
+# every kit that has them, and the indexes are only
+# made again when a DNA file changes
+
+def testQueryRsidAndRegion( tmp_path, sampleKits, samplePanel ):
+
+    emptyDir = tmp_path / 'empty'
+    os.makedirs( emptyDir )
+    workDir = tmp_path / 'query'
+    rsid, chromosome, position = samplePanel[ 2 ][ :3 ]
+    assert chromosome == '1' and position < 300000
+
+    log = runSuperKit( workDir, sampleKits, '-q', f'{rsid} chr1:300000-900000' )
+    assert log.count( 'Indexing ' ) == 5
+    assert '# Kits:                   5' in log
+
+    kits = [ 'AncestryDNA.txt', 'autosomal.txt', 'MyHeritage_raw_dna_data.csv', '37_Test_Chrom_Autoso_2020.csv', 'genome_Test_v5_Full_2020.txt' ]
+    calls = { kit: getKitCalls( os.path.join( sampleKits, kit ), 300000, 900000 ) for kit in kits }
+    rsidCalls = { kit: getKitCalls( os.path.join( sampleKits, kit ), position, position ) for kit in kits }
+    positions = set( kitPosition for kitCalls in list( calls.values() ) + list( rsidCalls.values() ) for kitPosition in kitCalls )
+    assert f'# SNPs found:             {len( positions )}' in log
+
+    # A row per position with the genotype of every kit that has it
+    rows = {}
+    for line in log.splitlines():
+        fields = line.split()
+        names = [ i for i, field in enumerate( fields ) if re.fullmatch( r'rs\d+', field ) ]
+        if names and fields[ names[ 0 ] - 1 ].isdigit():
+            rows[ int( fields[ names[ 0 ] - 1 ] ) ] = sorted( fields[ names[ 0 ] + 1: ] )
+    assert rows == { kitPosition: sorted( kitCalls[ kitPosition ] for kitCalls in list( calls.values() ) + list( rsidCalls.values() ) if kitPosition in kitCalls )
+                     for kitPosition in positions }
+
+    log = runSuperKit( workDir, emptyDir, '-q', rsid )
+    assert 'Indexing ' not in log
+    assert '# SNPs found:             1' in log
+
+
+##########################################
@@ -0,0 +1,117 @@
+##############################################################################################
+# Conversion service over HTTP (--serve)
+#
+
+import os
+import sys
+import json
+import shutil
+import signal
+import subprocess
+import urllib.error
+import urllib.request
+
+import pytest
+
+from conftest import packageDir, runSuperKit, readOutput
+
+
+##########################################
+# A job builds with its own settings, and the options
+# of the worker are the same after it, also when
+# the build fails
+
+def testServiceJobRestoresSettings( superkit, tmp_path, sampleKits, monkeypatch ):
+
+    import superkit_service
+
+    inputDir = os.path.join( str( tmp_path ), 'input', '' )
+    outputDir = os.path.join( str( tmp_path ), 'output', '' )
+    os.makedirs( inputDir )
+    os.makedirs( outputDir )
+    shutil.copy( os.path.join( sampleKits, 'AncestryDNA.txt' ), inputDir )
+    settings = superkit_service.getServiceJobSettings( inputDir, outputDir, 'SuperKit', False, True )
+    before = { name: getattr( superkit, name ) for name in list( settings ) + [ 'companyPriorityList' ] }
+
+    result = superkit_service.runServiceJob( superkit.buildServiceJob, settings )
+    assert result[ 'error' ] is None
+    assert result[ 'files' ] == [ 'DNASuperKit-SuperKit.txt' ]
+    assert { name: getattr( superkit, name ) for name in before } == before
+
+    def failingBuild():
+        assert superkit.inputFileDir == inputDir and superkit.majorityVote
+        raise ValueError( 'failed build' )
+    monkeypatch.setattr( superkit, 'createSuperKit', failingBuild )
+    result = superkit_service.runServiceJob( superkit.buildServiceJob, settings )
+    assert result[ 'error' ] == 'ValueError: failed build'
+    assert { name: getattr( superkit, name ) for name in before } == before
+
+
+##########################################
+
+
+##########################################
+# Start the service in workDir on a free port, and
+# return the process and the address it serves on
+
+def startService( workDir ) -> tuple:
+
+    for directory in [ 'input', 'output', 'data' ]:
+        os.makedirs( workDir / directory )
+    for file in os.listdir( packageDir ):
+        if file.endswith( '.py' ):
+            shutil.copy( os.path.join( packageDir, file ), workDir / file )
+
+    process = subprocess.Popen( [ sys.executable, '-u', 'create_superkit.py', '--serve', '127.0.0.1:0', '--serveWorkers', '1' ],
+                                cwd=workDir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True )
+    for line in process.stdout:
+        if line.startswith( 'Serving DNA file conversions on ' ):
+            return process, line.split()[ 5 ]
+    process.kill()
+    pytest.fail( 'The service did not start' )
+
+
+##########################################
+
+
+##########################################
+# A converted kit is the superkit of that kit built
+# from the command line, and the service counts it
+
+def testServiceConvert( tmp_path, sampleKits ):
+
+    kitsDir = tmp_path / 'kits'
+    os.makedirs( kitsDir )
+    shutil.copy( os.path.join( sampleKits, 'AncestryDNA.txt' ), kitsDir )
+    runSuperKit( tmp_path / 'build', kitsDir )
+    build = readOutput( tmp_path / 'build' )[ 'DNASuperKit-SuperKit.txt' ]
+
+    process, address = startService( tmp_path / 'service' )
+    try:
+        with urllib.request.urlopen( address + '/health', timeout=60 ) as response:
+            assert response.read() == b'ok\n'
+
+        with open( kitsDir / 'AncestryDNA.txt', 'rb' ) as f:
+            request = urllib.request.Request( address + '/convert?filename=AncestryDNA.txt', data=f.read(), method='POST' )
+        with urllib.request.urlopen( request, timeout=600 ) as response:
+            assert 'build;dur=' in response.headers[ 'Server-Timing' ]
+            assert [ line for line in response.read().splitlines() if not line.startswith( b'#' ) ] == build
+
+        request = urllib.request.Request( address + '/convert?filename=AncestryDNA.txt&outputFormat=unknown', data=b'rsid', method='POST' )
+        with pytest.raises( urllib.error.HTTPError ) as error:
+            urllib.request.urlopen( request, timeout=60 )
+        assert error.value.code == 400
+
+        with urllib.request.urlopen( address + '/metrics', timeout=60 ) as response:
+            metrics = json.loads( response.read() )
+        assert ( metrics[ 'completed' ], metrics[ 'failed' ], metrics[ 'inFlight' ] ) == ( 1, 0, 0 )
+        assert metrics[ 'seconds' ][ 'build' ][ 'count' ] == 1
+    finally:
+        process.send_signal( signal.SIGINT )
+        try:
+            process.wait( timeout=60 )
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+##########################################
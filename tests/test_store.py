@@ -0,0 +1,71 @@
+##############################################################################################
+# The superkit store (--saveStore/--loadStore/--update)
+#
+
+import os
+import shutil
+
+import pytest
+
+from conftest import runSuperKit, readOutput
+
+
+pytest.importorskip( 'pyarrow' )
+
+
+##########################################
+# Split the sample kits in two directories,
+# the old kits and the new kits of an update
+
+def splitKits( tmp_path, kitsDir: str ) -> tuple:
+
+    oldKits, newKits = tmp_path / 'oldKits', tmp_path / 'newKits'
+    for directory in [ oldKits, newKits ]:
+        os.makedirs( directory )
+    for file in os.listdir( kitsDir ):
+        target = oldKits if file in [ 'genome_Test_v5_Full_2020.txt', 'AncestryDNA.txt' ] else newKits
+        shutil.copy( os.path.join( kitsDir, file ), target / file )
+
+
+    return str( oldKits ), str( newKits )
+
+
+##########################################
+
+
+##########################################
+# Adding kits to the store is the same as merging
+# all kits again
+
+def testUpdateMatchesRebuild( tmp_path, sampleKits ):
+
+    oldKits, newKits = splitKits( tmp_path, sampleKits )
+
+    runSuperKit( tmp_path / 'update', oldKits, '-ss' )
+    log = runSuperKit( tmp_path / 'update', newKits, '-u' )
+    runSuperKit( tmp_path / 'rebuild', sampleKits )
+
+    rebuild = readOutput( tmp_path / 'rebuild' )
+    update = readOutput( tmp_path / 'update' )
+    assert rebuild and all( rebuild.values() )
+    assert update == rebuild
+    assert 'DNA SuperKit successfully created!' in log
+
+
+##########################################
+
+
+##########################################
+# A loaded store writes the superkit it was saved from
+
+def testLoadStoreMatchesBuild( tmp_path, sampleKits ):
+
+    runSuperKit( tmp_path / 'store', sampleKits, '-ss' )
+    build = readOutput( tmp_path / 'store' )
+    os.remove( tmp_path / 'store' / 'output' / 'DNASuperKit-SuperKit.txt' )
+    runSuperKit( tmp_path / 'store', sampleKits, '-ls' )
+
+    assert readOutput( tmp_path / 'store' ) == build
+
+
+##########################################
@@ -0,0 +1,160 @@
+##############################################################################################
+# VCF files are restricted to the positions of the DNA file templates in ./data/, the
+# kits are filtered on the template of the output format (--convertFormat), and the
+# templates are compiled to one reference panel
+#
+
+import os
+import random
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import runSuperKit, readOutput, sampleChromosomesAncestry
+
+
+##########################################
+# A VCF file of every SNP of the panel, without rsids
+
+def writeSampleVCF( directory: str, panel: list ):
+
+    rng = random.Random( 7 )
+    os.makedirs( directory )
+    with open( os.path.join( directory, 'sample.vcf' ), 'w' ) as f:
+        f.write( '##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tsample\n' )
+        for _, chromosome, position, reference, alternative in panel:
+            f.write( f'chr{chromosome}\t{position}\t.\t{reference}\t{alternative}\t.\tPASS\t.\tGT\t{rng.choice( [ "0/0", "0/1", "1/1" ] )}\n' )
+
+
+##########################################
+
+
+##########################################
+# The AncestryDNA v2 template names X, Y and MT
+# 23, 24 and 26, they are kept as X, Y and MT
+
+def testVCFOnAncestryTemplate( tmp_path, samplePanel, sampleTemplates ):
+
+    dataDir = tmp_path / 'data'
+    os.makedirs( dataDir )
+    shutil.copy( os.path.join( sampleTemplates, 'AncestryDNA v2.df' ), dataDir )
+    kitsDir = tmp_path / 'kits'
+    writeSampleVCF( kitsDir, samplePanel )
+
+    runSuperKit( tmp_path / 'build', kitsDir, dataDir=str( dataDir ) )
+
+    with open( dataDir / 'AncestryDNA v2.df' ) as f:
+        template = { tuple( line.split( '\t' )[ :3 ] ) for line in f.read().splitlines()[ 1: ] }
+    ancestryChromosomes = { name: chromosome for chromosome, name in sampleChromosomesAncestry.items() }
+    template = { ( rsid, ancestryChromosomes.get( chromosome, chromosome ), position ) for rsid, chromosome, position in template }
+
+    rows = { tuple( line.decode().split( '\t' )[ :3 ] ) for line in readOutput( tmp_path / 'build' )[ 'DNASuperKit-SuperKit.txt' ][ 1: ] }
+    assert rows == template
+    assert { chromosome for _, chromosome, _ in rows } >= { 'X', 'Y', 'MT' }
+
+
+##########################################
+
+
+##########################################
+# Run the superkit module in a directory with the DNA
+# file templates as ./data/, with nothing cached
+
+def useTemplates( superkit, monkeypatch, tmp_path, templatesDir: str ):
+
+    shutil.copytree( templatesDir, tmp_path / 'data' )
+    monkeypatch.chdir( tmp_path )
+    for cache in [ 'referencePanel', 'formatTemplates', 'formatTemplateKeys' ]:
+        monkeypatch.setattr( superkit, cache, {} )
+
+
+##########################################
+
+
+##########################################
+# The rows the template filter keeps are the rows on
+# the chromosomes and positions of the template
+
+def testTemplateFilterKeepsTemplateRows( superkit, tmp_path, monkeypatch, samplePanel, sampleTemplates ):
+
+    useTemplates( superkit, monkeypatch, tmp_path, sampleTemplates )
+    template = pd.read_csv( tmp_path / 'data' / '23andMe v5.df', sep='\t', dtype=str )
+    templatePositions = set( zip( template[ 'chromosome' ], template[ 'position' ].astype( int ) ) )
+
+    # Every SNP of the panel, and positions next to them
+    df = pd.DataFrame( [ ( rsid, chromosome, position + shift, 'AA' ) for rsid, chromosome, position, _, _ in samplePanel for shift in ( 0, 1 ) ],
+                       columns=[ 'rsid', 'chromosome', 'position', 'genotype' ] )
+    kept = superkit.selectTemplatePositions( df, '23andMe v5' )
+    expected = [ ( chromosome, position ) in templatePositions for chromosome, position in zip( df[ 'chromosome' ], df[ 'position' ] ) ]
+    pd.testing.assert_frame_equal( kept, df[ expected ] )
+    assert 0 < len( kept ) < len( df ) / 2
+
+
+##########################################
+
+
+##########################################
+# A converted superkit is the same with the filter, and
+# without it as with --saveStore, which keeps every row
+
+@pytest.mark.parametrize( 'arguments', [ [], [ '-mv' ] ] )
+def testConvertFormatFilterMatchesUnfiltered( tmp_path, sampleKits, sampleTemplates, arguments ):
+
+    runSuperKit( tmp_path / 'filtered', sampleKits, '-o', 'AncestryDNA v2', '-cf', *arguments, dataDir=sampleTemplates )
+    runSuperKit( tmp_path / 'unfiltered', sampleKits, '-o', 'AncestryDNA v2', '-cf', '-ss', *arguments, dataDir=sampleTemplates )
+
+    filtered = readOutput( tmp_path / 'filtered' )
+    assert filtered and all( filtered.values() )
+    assert filtered == readOutput( tmp_path / 'unfiltered' )
+
+
+##########################################
+
+
+##########################################
+# The reference panel has a row per position and rsid
+# of the templates, with the bit of every template it
+# is in. It is saved, and compiled again when a
+# template changes
+
+def testReferencePanelFormats( superkit, tmp_path, monkeypatch, sampleTemplates ):
+
+    useTemplates( superkit, monkeypatch, tmp_path, sampleTemplates )
+
+    def getTemplateRows( panel: np.ndarray, metadata: dict, template: str ) -> set:
+        rows = panel[ ( panel[ 'formats' ] >> metadata[ 'formats' ].index( template ) ) & 1 == 1 ]
+        return set( zip( np.array( metadata[ 'chromosomes' ] )[ rows[ 'chromosome' ] ], rows[ 'position' ].tolist(), rows[ 'rsid' ].astype( str ) ) )
+
+    def readTemplateRows( template: str ) -> set:
+        df = pd.read_csv( tmp_path / 'data' / f'{template}.df', sep='\t', dtype=str )
+        return set( zip( df[ 'chromosome' ], df[ 'position' ].astype( int ), df[ 'rsid' ] ) )
+
+    panel, metadata = superkit.loadReferencePanel()
+    assert metadata[ 'formats' ] == sorted( file[ :-3 ] for file in os.listdir( sampleTemplates ) )
+    assert len( panel ) == len( set( zip( panel[ 'chromosome' ].tolist(), panel[ 'position' ].tolist(), panel[ 'rsid' ].tolist() ) ) )
+    for template in metadata[ 'formats' ]:
+        assert getTemplateRows( panel, metadata, template ) == readTemplateRows( template ), template
+
+    # The saved panel is mapped by the next run
+    superkit.referencePanel.clear()
+    superkit.formatTemplates.clear()
+    saved, savedMetadata = superkit.loadReferencePanel()
+    assert isinstance( saved, np.memmap )
+    assert ( saved == panel ).all() and savedMetadata == metadata
+
+    # A changed template
+    with open( tmp_path / 'data' / 'LivingDNA v1.0.2.df' ) as f:
+        lines = f.read().splitlines( keepends=True )
+    with open( tmp_path / 'data' / 'LivingDNA v1.0.2.df', 'w' ) as f:
+        f.writelines( lines[ ::2 ] )
+    os.utime( tmp_path / 'data' / 'LivingDNA v1.0.2.df', ns=( 1, 1 ) )
+    superkit.referencePanel.clear()
+    superkit.formatTemplates.clear()
+    panel, metadata = superkit.loadReferencePanel()
+    assert not isinstance( panel, np.memmap )
+    assert getTemplateRows( panel, metadata, 'LivingDNA v1.0.2' ) == readTemplateRows( 'LivingDNA v1.0.2' )
+
+
+##########################################
@@ -0,0 +1,211 @@
+##############################################################################################
+# VCF v4 output, block-gzip (BGZF) compressed and tabix indexed
+#
+
+import io
+import gzip
+import zlib
+import struct
+
+import numpy as np
+import pandas as pd
+
+from conftest import runSuperKit, readOutput, writeSampleReferenceAlleles
+
+
+##########################################
+# The BGZF blocks of a file, their compressed offset
+# and decompressed contents
+
+def readBGZFBlocks( data: bytes ) -> list:
+
+    blocks = []
+    offset = 0
+    while offset < len( data ):
+        assert data[ offset:offset + 4 ] == b'\x1f\x8b\x08\x04'
+        assert data[ offset + 12:offset + 16 ] == b'BC\x02\x00'
+        size = struct.unpack( '<H', data[ offset + 16:offset + 18 ] )[ 0 ] + 1
+        contents = zlib.decompress( data[ offset + 18:offset + size - 8 ], -15 )
+        crc, length = struct.unpack( '<2I', data[ offset + size - 8:offset + size ] )
+        assert ( crc, length ) == ( zlib.crc32( contents ), len( contents ) )
+        blocks.append( ( offset, contents ) )
+        offset += size
+
+
+    return blocks
+
+
+##########################################
+
+
+##########################################
+
+def testBGZFBlocks( superkit ):
+
+    import superkit_vcf
+
+    parts = [ bytes( [ 65 + i % 26 ] ) * 30000 for i in range( 7 ) ]
+    f = io.BytesIO()
+    blockOffsets = superkit_vcf.writeBGZFFile( f, parts )
+    data = f.getvalue()
+
+    blocks = readBGZFBlocks( data )
+    assert gzip.decompress( data ) == b''.join( parts )
+    # Full blocks, a last partial block and the empty EOF block
+    assert [ len( contents ) for _, contents in blocks ] == [ superkit_vcf.bgzfBlockSize ] * 3 + [ 210000 - 3 * superkit_vcf.bgzfBlockSize, 0 ]
+    assert blockOffsets == [ offset for offset, _ in blocks ]
+    assert data.endswith( superkit_vcf.bgzfEOF )
+
+
+##########################################
+
+
+##########################################
+# Every bin of the tabix index points at the first row
+# of its 16 kb window and ends after its last row
+
+def testTabixIndex( superkit, tmp_path ):
+
+    import superkit_vcf
+
+    rng = np.random.default_rng( 1 )
+    chunks = []
+    for chromosome in [ '1', '2', 'X' ]:
+        position = np.sort( rng.choice( np.arange( 1, 3000000 ), 20000, replace=False ) )
+        for rows in np.array_split( np.arange( len( position ) ), 3 ):
+            chunks.append( pd.DataFrame( { '#CHROM': chromosome, 'POS': position[ rows ], 'ID': '.', 'REF': 'A', 'ALT': 'G',
+                                           'QUAL': '.', 'FILTER': '.', 'INFO': '.', 'FORMAT': 'GT', superkit.outputFileName: '0/1' } ) )
+
+    fileName = str( tmp_path / 'superkit.vcf.gz' )
+    superkit_vcf.writeVCFFileChunks( fileName, iter( chunks ), superkit.outputFileName, superkit.outputFileName )
+    with open( fileName, 'rb' ) as f:
+        blocks = readBGZFBlocks( f.read() )
+    with open( fileName + '.tbi', 'rb' ) as f:
+        index = gzip.decompress( f.read() )
+
+    # Virtual offsets to offsets in the decompressed file
+    starts = {}
+    text = b''
+    for offset, contents in blocks:
+        starts[ offset ] = len( text )
+        text += contents
+    def getOffset( virtualOffset: int ) -> int:
+        return starts[ virtualOffset >> 16 ] + ( virtualOffset & 0xffff )
+
+    rows = pd.read_csv( io.BytesIO( text ), sep='\t', comment='#', header=None, usecols=[ 0, 1 ], names=[ 'chromosome', 'position' ], dtype={ 'chromosome': str } )
+    lineStarts = np.r_[ 0, np.flatnonzero( np.frombuffer( text, dtype=np.uint8 ) == ord( '\n' ) ) + 1 ]
+    rows[ 'start' ] = lineStarts[ -len( rows ) - 1:-1 ]
+    rows[ 'end' ] = lineStarts[ -len( rows ): ]
+    rows[ 'window' ] = ( rows[ 'position' ].to_numpy() - 1 ) >> superkit_vcf.tabixMinShift
+
+    assert index[ :4 ] == b'TBI\1'
+    references, _, _, _, _, _, _, namesLength = struct.unpack( '<8i', index[ 4:36 ] )
+    names = index[ 36:36 + namesLength ].split( b'\0' )[ :-1 ]
+    assert names == [ b'1', b'2', b'X' ]
+    offset = 36 + namesLength
+    for name in names:
+        windows = rows[ rows[ 'chromosome' ] == name.decode() ].groupby( 'window' ).agg( start=( 'start', 'first' ), end=( 'end', 'last' ) )
+        bins = struct.unpack( '<i', index[ offset:offset + 4 ] )[ 0 ]
+        offset += 4
+        assert bins == len( windows )
+        for window, start, end in windows.itertuples():
+            binNumber, count, begin, finish = struct.unpack( '<Ii2Q', index[ offset:offset + 24 ] )
+            offset += 24
+            assert ( binNumber, count ) == ( window + superkit_vcf.tabixBinOffset, 1 )
+            assert ( getOffset( begin ), getOffset( finish ) ) == ( start, end )
+        linear = struct.unpack( '<i', index[ offset:offset + 4 ] )[ 0 ]
+        offset += 4 + 8 * linear
+        assert linear == windows.index[ -1 ] + 1
+    assert offset == len( index ) and references == len( names )
+
+
+##########################################
+
+
+##########################################
+# REF and ALT are the reference alleles, never the
+# first allele of the call
+
+def testVCFAlleles( superkit ):
+
+    import superkit_vcf
+
+    assert superkit_vcf.getVCFAlleles( 'AA', 'A', 'G' ) == ( 'A', 'G', '0/0' )
+    assert superkit_vcf.getVCFAlleles( 'AG', 'A', 'G' ) == ( 'A', 'G', '0/1' )
+    assert superkit_vcf.getVCFAlleles( 'GG', 'A', 'G' ) == ( 'A', 'G', '1/1' )
+    assert superkit_vcf.getVCFAlleles( 'CG', 'A', 'G' ) == ( 'A', 'G,C', '1/2' )
+    assert superkit_vcf.getVCFAlleles( 'G', 'A', 'G' ) == ( 'A', 'G', '1' )
+    assert superkit_vcf.getVCFAlleles( '--', 'A', 'G' ) == ( 'A', 'G', './.' )
+    # Without reference alleles every called allele is an ALT
+    assert superkit_vcf.getVCFAlleles( 'GG', '', '' ) == ( 'N', 'G', '1/1' )
+    assert superkit_vcf.getVCFAlleles( 'AG', '', '' ) == ( 'N', 'A,G', '1/2' )
+    assert superkit_vcf.getVCFAlleles( 'DI', '', '' ) == ( 'N', '.', './.' )
+
+
+##########################################
+
+
+##########################################
+# The rows rendered with numpy are the rows of to_csv,
+# across blocks and with missing rsids
+
+def testRenderVCFRows( superkit, monkeypatch ):
+
+    import superkit_vcf
+
+    monkeypatch.setattr( superkit_vcf, 'vcfRenderRows', 1000 )
+    rng = np.random.default_rng( 3 )
+    rows = 2500
+    df = pd.DataFrame( {
+        '#CHROM': rng.choice( [ '1', '22', 'X', 'MT' ], rows ),
+        'POS': rng.integers( 1, 250000000, rows ),
+        'ID': np.where( rng.random( rows ) < 0.1, None, np.char.add( 'rs', rng.integers( 1, 10**9, rows ).astype( str ) ) ),
+        'REF': rng.choice( [ 'A', 'C', 'N' ], rows ),
+        'ALT': rng.choice( [ '.', 'T', 'G,T' ], rows ),
+        'QUAL': '.', 'FILTER': '.', 'INFO': '.', 'FORMAT': 'GT',
+        'kit': rng.choice( [ '0/0', '0/1', '1/2', '1', './.' ], rows ) } )
+
+    blocks = list( superkit_vcf.renderVCFRows( df, 'ascii' ) )
+    assert len( blocks ) == 3
+    text = b''.join( block for block, lengths in blocks )
+    assert text == df.to_csv( None, index=None, header=False, sep='\t', lineterminator='\n' ).encode( 'ascii' )
+    lengths = np.concatenate( [ lengths for block, lengths in blocks ] )
+    assert ( np.cumsum( lengths ) == np.flatnonzero( np.frombuffer( text, dtype=np.uint8 ) == ord( '\n' ) ) + 1 ).all()
+
+
+##########################################
+
+
+##########################################
+# The calls of the VCF v4 output are the genotypes
+# of the superkit, on the reference alleles of the panel
+
+def testVCFOutputMatchesSuperKit( tmp_path, sampleKits, samplePanel ):
+
+    dataDir = tmp_path / 'data'
+    writeSampleReferenceAlleles( dataDir, samplePanel )
+    runSuperKit( tmp_path / 'superkit', sampleKits )
+    runSuperKit( tmp_path / 'vcf', sampleKits, '-o', 'VCF v4', dataDir=str( dataDir ) )
+
+    superkitRows = {}
+    for line in readOutput( tmp_path / 'superkit' )[ 'DNASuperKit-SuperKit.txt' ][ 1: ]:
+        _, chromosome, position, genotype = line.decode().split( '\t' )
+        if chromosome != '0':
+            superkitRows[ ( chromosome, position ) ] = genotype
+
+    panel = { ( chromosome, str( position ) ): ( reference, alternative ) for _, chromosome, position, reference, alternative in samplePanel }
+    with gzip.open( tmp_path / 'vcf' / 'output' / 'DNASuperKit-VCF v4.vcf.gz', 'rt' ) as f:
+        rows = [ line.rstrip( '\n' ).split( '\t' ) for line in f if not line.startswith( '#' ) ]
+
+    assert len( rows ) == len( superkitRows )
+    for chromosome, position, _, ref, alt, _, _, _, _, gt in rows:
+        assert ( ref, alt.split( ',' )[ 0 ] ) == panel[ ( chromosome, position ) ]
+        genotype = superkitRows[ ( chromosome, position ) ]
+        if gt == './.':
+            assert genotype == '--' or len( genotype ) > 2 or any( a not in 'ACGT' for a in genotype )
+        else:
+            alleles = [ ref ] + alt.split( ',' )
+            assert sorted( alleles[ int( i ) ] for i in gt.split( '/' ) ) == sorted( genotype )
+
+
+##########################################
@@ -0,0 +1,100 @@
+##############################################################################################
+# Watching ./input/ and building the superkit again as DNA files land in it (--watch)
+#
+
+import os
+import sys
+import shutil
+import signal
+import subprocess
+
+import pytest
+
+from conftest import packageDir, runSuperKit, readOutput
+
+
+##########################################
+# A kit is parsed once and taken from the cache until
+# the file changes
+
+def testKitCache( superkit, tmp_path, sampleKits ):
+
+    import superkit_files
+
+    file = str( tmp_path / 'AncestryDNA.txt' )
+    shutil.copy( os.path.join( sampleKits, 'AncestryDNA.txt' ), file )
+
+    kitCache = {}
+    company = superkit_files.screenDNAFile( file, kitCache )
+    kit = superkit.loadPreparedDNAFile( file, company, kitCache )
+    assert company == 'AncestryDNA v2'
+    assert superkit_files.screenDNAFile( file, kitCache ) == company
+    assert superkit.loadPreparedDNAFile( file, company, kitCache ) is kit
+
+    with open( file, 'a', newline='' ) as f:
+        f.write( 'rs1\t1\t1\tA\tA\r\n' )
+    assert superkit_files.screenDNAFile( file, kitCache ) == company
+    changed = superkit.loadPreparedDNAFile( file, company, kitCache )
+    assert changed is not kit
+    assert len( changed[ 0 ] ) == len( kit[ 0 ] ) + 1
+
+
+##########################################
+
+
+##########################################
+# Wait for the next rebuild of the watching process,
+# returns whether it was done
+
+def waitForRebuild( process ) -> bool:
+
+    for line in process.stdout:
+        if line.startswith( '# Rebuild ' ):
+            return ' done in ' in line
+    pytest.fail( 'The watch mode stopped' )
+
+
+##########################################
+
+
+##########################################
+# The superkit built after every batch of kits that
+# lands in ./input/ is the superkit of the kits there
+
+def testWatchRebuildsOnNewKits( tmp_path, sampleKits ):
+
+    firstKits = tmp_path / 'first'
+    os.makedirs( firstKits )
+    for file in [ 'AncestryDNA.txt', 'autosomal.txt' ]:
+        shutil.copy( os.path.join( sampleKits, file ), firstKits )
+    runSuperKit( tmp_path / 'firstBuild', firstKits )
+    runSuperKit( tmp_path / 'build', sampleKits )
+
+    workDir = tmp_path / 'watch'
+    for directory in [ 'input', 'output', 'data' ]:
+        os.makedirs( workDir / directory )
+    for file in os.listdir( packageDir ):
+        if file.endswith( '.py' ):
+            shutil.copy( os.path.join( packageDir, file ), workDir / file )
+    for file in os.listdir( firstKits ):
+        shutil.copy( firstKits / file, workDir / 'input' / file )
+
+    process = subprocess.Popen( [ sys.executable, '-u', 'create_superkit.py', '--watch' ],
+                                cwd=workDir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True )
+    try:
+        assert waitForRebuild( process )
+        assert readOutput( workDir ) == readOutput( tmp_path / 'firstBuild' )
+
+        for file in os.listdir( sampleKits ):
+            shutil.copy( os.path.join( sampleKits, file ), workDir / 'input' / file )
+        assert waitForRebuild( process )
+        assert readOutput( workDir ) == readOutput( tmp_path / 'build' )
+    finally:
+        process.send_signal( signal.SIGINT )
+        try:
+            process.wait( timeout=60 )
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+##########################################